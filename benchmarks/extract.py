@@ -0,0 +1,187 @@
+"""
+Local content extraction: correctness checks and throughput against Firecrawl.
+
+Serves the saved pages in benchmarks/pages/ from a local HTTP server and
+checks what LocalCrawler makes of each (body kept, boilerplate dropped,
+images found, or a Firecrawl fallback for pages that fail the quality
+checks), then crawls the RSS stub's blog posts with LocalCrawler and with
+Firecrawl (stubbed, at --firecrawl-latency) and compares pages per second.
+Exits non-zero if a check fails, so it can run in CI:
+
+    python benchmarks/extract.py
+    python benchmarks/extract.py --posts 400 --concurrency 16 --processes 4
+    python benchmarks/extract.py --async --firecrawl-latency 2
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+PAGES_DIR = os.path.join(ROOT, "benchmarks", "pages")
+
+from weflow.testing.stubs import RSSStubServer, FirecrawlStub, SavedPagesServer  # noqa: E402
+
+# page -> what extraction must produce: "local" (extracted here) or "fallback" (sent to Firecrawl)
+EXPECTED = {
+    "wordpress.html": {
+        "outcome": "local",
+        "images": 2,
+        "contains": ["# Scaling Retrieval for Long-Context Agents", "## What we measured", "- Hybrid retrieval matched", "```\nretriever = HybridRetriever"],
+        "absent": ["Recent Posts", "Proudly powered", "Great post", "Tweet", "Related posts", "pixel.gif"],
+    },
+    "ghost.html": {
+        "outcome": "local",
+        "images": 2,
+        "contains": ["# Robots that learn from one demonstration", "w2000/2026/09/arm.jpg", '> "The demonstration is closer', "**which**"],
+        "absent": ["Subscribe", "World models, explained", "Privacy", "casper.js"],
+    },
+    "divsoup.html": {  # GBK page, charset only in <meta>, no semantic tags
+        "outcome": "local",
+        "images": 1,
+        "contains": ["内存带宽", "| 甲型加速卡 | 192 GB | 8 TB/s |", "/pics/hbm-roadmap.jpg"],
+        "absent": ["热门文章", "联系我们", "登录", "banner-300x250"],
+    },
+    "spa-shell.html": {"outcome": "fallback"},   # JavaScript app shell: nothing to extract
+    "link-index.html": {"outcome": "fallback"},  # link list, not an article
+}
+
+
+def configure_env(firecrawl_url: str, processes: int):
+    os.environ.update({
+        "FIRECRAWL_API_KEY": "stub",
+        "FIRECRAWL_BASE_URL": firecrawl_url,
+        "EXTRACT_PROCESSES": str(processes),
+    })
+
+
+def check_pages() -> list[str]:
+    """Runs the saved-page checks; returns the failures."""
+    from weflow.main import extract_image_urls
+    from weflow.core.crawler import LocalCrawler
+
+    failures = []
+    with SavedPagesServer(PAGES_DIR) as pages, FirecrawlStub(pages.markdown_for) as firecrawl:
+        configure_env(firecrawl.url, int(os.environ.get("EXTRACT_PROCESSES", "2")))
+        # One test server is one domain: don't let the failing pages route it to Firecrawl here
+        crawler = LocalCrawler(fallback_after=1000)
+        for name, url in pages.page_urls().items():
+            expected = EXPECTED.get(name)
+            if expected is None:
+                print(f"  {name:<16} (no expectations, skipped)")
+                continue
+            markdown = crawler.crawl(url) or ""
+            outcome = "fallback" if SavedPagesServer.FIRECRAWL_MARKER in markdown else "local"
+            problems = []
+            if outcome != expected["outcome"]:
+                problems.append(f"expected {expected['outcome']}, got {outcome}")
+            if outcome == "local":
+                images = extract_image_urls(markdown)
+                if len(images) != expected.get("images", len(images)):
+                    problems.append(f"expected {expected['images']} images, got {len(images)}: {images}")
+                problems += [f"missing {s!r}" for s in expected.get("contains", []) if s not in markdown]
+                problems += [f"boilerplate {s!r}" for s in expected.get("absent", []) if s in markdown]
+            print(f"  {name:<16} {outcome:<8} {len(markdown):>6} chars  {'ok' if not problems else 'FAIL'}")
+            for problem in problems:
+                print(f"      {problem}")
+            failures += [f"{name}: {p}" for p in problems]
+
+        # A domain that keeps failing goes straight to Firecrawl, even for pages that would extract
+        crawler = LocalCrawler(fallback_after=2)
+        urls = pages.page_urls()
+        crawler.crawl(urls["spa-shell.html"])
+        crawler.crawl(urls["link-index.html"])
+        routed = SavedPagesServer.FIRECRAWL_MARKER in (crawler.crawl(urls["wordpress.html"]) or "")
+        print(f"  domain fallback after 2 failures: {'ok' if routed else 'FAIL'}")
+        if not routed:
+            failures.append("domain fallback: wordpress.html was extracted locally after 2 failures on its domain")
+    return failures
+
+
+def crawl_all(crawler, urls: list[str], concurrency: int) -> tuple[float, list]:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(crawler.crawl, urls))
+    return time.perf_counter() - start, results
+
+
+async def crawl_all_async(crawler, urls: list[str], concurrency: int) -> list:
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(url):
+        async with sem:
+            return await crawler.crawl(url)
+    return await asyncio.gather(*(one(url) for url in urls))
+
+
+def throughput(args) -> dict:
+    from weflow.main import extract_image_urls
+    from weflow.core.crawler import LocalCrawler, FirecrawlCrawler, AsyncLocalCrawler, AsyncFirecrawlCrawler
+
+    feeds = max(1, args.posts // 50)
+    rss = RSSStubServer(feeds=feeds, articles=-(-args.posts // feeds), paragraphs=args.paragraphs, latency=args.latency).start()
+    firecrawl = FirecrawlStub(rss.markdown_for, latency=args.firecrawl_latency).start()
+    configure_env(firecrawl.url, args.processes)
+    urls = [f"{rss.url}/post/{i}/{j}" for i in range(feeds) for j in range(rss.articles)][:args.posts]
+    try:
+        runs = {}
+        for name in ("local", "firecrawl"):
+            if args.use_async:
+                import httpx
+
+                async def go():
+                    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+                    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+                        crawler = AsyncLocalCrawler(client=client) if name == "local" else AsyncFirecrawlCrawler(client=client)
+                        start = time.perf_counter()
+                        results = await crawl_all_async(crawler, urls, args.concurrency)
+                        return time.perf_counter() - start, results
+                seconds, results = asyncio.run(go())
+            else:
+                crawler = LocalCrawler() if name == "local" else FirecrawlCrawler()
+                if name == "local":
+                    crawl_all(crawler, urls[:args.concurrency], args.concurrency)  # starts the extraction processes
+                seconds, results = crawl_all(crawler, urls, args.concurrency)
+            expected_images = sum(len(extract_image_urls(rss.markdown_for(u))) for u in urls)
+            found_images = sum(len(extract_image_urls(r or "")) for r in results)
+            runs[name] = {
+                "seconds": round(seconds, 3),
+                "pages_per_second": round(len(urls) / seconds, 1),
+                "failed": sum(1 for r in results if not r),
+                "image_recall": round(found_images / expected_images, 3) if expected_images else None,
+            }
+        return runs
+    finally:
+        rss.stop()
+        firecrawl.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=100, help="blog posts crawled for the throughput comparison")
+    parser.add_argument("--paragraphs", type=int, default=20, help="paragraphs per post (~450 bytes each)")
+    parser.add_argument("--concurrency", type=int, default=8, help="pages in flight at once")
+    parser.add_argument("--processes", type=int, default=min(4, os.cpu_count() or 1), help="extraction processes (EXTRACT_PROCESSES)")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds the blog takes to serve a page")
+    parser.add_argument("--firecrawl-latency", type=float, default=1.0, help="seconds the Firecrawl stub takes per scrape")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="use the asyncio crawlers")
+    parser.add_argument("--checks-only", action="store_true", help="skip the throughput comparison")
+    args = parser.parse_args()
+
+    os.environ["EXTRACT_PROCESSES"] = str(args.processes)
+    print("saved pages:")
+    failures = check_pages()
+    if not args.checks_only:
+        print(f"throughput ({args.posts} posts, {args.concurrency} in flight, {args.processes} extraction processes{', async' if args.use_async else ''}):")
+        for name, run in throughput(args).items():
+            print(f"  {name:<10} {run['seconds']:8.2f}s  {run['pages_per_second']:8.1f} pages/s  failed {run['failed']}  image recall {run['image_recall']}")
+    if failures:
+        print(f"{len(failures)} check(s) failed")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Cold-start import benchmark and regression guard.
+
+Imports each entry module in a fresh interpreter several times and reports the
+median wall time plus the slowest imports (from `python -X importtime`). Exits
+non-zero if an import exceeds its budget or if a provider SDK is loaded eagerly,
+so it can run in CI:
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --budget 0.8 --runs 7 --top 15
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+SRC = os.path.join(ROOT, "src")
+
+MODULES = ["weflow.main", "weflow.async_main"]
+
+# SDKs that must only be imported when a provider that needs them is created
+LAZY_MODULES = ["dashscope", "google.generativeai", "openai", "sqlalchemy"]
+
+_PROBE = """
+import sys, time, json
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "eager": [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+
+def _env() -> dict:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = SRC + os.pathsep + env.get("PYTHONPATH", "")
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    return env
+
+
+def probe(module: str) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(module=module, lazy=LAZY_MODULES)],
+        capture_output=True, text=True, env=_env(), cwd=ROOT, check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def slowest_imports(module: str, top: int) -> list[tuple[float, str]]:
+    """Cumulative time of each module imported directly by `module`, from -X importtime."""
+    err = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=_env(), cwd=ROOT, check=True,
+    ).stderr
+    totals = {}
+    for line in err.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        try:
+            us = int(cumulative)
+        except ValueError:
+            continue  # header row
+        # Rows are indented two spaces per nesting level; keep the module's direct imports
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 1:
+            pkg = name.strip()
+            totals[pkg] = max(totals.get(pkg, 0), us)
+    ranked = sorted(((us / 1e6, pkg) for pkg, us in totals.items()), reverse=True)
+    return ranked[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=1.0, help="max median import seconds per module")
+    parser.add_argument("--top", type=int, default=10, help="show this many slowest imports")
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    args = parser.parse_args()
+
+    failed = False
+    # Warm the bytecode cache so the first timed run is not penalised
+    for module in args.modules:
+        probe(module)
+
+    for module in args.modules:
+        runs = [probe(module) for _ in range(args.runs)]
+        median = statistics.median(r["seconds"] for r in runs)
+        eager = sorted({m for r in runs for m in r["eager"]})
+        status = "ok"
+        if median > args.budget:
+            status = f"SLOW (budget {args.budget:.2f}s)"
+            failed = True
+        if eager:
+            status = f"EAGER SDK IMPORT: {', '.join(eager)}"
+            failed = True
+        print(f"{module:<22} median {median:.3f}s  min {min(r['seconds'] for r in runs):.3f}s  [{status}]")
+        for seconds, pkg in slowest_imports(module, args.top):
+            print(f"    {seconds:7.3f}s  {pkg}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
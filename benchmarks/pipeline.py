@@ -0,0 +1,350 @@
+"""
+End-to-end pipeline benchmark against local stand-ins for every external service.
+
+Runs weflow's main() with N feeds x M articles, where RSS, Firecrawl, the
+OpenAI-compatible LLM, DashScope, WeChat and Feishu are all served by the
+stubs in weflow.testing.stubs. Nothing leaves the machine.
+
+    python benchmarks/pipeline.py --feeds 4 --articles 25 --latency 0.02 --llm-latency 0.3 --save
+    python benchmarks/pipeline.py --feeds 4 --articles 25 --async --save --label async
+    python benchmarks/pipeline.py --feeds 4 --articles 250 --paragraphs 150 --trace-memory   # long articles, memory
+    python benchmarks/pipeline.py --feeds 4 --articles 25 --crawler local   # local extraction instead of Firecrawl
+    python benchmarks/pipeline.py --feeds 4 --articles 25 --full-text-feeds 2   # half the feeds need no crawl
+    python benchmarks/pipeline.py --feeds 2 --articles 5 --image-latency 5   # slow cover/header rendering
+    python benchmarks/pipeline.py --feeds 2 --articles 5 --outbox --latency 0.5   # publish/notify through the outbox
+    python benchmarks/pipeline.py --feeds 4 --articles 25 --llm-token-latency 0.5   # big clusters, size-bound LLM
+    PROVIDER_TIMEOUTS=vision=2 python benchmarks/pipeline.py --hang dashscope   # timeouts + circuit breakers
+    python benchmarks/pipeline.py --feeds 4 --articles 25 --record cassettes/bench   # then:
+    python benchmarks/pipeline.py --replay cassettes/bench --replay-latency x1 --save --label replay
+    python benchmarks/pipeline.py --compare benchmarks/results/abc123.json benchmarks/results/def456.json
+
+Saved results are keyed by the current commit, so runs on two checkouts can be
+compared with --compare.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import contextlib
+import resource
+import subprocess
+import tempfile
+import tracemalloc
+from datetime import datetime
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from weflow.testing.stubs import (  # noqa: E402
+    RSSStubServer,
+    FirecrawlStub,
+    FakeOpenAIServer,
+    DashScopeStub,
+    WeChatStub,
+    FeishuStub,
+    pipeline_reply,
+)
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+# Saved next to a recording: its size and the service URLs it was made against
+BENCH_ENV = "bench_env.json"
+
+# Variables the pipeline reads that must not leak in from the caller's shell
+_CLEARED_ENV = ("LLM_ENDPOINTS", "WEFLOW_ASYNC", "GOOGLE_API_KEY", "RSS_FEEDS", "OUTBOX")
+
+
+def git_label() -> str:
+    try:
+        sha = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+        return f"{sha}-dirty" if dirty else sha
+    except (OSError, subprocess.CalledProcessError):
+        return datetime.now().strftime("run-%Y%m%d-%H%M%S")
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def stub_kwargs(args, latency: float) -> dict:
+    # +/-50% jitter around the configured latency
+    return {"latency": (latency * 0.5, latency * 1.5) if latency else 0.0, "error_rate": args.error_rate, "seed": args.seed}
+
+
+def start_stubs(args) -> dict:
+    rss = RSSStubServer(feeds=args.feeds, articles=args.articles, paragraphs=args.paragraphs, full_text_feeds=args.full_text_feeds, **stub_kwargs(args, args.latency)).start()
+    stubs = {
+        "rss": rss,
+        "firecrawl": FirecrawlStub(rss.markdown_for, **stub_kwargs(args, args.latency)).start(),
+        "llm": FakeOpenAIServer(reply=pipeline_reply, token_latency=args.llm_token_latency, **stub_kwargs(args, args.llm_latency)).start(),
+        "dashscope": DashScopeStub(image_url=f"{rss.url}/generated/cover.png", render_seconds=args.image_latency, **stub_kwargs(args, args.latency)).start(),
+        "wechat": WeChatStub(**stub_kwargs(args, args.latency)).start(),
+        "feishu": FeishuStub(**stub_kwargs(args, args.latency)).start(),
+    }
+    # Hung services accept the connection and never answer, like a stalled socket
+    for name in getattr(args, "hang", None) or []:
+        stubs[name].hang = True
+    return stubs
+
+
+def provider_env(stubs: dict) -> dict:
+    """Where the pipeline finds each service; saved with a recording so replay asks for the same URLs."""
+    return {
+        "RSS_FEEDS": ",".join(stubs["rss"].feed_urls()),
+        "FIRECRAWL_API_KEY": "stub",
+        "FIRECRAWL_BASE_URL": stubs["firecrawl"].url,
+        "DEEPSEEK_API_KEY": "stub",
+        "DEEPSEEK_BASE_URL": stubs["llm"].url,
+        "WECHAT_APP_ID": "stub",
+        "WECHAT_APP_SECRET": "stub",
+        "WECHAT_API_BASE": stubs["wechat"].url,
+        "FEISHU_WEBHOOK_URL": stubs["feishu"].webhook_url,
+        "DASHSCOPE_API_KEY": "stub",
+        "DASHSCOPE_HTTP_BASE_URL": f"{stubs['dashscope'].url}/api/v1",
+        "IMAGE_PROVIDER": "qwen",
+    }
+
+
+def configure_env(env: dict, workdir: str, args):
+    for key in _CLEARED_ENV + ("CASSETTE_MODE", "CASSETTE_DIR"):
+        os.environ.pop(key, None)
+    os.environ.update(env)
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "WEFLOW_METRICS": "1",
+        "METRICS_DIR": os.path.join(workdir, "metrics"),
+    })
+    if args.use_async:
+        os.environ["WEFLOW_ASYNC"] = "1"
+    os.environ["CRAWLER_PROVIDER"] = args.crawler
+    if args.outbox:
+        os.environ["OUTBOX"] = "1"
+    if args.profile:
+        os.environ["WEFLOW_PROFILE"] = "1"
+        os.environ["PROFILE_DIR"] = os.path.join(workdir, "profiles")
+    if args.record or args.replay:
+        os.environ["CASSETTE_MODE"] = "record" if args.record else "replay"
+        os.environ["CASSETTE_DIR"] = os.path.abspath(args.record or args.replay)
+        os.environ["CASSETTE_LATENCY"] = args.replay_latency
+
+
+def summarize_histograms(report: dict) -> tuple[dict, dict]:
+    stages = {}
+    for entry in report["histograms"].get("weflow_stage_seconds", []):
+        stages[entry["labels"]["stage"]] = round(entry["sum"], 3)
+    providers = {}
+    for entry in report["histograms"].get("weflow_provider_call_seconds", []):
+        labels = entry["labels"]
+        key = f"{labels['provider']}/{labels['op']}"
+        stats = providers.setdefault(key, {"calls": 0, "errors": 0, "p50": None, "p95": None})
+        stats["calls"] += entry["count"]
+        if labels.get("outcome") != "ok":
+            stats["errors"] += entry["count"]
+        else:
+            stats["p50"], stats["p95"] = entry["p50"], entry["p95"]
+    return stages, providers
+
+
+def published_drafts(report: dict) -> int:
+    """Drafts created, from the provider metrics (for replays, where there is no WeChat stub to ask)."""
+    return sum(
+        entry["count"] for entry in report["histograms"].get("weflow_provider_call_seconds", [])
+        if entry["labels"].get("provider") == "wechat" and entry["labels"].get("op") == "draft_add" and entry["labels"].get("outcome") == "ok"
+    )
+
+
+def llm_tokens(report: dict) -> dict:
+    tokens = {"prompt": 0, "completion": 0}
+    for entry in report["counters"].get("weflow_llm_tokens_total", []):
+        tokens[entry["labels"]["kind"]] += int(entry["value"])
+    return tokens
+
+
+def run(args) -> dict:
+    if args.replay:
+        # Every response comes from the cassette, so no stub is started
+        stubs = {}
+        with open(os.path.join(args.replay, BENCH_ENV)) as f:
+            saved = json.load(f)
+        env, args.feeds, args.articles = saved["env"], saved["feeds"], saved["articles"]
+    else:
+        stubs = start_stubs(args)
+        env = provider_env(stubs)
+        if args.record:
+            os.makedirs(args.record, exist_ok=True)
+            with open(os.path.join(args.record, BENCH_ENV), "w") as f:
+                json.dump({"feeds": args.feeds, "articles": args.articles, "env": env}, f, indent=2)
+    workdir = tempfile.mkdtemp(prefix="weflow-bench-")
+    configure_env(env, workdir, args)
+    # main.py loads .env from the working directory and writes articles.json/tmp there
+    os.chdir(workdir)
+    log_path = os.path.join(workdir, "pipeline.log")
+
+    if args.trace_memory:
+        tracemalloc.start()
+    try:
+        import_start = time.perf_counter()
+        from weflow.main import main
+        from weflow.core.metrics import metrics
+        import dashscope
+        dashscope.base_http_api_url = os.environ["DASHSCOPE_HTTP_BASE_URL"]
+        import_seconds = time.perf_counter() - import_start
+
+        start = time.perf_counter()
+        with open(log_path, "w") as log, contextlib.ExitStack() as stack:
+            if not args.verbose:
+                stack.enter_context(contextlib.redirect_stdout(log))
+                stack.enter_context(contextlib.redirect_stderr(log))
+            main()
+        wall = time.perf_counter() - start
+        traced_peak = tracemalloc.get_traced_memory()[1] if args.trace_memory else None
+    finally:
+        if args.trace_memory:
+            tracemalloc.stop()
+        for stub in stubs.values():
+            stub.stop()
+
+    report = metrics.report()
+    stages, providers = summarize_histograms(report)
+    total = args.feeds * args.articles
+    return {
+        "label": args.label or git_label(),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "feeds": args.feeds,
+            "articles_per_feed": args.articles,
+            "paragraphs": args.paragraphs,
+            "full_text_feeds": args.full_text_feeds,
+            "latency": args.latency,
+            "llm_latency": args.llm_latency,
+            "image_latency": args.image_latency,
+            "llm_token_latency": args.llm_token_latency,
+            "error_rate": args.error_rate,
+            "hang": args.hang or [],
+            "async": args.use_async,
+            "crawler": args.crawler,
+            "outbox": args.outbox,
+            "cassette": "record" if args.record else f"replay {args.replay_latency}" if args.replay else None,
+        },
+        "articles": total,
+        "wall_seconds": round(wall, 3),
+        "import_seconds": round(import_seconds, 3),
+        "articles_per_second": round(total / wall, 2) if wall else None,
+        "published": len(stubs["wechat"].drafts) if stubs else published_drafts(report),
+        "notifications": len(stubs["feishu"].cards) if stubs else None,
+        "stages": stages,
+        "providers": providers,
+        "llm_tokens": llm_tokens(report),
+        "crawls_avoided": int(sum(entry["value"] for entry in report["counters"].get("weflow_crawls_avoided_total", []))),
+        "stub_requests": {name: len(stub.requests) for name, stub in stubs.items()},
+        "peak_rss_mb": peak_rss_mb(),
+        "traced_peak_mb": round(traced_peak / 2**20, 1) if traced_peak is not None else None,
+        "log": log_path,
+        "profile": os.path.join(workdir, "profiles") if args.profile else None,
+    }
+
+
+def print_result(result: dict):
+    cfg = result["config"]
+    print(f"== {result['label']}: {cfg['feeds']} feeds x {cfg['articles_per_feed']} articles "
+          f"({'async' if cfg['async'] else 'threads'}, latency {cfg['latency']}s, llm {cfg['llm_latency']}s, errors {cfg['error_rate']:.0%}"
+          + (f", crawler {cfg['crawler']}" if cfg.get("crawler", "firecrawl") != "firecrawl" else "")
+          + (", outbox" if cfg.get("outbox") else "")
+          + (f", cassette {cfg['cassette']}" if cfg.get("cassette") else "") + ")")
+    print(f"wall {result['wall_seconds']}s  throughput {result['articles_per_second']} articles/s  "
+          f"published {result['published']}  notified {result.get('notifications')}  peak RSS {result['peak_rss_mb']} MB"
+          + (f"  traced peak {result['traced_peak_mb']} MB" if result.get("traced_peak_mb") is not None else ""))
+    if result.get("crawls_avoided"):
+        print(f"crawls avoided (full text in feed): {result['crawls_avoided']}")
+    if result.get("llm_tokens"):
+        print(f"llm tokens: {result['llm_tokens']['prompt']} prompt, {result['llm_tokens']['completion']} completion")
+    print("stages:")
+    for stage, seconds in result["stages"].items():
+        print(f"  {stage:<14} {seconds:>9.3f}s")
+    print("provider calls:")
+    for key, stats in sorted(result["providers"].items()):
+        p50 = f"{stats['p50']:.3f}" if stats["p50"] is not None else "-"
+        p95 = f"{stats['p95']:.3f}" if stats["p95"] is not None else "-"
+        print(f"  {key:<22} {stats['calls']:>5} calls  {stats['errors']:>4} errors  p50 {p50}s  p95 {p95}s")
+    print(f"pipeline log: {result['log']}")
+    if result.get("profile"):
+        print(f"profile: {result['profile']}")
+
+
+def compare(paths: list[str]):
+    results = []
+    for path in paths:
+        with open(path) as f:
+            results.append(json.load(f))
+    base = results[0]
+
+    def row(name, getter):
+        values = [getter(r) for r in results]
+        cells = []
+        for i, v in enumerate(values):
+            if v is None:
+                cells.append(f"{'-':>18}")
+                continue
+            delta = f" ({(v - values[0]) / values[0]:+.0%})" if i and values[0] else ""
+            cells.append(f"{v:>10.3f}{delta:<8}")
+        print(f"{name:<22}" + "".join(cells))
+
+    print(f"{'':<22}" + "".join(f"{r['label'][:16]:>18}" for r in results))
+    row("wall_seconds", lambda r: r["wall_seconds"])
+    row("articles/s", lambda r: r["articles_per_second"])
+    row("import_seconds", lambda r: r.get("import_seconds"))
+    row("peak_rss_mb", lambda r: r["peak_rss_mb"])
+    row("traced_peak_mb", lambda r: r.get("traced_peak_mb"))
+    stages = list(dict.fromkeys(s for r in results for s in r["stages"]))
+    for stage in stages:
+        row(f"stage:{stage}", lambda r, s=stage: r["stages"].get(s))
+    if any(r["config"] != base["config"] for r in results[1:]):
+        print("warning: runs used different configurations")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--feeds", type=int, default=4)
+    parser.add_argument("--articles", type=int, default=10, help="articles per feed")
+    parser.add_argument("--paragraphs", type=int, default=8, help="paragraphs per crawled article (~450 bytes each)")
+    parser.add_argument("--full-text-feeds", type=int, default=0, help="feeds that ship each post's full text in content:encoded (no crawl needed)")
+    parser.add_argument("--latency", type=float, default=0.01, help="mean latency (s) of the non-LLM stubs")
+    parser.add_argument("--llm-latency", type=float, default=0.1, help="mean latency (s) of the LLM stub")
+    parser.add_argument("--llm-token-latency", type=float, default=0.0, help="extra LLM stub seconds per 1,000 prompt+completion tokens")
+    parser.add_argument("--image-latency", type=float, default=0.0, help="seconds a Wanx task renders before it succeeds")
+    parser.add_argument("--hang", action="append", choices=["rss", "firecrawl", "llm", "dashscope", "wechat", "feishu"], help="make this stub hang (repeatable); see PROVIDER_TIMEOUTS")
+    parser.add_argument("--record", metavar="DIR", help="record every provider exchange into a cassette at DIR")
+    parser.add_argument("--replay", metavar="DIR", help="serve every provider call from the cassette at DIR instead of the stubs")
+    parser.add_argument("--replay-latency", default="0", help='injected latency per replayed call: seconds, or "x1" for the recorded timing')
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probability each stub answers 500")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--async", dest="use_async", action="store_true", help="run the asyncio pipeline (WEFLOW_ASYNC=1)")
+    parser.add_argument("--crawler", choices=["firecrawl", "local"], default="firecrawl", help="CRAWLER_PROVIDER: the Firecrawl stub, or local extraction of the stub blog's pages")
+    parser.add_argument("--outbox", action="store_true", help="OUTBOX=1: commit drafts and cards to the outbox; the dispatcher sends them")
+    parser.add_argument("--profile", action="store_true", help="also run the stage profiler (folded stacks + hotspots in the run's workdir)")
+    parser.add_argument("--trace-memory", action="store_true", help="also report the tracemalloc peak (slower)")
+    parser.add_argument("--verbose", action="store_true", help="show pipeline output instead of logging it")
+    parser.add_argument("--label", help="name for saved results (default: git commit)")
+    parser.add_argument("--save", action="store_true", help=f"write the result to {os.path.relpath(RESULTS_DIR, ROOT)}/<label>.json")
+    parser.add_argument("--compare", nargs="+", metavar="RESULT_JSON", help="compare saved results instead of running")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args.compare)
+        return
+
+    result = run(args)
+    print_result(result)
+    if args.save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{result['label']}.json")
+        with open(path, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"saved {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,406 @@
+import os
+import re
+import json
+import uuid
+import asyncio
+from urllib.parse import urlparse
+import httpx
+
+from weflow.main import (
+    load_feed_urls,
+    provider_names,
+    feed_mark_store,
+    commit_feed_marks,
+    extract_image_urls,
+    build_clusters,
+    select_digest_articles,
+    release_catalog,
+    report_crawls_avoided,
+    topic_sections,
+    unify_mode,
+    render_digest_html,
+    draft_key,
+    fallback_cover,
+    COVER_PROMPT,
+    HEADER_PROMPT,
+    IMAGE_PROMPT_CLASSES,
+    HEADER_PLACEHOLDER,
+)
+from weflow.core.rss import AsyncGenericRSS, has_full_text, CRAWLS_AVOIDED
+from weflow.core.llm import AsyncLLMAdapter
+from weflow.core.crawler import AsyncCrawlerAdapter
+from weflow.core.image import AsyncImageAdapter
+from weflow.core.imagescreen import ImageScreen
+from weflow.core.vision import AsyncVisionAdapter
+from weflow.core.registry import registry
+from weflow.core.wechat import AsyncWeChatPublisher
+from weflow.core.notifier import AsyncFeishuNotifier
+from weflow.core.metrics import metrics
+from weflow.core.dispatch import outbox
+from weflow.core.budget import budget, ANALYZE_CHARS, SYNTHESIS_CHARS
+from weflow.core.resilience import timeout_for
+
+# The async pipeline mirrors main() step by step, but every provider call is a
+# coroutine, so the number of in-flight requests is bounded by a semaphore
+# (ASYNC_CONCURRENCY) instead of a thread count.
+
+
+async def crawl_article_async(article, crawler, storage, sem):
+    """Step 1: Crawl single article"""
+    try:
+        if has_full_text(article):
+            metrics.inc(CRAWLS_AVOIDED)
+            await asyncio.to_thread(storage.save_article, article)
+            return article
+        async with sem:
+            content = await crawler.crawl(article.url)
+        if not content:
+            return None
+        article.content = content
+        article.status = "crawled"
+        # SQLAlchemy is synchronous; keep it off the event loop
+        await asyncio.to_thread(storage.save_article, article)
+        return article
+    except Exception as e:
+        print(f"Error crawling {article.title}: {e}")
+        return None
+
+
+async def analyze_article_async(article, llm, sem):
+    """Step 2: Analyze topic and relevance"""
+    if not article.content_chars:
+        return None
+    try:
+        async with sem:
+            analysis_json = await llm.analyze(article.content_head(ANALYZE_CHARS))
+        article.analysis = json.loads(analysis_json)
+        return article
+    except Exception as e:
+        print(f"Error analyzing {article.title}: {e}")
+        return None
+
+
+async def synthesize_topic_async(topic, articles, llm, image_gen, vision, wechat, used_images, sem, screen=None):
+    """Step 3: Synthesize report for a topic cluster (Markdown + Multimodal)"""
+    print(f"Synthesizing topic: {topic} ({len(articles)} articles)...")
+
+    articles_data = []
+    image_urls = []
+    for art in articles:
+        # One read of the (possibly spilled) body; the prompt only ever sees its head
+        content = art.content
+        articles_data.append({
+            "title": art.title,
+            "source_name": getattr(art, 'source_name', 'Unknown Source'),
+            "content": content[:SYNTHESIS_CHARS] if content else content,
+            "summary": (art.analysis or {}).get("summary"),
+            "also_reported_by": [src.get("source_name") for src in art.extra_sources]
+        })
+        for img_url in extract_image_urls(content):
+            if img_url.startswith("http") and img_url not in used_images:
+                image_urls.append(img_url)
+
+    # Drop pixels/icons/badges from their headers alone and try the biggest, earliest images first
+    if screen:
+        image_urls = [info.url for info in await asyncio.to_thread(screen.screen, image_urls)]
+
+    # Claiming happens without an await in between, so concurrent topics never claim the same image
+    candidate_urls = []
+    for img_url in image_urls:
+        if len(candidate_urls) >= 5:
+            break
+        if img_url not in used_images:
+            used_images.add(img_url)
+            candidate_urls.append(img_url)
+
+    async def describe(url):
+        async with sem:
+            return url, await vision.describe_image(url)
+
+    image_candidates = [
+        {"url": url, "description": desc}
+        for url, desc in await asyncio.gather(*(describe(u) for u in candidate_urls))
+        if desc
+    ]
+
+    # With no usable original image the AI header is certain: render it while the report is written
+    header_prompt = HEADER_PROMPT.format(topic=topic, title=articles[0].title)
+    header_task = asyncio.create_task(image_gen.generate_image(header_prompt)) if not image_candidates else None
+
+    async with sem:
+        report_md = await llm.synthesize_report(articles_data, topic, images=image_candidates)
+
+    # Upload all embedded images concurrently, then rewrite the links
+    embedded = list(dict.fromkeys(m.group(2) for m in re.finditer(r'!\[(.*?)\]\((http.*?)\)', report_md)))
+
+    async def upload(url):
+        try:
+            async with sem:
+                return url, await wechat.upload_article_image(url)
+        except Exception as e:
+            print(f"Failed to upload embedded image {url}: {e}")
+            return url, None
+
+    uploaded = {url: new for url, new in await asyncio.gather(*(upload(u) for u in embedded)) if new}
+    report_md = re.sub(
+        r'!\[(.*?)\]\((http.*?)\)',
+        lambda m: f"![{m.group(1)}]({uploaded[m.group(2)]})" if m.group(2) in uploaded else m.group(0),
+        report_md
+    )
+
+    # Header: first described image not already used in the body, else an AI illustration
+    wechat_header_url = None
+    for img_obj in image_candidates:
+        if img_obj['url'] in uploaded or img_obj['url'] in report_md:
+            continue
+        try:
+            wechat_header_url = await wechat.upload_article_image(img_obj['url'])
+            if wechat_header_url:
+                print(f"[{topic}] Using original image for header: {img_obj['url']}")
+                break
+        except Exception:
+            continue
+
+    if not wechat_header_url:
+        print(f"[{topic}] Generating AI illustration for header...")
+        try:
+            gen_url = await asyncio.wait_for(header_task or image_gen.generate_image(header_prompt), timeout_for("image"))
+            wechat_header_url = await wechat.upload_article_image(gen_url)
+        except TimeoutError:
+            print(f"[{topic}] Header image not ready in {timeout_for('image'):.0f}s, skipping it")
+            wechat_header_url = HEADER_PLACEHOLDER
+        except Exception as e:
+            print(f"[{topic}] Image generation for header failed: {e}")
+            wechat_header_url = HEADER_PLACEHOLDER
+
+    return report_md, wechat_header_url
+
+
+def create_async_provider(kind: str, name: str, adapter, **kwargs):
+    """The asyncio-native provider if one is registered, else the sync one in a thread adapter."""
+    if registry.has(f"async_{kind}", name):
+        return registry.create(f"async_{kind}", name, **kwargs)
+    return adapter(registry.create(kind, name))
+
+
+def build_async_components(client: httpx.AsyncClient) -> dict:
+    """Async providers where the SDK supports it, adapters around the sync ones otherwise."""
+    names = provider_names()
+    crawler = None
+    if names["crawler"] != "firecrawl" or os.getenv("FIRECRAWL_API_KEY"):
+        # Native async crawlers share the pipeline's connection pool
+        crawler = create_async_provider("crawler", names["crawler"], AsyncCrawlerAdapter, client=client)
+    llm = None
+    if names["llm"] != "deepseek" or os.getenv("DEEPSEEK_API_KEY"):
+        llm = create_async_provider("llm", names["llm"], AsyncLLMAdapter)
+    storage = None
+    if os.getenv("DATABASE_URL"):
+        from weflow.core.storage import PostgresStorage
+        storage = PostgresStorage()
+        if outbox.enabled:
+            outbox.bind(storage.engine)
+
+    image_gen = create_async_provider("image", names["image"], AsyncImageAdapter)
+    image_cache = None
+    if names["image"] != "mock":
+        from weflow.core.image_cache import GeneratedImageCache, AsyncCachedImageProvider
+        image_cache = GeneratedImageCache.from_env()
+        if image_cache:
+            image_gen = AsyncCachedImageProvider(image_gen, image_cache, names["image"], IMAGE_PROMPT_CLASSES)
+
+    return {
+        "crawler": crawler,
+        "llm": llm,
+        "storage": storage,
+        "wechat": AsyncWeChatPublisher(client=client) if os.getenv("WECHAT_APP_ID") else None,
+        "notifier": AsyncFeishuNotifier(client=client),
+        "outbox": outbox if outbox.store else None,
+        "image_gen": image_gen,
+        "image_cache": image_cache,
+        "image_screen": ImageScreen.from_env(),
+        "vision": create_async_provider("vision", names["vision"], AsyncVisionAdapter),
+    }
+
+
+async def wait_for_cover_async(cover_task, header_maps):
+    """Async wait_for_cover: the AI cover's URL, or a topic header if it is not ready within the image timeout"""
+    try:
+        return await asyncio.wait_for(cover_task, timeout_for("image"))
+    except TimeoutError:
+        cover_url = fallback_cover(header_maps)
+        if not cover_url:
+            raise TimeoutError(f"cover not ready in {timeout_for('image'):.0f}s and no header to use instead")
+        print(f"Cover not ready in {timeout_for('image'):.0f}s, using a topic header instead")
+        return cover_url
+
+async def upload_cover_async(cover_url, wechat, image_cache=None):
+    """Async upload_cover: reuses the media_id of a cached cover already on this account"""
+    media_id = await asyncio.to_thread(image_cache.media_id, cover_url, wechat.app_id) if image_cache else None
+    if media_id:
+        print(f"Reusing uploaded cover: {media_id}")
+        return media_id
+    media_id = await wechat.upload_image(cover_url)
+    if image_cache:
+        await asyncio.to_thread(image_cache.remember_media_id, cover_url, wechat.app_id, media_id)
+    return media_id
+
+
+async def run_async():
+    print("Starting WeFlow Service (Async Mode)...")
+    concurrency = int(os.getenv("ASYNC_CONCURRENCY", "64"))
+    sem = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(timeout=120, limits=limits, follow_redirects=True) as client:
+        try:
+            c = build_async_components(client)
+        except Exception as e:
+            print(f"Init failed: {e}")
+            return
+
+        crawler, llm, storage, wechat = c["crawler"], c["llm"], c["storage"], c["wechat"]
+        image_gen, vision, notifier = c["image_gen"], c["vision"], c["notifier"]
+        if not all([crawler, llm, storage, wechat]):
+            print("Missing config (check .env).")
+            return
+
+        try:
+            # 1. Fetch All Articles
+            print("Fetching articles...")
+            mark_store = await asyncio.to_thread(feed_mark_store, storage)
+
+            async def fetch(url):
+                rss = AsyncGenericRSS(url=url, client=client, mark_store=mark_store)
+                try:
+                    arts = await rss.fetch_articles()
+                    for a in arts:
+                        a.source_name = urlparse(url).netloc
+                    return rss, arts
+                except Exception as e:
+                    print(f"Error fetching {url}: {e}")
+                    return rss, []
+
+            with metrics.stage("fetch"):
+                fetched = await asyncio.gather(*(fetch(u) for u in load_feed_urls()))
+            all_articles = [a for _, arts in fetched for a in arts]
+
+            today_str, today_articles, is_fallback = select_digest_articles(all_articles)
+            fetched = release_catalog(fetched, today_articles)
+            del all_articles
+            if not today_articles:
+                print("No articles found even with fallback.")
+                return
+            print(f"Creating pipeline for {len(today_articles)} articles (Fallback: {is_fallback})...")
+
+            # 2. Crawl & Analyze: each article moves on to analysis as soon as its crawl finishes
+            async def crawl_then_analyze(article):
+                crawled = await crawl_article_async(article, crawler, storage, sem)
+                if not crawled or not budget.admit_one(crawled, "analyze"):
+                    return None
+                try:
+                    return await analyze_article_async(crawled, llm, sem)
+                finally:
+                    budget.release(crawled, "analyze")
+
+            to_crawl = budget.admit(today_articles, "crawl")
+            report_crawls_avoided(to_crawl)
+            with metrics.stage("crawl_analyze"):
+                analyzed_articles = [a for a in await asyncio.gather(*(crawl_then_analyze(a) for a in to_crawl)) if a]
+
+            # 3. Clustering
+            with metrics.stage("cluster"):
+                clusters = build_clusters(analyzed_articles)
+            print(f"Formed {len(clusters)} clusters: {list(clusters.keys())}")
+            if not clusters:
+                print("No relevant clusters found.")
+                return
+
+            # 4. Synthesize all topics concurrently; the cover only needs the topic list
+            topic_list = ", ".join(clusters.keys())
+            cover_task = asyncio.create_task(image_gen.generate_image(COVER_PROMPT.format(topics=topic_list)))
+            title_task = asyncio.create_task(llm.generate_digest_title(list(clusters.keys())))
+
+            used_images = set()
+
+            async def synth(topic, arts):
+                try:
+                    report_md, header_url = await synthesize_topic_async(topic, arts, llm, image_gen, vision, wechat, used_images, sem, screen=c["image_screen"])
+                    return topic, report_md, arts, header_url
+                except Exception as e:
+                    print(f"Synthesis failed for {topic}: {e}")
+                    return None
+
+            with metrics.stage("synthesize"):
+                results = [r for r in await asyncio.gather(*(synth(t, a) for t, a in clusters.items())) if r]
+            if not results:
+                print("No sections generated.")
+                cover_task.cancel()
+                title_task.cancel()
+                return
+
+            md_segments = [(t, md, arts) for t, md, arts, _ in results]
+            header_maps = {t: h for t, _, _, h in results}
+            sections, all_source_articles = topic_sections(md_segments, header_maps)
+
+            print("Unifying daily digest with LLM...")
+            with metrics.stage("unify"):
+                if unify_mode() == "full":
+                    unified_md = await llm.unify_daily_digest("\n\n".join(sections))
+                else:
+                    unified_md = await llm.unify_sections(sections)
+            author_name = os.getenv("WECHAT_AUTHOR", "")
+            with metrics.stage("format"):
+                full_html = render_digest_html(unified_md, all_source_articles, today_str, author=author_name)
+
+            print("Generating cover...")
+            try:
+                with metrics.stage("cover"):
+                    media_id = await upload_cover_async(await wait_for_cover_async(cover_task, header_maps), wechat, c["image_cache"])
+                try:
+                    title = f"{await title_task} | WeFlow Daily"
+                except Exception:
+                    title = f"WeFlow Daily - {today_str}"
+
+                draft = dict(
+                    title=title,
+                    summary=f"Topics: {topic_list}",
+                    media_id=media_id,
+                    content=full_html,
+                    source_url="",
+                    author=author_name
+                )
+                if c["outbox"]:
+                    # The dispatcher thread pushes with its own (threaded) publisher
+                    with metrics.stage("publish"):
+                        notify = {"webhook_url": notifier.webhook_url, "title": title, "summary": f"Topics: {topic_list}"}
+                        res = await asyncio.to_thread(
+                            c["outbox"].enqueue_draft,
+                            draft_key(wechat.app_id, today_str, "WeFlow Daily", clusters),
+                            wechat.app_id, draft, notify, f"{today_str}-{uuid.uuid4().hex[:8]}",
+                        )
+                    print(f"Draft queued: {res}")
+                    await asyncio.to_thread(commit_feed_marks, fetched, analyzed_articles)
+                    return
+
+                with metrics.stage("publish"):
+                    res = await wechat.push_draft(**draft)
+                print(f"Draft pushed: {res}")
+
+                if res:
+                    await asyncio.to_thread(commit_feed_marks, fetched, analyzed_articles)
+                    with metrics.stage("notify"):
+                        draft_info = await wechat.get_draft(res) if res != "Success" else None
+                        article_url = draft_info.get("url") if draft_info else "https://mp.weixin.qq.com"
+                        await notifier.send_card(title=title, summary=f"Topics: {topic_list}", article_url=article_url)
+            except Exception as e:
+                print(f"Push failed: {e}")
+        finally:
+            await llm.aclose()
+
+
+def main_async():
+    asyncio.run(run_async())
+
+
+if __name__ == "__main__":
+    main_async()
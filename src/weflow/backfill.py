@@ -0,0 +1,190 @@
+"""
+Rebuilds past digests from articles already crawled into storage.
+
+    python -m weflow.backfill --from 2026-09-01 --to 2026-09-30
+    python -m weflow.backfill --from 2026-09-01 --to 2026-09-07 --parallel 2 --out backfill/prompt-v2
+
+Each day's stored articles are analyzed, clustered and synthesized again (so
+new prompts and topic maps apply), several days at a time. The LLM, image
+and vision providers, the image caches and the run budget (RUN_MAX_*) are
+shared by all days. Digests are written to --out as <day>.html plus
+<day>.json; nothing is pushed to WeChat and nobody is notified.
+"""
+import os
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from weflow.main import (
+    build_components,
+    analyze_article,
+    build_clusters,
+    publish_clusters,
+)
+from weflow.core.vision import SharedVisionProvider
+from weflow.core.metrics import metrics
+from weflow.core.budget import budget
+from weflow.core.cassette import cassette
+from weflow.core.spill import content_store
+from weflow.core.profiling import profiler
+
+BACKFILL_DAYS = "weflow_backfill_days_total"
+
+
+class LocalDrafts:
+    """
+    Stands in for WeChatPublisher while backfilling one day: images keep
+    their original URLs (or generated file paths) and the draft is written
+    to `directory` instead of pushed.
+    """
+    app_id = "local"
+
+    def __init__(self, directory: str, day: str):
+        self.directory = directory
+        self.day = day
+
+    def upload_article_image(self, image_url: str) -> str:
+        return image_url
+
+    def upload_image(self, image_url: str) -> str:
+        return image_url
+
+    def push_draft(self, title, summary, media_id, content, source_url="", author="") -> str:
+        path = os.path.join(self.directory, f"{self.day}.html")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        meta = {"day": self.day, "title": title, "summary": summary, "cover": media_id, "author": author}
+        with open(os.path.join(self.directory, f"{self.day}.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2, ensure_ascii=False)
+        return path
+
+    def get_draft(self, path: str) -> dict:
+        return {"url": f"file://{os.path.abspath(path)}"}
+
+
+class SilentNotifier:
+    def send_card(self, title: str, summary: str, article_url: str):
+        print(f"Digest written: {title} ({article_url})")
+
+
+def days_between(start: date, end: date) -> list[date]:
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def backfill_day(day: date, c: dict, out_dir: str) -> dict:
+    """Analyze, cluster and synthesize one day's stored articles; returns the day's outcome"""
+    day_str = day.strftime("%Y-%m-%d")
+    reason = budget.exhausted()
+    if reason:
+        return {"day": day_str, "status": f"skipped ({reason})"}
+
+    articles = c["storage"].articles_between(day, day)
+    if not articles:
+        return {"day": day_str, "status": "no articles"}
+    print(f"[{day_str}] Backfilling {len(articles)} stored articles...")
+
+    analyzed_articles = []
+    with metrics.stage("analyze"), ThreadPoolExecutor(max_workers=5) as executor:
+        futures = [executor.submit(analyze_article, a, c["llm"]) for a in budget.admit(articles, "analyze")]
+        for f in as_completed(futures):
+            res = f.result()
+            if res: analyzed_articles.append(res)
+    # Back to stored order, so the same data gives the same digest
+    order = {a.url: i for i, a in enumerate(articles)}
+    analyzed_articles.sort(key=lambda a: order[a.url])
+
+    with metrics.stage("cluster"):
+        clusters = build_clusters(analyzed_articles)
+    day_c = dict(c, wechat=LocalDrafts(out_dir, day_str), notifier=SilentNotifier(), outbox=None)
+    path = publish_clusters(clusters, day_c, day_str)
+    return {
+        "day": day_str,
+        "status": "written" if path else "no digest",
+        "articles": len(articles),
+        "analyzed": len(analyzed_articles),
+        "topics": list(clusters.keys()),
+        "path": path,
+    }
+
+
+def run_backfill(start: date, end: date, out_dir: str, parallel: int = 4) -> Optional[dict]:
+    """Backfills every day from `start` through `end`, `parallel` days at a time; returns the run summary"""
+    c = build_components(require=("llm", "storage"))
+    if c is None:
+        return None
+    os.makedirs(out_dir, exist_ok=True)
+    # Shared by every day: image descriptions once per URL. Covers are not
+    # real uploads here, so they are kept out of the cache's media ids.
+    c = dict(c, vision=SharedVisionProvider(c["vision"]), image_cache=None)
+
+    days = days_between(start, end)
+    print(f"Backfilling {len(days)} days ({start} to {end}), {parallel} at a time, into {out_dir}...")
+    started = time.monotonic()
+    results = []
+    with ThreadPoolExecutor(max_workers=parallel, thread_name_prefix="weflow-backfill") as executor:
+        futures = {executor.submit(backfill_day, day, c, out_dir): day for day in days}
+        for f in as_completed(futures):
+            day = futures[f].strftime("%Y-%m-%d")
+            try:
+                result = f.result()
+            except Exception as e:
+                print(f"[{day}] Backfill failed: {e}")
+                result = {"day": day, "status": f"failed ({e})"}
+            metrics.inc(BACKFILL_DAYS, status=result["status"].split(" ")[0])
+            results.append(result)
+            print(f"[{day}] {result['status']}")
+
+    elapsed = time.monotonic() - started
+    written = sum(1 for r in results if r["status"] == "written")
+    summary = {
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "days": len(days),
+        "written": written,
+        "seconds": round(elapsed, 1),
+        "days_per_hour": round(len(days) / elapsed * 3600, 1) if elapsed else None,
+        "written_per_hour": round(written / elapsed * 3600, 1) if elapsed else None,
+        "results": sorted(results, key=lambda r: r["day"]),
+    }
+    with open(os.path.join(out_dir, "backfill.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2, ensure_ascii=False)
+    print(
+        f"Backfill: {len(days)} days in {elapsed:.0f}s, {written} digests written; "
+        f"{summary['days_per_hour']} days/hour ({summary['written_per_hour']} digests/hour)"
+    )
+    return summary
+
+
+def parse_day(value: str) -> date:
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--from", dest="start", type=parse_day, required=True, help="first day (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="end", type=parse_day, help="last day, inclusive (default: --from)")
+    parser.add_argument("--parallel", type=int, default=int(os.getenv("BACKFILL_PARALLEL", "4")), help="days in flight at once (BACKFILL_PARALLEL, default: 4)")
+    parser.add_argument("--out", default=os.getenv("BACKFILL_DIR", "backfill"), help="output directory (BACKFILL_DIR, default: backfill)")
+    args = parser.parse_args()
+    end = args.end or args.start
+    if end < args.start:
+        parser.error("--to is before --from")
+
+    metrics.configure_from_env()
+    budget.configure_from_env()
+    cassette.configure_from_env()
+    content_store.configure_from_env()
+    profiler.configure_from_env()
+    try:
+        run_backfill(args.start, end, args.out, parallel=max(1, args.parallel))
+    finally:
+        budget.report()
+        metrics.export()
+        profiler.export()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import os
+import time
+import uuid
+import signal
+import threading
+
+from weflow.main import (
+    build_components,
+    extract_image_urls,
+    feed_mark_store,
+    fetch_feeds,
+    select_digest_articles,
+    release_catalog,
+    report_crawls_avoided,
+    commit_feed_marks,
+    publish_all,
+)
+from weflow.core.models import Article
+from weflow.core.vision import VisionProvider
+from weflow.core.metrics import metrics
+from weflow.core.budget import budget
+from weflow.core.cassette import cassette
+from weflow.core.spill import content_store
+from weflow.core.profiling import profiler
+from weflow.core.dispatch import outbox
+from weflow.core.queue import JobQueue
+
+# Distributed run: the coordinator fetches feeds and enqueues one crawl job per
+# article; workers on any host (python -m weflow.worker) crawl, then analyze,
+# then describe images. Once a batch drains, the coordinator assembles and
+# publishes the digest exactly as the single-process pipeline does.
+
+
+class PrecomputedVision(VisionProvider):
+    """Serves image descriptions produced by vision jobs, falling back to a live provider."""
+    def __init__(self, descriptions: dict, fallback: VisionProvider):
+        self.descriptions = descriptions
+        self.fallback = fallback
+
+    def describe_image(self, image_url: str) -> str:
+        if image_url in self.descriptions:
+            return self.descriptions[image_url]
+        return self.fallback.describe_image(image_url)
+
+
+def wait_for_batch(queue: JobQueue, batch_id: str, timeout: float, poll_interval: float = 2.0) -> bool:
+    """Blocks until no job in the batch is queued or running; False on timeout."""
+    deadline = time.monotonic() + timeout
+    last = None
+    while True:
+        counts = queue.counts(batch_id)
+        if counts != last:
+            print(f"Batch {batch_id}: " + ", ".join(f"{k}={v}" for k, v in sorted(counts.items())))
+            last = counts
+        if not counts.get("queued") and not counts.get("running"):
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(poll_interval)
+
+
+def image_jobs(analyzed_articles, screen=None, per_article: int = 2) -> list[dict]:
+    """Vision payloads for the best images of each recommended article (what synthesis will look at)."""
+    urls = []
+    for art in analyzed_articles:
+        if not (art.analysis or {}).get("recommended"):
+            continue
+        imgs = [u for u in extract_image_urls(art.content) if u.startswith("http")]
+        if screen:
+            imgs = [info.url for info in screen.screen(imgs)]
+        urls.extend(imgs[:per_article])
+    return [{"url": u} for u in dict.fromkeys(urls)]
+
+
+def run_coordinator(c: dict, queue: JobQueue, timeout: float = 3600, local_workers: int = 0, poll_interval: float = 2.0):
+    print("Starting WeFlow coordinator...")
+    storage = c["storage"]
+
+    all_articles, fetched = fetch_feeds(feed_mark_store(storage))
+    today_str, today_articles, is_fallback = select_digest_articles(all_articles)
+    fetched = release_catalog(fetched, today_articles)
+    del all_articles
+    if not today_articles:
+        print("No articles found even with fallback.")
+        return
+
+    # Workers run in other processes, so the coordinator's budget governs admission, not spend
+    admitted = budget.admit(today_articles, "crawl")
+    report_crawls_avoided(admitted)
+    batch_id = f"{today_str}-{uuid.uuid4().hex[:8]}"
+    queue.enqueue_many("crawl", [{"article": a.model_dump(mode="json")} for a in admitted], batch_id)
+    print(f"Enqueued {len(admitted)} crawl jobs as batch {batch_id} (Fallback: {is_fallback})")
+
+    # Optional in-process workers, for single-host runs and SQLite testing
+    worker = None
+    if local_workers:
+        from weflow.worker import Worker
+        worker = Worker(queue, c, concurrency=local_workers, poll_interval=poll_interval)
+        threading.Thread(target=worker.run, name="weflow-local-worker", daemon=True).start()
+
+    try:
+        with metrics.stage("queue_analyze"):
+            drained = wait_for_batch(queue, batch_id, timeout, poll_interval)
+        analyzed_articles = [Article(**r["article"]) for r in queue.results(batch_id, "analyze")]
+
+        # Image descriptions are independent per image, so they fan out too
+        payloads = image_jobs(analyzed_articles, c.get("image_screen"))
+        if payloads and drained:
+            queue.enqueue_many("vision", payloads, batch_id)
+            with metrics.stage("queue_vision"):
+                drained = wait_for_batch(queue, batch_id, timeout, poll_interval)
+        descriptions = {r["url"]: r["description"] for r in queue.results(batch_id, "vision")}
+    finally:
+        if worker:
+            worker.stop()
+
+    dead = queue.dead_letters(batch_id)
+    if dead:
+        print(f"{len(dead)} jobs dead-lettered in batch {batch_id}:")
+        for job in dead:
+            print(f"  #{job['id']} {job['kind']}: {job['error']}")
+    if not drained:
+        print(f"Batch {batch_id} did not finish within {timeout:.0f}s; publishing what is done.")
+    print(f"{len(analyzed_articles)} analyzed articles, {len(descriptions)} image descriptions from workers")
+
+    digest_c = dict(c, vision=PrecomputedVision(descriptions, c["vision"]))
+    # Marks only move when every job settled, so unfinished entries are fetched again
+    if publish_all(analyzed_articles, digest_c, today_str) and drained:
+        commit_feed_marks(fetched, analyzed_articles)
+
+
+def _interrupt(*_):
+    raise KeyboardInterrupt
+
+
+def main():
+    metrics.configure_from_env()
+    budget.configure_from_env()
+    cassette.configure_from_env()
+    content_store.configure_from_env()
+    profiler.configure_from_env()
+    outbox.configure_from_env()
+    try:
+        c = build_components()
+        if c is None:
+            return
+        queue = JobQueue(engine=c["storage"].engine)
+        # SIGTERM unwinds like Ctrl-C, so local workers stop and metrics are exported
+        signal.signal(signal.SIGTERM, _interrupt)
+        run_coordinator(
+            c,
+            queue,
+            timeout=float(os.getenv("QUEUE_BATCH_TIMEOUT", "3600")),
+            local_workers=int(os.getenv("COORDINATOR_LOCAL_WORKERS", "0")),
+            poll_interval=float(os.getenv("QUEUE_POLL_SECONDS", "2")),
+        )
+    finally:
+        outbox.close()
+        budget.report()
+        metrics.export()
+        profiler.export()
+
+
+if __name__ == "__main__":
+    main()
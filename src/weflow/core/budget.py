@@ -0,0 +1,252 @@
+import os
+import json
+import time
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+# Rough per-article costs used for admission; actual spend is charged as it happens
+CHARS_PER_TOKEN = 3            # mixed Chinese/English Markdown
+UNCRAWLED_TOKENS = 2000        # prompt tokens assumed per call before the content is known
+RECOMMEND_RATE = 0.5           # share of not yet analyzed articles expected to reach synthesis
+PROMPT_OVERHEAD_TOKENS = 500   # instructions + answer per analysis call
+ANALYZE_CHARS = 15000          # analysis prompt cut
+SYNTHESIS_CHARS = 8000         # synthesis prompt cut
+SYNTHESIS_CALLS = 3            # vision, upload and (share of) LLM calls per synthesized article
+
+# Stages in pipeline order; an article admitted to one stage is expected to go through the rest
+STAGES = ("crawl", "analyze", "synthesize")
+
+DROPPED_TOTAL = "weflow_budget_dropped_total"
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """'{"a.com": 2}' or "a.com=2,b.org=0.5" -> {source: weight}"""
+    spec = (spec or "").strip()
+    if spec.startswith("{"):
+        return {k: float(v) for k, v in json.loads(spec).items()}
+    weights = {}
+    for part in spec.split(","):
+        if "=" in part:
+            name, value = part.split("=", 1)
+            weights[name.strip()] = float(value)
+    return weights
+
+
+class RunBudget:
+    """
+    Token, API-call and wall-clock budget for one run, plus priority admission.
+
+    Spend is charged where it happens (LLM usage and provider calls go
+    through `metrics`, which forwards them here). Before each stage the
+    pipeline asks `admit()` which articles may go on: they are ranked by
+    source weight, recency and (once analyzed) the analysis verdict, and
+    admitted best first while the estimated cost of taking them through the
+    remaining stages still fits. The top `min_articles` are always admitted
+    so a tight budget still yields a digest. Everything dropped is kept with
+    its reason for the end-of-run report.
+
+    Streaming admission (`admit_one`) reserves each admitted article's
+    estimate until `release()`, so articles admitted concurrently can't
+    all fit the same remaining budget.
+    """
+    def __init__(
+        self,
+        max_tokens: Optional[int] = None,
+        max_calls: Optional[int] = None,
+        max_seconds: Optional[float] = None,
+        source_weights: Optional[Dict[str, float]] = None,
+        half_life_hours: float = 24.0,
+        min_articles: int = 3,
+    ):
+        self.max_tokens = max_tokens
+        self.max_calls = max_calls
+        self.max_seconds = max_seconds
+        self.source_weights = source_weights or {}
+        self.half_life_hours = half_life_hours
+        self.min_articles = min_articles
+        self._lock = threading.Lock()
+        self.reset()
+
+    def configure_from_env(self):
+        """RUN_MAX_TOKENS, RUN_MAX_CALLS, RUN_MAX_SECONDS (unset = unlimited), SOURCE_WEIGHTS, RECENCY_HALF_LIFE_HOURS, RUN_MIN_ARTICLES"""
+        self.max_tokens = int(os.environ["RUN_MAX_TOKENS"]) if os.getenv("RUN_MAX_TOKENS") else None
+        self.max_calls = int(os.environ["RUN_MAX_CALLS"]) if os.getenv("RUN_MAX_CALLS") else None
+        self.max_seconds = float(os.environ["RUN_MAX_SECONDS"]) if os.getenv("RUN_MAX_SECONDS") else None
+        self.source_weights = parse_weights(os.getenv("SOURCE_WEIGHTS", ""))
+        self.half_life_hours = float(os.getenv("RECENCY_HALF_LIFE_HOURS", "24"))
+        self.min_articles = int(os.getenv("RUN_MIN_ARTICLES", "3"))
+        self.reset()
+
+    def reset(self):
+        """Starts a new run: the clock restarts and spend and drops are cleared."""
+        with self._lock:
+            self.started = time.monotonic()
+            self.tokens = 0
+            self.calls = 0
+            self.reserved_tokens = 0
+            self.reserved_calls = 0
+            self._reservations = {}  # (id(article), stage) -> (tokens, calls) admitted but not released
+            self.dropped = []  # (stage, reason, title, url)
+
+    # --- Spend ---
+
+    def charge(self, tokens: int = 0, calls: int = 0):
+        with self._lock:
+            self.tokens += tokens
+            self.calls += calls
+
+    def time_left(self) -> Optional[float]:
+        """Seconds until the run's wall-clock budget is spent; None when unlimited."""
+        if self.max_seconds is None:
+            return None
+        return self.max_seconds - (time.monotonic() - self.started)
+
+    def exhausted(self) -> Optional[str]:
+        """Which budget is already used up (time, token, call); None while there is room."""
+        return self._over(0, 0)
+
+    @property
+    def limited(self) -> bool:
+        return any(v is not None for v in (self.max_tokens, self.max_calls, self.max_seconds))
+
+    # --- Scoring ---
+
+    def source_weight(self, article) -> float:
+        for key in (article.source_name, article.url):
+            if key in self.source_weights:
+                return self.source_weights[key]
+        return self.source_weights.get("*", 1.0)
+
+    def recency(self, article) -> float:
+        """1.0 for a fresh entry, halving every `half_life_hours`; 0.5 when the date is unknown."""
+        published = article.published_at
+        if published is None and article.published_date:
+            try:
+                published = datetime.strptime(article.published_date, "%Y-%m-%d")
+            except ValueError:
+                published = None
+        if published is None:
+            return 0.5
+        if published.tzinfo is None:
+            published = published.replace(tzinfo=timezone.utc)
+        age_hours = max(0.0, (datetime.now(timezone.utc) - published).total_seconds() / 3600)
+        return 0.5 ** (age_hours / self.half_life_hours)
+
+    def score(self, article) -> float:
+        score = self.source_weight(article) * self.recency(article)
+        analysis = article.analysis or {}
+        if analysis:
+            # Analyzed: recommended articles first, the rest only if there is room
+            score *= 1.0 if analysis.get("recommended") else 0.1
+        return score
+
+    def rank(self, articles: list) -> list:
+        """Best first; ties keep their original (feed) order."""
+        return sorted(articles, key=self.score, reverse=True)
+
+    # --- Admission ---
+
+    @staticmethod
+    def estimate(article, stage: str) -> tuple[int, int]:
+        """(tokens, calls) to take one article from `stage` through the rest of the pipeline."""
+        content_chars = article.content_chars or None
+        tokens = calls = 0
+        stages = STAGES[STAGES.index(stage):]
+        if "crawl" in stages and content_chars is None:  # full text from the feed needs no crawl
+            calls += 1
+        if "analyze" in stages:
+            calls += 1
+            tokens += PROMPT_OVERHEAD_TOKENS + (UNCRAWLED_TOKENS if content_chars is None else min(content_chars, ANALYZE_CHARS) // CHARS_PER_TOKEN)
+        if "synthesize" in stages:
+            share = 1.0 if article.analysis else RECOMMEND_RATE
+            calls += share * SYNTHESIS_CALLS
+            tokens += share * (UNCRAWLED_TOKENS if content_chars is None else min(content_chars, SYNTHESIS_CHARS) // CHARS_PER_TOKEN)
+        return int(tokens), int(round(calls))
+
+    def _over(self, tokens: int, calls: int) -> Optional[str]:
+        """Why committing this much more spend would break the budget; None if it fits."""
+        left = self.time_left()
+        if left is not None and left <= 0:
+            return "time budget"
+        if self.max_tokens is not None and self.tokens + self.reserved_tokens + tokens > self.max_tokens:
+            return "token budget"
+        if self.max_calls is not None and self.calls + self.reserved_calls + calls > self.max_calls:
+            return "call budget"
+        return None
+
+    def _drop(self, article, stage: str, reason: str):
+        from .metrics import metrics
+        with self._lock:
+            self.dropped.append((stage, reason, article.title, article.url))
+        metrics.inc(DROPPED_TOTAL, stage=stage, reason=reason)
+        print(f"Budget: dropping from {stage} ({reason}): {article.title}")
+
+    def admit(self, articles: list, stage: str) -> list:
+        """The articles that may enter `stage`, in their original order."""
+        if not articles:
+            return []
+        committed_tokens = committed_calls = 0
+        admitted = set()
+        for i, art in enumerate(self.rank(articles)):
+            if self.source_weight(art) <= 0:
+                self._drop(art, stage, "source weight 0")
+                continue
+            tokens, calls = self.estimate(art, stage)
+            reason = self._over(committed_tokens + tokens, committed_calls + calls)
+            if reason and len(admitted) >= self.min_articles:
+                self._drop(art, stage, reason)
+                continue
+            committed_tokens += tokens
+            committed_calls += calls
+            admitted.add(id(art))
+        return [a for a in articles if id(a) in admitted]
+
+    def admit_one(self, article, stage: str) -> bool:
+        """
+        Streaming admission (no ranking): whether one more article still fits
+        next to what is spent and reserved. An admitted article's estimate
+        stays reserved until `release(article, stage)`.
+        """
+        tokens, calls = self.estimate(article, stage)
+        if self.source_weight(article) <= 0:
+            reason = "source weight 0"
+        else:
+            with self._lock:
+                reason = self._over(tokens, calls)
+                if reason is None:
+                    self._reservations[(id(article), stage)] = (tokens, calls)
+                    self.reserved_tokens += tokens
+                    self.reserved_calls += calls
+        if reason:
+            self._drop(article, stage, reason)
+        return reason is None
+
+    def release(self, article, stage: str):
+        """Frees an `admit_one` reservation once the article's work is done (its actual spend is charged by then)."""
+        with self._lock:
+            tokens, calls = self._reservations.pop((id(article), stage), (0, 0))
+            self.reserved_tokens -= tokens
+            self.reserved_calls -= calls
+
+    # --- Report ---
+
+    def report(self):
+        """Prints the run's spend against its limits and what was dropped, and why."""
+        if not self.limited and not self.dropped:
+            return
+        elapsed = time.monotonic() - self.started
+        print(
+            f"Budget: {self.tokens} tokens{f' of {self.max_tokens}' if self.max_tokens is not None else ''}, "
+            f"{self.calls} calls{f' of {self.max_calls}' if self.max_calls is not None else ''}, "
+            f"{elapsed:.0f}s{f' of {self.max_seconds:g}s' if self.max_seconds is not None else ''}"
+        )
+        if self.dropped:
+            counts = Counter((stage, reason) for stage, reason, _, _ in self.dropped)
+            print(f"Budget: dropped {len(self.dropped)} articles: " + ", ".join(f"{n} at {stage} ({reason})" for (stage, reason), n in counts.items()))
+            for stage, reason, title, url in self.dropped:
+                print(f"  - [{stage}] {title} <{url}> ({reason})")
+
+
+budget = RunBudget()
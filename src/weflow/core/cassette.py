@@ -0,0 +1,496 @@
+import os
+import re
+import json
+import time
+import zlib
+import asyncio
+import hashlib
+import importlib
+import threading
+from http import HTTPStatus
+from typing import Dict, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from .metrics import metrics
+
+# Record/replay of every outbound HTTP call. The hooks sit in the transports of
+# requests, httpx and aiohttp, which between them carry all provider traffic:
+# feeds, Firecrawl, the OpenAI SDK, DashScope (sync and async), WeChat, Feishu
+# and image downloads.
+#
+# Store layout (CASSETTE_DIR):
+#   index.jsonl          one line per recorded exchange
+#   blobs/ab/abcd...     zlib-compressed bodies, named by the SHA-256 of their bytes
+
+CASSETTE_TOTAL = "weflow_cassette_total"
+
+# Query parameters whose values are credentials; kept out of the store and the match key
+SECRET_PARAMS = {"secret", "access_token", "key", "api_key", "apikey", "token", "sign"}
+# JSON body fields holding credentials (e.g. WeChat's cgi-bin/token reply); redacted in stored bodies
+SECRET_FIELDS = SECRET_PARAMS | {"refresh_token", "tenant_access_token", "app_access_token", "appsecret", "app_secret", "client_secret", "password"}
+# Response headers that describe the wire encoding, not the (already decoded) body we keep
+WIRE_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "keep-alive"}
+
+HTTPX_MODULES = ("httpx", "httpx2")
+
+_BOUNDARY = re.compile(r'boundary="?([^";]+)"?')
+_FILENAME = re.compile(rb'filename="[^"]*"')
+
+
+class CassetteMiss(Exception):
+    """Replay found no recording for a request."""
+
+
+def redact_url(url: str) -> str:
+    parts = urlsplit(str(url))
+    if not parts.query:
+        return str(url)
+    query = [(k, "REDACTED" if k.lower() in SECRET_PARAMS else v) for k, v in parse_qsl(parts.query, keep_blank_values=True)]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def _redact_fields(value):
+    if isinstance(value, dict):
+        return {k: "REDACTED" if k.lower() in SECRET_FIELDS and isinstance(v, str) else _redact_fields(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_redact_fields(v) for v in value]
+    return value
+
+
+def redact_body(body: bytes) -> bytes:
+    """A JSON body with its credential fields replaced; anything else (or nothing to redact) unchanged."""
+    if not body or body[:1] not in (b"{", b"["):
+        return body
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return body
+    redacted = _redact_fields(data)
+    if redacted == data:
+        return body
+    return json.dumps(redacted, ensure_ascii=False).encode("utf-8")
+
+
+def request_key(method: str, url: str, body: bytes, content_type: str = "", range_header: str = "") -> str:
+    """Content address of a request: method, redacted URL, Range and body (multipart boundaries and file names normalized)."""
+    match = _BOUNDARY.search(content_type or "")
+    if match and body:
+        # Boundaries are random, and uploads are named after temp files; the file bytes are what matter
+        body = _FILENAME.sub(b'filename="FILE"', body.replace(match.group(1).encode(), b"BOUNDARY"))
+    h = hashlib.sha256(f"{method.upper()} {redact_url(url)}\n{range_header or ''}\n".encode())
+    h.update(body or b"")
+    return h.hexdigest()
+
+
+def _body_bytes(body) -> bytes:
+    if body is None:
+        return b""
+    if isinstance(body, str):
+        return body.encode("utf-8")
+    if isinstance(body, (bytes, bytearray, memoryview)):
+        return bytes(body)
+    return b""  # streamed/generator bodies are not replayable content; match on the URL
+
+
+def _stored_headers(headers) -> Dict[str, str]:
+    return {k: v for k, v in headers.items() if k.lower() not in WIRE_HEADERS}
+
+
+class Cassette:
+    """
+    Records provider HTTP exchanges into a content-addressed store, or serves
+    them back.
+
+    Replay looks a request up by its content key first; identical requests
+    get their recordings in recorded order (the last one repeats). A request
+    whose body changed (a prompt with a different date, say) falls back to
+    the next recording for the same method and URL. Anything else raises
+    CassetteMiss. `latency` injects a fixed delay per replayed call, or with
+    `latency_scale` a multiple of the recorded duration.
+
+    Recording passes httpx bodies through as they stream in, so a caller
+    that closes a stream early (a cancelled hedge) still cuts the
+    connection; what was read is recorded. Credentials in URLs and JSON
+    bodies are redacted before anything is stored.
+    """
+    def __init__(self, path: str = "cassettes", mode: Optional[str] = None, latency: float = 0.0, latency_scale: float = 0.0):
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self._by_key: Dict[str, List[dict]] = {}
+        self._by_route: Dict[str, List[dict]] = {}
+        self._served: Dict[str, int] = {}
+
+    def configure_from_env(self):
+        """CASSETTE_MODE=record|replay (unset = off), CASSETTE_DIR, CASSETTE_LATENCY (seconds, or "x1" for the recorded timing)"""
+        mode = os.getenv("CASSETTE_MODE", "").strip().lower() or None
+        if mode not in (None, "record", "replay"):
+            raise ValueError(f"CASSETTE_MODE must be record or replay, not {mode!r}")
+        self.path = os.getenv("CASSETTE_DIR", "cassettes")
+        latency = os.getenv("CASSETTE_LATENCY", "0").strip()
+        if latency.startswith("x"):
+            self.latency, self.latency_scale = 0.0, float(latency[1:])
+        else:
+            self.latency, self.latency_scale = float(latency), 0.0
+        self.mode = mode
+        if mode:
+            self.load()
+            install(self)
+            print(f"Cassette: {mode} {self.path} ({sum(len(v) for v in self._by_key.values())} recorded exchanges)")
+        else:
+            uninstall()
+
+    # --- Store ---
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.path, "blobs", digest[:2], digest)
+
+    def _put_blob(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(zlib.compress(data, 6))
+            os.replace(tmp, path)
+        return digest
+
+    def _get_blob(self, digest: str) -> bytes:
+        with open(self._blob_path(digest), "rb") as f:
+            return zlib.decompress(f.read())
+
+    def load(self):
+        """Reads the index, so replay can serve it and record appends to it."""
+        with self._lock:
+            self._by_key, self._by_route, self._served = {}, {}, {}
+            index = os.path.join(self.path, "index.jsonl")
+            if not os.path.exists(index):
+                return
+            with open(index, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._by_key.setdefault(entry["key"], []).append(entry)
+                        self._by_route.setdefault(entry["route"], []).append(entry)
+
+    def record(self, key: str, method: str, url: str, request_body: bytes, status: int, headers, body: bytes, seconds: float):
+        url = redact_url(url)
+        entry = {
+            "key": key,
+            "route": f"{method.upper()} {url}",
+            "method": method.upper(),
+            "url": url,
+            "request": self._put_blob(redact_body(request_body)) if request_body else None,
+            "status": status,
+            "headers": _stored_headers(headers),
+            "body": self._put_blob(redact_body(body)),
+            "seconds": round(seconds, 4),
+        }
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            with open(os.path.join(self.path, "index.jsonl"), "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._by_key.setdefault(key, []).append(entry)
+            self._by_route.setdefault(entry["route"], []).append(entry)
+        metrics.inc(CASSETTE_TOTAL, mode="record", result="recorded")
+
+    def _next(self, table: Dict[str, List[dict]], name: str) -> Optional[dict]:
+        entries = table.get(name)
+        if not entries:
+            return None
+        i = self._served.get(name, 0)
+        self._served[name] = i + 1
+        return entries[min(i, len(entries) - 1)]
+
+    def lookup(self, key: str, method: str, url: str):
+        """(status, headers, body, delay) for a replayed request; raises CassetteMiss."""
+        route = f"{method.upper()} {redact_url(url)}"
+        with self._lock:
+            entry, result = self._next(self._by_key, key), "hit"
+            if entry is None:
+                entry, result = self._next(self._by_route, route), "fallback"
+        if entry is None:
+            metrics.inc(CASSETTE_TOTAL, mode="replay", result="miss")
+            raise CassetteMiss(f"no recording for {route}")
+        metrics.inc(CASSETTE_TOTAL, mode="replay", result=result)
+        delay = self.latency + self.latency_scale * entry["seconds"]
+        return entry["status"], entry["headers"], self._get_blob(entry["body"]), delay
+
+
+cassette = Cassette()
+
+
+# --- Transport hooks ---
+
+_originals = {}
+
+
+def install(c: Cassette):
+    """Routes requests, httpx and aiohttp traffic through `c`."""
+    import requests
+
+    if _originals:
+        return
+    _originals["requests"] = requests.adapters.HTTPAdapter.send
+
+    def requests_send(adapter, request, **kwargs):
+        body = _body_bytes(request.body)
+        key = request_key(request.method, request.url, body, request.headers.get("Content-Type", ""), request.headers.get("Range", ""))
+        if c.mode == "replay":
+            status, headers, content, delay = c.lookup(key, request.method, request.url)
+            if delay:
+                time.sleep(delay)
+            return _requests_response(request, status, headers, content)
+        start = time.monotonic()
+        resp = _originals["requests"](adapter, request, **kwargs)
+        content = resp.content
+        c.record(key, request.method, request.url, body, resp.status_code, resp.headers, content, time.monotonic() - start)
+        return resp
+
+    requests.adapters.HTTPAdapter.send = requests_send
+    # Newer OpenAI SDKs ship on the httpx2 fork, which keeps httpx's transport API
+    for name in HTTPX_MODULES:
+        try:
+            _install_httpx(c, importlib.import_module(name))
+        except ImportError:
+            pass
+
+    # aiohttp only arrives with the DashScope SDK (its async calls)
+    try:
+        import aiohttp
+    except ImportError:
+        return
+    _originals["aiohttp"] = aiohttp.ClientSession._request
+
+    async def aiohttp_request(session, method, str_or_url, *, params=None, data=None, json=None, headers=None, **kwargs):
+        from yarl import URL
+        url = URL(str(str_or_url))
+        if params:
+            url = url.update_query(params)
+        body = _body_bytes(data) if json is None else _json_bytes(json)
+        headers = dict(headers or {})
+        key = request_key(method, str(url), body, headers.get("Content-Type", ""), headers.get("Range", ""))
+        if c.mode == "replay":
+            status, stored, content, delay = c.lookup(key, method, str(url))
+            if delay:
+                await asyncio.sleep(delay)
+            return _AiohttpResponse(method, url, status, stored, content)
+        start = time.monotonic()
+        resp = await _originals["aiohttp"](session, method, str_or_url, params=params, data=data, json=json, headers=headers, **kwargs)
+        try:
+            content = await resp.read()
+        finally:
+            resp.release()
+        c.record(key, method, str(url), body, resp.status, resp.headers, content, time.monotonic() - start)
+        return _AiohttpResponse(method, url, resp.status, _stored_headers(resp.headers), content)
+
+    aiohttp.ClientSession._request = aiohttp_request
+
+
+def _install_httpx(c: Cassette, httpx):
+    sync_send = _originals[(httpx.__name__, "sync")] = httpx.HTTPTransport.handle_request
+    async_send = _originals[(httpx.__name__, "async")] = httpx.AsyncHTTPTransport.handle_async_request
+
+    class TeeStream(httpx.SyncByteStream):
+        """Passes the (decoded) body through as it arrives and records it once the caller closes the response."""
+        def __init__(self, resp, done):
+            self.resp, self.done, self.parts = resp, done, []
+
+        def __iter__(self):
+            for chunk in self.resp.iter_bytes():
+                self.parts.append(chunk)
+                yield chunk
+
+        def close(self):
+            try:
+                self.resp.close()
+            finally:
+                if self.done:
+                    self.done(b"".join(self.parts))
+                    self.done = None
+
+    class AsyncTeeStream(httpx.AsyncByteStream):
+        def __init__(self, resp, done):
+            self.resp, self.done, self.parts = resp, done, []
+
+        async def __aiter__(self):
+            async for chunk in self.resp.aiter_bytes():
+                self.parts.append(chunk)
+                yield chunk
+
+        async def aclose(self):
+            try:
+                await self.resp.aclose()
+            finally:
+                if self.done:
+                    self.done(b"".join(self.parts))
+                    self.done = None
+
+    def recorder(key, request, body, resp, start):
+        # A stream closed early (a cancelled hedge) is recorded as far as it was read
+        return lambda content: c.record(key, request.method, str(request.url), body, resp.status_code, resp.headers, content, time.monotonic() - start)
+
+    def handle_request(transport, request):
+        body = request.read()
+        key = request_key(request.method, str(request.url), body, request.headers.get("Content-Type", ""), request.headers.get("Range", ""))
+        if c.mode == "replay":
+            status, headers, content, delay = c.lookup(key, request.method, str(request.url))
+            if delay:
+                time.sleep(delay)
+            return httpx.Response(status, headers=headers, content=content, request=request)
+        start = time.monotonic()
+        resp = sync_send(transport, request)
+        stream = TeeStream(resp, recorder(key, request, body, resp, start))
+        return httpx.Response(resp.status_code, headers=_stored_headers(resp.headers), stream=stream, request=request)
+
+    async def handle_async_request(transport, request):
+        body = await request.aread()
+        key = request_key(request.method, str(request.url), body, request.headers.get("Content-Type", ""), request.headers.get("Range", ""))
+        if c.mode == "replay":
+            status, headers, content, delay = c.lookup(key, request.method, str(request.url))
+            if delay:
+                await asyncio.sleep(delay)
+            return httpx.Response(status, headers=headers, content=content, request=request)
+        start = time.monotonic()
+        resp = await async_send(transport, request)
+        stream = AsyncTeeStream(resp, recorder(key, request, body, resp, start))
+        return httpx.Response(resp.status_code, headers=_stored_headers(resp.headers), stream=stream, request=request)
+
+    httpx.HTTPTransport.handle_request = handle_request
+    httpx.AsyncHTTPTransport.handle_async_request = handle_async_request
+
+
+def uninstall():
+    if not _originals:
+        return
+    import requests
+    requests.adapters.HTTPAdapter.send = _originals.pop("requests")
+    for name in HTTPX_MODULES:
+        if (name, "sync") in _originals:
+            httpx = importlib.import_module(name)
+            httpx.HTTPTransport.handle_request = _originals.pop((name, "sync"))
+            httpx.AsyncHTTPTransport.handle_async_request = _originals.pop((name, "async"))
+    if "aiohttp" in _originals:
+        import aiohttp
+        aiohttp.ClientSession._request = _originals.pop("aiohttp")
+
+
+def _json_bytes(obj) -> bytes:
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
+def _requests_response(request, status: int, headers: dict, content: bytes):
+    import requests
+    from requests.structures import CaseInsensitiveDict
+    from requests.utils import get_encoding_from_headers
+
+    resp = requests.Response()
+    resp.status_code = status
+    resp.headers = CaseInsensitiveDict(headers)
+    resp._content = content
+    resp._content_consumed = True
+    resp.encoding = get_encoding_from_headers(resp.headers)
+    resp.reason = _reason(status)
+    resp.url = request.url
+    resp.request = request
+    return resp
+
+
+def _reason(status: int) -> str:
+    try:
+        return HTTPStatus(status).phrase
+    except ValueError:
+        return ""
+
+
+class _BodyStream:
+    """The parts of aiohttp's StreamReader that SDKs read a finished body through."""
+    def __init__(self, body: bytes):
+        self._body = body
+        self._pos = 0
+
+    async def read(self, n: int = -1) -> bytes:
+        end = len(self._body) if n < 0 else self._pos + n
+        chunk, self._pos = self._body[self._pos:end], min(end, len(self._body))
+        return chunk
+
+    async def readline(self) -> bytes:
+        end = self._body.find(b"\n", self._pos)
+        end = len(self._body) if end < 0 else end + 1
+        line, self._pos = self._body[self._pos:end], end
+        return line
+
+    async def iter_any(self):
+        if self._pos < len(self._body):
+            yield await self.read()
+
+    async def iter_chunked(self, n: int):
+        while self._pos < len(self._body):
+            yield await self.read(n)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> bytes:
+        line = await self.readline()
+        if not line:
+            raise StopAsyncIteration
+        return line
+
+
+class _AiohttpResponse:
+    """A finished aiohttp.ClientResponse stand-in, built from a recording."""
+    def __init__(self, method: str, url, status: int, headers: dict, body: bytes):
+        from multidict import CIMultiDict, CIMultiDictProxy
+        self.method = method
+        self.url = self.real_url = url
+        self.status = status
+        self.reason = _reason(status)
+        self.headers = CIMultiDictProxy(CIMultiDict(headers))
+        self.content = _BodyStream(body)
+        self._body = body
+
+    @property
+    def content_type(self) -> str:
+        return self.headers.get("Content-Type", "application/octet-stream").split(";")[0].strip().lower()
+
+    @property
+    def charset(self) -> Optional[str]:
+        match = re.search(r"charset=([\w-]+)", self.headers.get("Content-Type", ""))
+        return match.group(1) if match else None
+
+    @property
+    def ok(self) -> bool:
+        return self.status < 400
+
+    async def read(self) -> bytes:
+        return self._body
+
+    async def text(self, encoding: Optional[str] = None, errors: str = "strict") -> str:
+        return self._body.decode(encoding or self.charset or "utf-8", errors)
+
+    async def json(self, *, encoding: Optional[str] = None, loads=json.loads, content_type: Optional[str] = "application/json"):
+        return loads(await self.text(encoding))
+
+    def raise_for_status(self):
+        if not self.ok:
+            import aiohttp
+            info = aiohttp.RequestInfo(self.url, self.method, self.headers, self.url)
+            raise aiohttp.ClientResponseError(info, (), status=self.status, message=self.reason, headers=self.headers)
+
+    def release(self):
+        pass
+
+    def close(self):
+        pass
+
+    async def wait_for_close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
@@ -1,7 +1,26 @@
 from abc import ABC, abstractmethod
 import os
+import re
+import time
+import asyncio
+import threading
+import httpx
 import requests
-from typing import Optional
+from requests.adapters import HTTPAdapter
+from typing import Optional, Tuple
+from urllib.parse import urlparse
+from .metrics import metrics
+from .resilience import CircuitOpenError, guarded_call, timeout_for
+from .extract import extract, extract_markdown, extraction_pool
+
+FIRECRAWL_BASE_URL = "https://api.firecrawl.dev"
+EXTRACT_TOTAL = "weflow_extract_total"
+EXTRACT_SECONDS = "weflow_extract_seconds"  # local work, so not a provider call (nor charged to the budget)
+LOCAL_USER_AGENT = "Mozilla/5.0 (compatible; weflow)"
+
+def _scrape_url() -> str:
+    # FIRECRAWL_BASE_URL points at a self-hosted Firecrawl or a local stub
+    return os.getenv("FIRECRAWL_BASE_URL", FIRECRAWL_BASE_URL).rstrip("/") + "/v0/scrape"
 
 class CrawlerProvider(ABC):
     @abstractmethod
@@ -9,32 +28,239 @@ class CrawlerProvider(ABC):
         """Returns the markdown or text content of the page"""
         pass
 
+def _scrape_payload(url: str) -> dict:
+    return {
+        "url": url,
+        "pageOptions": {
+            "onlyMainContent": True
+        }
+    }
+
+def _scrape_markdown(data: dict) -> Optional[str]:
+    # Firecrawl v0 implementation usually returns markdown in `markdown` field or data object
+    # Adjusting structure based on common firecrawl response patterns, verify if needed
+    return data.get("data", {}).get("markdown") or data.get("markdown")
+
 class FirecrawlCrawler(CrawlerProvider):
     def __init__(self, api_key: Optional[str] = None):
         self.api_key = api_key or os.getenv("FIRECRAWL_API_KEY")
         if not self.api_key:
             raise ValueError("Firecrawl API key is required")
-        self.base_url = "https://api.firecrawl.dev/v0/scrape"
+        self.base_url = _scrape_url()
+        # Pooled connections: every scrape goes to the same host
+        self.session = requests.Session()
 
     def crawl(self, url: str) -> Optional[str]:
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
-        payload = {
-            "url": url,
-            "pageOptions": {
-                "onlyMainContent": True
-            }
-        }
         
         try:
-            response = requests.post(self.base_url, json=payload, headers=headers)
-            response.raise_for_status()
-            data = response.json()
-            # Firecrawl v0 implementation usually returns markdown in `markdown` field or data object
-            # Adjusting structure based on common firecrawl response patterns, verify if needed
-            return data.get("data", {}).get("markdown") or data.get("markdown")
+            with guarded_call("firecrawl", "firecrawl", "scrape"):
+                response = self.session.post(self.base_url, json=_scrape_payload(url), headers=headers, timeout=timeout_for("crawl"))
+                response.raise_for_status()
+            return _scrape_markdown(response.json())
+        except Exception as e:
+            print(f"Error crawling {url}: {e}")
+            return None
+
+class AsyncCrawlerProvider(ABC):
+    @abstractmethod
+    async def crawl(self, url: str) -> Optional[str]:
+        """Returns the markdown or text content of the page"""
+        pass
+
+class AsyncFirecrawlCrawler(AsyncCrawlerProvider):
+    """Firecrawl over a shared httpx.AsyncClient, so many scrapes can be in flight at once."""
+    def __init__(self, api_key: Optional[str] = None, client: Optional[httpx.AsyncClient] = None):
+        self.api_key = api_key or os.getenv("FIRECRAWL_API_KEY")
+        if not self.api_key:
+            raise ValueError("Firecrawl API key is required")
+        self.base_url = _scrape_url()
+        self.client = client or httpx.AsyncClient(timeout=120)
+
+    async def crawl(self, url: str) -> Optional[str]:
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        try:
+            with guarded_call("firecrawl", "firecrawl", "scrape"):
+                response = await self.client.post(self.base_url, json=_scrape_payload(url), headers=headers, timeout=timeout_for("crawl"))
+                response.raise_for_status()
+            return _scrape_markdown(response.json())
         except Exception as e:
             print(f"Error crawling {url}: {e}")
             return None
+
+class AsyncCrawlerAdapter(AsyncCrawlerProvider):
+    """Runs a sync CrawlerProvider in worker threads for the async pipeline."""
+    def __init__(self, crawler: CrawlerProvider):
+        self.crawler = crawler
+
+    async def crawl(self, url: str) -> Optional[str]:
+        return await asyncio.to_thread(self.crawler.crawl, url)
+
+
+# --- Local extraction ---
+
+def _charset(content_type: str) -> Optional[str]:
+    match = re.search(r"charset=[\"']?([\w-]+)", content_type or "", re.I)
+    return match.group(1) if match else None
+
+def _not_html(content_type: str) -> Optional[str]:
+    mime = (content_type or "text/html").split(";")[0].strip().lower()
+    return None if mime in ("text/html", "application/xhtml+xml") else f"not html ({mime})"
+
+class DomainFallback:
+    """
+    Per-domain run of local extraction failures. A domain that fails
+    `after` times in a row (JS shells, bot walls, odd markup) is sent
+    straight to Firecrawl for the rest of the process.
+    """
+    def __init__(self, after: int = 2):
+        self.after = after
+        self._failures = {}
+        self._routed = set()
+        self._lock = threading.Lock()
+
+    def routed(self, domain: str) -> bool:
+        with self._lock:
+            return domain in self._routed
+
+    def success(self, domain: str):
+        with self._lock:
+            self._failures.pop(domain, None)
+
+    def failure(self, domain: str, reason: str):
+        with self._lock:
+            self._failures[domain] = self._failures.get(domain, 0) + 1
+            if self._failures[domain] < self.after or domain in self._routed:
+                return
+            self._routed.add(domain)
+        print(f"Local extraction failed {self.after} times in a row on {domain} (last: {reason}); using Firecrawl for it from now on")
+
+def _local_settings(min_chars: Optional[int], fallback_after: Optional[int]) -> Tuple[int, int]:
+    """EXTRACT_MIN_CHARS (500) and EXTRACT_FALLBACK_AFTER (2)"""
+    min_chars = min_chars if min_chars is not None else int(os.getenv("EXTRACT_MIN_CHARS", "500"))
+    fallback_after = fallback_after if fallback_after is not None else int(os.getenv("EXTRACT_FALLBACK_AFTER", "2"))
+    return min_chars, fallback_after
+
+class LocalCrawler(CrawlerProvider):
+    """
+    Fetches pages directly over pooled connections and converts their main
+    content to Markdown in a process pool (weflow.core.extract), images
+    included, so plain blog posts cost no Firecrawl call. A page that fails
+    the quality checks (not HTML, HTTP error, too short, mostly links,
+    garbled) is scraped by Firecrawl instead, when FIRECRAWL_API_KEY is set;
+    see DomainFallback for domains that keep failing.
+    """
+    def __init__(self, fallback: Optional[CrawlerProvider] = None, pool_size: Optional[int] = None, min_chars: Optional[int] = None, fallback_after: Optional[int] = None):
+        self.min_chars, fallback_after = _local_settings(min_chars, fallback_after)
+        self.fallback = fallback if fallback is not None else (FirecrawlCrawler() if os.getenv("FIRECRAWL_API_KEY") else None)
+        self.domains = DomainFallback(fallback_after)
+        # EXTRACT_POOL_SIZE connections kept per host
+        pool_size = pool_size or int(os.getenv("EXTRACT_POOL_SIZE", "10"))
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["User-Agent"] = LOCAL_USER_AGENT
+
+    def _extract(self, url: str, domain: str) -> Tuple[Optional[str], Optional[str]]:
+        try:
+            with guarded_call(f"local:{domain}", "local", "fetch"):
+                response = self.session.get(url, timeout=timeout_for("crawl"))
+                response.raise_for_status()
+        except CircuitOpenError:
+            return None, "circuit open"
+        except requests.HTTPError as e:
+            return None, f"http {e.response.status_code}"
+        except Exception as e:
+            print(f"Error fetching {url}: {e}")
+            return None, "fetch error"
+        content_type = response.headers.get("Content-Type", "")
+        reason = _not_html(content_type)
+        if reason:
+            return None, reason
+        start = time.perf_counter()
+        try:
+            result = extract(response.content, response.url, _charset(content_type), self.min_chars)
+        except Exception as e:
+            print(f"Error extracting {url}: {e!r}")
+            return None, "extract_error"
+        metrics.observe(EXTRACT_SECONDS, time.perf_counter() - start)
+        return result
+
+    def crawl(self, url: str) -> Optional[str]:
+        domain = urlparse(url).netloc
+        reason = "domain"
+        if not self.domains.routed(domain):
+            markdown, reason = self._extract(url, domain)
+            if markdown:
+                self.domains.success(domain)
+                metrics.inc(EXTRACT_TOTAL, outcome="local", reason="ok")
+                return markdown
+            self.domains.failure(domain, reason)
+        metrics.inc(EXTRACT_TOTAL, outcome="fallback" if self.fallback else "failed", reason=reason)
+        if self.fallback is None:
+            print(f"Local extraction failed for {url} ({reason}) and no Firecrawl fallback is configured")
+            return None
+        if reason != "domain":
+            print(f"Local extraction failed for {url} ({reason}), falling back to Firecrawl")
+        return self.fallback.crawl(url)
+
+class AsyncLocalCrawler(AsyncCrawlerProvider):
+    """LocalCrawler over the pipeline's shared httpx.AsyncClient; extraction runs in the same process pool."""
+    def __init__(self, client: Optional[httpx.AsyncClient] = None, fallback: Optional[AsyncCrawlerProvider] = None, min_chars: Optional[int] = None, fallback_after: Optional[int] = None):
+        self.min_chars, fallback_after = _local_settings(min_chars, fallback_after)
+        self.client = client or httpx.AsyncClient(timeout=120)
+        self.fallback = fallback if fallback is not None else (AsyncFirecrawlCrawler(client=self.client) if os.getenv("FIRECRAWL_API_KEY") else None)
+        self.domains = DomainFallback(fallback_after)
+
+    async def _extract(self, url: str, domain: str) -> Tuple[Optional[str], Optional[str]]:
+        try:
+            with guarded_call(f"local:{domain}", "local", "fetch"):
+                response = await self.client.get(url, headers={"User-Agent": LOCAL_USER_AGENT}, follow_redirects=True, timeout=timeout_for("crawl"))
+                response.raise_for_status()
+        except CircuitOpenError:
+            return None, "circuit open"
+        except httpx.HTTPStatusError as e:
+            return None, f"http {e.response.status_code}"
+        except Exception as e:
+            print(f"Error fetching {url}: {e}")
+            return None, "fetch error"
+        content_type = response.headers.get("Content-Type", "")
+        reason = _not_html(content_type)
+        if reason:
+            return None, reason
+        start = time.perf_counter()
+        # No pool (EXTRACT_PROCESSES=0): the loop's default thread executor
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(
+                extraction_pool(), extract_markdown, response.content, str(response.url), _charset(content_type), self.min_chars
+            )
+        except Exception as e:
+            print(f"Error extracting {url}: {e!r}")
+            return None, "extract_error"
+        metrics.observe(EXTRACT_SECONDS, time.perf_counter() - start)
+        return result
+
+    async def crawl(self, url: str) -> Optional[str]:
+        domain = urlparse(url).netloc
+        reason = "domain"
+        if not self.domains.routed(domain):
+            markdown, reason = await self._extract(url, domain)
+            if markdown:
+                self.domains.success(domain)
+                metrics.inc(EXTRACT_TOTAL, outcome="local", reason="ok")
+                return markdown
+            self.domains.failure(domain, reason)
+        metrics.inc(EXTRACT_TOTAL, outcome="fallback" if self.fallback else "failed", reason=reason)
+        if self.fallback is None:
+            print(f"Local extraction failed for {url} ({reason}) and no Firecrawl fallback is configured")
+            return None
+        if reason != "domain":
+            print(f"Local extraction failed for {url} ({reason}), falling back to Firecrawl")
+        return await self.fallback.crawl(url)
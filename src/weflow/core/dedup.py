@@ -0,0 +1,189 @@
+import os
+import re
+import hashlib
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence
+from .models import Article
+
+# Shingle hashes are 64-bit, so anything at or above 2**64 marks an empty bin.
+_EMPTY = 1 << 64
+# Offset added per rotation step when densifying empty bins, so a borrowed value
+# only matches another signature that borrowed from the same distance.
+_ROTATION_OFFSET = 1 << 65
+
+# Latin words or single CJK characters. Chinese text has no spaces, so each
+# character becomes one token and shingles behave like character n-grams.
+_TOKEN_RE = re.compile(r"[\u4e00-\u9fff]|[a-z0-9]+")
+_MD_IMAGE_RE = re.compile(r"!\[.*?\]\(.*?\)")
+_MD_LINK_RE = re.compile(r"\[(.*?)\]\(.*?\)")
+
+
+class MinHasher:
+    """
+    Computes MinHash signatures over token shingles.
+
+    Uses one-permutation hashing: each shingle is hashed once and routed to one
+    of `num_perm` bins, keeping the minimum per bin. Empty bins are filled by
+    rotation densification. This costs O(shingles) per article instead of
+    O(shingles * num_perm), which matters once thousands of articles are folded.
+    """
+    def __init__(self, num_perm: int = 64, shingle_size: int = 5, max_chars: int = 20000):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.max_chars = max_chars
+
+    def shingles(self, text: str) -> set[int]:
+        text = text[:self.max_chars].lower()
+        # Image and link URLs differ between mirrors of the same story; keep only the visible text
+        text = _MD_IMAGE_RE.sub(" ", text)
+        text = _MD_LINK_RE.sub(r"\1", text)
+        tokens = _TOKEN_RE.findall(text)
+        k = self.shingle_size
+        if len(tokens) < k:
+            grams = [" ".join(tokens)] if tokens else []
+        else:
+            grams = [" ".join(tokens[i:i + k]) for i in range(len(tokens) - k + 1)]
+        return {
+            int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=8).digest(), "big")
+            for g in grams
+        }
+
+    def signature(self, text: str) -> Optional[List[int]]:
+        hashes = self.shingles(text or "")
+        if not hashes:
+            return None
+        k = self.num_perm
+        sig = [_EMPTY] * k
+        for h in hashes:
+            b = h % k
+            v = h // k
+            if v < sig[b]:
+                sig[b] = v
+        # Densify: borrow from the next non-empty bin to the right
+        for i in range(k):
+            if sig[i] != _EMPTY:
+                continue
+            for step in range(1, k):
+                v = sig[(i + step) % k]
+                if v < _EMPTY:
+                    sig[i] = v + step * _ROTATION_OFFSET
+                    break
+        return sig
+
+
+def estimate_similarity(sig_a: Sequence[int], sig_b: Sequence[int]) -> float:
+    """Estimated Jaccard similarity: fraction of matching signature slots."""
+    same = sum(1 for x, y in zip(sig_a, sig_b) if x == y)
+    return same / len(sig_a)
+
+
+class LSHIndex:
+    """
+    Banded LSH over MinHash signatures.
+    Only keys that collide in at least one band are compared, so lookups stay
+    cheap even with thousands of indexed articles.
+    """
+    def __init__(self, num_perm: int = 64, bands: int = 16):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.bands = bands
+        self.rows = num_perm // bands
+        self._buckets: List[Dict[tuple, List[str]]] = [defaultdict(list) for _ in range(bands)]
+        self._signatures: Dict[str, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def _band_keys(self, sig: Sequence[int]) -> Iterable[tuple]:
+        r = self.rows
+        for i in range(self.bands):
+            yield tuple(sig[i * r:(i + 1) * r])
+
+    def insert(self, key: str, sig: Sequence[int]):
+        if key in self._signatures:
+            return
+        self._signatures[key] = list(sig)
+        for band, band_key in zip(self._buckets, self._band_keys(sig)):
+            band[band_key].append(key)
+
+    def query(self, sig: Sequence[int], threshold: float = 0.0) -> List[tuple[str, float]]:
+        """Returns (key, similarity) for indexed items at or above threshold, best first."""
+        candidates = set()
+        for band, band_key in zip(self._buckets, self._band_keys(sig)):
+            candidates.update(band.get(band_key, ()))
+        matches = []
+        for key in candidates:
+            sim = estimate_similarity(sig, self._signatures[key])
+            if sim >= threshold:
+                matches.append((key, sim))
+        matches.sort(key=lambda m: m[1], reverse=True)
+        return matches
+
+
+class NearDuplicateDetector:
+    """
+    Folds near-duplicate articles (same story from several outlets) into one
+    representative. The other copies are kept on `representative.extra_sources`
+    so they still show up as sources without being sent to synthesis.
+    """
+    def __init__(self, threshold: float = 0.5, num_perm: int = 64, bands: int = 16, shingle_size: int = 5):
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm=num_perm, shingle_size=shingle_size)
+        self.num_perm = num_perm
+        self.bands = bands
+
+    def fold(self, articles: List[Article]) -> List[Article]:
+        index = LSHIndex(num_perm=self.num_perm, bands=self.bands)
+        parent = list(range(len(articles)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for i, art in enumerate(articles):
+            sig = self.hasher.signature(art.content or "")
+            if sig is None:
+                continue
+            for key, _ in index.query(sig, self.threshold):
+                ri, rj = find(i), find(int(key))
+                if ri != rj:
+                    parent[ri] = rj
+            index.insert(str(i), sig)
+
+        groups = defaultdict(list)
+        for i in range(len(articles)):
+            groups[find(i)].append(i)
+
+        representatives = {}
+        for members in groups.values():
+            # Prefer the most complete write-up as the representative
+            rep_idx = max(members, key=lambda i: articles[i].content_chars)
+            rep = articles[rep_idx]
+            for i in members:
+                if i == rep_idx:
+                    continue
+                dup = articles[i]
+                rep.extra_sources.append({
+                    "title": dup.title,
+                    "url": dup.url,
+                    "source_name": dup.source_name or "Unknown Source",
+                })
+                rep.extra_sources.extend(dup.extra_sources)
+            representatives[rep_idx] = rep
+
+        folded = len(articles) - len(representatives)
+        if folded:
+            print(f"Folded {folded} near-duplicate articles into {len(representatives)} stories.")
+        # Keep original (feed) order of the representatives
+        return [representatives[i] for i in sorted(representatives)]
+
+
+def fold_near_duplicates(articles: List[Article], threshold: Optional[float] = None) -> List[Article]:
+    """Convenience wrapper configured from NEAR_DUP_THRESHOLD (0 disables folding)."""
+    if threshold is None:
+        threshold = float(os.getenv("NEAR_DUP_THRESHOLD", "0.5"))
+    if threshold <= 0 or len(articles) < 2:
+        return articles
+    return NearDuplicateDetector(threshold=threshold).fold(articles)
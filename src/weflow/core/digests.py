@@ -0,0 +1,51 @@
+import os
+import json
+from typing import Dict, List, Optional
+from pydantic import BaseModel
+
+
+class DigestDefinition(BaseModel):
+    """
+    One digest built from the shared corpus: which topics it carries, how they
+    are named, and which WeChat account (and Feishu webhook) it goes to.
+    Credentials are read from the named environment variables so the
+    definitions file can be committed.
+    """
+    name: str
+    topics: Optional[List[str]] = None       # raw or translated topic names; None keeps all
+    topic_map: Optional[Dict[str, str]] = None  # replaces TOPIC_MAP for this digest
+    author: str = ""
+    title_suffix: str = "WeFlow Daily"
+    wechat_app_id_env: str = "WECHAT_APP_ID"
+    wechat_app_secret_env: str = "WECHAT_APP_SECRET"
+    feishu_webhook_env: str = "FEISHU_WEBHOOK_URL"
+
+    @property
+    def wechat_app_id(self) -> Optional[str]:
+        return os.getenv(self.wechat_app_id_env)
+
+    @property
+    def wechat_app_secret(self) -> Optional[str]:
+        return os.getenv(self.wechat_app_secret_env)
+
+    @property
+    def feishu_webhook_url(self) -> Optional[str]:
+        return os.getenv(self.feishu_webhook_env)
+
+    def keeps(self, raw_topic: str, topic: str) -> bool:
+        return self.topics is None or raw_topic in self.topics or topic in self.topics
+
+
+def load_digest_definitions() -> List[DigestDefinition]:
+    """DIGESTS_FILE (path to a JSON list) or DIGESTS (inline JSON); empty means single-digest mode."""
+    path = os.getenv("DIGESTS_FILE")
+    if path:
+        with open(path, encoding="utf-8") as f:
+            raw = json.load(f)
+    else:
+        raw = json.loads(os.getenv("DIGESTS") or "[]")
+    digests = [DigestDefinition(**d) for d in raw]
+    names = [d.name for d in digests]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Digest names must be unique: {names}")
+    return digests
@@ -0,0 +1,217 @@
+import os
+import time
+import threading
+from collections import defaultdict
+from typing import Optional
+
+PUBLISH = "publish"
+NOTIFY = "notify"
+DEFAULT_ARTICLE_URL = "https://mp.weixin.qq.com"
+
+
+class OutboxDispatcher:
+    """
+    Background sender for the publish/notify outbox (core.outbox).
+
+    With OUTBOX=1 the pipeline commits each finished draft to the outbox
+    and moves on; this thread pushes the drafts to WeChat, resolves their
+    URLs and sends the Feishu cards, retrying failures with backoff. Cards
+    for the same webhook that are due together (the digests of one run)
+    go out as a single message.
+
+    Entry points `close()` it at exit, which waits up to
+    OUTBOX_DRAIN_SECONDS for the actions this process queued that are due
+    now (not ones backing off after a failure, nor other runs' leftovers);
+    anything left stays in the database for the next run, the daemon, or
+    `python -m weflow.outbox`.
+    """
+    def __init__(self, enabled: bool = False, interval: float = 2.0, batch_size: int = 20, drain_seconds: float = 60,
+                 retry_delay: float = 30.0, max_attempts: int = 5, lease_seconds: float = 300):
+        self.enabled = enabled
+        self.interval = interval
+        self.batch_size = batch_size
+        self.drain_seconds = drain_seconds
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.store = None
+        self.publishers = {}  # app_id -> WeChatPublisher
+        self._owner = None
+        self._batches = set()  # batches queued by this process: what close() waits for
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+    def configure_from_env(self):
+        """OUTBOX=1 queues publishing and notifications; OUTBOX_POLL_SECONDS (2), OUTBOX_BATCH (20),
+        OUTBOX_DRAIN_SECONDS (60), OUTBOX_RETRY_SECONDS (30), OUTBOX_MAX_ATTEMPTS (5)"""
+        self.enabled = os.getenv("OUTBOX", "").lower() in ("1", "true", "yes")
+        self.interval = float(os.getenv("OUTBOX_POLL_SECONDS", "2"))
+        self.batch_size = int(os.getenv("OUTBOX_BATCH", "20"))
+        self.drain_seconds = float(os.getenv("OUTBOX_DRAIN_SECONDS", "60"))
+        self.retry_delay = float(os.getenv("OUTBOX_RETRY_SECONDS", "30"))
+        self.max_attempts = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+
+    def bind(self, engine, start: bool = True):
+        """Opens the outbox in `engine`'s database and (by default) starts sending."""
+        if self.store is None:
+            from .outbox import OutboxStore
+            from .queue import default_worker_id
+            self.store = OutboxStore(engine=engine, retry_delay=self.retry_delay, max_attempts=self.max_attempts)
+            self._owner = default_worker_id()
+        if start:
+            self.start()
+        return self.store
+
+    def register(self, publisher):
+        """Sends this account's drafts through `publisher` (keeps its token and sessions)."""
+        with self._lock:
+            self.publishers.setdefault(publisher.app_id, publisher)
+
+    # --- Producer side ---
+
+    def enqueue_draft(self, key: str, app_id: str, draft: dict, notify: Optional[dict] = None, batch: Optional[str] = None) -> str:
+        """
+        Commits a draft (push_draft's arguments) to the outbox, with the card
+        to send once it is pushed (webhook_url, title, summary). Returns an
+        outbox reference in place of the draft id.
+        """
+        batch = batch or f"draft:{key}"
+        action_id, _ = self.store.add(PUBLISH, key, {"app_id": app_id, "draft": draft, "notify": notify}, batch=batch)
+        with self._lock:
+            self._batches.add(batch)
+        self._wake.set()
+        return f"outbox:{action_id}"
+
+    # --- Sending ---
+
+    def _publisher(self, app_id: str):
+        with self._lock:
+            publisher = self.publishers.get(app_id)
+        if publisher is not None:
+            return publisher
+        # Not registered by this process (e.g. queued by another run): credentials from the environment
+        from .wechat import WeChatPublisher
+        from .digests import load_digest_definitions
+        if app_id == os.getenv("WECHAT_APP_ID"):
+            publisher = WeChatPublisher()
+        else:
+            secret = next((d.wechat_app_secret for d in load_digest_definitions() if d.wechat_app_id == app_id), None)
+            if not secret:
+                raise ValueError(f"No WeChat credentials for app id {app_id}")
+            publisher = WeChatPublisher(app_id=app_id, app_secret=secret)
+        self.register(publisher)
+        return publisher
+
+    def _publish(self, action: dict):
+        payload = action["payload"]
+        try:
+            wechat = self._publisher(payload["app_id"])
+            draft_id = wechat.push_draft(**payload["draft"])
+        except Exception as e:
+            self.store.fail(action, self._owner, str(e))
+            return
+        print(f"Draft pushed: {draft_id}")
+        # The draft exists now: from here on nothing may leave the action to be pushed again
+        article_url = DEFAULT_ARTICLE_URL
+        try:
+            draft_info = wechat.get_draft(draft_id) if draft_id != "Success" else None
+            article_url = (draft_info or {}).get("url") or DEFAULT_ARTICLE_URL
+        except Exception as e:
+            print(f"Outbox: no URL for draft {draft_id}: {e}")
+        follow_up = []
+        notify = payload.get("notify")
+        if notify and notify.get("webhook_url"):
+            follow_up.append((NOTIFY, f"notify:{action['key']}", dict(notify, article_url=article_url)))
+        result = {"draft_id": draft_id, "url": article_url}
+        for attempt in range(3):
+            try:
+                self.store.complete(action, self._owner, result, follow_up=follow_up)
+                return
+            except Exception as e:
+                print(f"Outbox: recording {action['key']} as sent failed (try {attempt + 1}/3): {e}")
+                time.sleep(1 + attempt)
+        print(f"Outbox: {action['key']} was pushed as {draft_id} but is not recorded; it may be pushed again")
+
+    def _notify(self, actions: list[dict]):
+        from .notifier import FeishuNotifier
+        by_webhook = defaultdict(list)
+        for action in actions:
+            by_webhook[action["payload"]["webhook_url"]].append(action)
+        for webhook_url, group in by_webhook.items():
+            cards = [{k: a["payload"][k] for k in ("title", "summary", "article_url")} for a in group]
+            sent = FeishuNotifier(webhook_url).send_cards(cards)
+            for action in group:
+                if sent:
+                    self.store.complete(action, self._owner, {"cards": len(cards)})
+                else:
+                    self.store.fail(action, self._owner, "Feishu notification not sent")
+
+    def run_once(self) -> int:
+        """Sends what is due; returns how many actions were claimed."""
+        published = self.store.claim(self._owner, PUBLISH, self.batch_size, self.lease_seconds)
+        for action in published:
+            try:
+                self._publish(action)
+            except Exception as e:
+                # Left to its lease; the rest of the batch still goes out
+                print(f"Outbox: {action['key']} failed: {e}")
+        notified = self.store.claim(self._owner, NOTIFY, self.batch_size, self.lease_seconds)
+        if notified:
+            try:
+                self._notify(notified)
+            except Exception as e:
+                print(f"Outbox: notifications failed: {e}")
+        return len(published) + len(notified)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                busy = self.run_once()
+            except Exception as e:
+                print(f"Outbox dispatch failed: {e}")
+                busy = 0
+            if not busy:
+                self._wake.wait(self.interval)
+                self._wake.clear()
+
+    def start(self):
+        if self._thread is not None or self.store is None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="weflow-outbox", daemon=True)
+        self._thread.start()
+
+    def drain(self, timeout: float, batches: Optional[set] = None) -> int:
+        """
+        Waits up to `timeout` seconds until no action (of `batches`, default
+        all) is due or being sent; returns how many still are. Actions
+        backing off after a failure aren't waited for.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            left = self.store.due(batches)
+            if not left or time.monotonic() >= deadline:
+                return left
+            self._wake.set()
+            time.sleep(min(0.2, max(0.0, deadline - time.monotonic())))
+
+    def close(self):
+        """Drains this process's batches for up to drain_seconds, then stops the dispatcher thread."""
+        if self._thread is None:
+            return
+        with self._lock:
+            batches = set(self._batches)
+        if batches:
+            self.drain(self.drain_seconds, batches)
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+        left = sum(self.store.unsent(batch) for batch in batches)
+        if left:
+            print(f"Outbox: {left} action(s) not sent yet; they go out with the next run or `python -m weflow.outbox`.")
+
+
+outbox = OutboxDispatcher()
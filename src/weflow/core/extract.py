@@ -0,0 +1,405 @@
+import os
+import re
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from typing import Optional, Tuple
+from urllib.parse import urljoin
+
+# Stdlib only: this module is what the extraction worker processes import.
+
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+# Never content; dropped with everything inside
+SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "canvas", "iframe", "object", "form", "button", "select", "textarea", "nav", "aside", "footer", "dialog", "head"}
+BLOCK_TAGS = {
+    "address", "article", "blockquote", "dd", "details", "div", "dl", "dt", "fieldset", "figcaption", "figure",
+    "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li", "main", "ol", "p", "pre", "section", "summary",
+    "table", "tbody", "td", "tfoot", "th", "thead", "tr", "ul",
+}
+# Starting one of these closes an open <p>
+CLOSES_P = BLOCK_TAGS - {"li", "td", "th", "tr", "tbody", "thead", "tfoot", "dd", "dt", "figcaption", "summary"}
+
+# Readability-style class/id hints
+UNLIKELY = re.compile(r"comment|sidebar|share|social|related|footer|menu|nav|promo|newsletter|subscribe|cookie|banner|breadcrumb|widget|advert|sponsor|popup|modal|masthead|signup|author-bio|pagination|\bads?\b", re.I)
+LIKELY = re.compile(r"article|content|entry|main|post|body|story|text|prose|blog", re.I)
+LAZY_SRC = ("data-src", "data-lazy-src", "data-original", "data-url", "src")
+
+MIN_PARAGRAPH_CHARS = 25
+# Deeper elements are flattened into their ancestor at this depth, which bounds the
+# recursive rendering (malformed pages can leave thousands of inline tags unclosed)
+MAX_DEPTH = 150
+
+
+class _Node:
+    __slots__ = ("tag", "attrs", "children", "parent")
+
+    def __init__(self, tag: str, attrs: dict, parent: Optional["_Node"]):
+        self.tag = tag
+        self.attrs = attrs
+        self.children: list = []  # _Node or str
+        self.parent = parent
+
+    def hint(self) -> str:
+        return f"{self.attrs.get('class', '')} {self.attrs.get('id', '')}"
+
+
+class _TreeBuilder(HTMLParser):
+    """
+    Forgiving HTML -> _Node tree: unknown end tags are ignored, unclosed ones
+    closed by their ancestors, and nesting stops at MAX_DEPTH.
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = _Node("#root", {}, None)
+        self.stack = [self.root]
+
+    def _close(self, tag: str):
+        for i in range(len(self.stack) - 1, 0, -1):
+            if self.stack[i].tag == tag:
+                del self.stack[i:]
+                return
+
+    def handle_starttag(self, tag, attrs):
+        current = self.stack[-1]
+        if tag in CLOSES_P and current.tag == "p":
+            self.stack.pop()
+        elif tag == "li" and current.tag == "li":
+            self.stack.pop()
+        elif tag in ("td", "th") and current.tag in ("td", "th"):
+            self.stack.pop()
+        elif tag == "tr" and any(n.tag == "tr" for n in self.stack[-3:]):
+            self._close("tr")
+        parent = self.stack[-1]
+        node = _Node(tag, {k: v or "" for k, v in attrs}, parent)
+        parent.children.append(node)
+        if tag not in VOID_TAGS and len(self.stack) < MAX_DEPTH:
+            self.stack.append(node)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS and self.stack[-1].tag == tag:
+            self.stack.pop()
+
+    def handle_endtag(self, tag):
+        if tag not in VOID_TAGS:
+            self._close(tag)
+
+    def handle_data(self, data):
+        self.stack[-1].children.append(data)
+
+
+def _text(node: _Node) -> str:
+    parts = []
+    stack = [node]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            parts.append(item)
+        else:
+            stack.extend(reversed(item.children))
+    return " ".join("".join(parts).split())
+
+
+def _link_chars(node: _Node) -> int:
+    total = 0
+    stack = [node]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, _Node):
+            if item.tag == "a":
+                total += len(_text(item))
+            else:
+                stack.extend(item.children)
+    return total
+
+
+def _prune(node: _Node, inside_content: bool = False):
+    """Drops never-content tags and boilerplate blocks (by class/id) in place."""
+    stack = [(node, inside_content)]
+    while stack:
+        node, inside_content = stack.pop()
+        kept = []
+        for child in node.children:
+            if isinstance(child, _Node):
+                if child.tag in SKIP_TAGS:
+                    continue
+                if child.tag == "header" and not inside_content:
+                    continue
+                hint = child.hint()
+                if child.tag not in ("body", "html", "article", "main") and UNLIKELY.search(hint) and not LIKELY.search(hint):
+                    continue
+                stack.append((child, inside_content or child.tag in ("article", "main")))
+            kept.append(child)
+        node.children = kept
+
+
+def _nodes(node: _Node):
+    """Elements under (and including) node, in document order"""
+    stack = [node]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, _Node):
+            yield item
+            stack.extend(reversed(item.children))
+
+
+def _main_content(root: _Node) -> _Node:
+    """The element holding the article body: scores paragraph containers (readability-style)."""
+    scores = {}
+    for node in _nodes(root):
+        if node.tag not in ("p", "pre", "td", "blockquote") or node.parent is None:
+            continue
+        text = _text(node)
+        if len(text) < MIN_PARAGRAPH_CHARS:
+            continue
+        score = 1 + text.count(",") + text.count("，") + min(len(text) // 100, 3)
+        parent, grandparent = node.parent, node.parent.parent
+        scores[parent] = scores.get(parent, 0) + score
+        if grandparent is not None:
+            scores[grandparent] = scores.get(grandparent, 0) + score / 2
+    if not scores:
+        return root
+
+    finals = {}
+
+    def final(node):
+        if node not in finals:
+            hint = node.hint()
+            weight = (25 if LIKELY.search(hint) else 0) - (25 if UNLIKELY.search(hint) else 0)
+            weight += 25 if node.tag in ("article", "main") else 0
+            text_chars = len(_text(node)) or 1
+            finals[node] = (scores.get(node, 0) + weight) * (1 - _link_chars(node) / text_chars)
+        return finals[node]
+
+    best = max(scores, key=final)
+    # Bodies split over sibling blocks: climb while the parent holds other strong candidates
+    while best.parent is not None and best.parent.tag != "#root":
+        siblings = [c for c in best.parent.children if isinstance(c, _Node) and c is not best and c in scores]
+        if not any(final(c) >= 0.3 * final(best) for c in siblings):
+            break
+        best = best.parent
+    return best
+
+
+# --- Markdown rendering ---
+
+def _image_src(node: _Node, base_url: str) -> Optional[str]:
+    srcset = node.attrs.get("data-srcset") or node.attrs.get("srcset")
+    candidates = [node.attrs.get(attr) for attr in LAZY_SRC]
+    if srcset:
+        # Widest candidate of "url 640w, url 1280w"
+        best, best_w = None, -1
+        for part in srcset.split(","):
+            bits = part.strip().split()
+            if not bits:
+                continue
+            width = int(bits[1][:-1]) if len(bits) > 1 and bits[1].endswith("w") and bits[1][:-1].isdigit() else 0
+            if width > best_w:
+                best, best_w = bits[0], width
+        candidates.insert(0, best)
+    for src in candidates:
+        if src and not src.startswith("data:"):
+            return urljoin(base_url, src.strip())
+    return None
+
+
+class _Renderer:
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+
+    def inline(self, nodes) -> str:
+        out = []
+        for item in nodes:
+            if isinstance(item, str):
+                out.append(re.sub(r"\s+", " ", item))
+                continue
+            tag = item.tag
+            if tag == "br":
+                out.append("\n")
+            elif tag == "img":
+                out.append(self.image(item))
+            elif tag == "a":
+                images = [n for n in _nodes(item) if n.tag == "img"]
+                text = self.inline(item.children).strip()
+                href = item.attrs.get("href", "")
+                if images and not _text(item):
+                    out.append(text)  # linked image: keep the image
+                elif text and href and not href.startswith(("javascript:", "#")):
+                    out.append(f"[{text}]({urljoin(self.base_url, href)})")
+                else:
+                    out.append(text)
+            elif tag in ("strong", "b"):
+                text = self.inline(item.children).strip()
+                out.append(f"**{text}**" if text else "")
+            elif tag in ("em", "i"):
+                text = self.inline(item.children).strip()
+                out.append(f"*{text}*" if text else "")
+            elif tag == "code":
+                out.append(f"`{_text(item)}`")
+            elif tag in BLOCK_TAGS:
+                out.append("\n\n" + self.block(item) + "\n\n")
+            else:
+                out.append(self.inline(item.children))
+        return "".join(out)
+
+    def image(self, node: _Node) -> str:
+        src = _image_src(node, self.base_url)
+        if not src:
+            return ""
+        alt = re.sub(r"[\[\]\n]+", " ", node.attrs.get("alt", "")).strip()
+        return f"\n\n![{alt}]({src})\n\n"
+
+    def children(self, node: _Node) -> str:
+        """Renders a mix of inline runs and blocks, blank line between blocks."""
+        parts, run = [], []
+        for item in node.children:
+            if isinstance(item, _Node) and item.tag in BLOCK_TAGS:
+                if run:
+                    parts.append(self.inline(run))
+                    run = []
+                parts.append(self.block(item))
+            else:
+                run.append(item)
+        if run:
+            parts.append(self.inline(run))
+        return "\n\n".join(p.strip() for p in parts if p and p.strip())
+
+    def block(self, node: _Node) -> str:
+        tag = node.tag
+        if tag in ("h1", "h2", "h3", "h4", "h5", "h6"):
+            text = " ".join(self.inline(node.children).split())
+            return f"{'#' * int(tag[1])} {text}" if text else ""
+        if tag == "hr":
+            return "---"
+        if tag == "pre":
+            code = "".join(n if isinstance(n, str) else _raw_text(n) for n in node.children).strip("\n")
+            return f"```\n{code}\n```"
+        if tag in ("ul", "ol"):
+            items = [c for c in node.children if isinstance(c, _Node) and c.tag == "li"]
+            lines = []
+            for i, li in enumerate(items, 1):
+                marker = f"{i}." if tag == "ol" else "-"
+                body = self.children(li).replace("\n", "\n   ")
+                lines.append(f"{marker} {body}")
+            return "\n".join(lines)
+        if tag == "blockquote":
+            return "\n".join(f"> {line}" if line else ">" for line in self.children(node).split("\n"))
+        if tag == "table":
+            lines = []
+            for row in (n for n in _nodes(node) if n.tag == "tr"):
+                cells = [" ".join(self.inline(c.children).split()).replace("|", "\\|") for c in row.children if isinstance(c, _Node) and c.tag in ("td", "th")]
+                if not cells:
+                    continue
+                lines.append("| " + " | ".join(cells) + " |")
+                if len(lines) == 1:
+                    lines.append("|" + " --- |" * len(cells))
+            return "\n".join(lines)
+        return self.children(node)
+
+
+def _raw_text(node: _Node) -> str:
+    return "".join(c if isinstance(c, str) else ("\n" if c.tag == "br" else _raw_text(c)) for c in node.children)
+
+
+# --- Entry point (runs in the worker processes) ---
+
+_CJK = re.compile(r"[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af\uf900-\ufaff]")
+_META_CHARSET = re.compile(rb"""<meta[^>]+charset=["']?([\w-]+)""", re.I)
+
+
+def decode_html(raw: bytes, charset: Optional[str] = None) -> str:
+    """Header charset, else the page's <meta charset>, else UTF-8"""
+    if not charset:
+        match = _META_CHARSET.search(raw[:4096])
+        charset = match.group(1).decode("ascii") if match else "utf-8"
+    try:
+        return raw.decode(charset, errors="replace")
+    except LookupError:
+        return raw.decode("utf-8", errors="replace")
+
+
+def _plain(markdown: str) -> str:
+    return re.sub(r"!?\[([^\]]*)\]\([^)]*\)", r"\1", markdown)
+
+
+def text_length(markdown: str) -> int:
+    """Non-space characters of text (links and images count by their text); a CJK character
+    carries about as much as a short English word, so it counts twice"""
+    text = _plain(markdown)
+    return len("".join(text.split())) + len(_CJK.findall(text))
+
+
+def check_quality(markdown: str, link_density: float, min_chars: int) -> Optional[str]:
+    """Why the extraction can't be trusted (a reason label), or None"""
+    text = _plain(markdown)
+    text_chars = len("".join(text.split()))
+    if text_length(markdown) < min_chars:
+        return "too short"
+    if link_density > 0.5:
+        return "mostly links"
+    if text.count("�") > text_chars * 0.01:
+        return "garbled"
+    return None
+
+
+def html_to_markdown(html: str, base_url: str) -> str:
+    """Markdown for an HTML fragment that is all content (a feed entry's body): no main-content detection"""
+    builder = _TreeBuilder()
+    builder.feed(html)
+    builder.close()
+    _prune(builder.root, inside_content=True)
+    return re.sub(r"\n{3,}", "\n\n", _Renderer(base_url).block(builder.root)).strip()
+
+
+def extract_markdown(raw: bytes, url: str, charset: Optional[str] = None, min_chars: int = 500) -> Tuple[Optional[str], Optional[str]]:
+    """(Markdown of the page's main content, None) or (None, why extraction failed the quality checks)"""
+    builder = _TreeBuilder()
+    try:
+        builder.feed(decode_html(raw, charset))
+        builder.close()
+    except Exception as e:
+        return None, f"parse error: {e}"
+    root = builder.root
+    base = next((n.attrs.get("href") for n in _nodes(root) if n.tag == "base" and n.attrs.get("href")), None)
+    _prune(root)
+    content = _main_content(root)
+    markdown = _Renderer(urljoin(url, base) if base else url).block(content)
+    markdown = re.sub(r"\n{3,}", "\n\n", markdown).strip()
+    text_chars = len(_text(content)) or 1
+    reason = check_quality(markdown, _link_chars(content) / text_chars, min_chars)
+    return (None, reason) if reason else (markdown, None)
+
+
+# --- Process pool ---
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def extraction_processes() -> int:
+    """EXTRACT_PROCESSES worker processes (default: CPUs, at most 4); 0 extracts in the calling thread"""
+    return int(os.getenv("EXTRACT_PROCESSES", str(min(4, os.cpu_count() or 1))))
+
+
+def extraction_pool() -> Optional[ProcessPoolExecutor]:
+    """The process-wide extraction pool, started on first use; None when EXTRACT_PROCESSES=0"""
+    global _pool
+    processes = extraction_processes()
+    if processes <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the pipeline is full of threads holding locks
+            _pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"))
+            atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+        return _pool
+
+
+def extract(raw: bytes, url: str, charset: Optional[str] = None, min_chars: int = 500) -> Tuple[Optional[str], Optional[str]]:
+    """extract_markdown in the process pool (or inline)"""
+    pool = extraction_pool()
+    if pool is None:
+        return extract_markdown(raw, url, charset, min_chars)
+    return pool.submit(extract_markdown, raw, url, charset, min_chars).result()
@@ -1,9 +1,22 @@
 from abc import ABC, abstractmethod
 import os
-import dashscope
-from dashscope import ImageSynthesis
-import google.generativeai as genai
+import time
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Optional
+from .resilience import ProviderError, guarded_call, timeout_for
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def image_pool() -> ThreadPoolExecutor:
+    """Shared background pool for image generation (IMAGE_WORKERS threads)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=int(os.getenv("IMAGE_WORKERS", "4")), thread_name_prefix="weflow-image")
+        return _pool
 
 class ImageProvider(ABC):
     @abstractmethod
@@ -11,6 +24,10 @@ class ImageProvider(ABC):
         """Returns the URL of the generated image"""
         pass
 
+    def submit(self, prompt: str) -> Future:
+        """Starts generation in the background; the Future resolves to the image URL."""
+        return image_pool().submit(self.generate_image, prompt)
+
 class MockImageProvider(ImageProvider):
     """Temporary mock provider for testing without consuming credits"""
     def generate_image(self, prompt: str) -> str:
@@ -21,28 +38,86 @@ class QwenImageProvider(ImageProvider):
     Uses Alibaba Cloud's DashScope Wanx model for image generation.
     Requires DASHSCOPE_API_KEY env var.
     """
+    model_name = "wanx-v1"
+    poll_interval = 2.0
+
     def __init__(self, api_key: Optional[str] = None):
         self.api_key = api_key or os.getenv("DASHSCOPE_API_KEY")
         if not self.api_key:
             raise ValueError("DashScope API key is required for QwenImageProvider")
+        # SDKs are imported here rather than at module level, so a mock run never loads them
+        import dashscope
         dashscope.api_key = self.api_key
 
+    @staticmethod
+    def _result_url(rsp) -> str:
+        if rsp.status_code == 200:
+            # The response structure might vary, usually rsp.output.results[0].url
+            if rsp.output and rsp.output.results:
+                return rsp.output.results[0].url
+            else:
+                raise Exception(f"Empty results from Qwen: {rsp}")
+        else:
+            raise Exception(f"Qwen API failed: {rsp.code} - {rsp.message}")
+
+    @staticmethod
+    def _finished(rsp) -> bool:
+        status = rsp.output.task_status if rsp.output else None
+        return status in ("SUCCEEDED", "FAILED", "CANCELED", "UNKNOWN") or rsp.status_code != 200
+
     def generate_image(self, prompt: str) -> str:
+        from dashscope import ImageSynthesis
         try:
-            rsp = ImageSynthesis.call(
-                model=ImageSynthesis.Models.wanx_v1,
-                prompt=prompt,
-                n=1,
-                size='1024*1024'
-            )
-            if rsp.status_code == 200:
-                # The response structure might vary, usually rsp.output.results[0].url
-                if rsp.output and rsp.output.results:
-                    return rsp.output.results[0].url
-                else:
-                    raise Exception(f"Empty results from Qwen: {rsp}")
-            else:
-                raise Exception(f"Qwen API failed: {rsp.code} - {rsp.message}")
+            with guarded_call("wanx", "wanx", "generate"):
+                rsp = ImageSynthesis.call(
+                    model=ImageSynthesis.Models.wanx_v1,
+                    prompt=prompt,
+                    n=1,
+                    size='1024*1024',
+                    request_timeout=int(timeout_for("image"))
+                )
+                return self._result_url(rsp)
+        except Exception as e:
+            print(f"Error generating image with Qwen: {e}")
+            raise e
+
+    def submit(self, prompt: str) -> Future:
+        """
+        Creates the DashScope task right away (so rendering starts now) and
+        polls for the result on the image pool.
+        """
+        from dashscope import ImageSynthesis
+        try:
+            with guarded_call("wanx", "wanx", "submit"):
+                task = ImageSynthesis.async_call(
+                    model=ImageSynthesis.Models.wanx_v1,
+                    prompt=prompt,
+                    n=1,
+                    size='1024*1024',
+                    request_timeout=int(timeout_for("image"))
+                )
+                if task.status_code != 200:
+                    raise ProviderError(task.status_code, f"Qwen API failed: {task.code} - {task.message}")
+        except Exception as e:
+            print(f"Error generating image with Qwen: {e}")
+            future = Future()
+            future.set_exception(e)
+            return future
+        return image_pool().submit(self._wait, task)
+
+    def _wait(self, task) -> str:
+        from dashscope import ImageSynthesis
+        # The whole render shares one deadline (each fetch is bounded by the SDK's own request timeout)
+        deadline = time.monotonic() + timeout_for("image")
+        try:
+            with guarded_call("wanx", "wanx", "generate"):
+                while True:
+                    rsp = ImageSynthesis.fetch(task)
+                    if self._finished(rsp):
+                        return self._result_url(rsp)
+                    if time.monotonic() >= deadline:
+                        raise TimeoutError(f"Wanx task not finished in {timeout_for('image'):.0f}s")
+                    time.sleep(self.poll_interval)
         except Exception as e:
             print(f"Error generating image with Qwen: {e}")
             raise e
@@ -58,16 +133,18 @@ class GeminiImageProvider(ImageProvider):
         self.api_key = api_key or os.getenv("GOOGLE_API_KEY")
         if not self.api_key:
             raise ValueError("Google API key is required for GeminiImageProvider")
+        import google.generativeai as genai
         genai.configure(api_key=self.api_key)
         self.model_name = model_name
         self.model = genai.ImageGenerationModel(model_name=self.model_name)
 
     def generate_image(self, prompt: str) -> str:
         try:
-            response = self.model.generate_images(
-                prompt=prompt,
-                number_of_images=1,
-            )
+            with guarded_call("imagen", "imagen", "generate"):
+                response = self.model.generate_images(
+                    prompt=prompt,
+                    number_of_images=1,
+                )
             # The SDK might return an object that needs saving or has a temporary URL.
             # Typically response.images[0] is the image data.
             # If we need a URL, we might need to upload it somewhere or save locally and serve.
@@ -88,10 +165,59 @@ class GeminiImageProvider(ImageProvider):
             # I'll need to update `wechat.py` to handle local files.
             
             image = response.images[0]
-            filename = f"temp_gen_{os.urandom(4).hex()}.png"
+            # Same tmp directory as the WeChat uploader; the image cache moves it out
+            tmp_dir = os.path.join(os.getcwd(), "tmp")
+            os.makedirs(tmp_dir, exist_ok=True)
+            filename = os.path.join(tmp_dir, f"temp_gen_{os.urandom(4).hex()}.png")
             image.save(filename)
             return os.path.abspath(filename)
             
         except Exception as e:
             print(f"Error generating image with Gemini: {e}")
             raise e
+
+
+class AsyncImageProvider(ABC):
+    @abstractmethod
+    async def generate_image(self, prompt: str) -> str:
+        """Returns the URL of the generated image"""
+        pass
+
+class AsyncQwenImageProvider(AsyncImageProvider, QwenImageProvider):
+    """
+    Wanx through DashScope's task API: submit, then poll without holding a
+    thread while the image renders (typically 10-30 s).
+    """
+    async def generate_image(self, prompt: str) -> str:
+        from dashscope import ImageSynthesis
+        deadline = time.monotonic() + timeout_for("image")
+        try:
+            with guarded_call("wanx", "wanx", "generate"):
+                task = await asyncio.to_thread(
+                    ImageSynthesis.async_call,
+                    model=ImageSynthesis.Models.wanx_v1,
+                    prompt=prompt,
+                    n=1,
+                    size='1024*1024',
+                    request_timeout=int(timeout_for("image"))
+                )
+                if task.status_code != 200:
+                    raise ProviderError(task.status_code, f"Qwen API failed: {task.code} - {task.message}")
+                while True:
+                    rsp = await asyncio.to_thread(ImageSynthesis.fetch, task)
+                    if self._finished(rsp):
+                        return self._result_url(rsp)
+                    if time.monotonic() >= deadline:
+                        raise TimeoutError(f"Wanx task not finished in {timeout_for('image'):.0f}s")
+                    await asyncio.sleep(self.poll_interval)
+        except Exception as e:
+            print(f"Error generating image with Qwen: {e}")
+            raise e
+
+class AsyncImageAdapter(AsyncImageProvider):
+    """Runs a sync ImageProvider in worker threads for the async pipeline."""
+    def __init__(self, image_gen: ImageProvider):
+        self.image_gen = image_gen
+
+    async def generate_image(self, prompt: str) -> str:
+        return await asyncio.to_thread(self.image_gen.generate_image, prompt)
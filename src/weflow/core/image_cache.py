@@ -0,0 +1,311 @@
+import os
+import re
+import json
+import time
+import shutil
+import asyncio
+import hashlib
+import threading
+from contextlib import contextmanager
+from concurrent.futures import Future
+from typing import Dict, Optional
+import requests
+try:
+    import fcntl
+except ImportError:  # Windows: in-process locking only
+    fcntl = None
+from .image import ImageProvider, AsyncImageProvider
+from .metrics import metrics
+from .resilience import timeout_for
+
+DEFAULT_REUSE_HOURS = {"cover": 24, "header": 7 * 24, "default": 7 * 24}
+
+
+def normalize_prompt(prompt: str) -> str:
+    return re.sub(r"\s+", " ", prompt.strip().lower()).rstrip(" .!")
+
+
+def parse_reuse_hours(spec: str) -> Dict[str, float]:
+    """"cover=24,header=168" -> {"cover": 24.0, "header": 168.0} on top of the defaults"""
+    hours = dict(DEFAULT_REUSE_HOURS)
+    for part in spec.split(","):
+        if "=" in part:
+            name, value = part.split("=", 1)
+            hours[name.strip()] = float(value)
+    return hours
+
+
+class GeneratedImageCache:
+    """
+    On-disk store of generated images.
+
+    Entries are keyed by (provider, model, normalized prompt) and point at
+    content-addressed blobs (sha256 of the image bytes), so identical images
+    are stored once. An entry is only reused within its prompt class's reuse
+    window (covers go stale faster than topic headers). The total size is
+    capped; least recently used blobs (by file mtime, touched on every hit)
+    are evicted first.
+
+    Several processes may share the directory (backfill workers, the
+    coordinator and its workers): changes to the index re-read it and
+    write it back under a file lock, so none overwrites another's entries.
+    Lookups only read it.
+
+    Each blob also remembers the WeChat permanent-material media_id per
+    account, so re-publishing the same cover needs neither generation nor upload.
+    """
+    def __init__(self, directory: str, max_bytes: int = 200 * 2**20, reuse_hours: Optional[Dict[str, float]] = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.reuse_hours = reuse_hours or dict(DEFAULT_REUSE_HOURS)
+        self.index_path = os.path.join(directory, "index.json")
+        self.session = requests.Session()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._index = self._load_index()
+        self._index_mtime = self._mtime(self.index_path)
+
+    @classmethod
+    def from_env(cls) -> Optional["GeneratedImageCache"]:
+        """IMAGE_CACHE=0 disables; IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_MB, IMAGE_CACHE_REUSE_HOURS tune it."""
+        if os.getenv("IMAGE_CACHE", "1").lower() in ("0", "false", "no"):
+            return None
+        return cls(
+            os.getenv("IMAGE_CACHE_DIR", os.path.join(os.getcwd(), ".cache", "images")),
+            max_bytes=int(float(os.getenv("IMAGE_CACHE_MAX_MB", "200")) * 2**20),
+            reuse_hours=parse_reuse_hours(os.getenv("IMAGE_CACHE_REUSE_HOURS", "")),
+        )
+
+    # --- Index ---
+
+    def _load_index(self) -> dict:
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        index.setdefault("entries", {})
+        index.setdefault("blobs", {})
+        # Drop blobs whose files were removed by hand
+        for digest in [d for d, b in index["blobs"].items() if not os.path.exists(b["path"])]:
+            del index["blobs"][digest]
+        index["entries"] = {k: e for k, e in index["entries"].items() if e["blob"] in index["blobs"]}
+        return index
+
+    def _save_index(self):
+        tmp = f"{self.index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._index, f, ensure_ascii=False)
+        os.replace(tmp, self.index_path)
+        self._index_mtime = self._mtime(self.index_path)
+
+    @staticmethod
+    def _mtime(path: str) -> Optional[int]:
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _refresh(self):
+        """Re-reads the index if another process changed it. Call with _lock held."""
+        mtime = self._mtime(self.index_path)
+        if mtime != self._index_mtime:
+            self._index = self._load_index()
+            self._index_mtime = mtime
+
+    @contextmanager
+    def _updating(self):
+        """Exclusive access to the latest index, saved on exit: merge-on-write across processes."""
+        with self._lock:
+            with open(f"{self.index_path}.lock", "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    self._index = self._load_index()
+                    yield self._index
+                    self._save_index()
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def key(provider: str, model: str, prompt: str) -> str:
+        return hashlib.sha256(f"{provider}\n{model}\n{normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+
+    # --- Lookup / store ---
+
+    def get(self, provider: str, model: str, prompt: str, prompt_class: str = "default") -> Optional[str]:
+        """Path of a cached image for this prompt, if one was made within the reuse window."""
+        window = self.reuse_hours.get(prompt_class, self.reuse_hours["default"]) * 3600
+        with self._lock:
+            self._refresh()
+            entry = self._index["entries"].get(self.key(provider, model, prompt))
+            blob = self._index["blobs"].get(entry["blob"]) if entry else None
+        hit = blob is not None and time.time() - entry["created_at"] <= window
+        if hit:
+            try:
+                # Recency lives in the blob's mtime, so a hit doesn't rewrite the index
+                os.utime(blob["path"])
+            except OSError:
+                hit = False  # evicted by another process meanwhile
+        metrics.record_cache(f"generated_image_{prompt_class}", hit=hit)
+        return blob["path"] if hit else None
+
+    def put(self, provider: str, model: str, prompt: str, image_url: str) -> str:
+        """Stores a generated image (URL or local temp file, which is moved in); returns its cached path."""
+        if os.path.exists(image_url):
+            with open(image_url, "rb") as f:
+                data = f.read()
+        else:
+            resp = self.session.get(image_url, timeout=timeout_for("download"))
+            resp.raise_for_status()
+            data = resp.content
+        if len(data) > self.max_bytes:
+            # Would be evicted as soon as it is stored
+            print(f"Generated image is {len(data)} bytes, over the cache's {self.max_bytes}; not caching it")
+            return image_url
+        digest = hashlib.sha256(data).hexdigest()
+        ext = os.path.splitext(image_url.split("?", 1)[0])[1].lower()
+        ext = ext if ext in (".png", ".jpg", ".jpeg", ".webp") else ".png"
+        path = os.path.join(self.directory, digest[:2], digest + ext)
+
+        with self._updating() as index:
+            if digest not in index["blobs"]:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if os.path.exists(image_url):
+                    shutil.move(image_url, path)
+                else:
+                    with open(path, "wb") as f:
+                        f.write(data)
+                index["blobs"][digest] = {"path": path, "bytes": len(data), "media_ids": {}}
+            else:
+                if os.path.exists(image_url):
+                    os.remove(image_url)
+                os.utime(index["blobs"][digest]["path"])
+            index["entries"][self.key(provider, model, prompt)] = {
+                "blob": digest,
+                "provider": provider,
+                "model": model,
+                "prompt": prompt,
+                "created_at": time.time(),
+            }
+            self._evict(index, keep=digest)
+            return index["blobs"][digest]["path"]
+
+    def _evict(self, index: dict, keep: str):
+        blobs = index["blobs"]
+        total = sum(b["bytes"] for b in blobs.values())
+        # Least recently used first; the blob just stored always stays
+        for digest in sorted((d for d in blobs if d != keep), key=lambda d: self._mtime(blobs[d]["path"]) or 0):
+            if total <= self.max_bytes:
+                break
+            blob = blobs.pop(digest)
+            total -= blob["bytes"]
+            try:
+                os.remove(blob["path"])
+            except OSError:
+                pass
+            metrics.inc("weflow_image_cache_evictions_total")
+        index["entries"] = {k: e for k, e in index["entries"].items() if e["blob"] in blobs}
+
+    # --- WeChat media ids ---
+
+    def _blob_for_path(self, path: str) -> Optional[dict]:
+        for blob in self._index["blobs"].values():
+            if blob["path"] == path:
+                return blob
+        return None
+
+    def media_id(self, path: str, account: str) -> Optional[str]:
+        with self._lock:
+            self._refresh()
+            blob = self._blob_for_path(path)
+            media_id = blob["media_ids"].get(account) if blob else None
+        if blob:
+            metrics.record_cache("wechat_cover_media", hit=media_id is not None)
+        return media_id
+
+    def remember_media_id(self, path: str, account: str, media_id: str):
+        with self._updating():
+            blob = self._blob_for_path(path)
+            if blob:
+                blob["media_ids"][account] = media_id
+
+
+def classify_prompt(prompt: str, prompt_classes: Dict[str, str]) -> str:
+    """Prompt class (reuse window) from {class: prompt prefix}; "default" if none match."""
+    normalized = normalize_prompt(prompt)
+    for name, prefix in prompt_classes.items():
+        if normalized.startswith(normalize_prompt(prefix)):
+            return name
+    return "default"
+
+
+class CachedImageProvider(ImageProvider):
+    """
+    Serves generated images from a GeneratedImageCache, generating (and
+    storing) on a miss. `prompt_classes` maps class names to prompt prefixes.
+    """
+    def __init__(self, image_gen: ImageProvider, cache: GeneratedImageCache, provider: str, prompt_classes: Optional[Dict[str, str]] = None):
+        self.image_gen = image_gen
+        self.cache = cache
+        self.provider = provider
+        self.prompt_classes = prompt_classes or {}
+        self.model = getattr(image_gen, "model_name", type(image_gen).__name__)
+
+    def _lookup(self, prompt: str) -> Optional[str]:
+        return self.cache.get(self.provider, self.model, prompt, classify_prompt(prompt, self.prompt_classes))
+
+    def _store(self, prompt: str, url: str) -> str:
+        try:
+            return self.cache.put(self.provider, self.model, prompt, url)
+        except Exception as e:
+            print(f"Could not cache generated image {url}: {e}")
+            return url
+
+    def generate_image(self, prompt: str) -> str:
+        cached = self._lookup(prompt)
+        if cached:
+            return cached
+        return self._store(prompt, self.image_gen.generate_image(prompt))
+
+    def submit(self, prompt: str) -> Future:
+        cached = self._lookup(prompt)
+        if cached:
+            future = Future()
+            future.set_result(cached)
+            return future
+        result = Future()
+
+        def done(f: Future):
+            try:
+                result.set_result(self._store(prompt, f.result()))
+            except Exception as e:
+                result.set_exception(e)
+
+        # Keeps the inner provider's own submit (e.g. DashScope's task API)
+        self.image_gen.submit(prompt).add_done_callback(done)
+        return result
+
+
+class AsyncCachedImageProvider(AsyncImageProvider):
+    """GeneratedImageCache in front of an async image provider; disk and download work runs in threads."""
+    def __init__(self, image_gen: AsyncImageProvider, cache: GeneratedImageCache, provider: str, prompt_classes: Optional[Dict[str, str]] = None):
+        self.image_gen = image_gen
+        self.cache = cache
+        self.provider = provider
+        self.prompt_classes = prompt_classes or {}
+        inner = getattr(image_gen, "image_gen", image_gen)  # unwrap AsyncImageAdapter
+        self.model = getattr(inner, "model_name", type(inner).__name__)
+
+    async def generate_image(self, prompt: str) -> str:
+        prompt_class = classify_prompt(prompt, self.prompt_classes)
+        cached = await asyncio.to_thread(self.cache.get, self.provider, self.model, prompt, prompt_class)
+        if cached:
+            return cached
+        url = await self.image_gen.generate_image(prompt)
+        try:
+            return await asyncio.to_thread(self.cache.put, self.provider, self.model, prompt, url)
+        except Exception as e:
+            print(f"Could not cache generated image {url}: {e}")
+            return url
@@ -0,0 +1,188 @@
+import os
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+import requests
+from .metrics import metrics
+from .resilience import timeout_for
+
+SCREEN_TOTAL = "weflow_image_screen_total"
+
+# JPEG start-of-frame markers (carry the dimensions); C4/C8/CC are not frames
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def sniff_image(data: bytes):
+    """(mime, width, height) from the first bytes of an image; None for what can't be read."""
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        w, h = struct.unpack(">II", data[16:24])
+        return "image/png", w, h
+    if data[:6] in (b"GIF87a", b"GIF89a") and len(data) >= 10:
+        w, h = struct.unpack("<HH", data[6:10])
+        return "image/gif", w, h
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP" and len(data) >= 30:
+        chunk = data[12:16]
+        if chunk == b"VP8 ":
+            w, h = struct.unpack("<HH", data[26:30])
+            return "image/webp", w & 0x3FFF, h & 0x3FFF
+        if chunk == b"VP8L":
+            bits = int.from_bytes(data[21:25], "little")
+            return "image/webp", (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8X":
+            return "image/webp", int.from_bytes(data[24:27], "little") + 1, int.from_bytes(data[27:30], "little") + 1
+        return "image/webp", None, None
+    if data[:2] == b"BM" and len(data) >= 26:
+        w, h = struct.unpack("<ii", data[18:26])
+        return "image/bmp", w, abs(h)
+    if data[:2] == b"\xff\xd8":
+        i = 2
+        while i + 9 < len(data):
+            if data[i] != 0xFF:
+                break
+            marker = data[i + 1]
+            if marker == 0xFF:  # fill byte
+                i += 1
+                continue
+            if marker in _JPEG_SOF:
+                h, w = struct.unpack(">HH", data[i + 5:i + 9])
+                return "image/jpeg", w, h
+            if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+                i += 2
+                continue
+            i += 2 + struct.unpack(">H", data[i + 2:i + 4])[0]
+        return "image/jpeg", None, None  # SOF beyond the probed bytes (huge EXIF)
+    head = data[:256].lstrip().lower()
+    if head.startswith(b"<svg") or (head.startswith(b"<?xml") and b"<svg" in data[:1024].lower()):
+        return "image/svg+xml", None, None
+    return None, None, None
+
+
+class ImageInfo:
+    def __init__(self, url: str, position: int, mime: Optional[str] = None, width: Optional[int] = None, height: Optional[int] = None, size: Optional[int] = None, reason: Optional[str] = None):
+        self.url = url
+        self.position = position    # order of appearance in the topic's articles
+        self.mime = mime
+        self.width = width
+        self.height = height
+        self.size = size            # total bytes, from Content-Range/Content-Length
+        self.reason = reason        # why it was dropped; None if kept
+
+    @property
+    def score(self) -> float:
+        # Bigger and earlier is better; unknown dimensions rank after every measured image
+        if not (self.width and self.height):
+            return 0.0
+        return (self.width * self.height) ** 0.5 / (1 + 0.25 * self.position)
+
+    def __repr__(self):
+        return f"ImageInfo({self.url!r}, {self.mime}, {self.width}x{self.height}, {self.size}B, {self.reason or 'kept'})"
+
+
+class ImageScreen:
+    """
+    Cheap pre-screen for image candidates, run before any vision or upload call.
+
+    Each URL costs one ranged GET for the first `probe_bytes`, enough for the
+    MIME type, the pixel dimensions (PNG/GIF/JPEG/WebP/BMP headers) and the
+    total size from Content-Range. Tracking pixels, avatars, icons, badges,
+    banners and SVGs are dropped; the rest are ranked by size and position.
+    Probe results are kept per URL, so several topics or digests share them.
+    """
+    def __init__(
+        self,
+        min_width: int = 200,
+        min_height: int = 120,
+        min_bytes: int = 1024,
+        max_aspect: float = 4.0,
+        probe_bytes: int = 32 * 1024,
+        workers: int = 8,
+        timeout: float = 10,
+    ):
+        self.min_width = min_width
+        self.min_height = min_height
+        self.min_bytes = min_bytes
+        self.max_aspect = max_aspect
+        self.probe_bytes = probe_bytes
+        self.workers = workers
+        self.timeout = timeout
+        self.session = requests.Session()
+        self._lock = threading.Lock()
+        self._probed = {}  # url -> (mime, width, height, size, error)
+
+    @classmethod
+    def from_env(cls) -> Optional["ImageScreen"]:
+        """IMAGE_SCREEN=0 disables; IMAGE_MIN_WIDTH, IMAGE_MIN_HEIGHT, IMAGE_MIN_BYTES, IMAGE_MAX_ASPECT tune it."""
+        if os.getenv("IMAGE_SCREEN", "1").lower() in ("0", "false", "no"):
+            return None
+        return cls(
+            min_width=int(os.getenv("IMAGE_MIN_WIDTH", "200")),
+            min_height=int(os.getenv("IMAGE_MIN_HEIGHT", "120")),
+            min_bytes=int(os.getenv("IMAGE_MIN_BYTES", "1024")),
+            max_aspect=float(os.getenv("IMAGE_MAX_ASPECT", "4.0")),
+        )
+
+    def _probe(self, url: str):
+        with self._lock:
+            if url in self._probed:
+                return self._probed[url]
+        try:
+            with metrics.provider_call("image-probe", "range_get"):
+                resp = self.session.get(url, headers={"Range": f"bytes=0-{self.probe_bytes - 1}"}, stream=True, timeout=min(self.timeout, timeout_for("download")))
+                try:
+                    resp.raise_for_status()
+                    data = b""
+                    for chunk in resp.iter_content(8192):
+                        data += chunk
+                        if len(data) >= self.probe_bytes:
+                            break
+                finally:
+                    resp.close()
+            total = None
+            content_range = resp.headers.get("Content-Range", "")
+            if "/" in content_range and content_range.rsplit("/", 1)[1].isdigit():
+                total = int(content_range.rsplit("/", 1)[1])
+            elif resp.status_code == 200 and resp.headers.get("Content-Length", "").isdigit():
+                total = int(resp.headers["Content-Length"])
+            mime, width, height = sniff_image(data)
+            result = (mime or resp.headers.get("Content-Type", "").split(";")[0].strip() or None, width, height, total, None)
+        except Exception as e:
+            result = (None, None, None, None, f"probe failed: {type(e).__name__}")
+        with self._lock:
+            self._probed[url] = result
+        return result
+
+    def _judge(self, info: ImageInfo, error: Optional[str]) -> Optional[str]:
+        if error:
+            return error
+        if not info.mime or not info.mime.startswith("image/"):
+            return "not an image"
+        if info.mime == "image/svg+xml":
+            return "svg"
+        if info.size is not None and info.size < self.min_bytes:
+            return "too few bytes"
+        if info.width and info.height:
+            if info.width < self.min_width or info.height < self.min_height:
+                return "too small"
+            if max(info.width, info.height) / min(info.width, info.height) > self.max_aspect:
+                return "extreme aspect ratio"
+        return None
+
+    def screen(self, urls: List[str]) -> List[ImageInfo]:
+        """Probes `urls` (in order of appearance) and returns the keepers, best first."""
+        urls = list(dict.fromkeys(urls))
+        if not urls:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(urls))) as executor:
+            probes = list(executor.map(self._probe, urls))
+
+        kept = []
+        for position, (url, (mime, width, height, size, error)) in enumerate(zip(urls, probes)):
+            info = ImageInfo(url, position, mime, width, height, size)
+            info.reason = self._judge(info, error)
+            metrics.inc(SCREEN_TOTAL, result=info.reason or "kept")
+            if info.reason:
+                print(f"Skipping image ({info.reason}): {url}")
+            else:
+                kept.append(info)
+        return sorted(kept, key=lambda i: (-i.score, i.position))
@@ -1,7 +1,36 @@
 from abc import ABC, abstractmethod
 import os
-from openai import OpenAI
+import re
+import asyncio
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
+from .metrics import metrics
+from .resilience import guarded_call, timeout_for
+
+# Synthesis input sizing. A cluster whose source text fits SYNTH_DIRECT_CHARS is
+# written from one prompt; larger clusters are packed into sub-groups of about
+# SYNTH_GROUP_CHARS, condensed in parallel (map) and written from the briefs (reduce).
+ARTICLE_CHARS = 8000      # per-article cut in the synthesis prompt
+BRIEF_CHARS = 1500        # groups at or under this are passed through uncondensed
+MAX_CONDENSE_LEVELS = 2
+
+# Sectional unification: finished sections are kept verbatim and only the glue
+# (intro, one transition per section boundary, conclusion) is generated.
+OUTLINE_CHARS = 600       # how much of a section the glue prompts see
+GLUE_MAX_TOKENS = 400
+IMAGE_LINK = re.compile(r'!\[[^\]]*\]\(([^)\s]+)\)')
+
+def image_links(markdown: str) -> list[str]:
+    return IMAGE_LINK.findall(markdown or "")
+
+def synthesis_limits() -> tuple[int, int, int]:
+    """(direct chars, group chars, parallel condense calls) from SYNTH_DIRECT_CHARS, SYNTH_GROUP_CHARS, SYNTH_MAP_WORKERS"""
+    return (
+        int(os.getenv("SYNTH_DIRECT_CHARS", "24000")),
+        int(os.getenv("SYNTH_GROUP_CHARS", "12000")),
+        int(os.getenv("SYNTH_MAP_WORKERS", "8")),
+    )
 
 class LLMProvider(ABC):
     @abstractmethod
@@ -14,18 +43,22 @@ class LLMProvider(ABC):
         """Synthesizes multiple articles into a single HTML report"""
         pass
 
-class DeepSeekLLM(LLMProvider):
-    def __init__(self, api_key: Optional[str] = None, base_url: str = "https://api.deepseek.com"):
+class DeepSeekPrompts:
+    """
+    Prompt building and reply handling shared by the sync and async DeepSeek
+    clients, so the two differ only in how `_chat` calls are run.
+    """
+
+    def _configure(self, api_key: Optional[str], base_url: Optional[str], model: str) -> dict:
+        """Sets the key and model (DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL) and returns the OpenAI client arguments."""
         self.api_key = api_key or os.getenv("DEEPSEEK_API_KEY")
         if not self.api_key:
             raise ValueError("DeepSeek API key is required")
-        self.client = OpenAI(api_key=self.api_key, base_url=base_url)
+        self.model = model
+        return {"api_key": self.api_key, "base_url": base_url or os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com")}
 
-    def summarize(self, content: str) -> str:
-        # Backward compatibility or simple usage
-        return self.analyze(content)
-
-    def analyze(self, content: str) -> str:
+    @staticmethod
+    def _analyze_messages(content: str) -> list[dict]:
         prompt = f"""
         You are a Senior Technical Editor. Analyze the following article content.
 
@@ -47,29 +80,21 @@ class DeepSeekLLM(LLMProvider):
         **Content**:
         {content[:15000]}
         """
+        return [
+            {"role": "system", "content": "You are a helpful assistant that outputs strictly valid JSON."},
+            {"role": "user", "content": prompt}
+        ]
 
-        try:
-            response = self.client.chat.completions.create(
-                model="deepseek-chat",
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant that outputs strictly valid JSON."},
-                    {"role": "user", "content": prompt}
-                ],
-                stream=False,
-                response_format={ "type": "json_object" }
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            print(f"Error analyzing content: {e}")
-            return "{}"
-
-    def synthesize_report(self, articles_data: list[dict], topic: str, images: list[dict] = []) -> str:
+    @staticmethod
+    def _synthesis_messages(articles_data: list[dict], topic: str, images: list[dict]) -> list[dict]:
         # articles_data: list of dicts with 'title', 'source_name', 'content' (or summary)
         # images: list of dicts with 'url', 'description'
 
         combined_text = ""
         for i, art in enumerate(articles_data):
-            combined_text += f"--- Article {i+1} ---\nTitle: {art.get('title')}\nSource: {art.get('source_name')}\nContent: {art.get('content')[:8000]}\n\n"
+            also = art.get('also_reported_by')
+            also_line = f"Also reported by: {', '.join(also)}\n" if also else ""
+            combined_text += f"--- Article {i+1} ---\nTitle: {art.get('title')}\nSource: {art.get('source_name')}\n{also_line}Content: {(art.get('content') or '')[:ARTICLE_CHARS]}\n\n"
 
         image_context = ""
         if images:
@@ -99,22 +124,84 @@ class DeepSeekLLM(LLMProvider):
         **Source Material**:
         {combined_text}
         """
+        return [
+            {"role": "system", "content": "You are a specific technical writer. You output ONLY Markdown content. No conversational fillers."},
+            {"role": "user", "content": prompt}
+        ]
 
-        try:
-            response = self.client.chat.completions.create(
-                model="deepseek-chat",
-                messages=[
-                    {"role": "system", "content": "You are a specific technical writer. You output ONLY Markdown content. No conversational fillers."},
-                    {"role": "user", "content": prompt}
-                ],
-                stream=False
-            )
-            return response.choices[0].message.content.strip() # Strip to remove any potential whitespace
-        except Exception as e:
-            print(f"Error synthesizing report: {e}")
-            return f"Error generating report for {topic}."
+    @staticmethod
+    def _synthesis_groups(articles_data: list[dict]) -> list[list[dict]]:
+        """Consecutive sub-groups to condense before writing; empty when the cluster fits one prompt."""
+        direct_chars, group_chars, _ = synthesis_limits()
+        sizes = [min(len(art.get('content') or ''), ARTICLE_CHARS) for art in articles_data]
+        if len(articles_data) < 2 or sum(sizes) <= direct_chars:
+            return []
+        groups, current, current_chars = [], [], 0
+        for art, size in zip(articles_data, sizes):
+            if current and current_chars + size > group_chars:
+                groups.append(current)
+                current, current_chars = [], 0
+            current.append(art)
+            current_chars += size
+        groups.append(current)
+        return groups
 
-    def generate_digest_title(self, topics: list[str]) -> str:
+    @staticmethod
+    def _condense_messages(group: list[dict], topic: str) -> list[dict]:
+        sources = ""
+        for i, art in enumerate(group):
+            summary = art.get('summary')
+            summary_line = f"Triage summary: {summary}\n" if summary else ""
+            sources += f"--- Source {i+1} ---\nTitle: {art.get('title')}\nSource: {art.get('source_name')}\n{summary_line}Content: {(art.get('content') or '')[:ARTICLE_CHARS]}\n\n"
+
+        prompt = f"""
+        Condense the following source material on **"{topic}"** into one dense brief for an editor who will write the final report.
+
+        **Requirements**:
+        1. Start from each triage summary and add what it leaves out: concrete facts, numbers, names, dates, claims and caveats.
+        2. Keep which source said what (by title) when sources differ.
+        3. No introduction, no conclusion, no opinions. Plain bullet points.
+        4. At most {BRIEF_CHARS} characters.
+
+        **Sources**:
+        {sources}
+        """
+        return [
+            {"role": "system", "content": "You are a research assistant who condenses source articles into dense factual briefs."},
+            {"role": "user", "content": prompt}
+        ]
+
+    @staticmethod
+    def _brief_entry(group: list[dict], brief: Optional[str]) -> dict:
+        """One reduce-step input standing in for a condensed group; summaries when the brief failed."""
+        if len(group) == 1 and not brief:
+            return group[0]
+        if not brief:
+            brief = "\n".join(f"- {art.get('title')}: {art.get('summary') or (art.get('content') or '')[:BRIEF_CHARS // len(group)]}" for art in group)
+        also = [name for art in group for name in (art.get('also_reported_by') or [])]
+        return {
+            "title": " / ".join(str(art.get('title')) for art in group),
+            "source_name": ", ".join(dict.fromkeys(str(art.get('source_name')) for art in group)),
+            "content": brief,
+            "also_reported_by": list(dict.fromkeys(also)),
+        }
+
+    @classmethod
+    def _passthrough_brief(cls, group: list[dict]) -> Optional[dict]:
+        """The reduce-step input for a group already short enough to be its own brief; None if it needs condensing."""
+        if sum(len(art.get('content') or '') for art in group) <= BRIEF_CHARS:
+            return cls._brief_entry(group, "\n\n".join(art.get('content') or '' for art in group))
+        return None
+
+    @classmethod
+    def _condense_plan(cls, articles_data: list[dict]) -> list[list[dict]]:
+        """First-level sub-groups of a cluster (empty when it is written directly), counted by synthesis mode."""
+        groups = cls._synthesis_groups(articles_data)
+        metrics.inc("weflow_synthesis_total", mode="map_reduce" if groups else "direct")
+        return groups
+
+    @staticmethod
+    def _title_messages(topics: list[str]) -> list[dict]:
         prompt = f"""
         Generate a catchy, professional, and concise title for a daily AI technology digest covering the following topics:
         {', '.join(topics)}
@@ -125,24 +212,22 @@ class DeepSeekLLM(LLMProvider):
         3. Length: Maximum 20 characters.
         4. Format: Plain text, no quotes, no markdown.
         """
-        try:
-            response = self.client.chat.completions.create(
-                model="deepseek-chat",
-                messages=[
-                    {"role": "system", "content": "You are a creative editor."},
-                    {"role": "user", "content": prompt}
-                ],
-                stream=False
-            )
-            title = response.choices[0].message.content.strip()
-            # Remove quotes if present
-            title = title.replace('"', '').replace('”', '').replace('“', '')
-            return title
-        except Exception as e:
-            print(f"Error generating title: {e}")
-            return f"WeFlow Daily - {datetime.now().strftime('%Y-%m-%d')}"
+        return [
+            {"role": "system", "content": "You are a creative editor."},
+            {"role": "user", "content": prompt}
+        ]
 
-    def unify_daily_digest(self, combined_markdown: str) -> str:
+    @staticmethod
+    def _clean_title(content: str) -> str:
+        # Remove quotes if present
+        return content.strip().replace('"', '').replace('”', '').replace('“', '')
+
+    @staticmethod
+    def _fallback_title() -> str:
+        return f"WeFlow Daily - {datetime.now().strftime('%Y-%m-%d')}"
+
+    @staticmethod
+    def _unify_messages(combined_markdown: str) -> list[dict]:
         prompt = f"""
         You are a Chief Editor for a top-tier tech publication.
         **Goal**: Re-write and polish the following collection of topic reports into a single, cohesive Daily Digest.
@@ -157,16 +242,312 @@ class DeepSeekLLM(LLMProvider):
         **Draft Content**:
         {combined_markdown}
         """
-        try:
+        return [
+            {"role": "system", "content": "You are a Chief Editor. Output Markdown only."},
+            {"role": "user", "content": prompt}
+        ]
+
+    @staticmethod
+    def _outline(section: str, tail: bool = False) -> str:
+        """Image-free head (or tail) of a section, as context for the glue prompts."""
+        text = re.sub(r"\n{3,}", "\n\n", IMAGE_LINK.sub("", section)).strip()
+        return text[-OUTLINE_CHARS:] if tail else text[:OUTLINE_CHARS]
+
+    @staticmethod
+    def _glue_messages(task: str, context: str) -> list[dict]:
+        prompt = f"""
+        You are finishing a Daily Digest whose topic sections are already written and must not change.
+        **Task**: {task}
+
+        **Requirements**:
+        1. Language: Chinese (Simplified), "Tech Crunch" style.
+        2. 1-3 sentences, one paragraph. No headers, no images, no lists, no links.
+        3. Do NOT repeat the sections; connect them.
+        4. Output the paragraph only. No conversational fillers.
+
+        **Context**:
+        {context}
+        """
+        return [
+            {"role": "system", "content": "You are a Chief Editor writing connective copy between finished sections. Output one plain paragraph."},
+            {"role": "user", "content": prompt}
+        ]
+
+    @classmethod
+    def _glue_requests(cls, sections: list[str]) -> list[list[dict]]:
+        """Messages for [intro, transition 1..n-1, conclusion]."""
+        outlines = "\n\n".join(f"--- Section {i+1} ---\n{cls._outline(sec)}" for i, sec in enumerate(sections))
+        requests = [cls._glue_messages("Write the opening paragraph that introduces today's digest and its topics.", outlines)]
+        for i in range(len(sections) - 1):
+            context = f"--- End of previous section ---\n{cls._outline(sections[i], tail=True)}\n\n--- Start of next section ---\n{cls._outline(sections[i + 1])}"
+            requests.append(cls._glue_messages("Write the transition that leads from the previous section into the next one.", context))
+        requests.append(cls._glue_messages("Write the closing paragraph that draws today's topics together.", outlines))
+        return requests
+
+    @staticmethod
+    def _clean_glue(text: Optional[str]) -> str:
+        """Keeps generated glue to plain prose: no images, headers or rules that could disturb the sections."""
+        if not text:
+            return ""
+        lines = [l for l in IMAGE_LINK.sub("", text).splitlines() if not l.lstrip().startswith("#") and l.strip() != "---"]
+        return "\n".join(lines).strip()
+
+    @classmethod
+    def _assemble_sections(cls, sections: list[str], glue: list[Optional[str]]) -> str:
+        intro, transitions, conclusion = cls._clean_glue(glue[0]), [cls._clean_glue(g) for g in glue[1:-1]], cls._clean_glue(glue[-1])
+        parts = [intro] if intro else []
+        for i, section in enumerate(sections):
+            if i:
+                parts.append("---")
+                if transitions[i - 1]:
+                    parts.append(transitions[i - 1])
+            parts.append(section.strip())
+        if conclusion:
+            parts += ["---", conclusion]
+        return "\n\n".join(parts)
+
+    @staticmethod
+    def _check_images(before: str, after: str) -> bool:
+        """True when every image link of the draft is still in the unified text."""
+        kept = set(image_links(after))
+        lost = [url for url in dict.fromkeys(image_links(before)) if url not in kept]
+        metrics.inc("weflow_unify_image_check_total", result="lost" if lost else "ok")
+        if lost:
+            print(f"Unify dropped or changed {len(lost)} image links, e.g. {lost[0]}")
+        return not lost
+
+    @classmethod
+    def _unified_or_draft(cls, draft: str, unified: str) -> str:
+        # A rewrite can mangle URLs; the draft is better than a digest with broken images
+        return unified if cls._check_images(draft, unified) else draft
+
+    @classmethod
+    def _unified_sections(cls, sections: list[str], glue: list[Optional[str]]) -> str:
+        return cls._unified_or_draft("\n\n".join(sections), cls._assemble_sections(sections, glue))
+
+class DeepSeekLLM(LLMProvider, DeepSeekPrompts):
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None, model: str = "deepseek-chat"):
+        from openai import OpenAI  # deferred: the SDK is only loaded once an LLM is built
+        self.client = OpenAI(**self._configure(api_key, base_url, model))
+
+    def _chat(self, messages: list[dict], **kwargs) -> str:
+        """Runs one chat completion and returns the message content."""
+        kwargs.setdefault("timeout", timeout_for("llm"))
+        with guarded_call(f"llm:{self.model}", self.model, "chat"):
             response = self.client.chat.completions.create(
-                model="deepseek-chat",
-                messages=[
-                    {"role": "system", "content": "You are a Chief Editor. Output Markdown only."},
-                    {"role": "user", "content": prompt}
-                ],
-                stream=False
+                model=self.model,
+                messages=messages,
+                stream=False,
+                **kwargs
+            )
+        metrics.record_tokens(self.model, response.usage)
+        return response.choices[0].message.content
+
+    def summarize(self, content: str) -> str:
+        # Backward compatibility or simple usage
+        return self.analyze(content)
+
+    def analyze(self, content: str) -> str:
+        try:
+            return self._chat(
+                messages=self._analyze_messages(content),
+                response_format={ "type": "json_object" }
             )
-            return response.choices[0].message.content.strip()
+        except Exception as e:
+            print(f"Error analyzing content: {e}")
+            return "{}"
+
+    def _condense(self, group: list[dict], topic: str) -> dict:
+        passthrough = self._passthrough_brief(group)
+        if passthrough:
+            return passthrough
+        try:
+            brief = self._chat(messages=self._condense_messages(group, topic)).strip()
+        except Exception as e:
+            print(f"Error condensing {len(group)} articles for {topic}, using their summaries: {e}")
+            brief = None
+        return self._brief_entry(group, brief)
+
+    def _condensed_inputs(self, articles_data: list[dict], topic: str) -> list[dict]:
+        """Map step: condenses an oversized cluster's sub-groups in parallel until it fits one prompt."""
+        groups = self._condense_plan(articles_data)
+        if not groups:
+            return articles_data
+        _, _, workers = synthesis_limits()
+        for _ in range(MAX_CONDENSE_LEVELS):
+            print(f"Condensing {len(articles_data)} inputs for {topic} in {len(groups)} groups...")
+            with ThreadPoolExecutor(max_workers=max(1, min(workers, len(groups))), thread_name_prefix="synth-map") as executor:
+                articles_data = list(executor.map(lambda g: self._condense(g, topic), groups))
+            groups = self._synthesis_groups(articles_data)
+            if not groups:
+                break
+        return articles_data
+
+    def synthesize_report(self, articles_data: list[dict], topic: str, images: list[dict] = []) -> str:
+        try:
+            articles_data = self._condensed_inputs(articles_data, topic)
+            content = self._chat(messages=self._synthesis_messages(articles_data, topic, images))
+            return content.strip() # Strip to remove any potential whitespace
+        except Exception as e:
+            print(f"Error synthesizing report: {e}")
+            return f"Error generating report for {topic}."
+
+    def generate_digest_title(self, topics: list[str]) -> str:
+        try:
+            return self._clean_title(self._chat(messages=self._title_messages(topics)))
+        except Exception as e:
+            print(f"Error generating title: {e}")
+            return self._fallback_title()
+
+    def unify_daily_digest(self, combined_markdown: str) -> str:
+        try:
+            content = self._chat(messages=self._unify_messages(combined_markdown)).strip()
+            return self._unified_or_draft(combined_markdown, content)
         except Exception as e:
             print(f"Error unifying report: {e}")
             return combined_markdown # Return original if failure
+
+    def _glue(self, messages: list[dict]) -> Optional[str]:
+        try:
+            return self._chat(messages=messages, max_tokens=GLUE_MAX_TOKENS)
+        except Exception as e:
+            print(f"Error writing digest glue: {e}")
+            return None
+
+    def unify_sections(self, sections: list[str]) -> str:
+        """Keeps each finished section verbatim and writes only the intro, transitions and conclusion, in parallel."""
+        requests = self._glue_requests(sections)
+        with ThreadPoolExecutor(max_workers=min(len(requests), 8), thread_name_prefix="unify-glue") as executor:
+            glue = list(executor.map(self._glue, requests))
+        return self._unified_sections(sections, glue)
+
+
+class AsyncLLMProvider(ABC):
+    @abstractmethod
+    async def analyze(self, content: str) -> str:
+        """Returns JSON analysis of the content (topic, recommended, etc.)"""
+        pass
+
+    @abstractmethod
+    async def synthesize_report(self, articles_data: list[dict], topic: str) -> str:
+        """Synthesizes multiple articles into a single Markdown report"""
+        pass
+
+class AsyncDeepSeekLLM(AsyncLLMProvider, DeepSeekPrompts):
+    """asyncio-native DeepSeek client (AsyncOpenAI), same prompts as DeepSeekLLM."""
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None, model: str = "deepseek-chat"):
+        from openai import AsyncOpenAI
+        self.client = AsyncOpenAI(**self._configure(api_key, base_url, model))
+
+    async def _chat(self, messages: list[dict], **kwargs) -> str:
+        kwargs.setdefault("timeout", timeout_for("llm"))
+        with guarded_call(f"llm:{self.model}", self.model, "chat"):
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                stream=False,
+                **kwargs
+            )
+        metrics.record_tokens(self.model, response.usage)
+        return response.choices[0].message.content
+
+    async def analyze(self, content: str) -> str:
+        try:
+            return await self._chat(
+                messages=self._analyze_messages(content),
+                response_format={ "type": "json_object" }
+            )
+        except Exception as e:
+            print(f"Error analyzing content: {e}")
+            return "{}"
+
+    async def _condense(self, group: list[dict], topic: str) -> dict:
+        passthrough = self._passthrough_brief(group)
+        if passthrough:
+            return passthrough
+        try:
+            brief = (await self._chat(messages=self._condense_messages(group, topic))).strip()
+        except Exception as e:
+            print(f"Error condensing {len(group)} articles for {topic}, using their summaries: {e}")
+            brief = None
+        return self._brief_entry(group, brief)
+
+    async def _condensed_inputs(self, articles_data: list[dict], topic: str) -> list[dict]:
+        groups = self._condense_plan(articles_data)
+        if not groups:
+            return articles_data
+        _, _, workers = synthesis_limits()
+        sem = asyncio.Semaphore(max(1, workers))
+
+        async def condense(group):
+            async with sem:
+                return await self._condense(group, topic)
+
+        for _ in range(MAX_CONDENSE_LEVELS):
+            print(f"Condensing {len(articles_data)} inputs for {topic} in {len(groups)} groups...")
+            articles_data = list(await asyncio.gather(*(condense(g) for g in groups)))
+            groups = self._synthesis_groups(articles_data)
+            if not groups:
+                break
+        return articles_data
+
+    async def synthesize_report(self, articles_data: list[dict], topic: str, images: list[dict] = []) -> str:
+        try:
+            articles_data = await self._condensed_inputs(articles_data, topic)
+            content = await self._chat(messages=self._synthesis_messages(articles_data, topic, images))
+            return content.strip()
+        except Exception as e:
+            print(f"Error synthesizing report: {e}")
+            return f"Error generating report for {topic}."
+
+    async def generate_digest_title(self, topics: list[str]) -> str:
+        try:
+            return self._clean_title(await self._chat(messages=self._title_messages(topics)))
+        except Exception as e:
+            print(f"Error generating title: {e}")
+            return self._fallback_title()
+
+    async def unify_daily_digest(self, combined_markdown: str) -> str:
+        try:
+            content = (await self._chat(messages=self._unify_messages(combined_markdown))).strip()
+            return self._unified_or_draft(combined_markdown, content)
+        except Exception as e:
+            print(f"Error unifying report: {e}")
+            return combined_markdown
+
+    async def _glue(self, messages: list[dict]) -> Optional[str]:
+        try:
+            return await self._chat(messages=messages, max_tokens=GLUE_MAX_TOKENS)
+        except Exception as e:
+            print(f"Error writing digest glue: {e}")
+            return None
+
+    async def unify_sections(self, sections: list[str]) -> str:
+        glue = await asyncio.gather(*(self._glue(m) for m in self._glue_requests(sections)))
+        return self._unified_sections(sections, glue)
+
+    async def aclose(self):
+        await self.client.close()
+
+class AsyncLLMAdapter(AsyncLLMProvider):
+    """Runs a sync LLMProvider (e.g. HedgedLLM) in worker threads for the async pipeline."""
+    def __init__(self, llm: LLMProvider):
+        self.llm = llm
+
+    async def analyze(self, content: str) -> str:
+        return await asyncio.to_thread(self.llm.analyze, content)
+
+    async def synthesize_report(self, articles_data: list[dict], topic: str, images: list[dict] = []) -> str:
+        return await asyncio.to_thread(self.llm.synthesize_report, articles_data, topic, images)
+
+    async def generate_digest_title(self, topics: list[str]) -> str:
+        return await asyncio.to_thread(self.llm.generate_digest_title, topics)
+
+    async def unify_daily_digest(self, combined_markdown: str) -> str:
+        return await asyncio.to_thread(self.llm.unify_daily_digest, combined_markdown)
+
+    async def unify_sections(self, sections: list[str]) -> str:
+        return await asyncio.to_thread(self.llm.unify_sections, sections)
+
+    async def aclose(self):
+        pass
@@ -0,0 +1,268 @@
+import os
+import json
+import time
+import uuid
+import threading
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from .budget import budget
+from .profiling import profiler
+
+# Latency buckets (seconds) cover everything from a cache hit to a slow synthesis call
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+# Raw samples kept per series for exact percentiles in the JSON report
+MAX_SAMPLES = 10000
+
+STAGE_SECONDS = "weflow_stage_seconds"
+PROVIDER_SECONDS = "weflow_provider_call_seconds"
+LLM_TOKENS = "weflow_llm_tokens_total"
+UPLOAD_BYTES = "weflow_upload_bytes_total"
+CACHE_REQUESTS = "weflow_cache_requests_total"
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.samples = []
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        if len(self.samples) < MAX_SAMPLES:
+            self.samples.append(value)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class _NoopSpan:
+    """Returned when metrics are off: entering and leaving costs two method calls."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **labels):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    """Times a block and records it into a histogram; exceptions mark outcome="error"."""
+    __slots__ = ("metrics", "name", "labels", "start")
+
+    def __init__(self, metrics: "Metrics", name: str, labels: dict):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def set(self, **labels):
+        self.labels.update(labels)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        self.labels.setdefault("outcome", "error" if exc_type else "ok")
+        self.metrics.observe(self.name, elapsed, **self.labels)
+        return False
+
+
+class Metrics:
+    """
+    Process-wide instrumentation: timing spans, counters and histograms with
+    Prometheus textfile and JSON export. Everything is a no-op until enabled.
+    """
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started_at = time.time()
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._lock = threading.Lock()
+
+    def configure_from_env(self):
+        """WEFLOW_METRICS=1 turns collection on; METRICS_DIR sets where reports go."""
+        self.enabled = os.getenv("WEFLOW_METRICS", "").lower() in ("1", "true", "yes")
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.run_id = uuid.uuid4().hex[:12]
+            self.started_at = time.time()
+            self._histograms = {}
+            self._counters = {}
+
+    @staticmethod
+    def _key(labels: dict) -> LabelKey:
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    # --- Recording ---
+
+    def span(self, name: str, **labels):
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, name, labels)
+
+    def stage(self, stage: str):
+        """Span for one pipeline stage (fetch, crawl, analyze, ...); also scopes the profiler's samples."""
+        span = Span(self, STAGE_SECONDS, {"stage": stage}) if self.enabled else _NOOP_SPAN
+        return profiler.stage(stage, span) if profiler.enabled else span
+
+    def provider_call(self, provider: str, op: str):
+        """Span for one outbound provider call (also charged to the run budget)."""
+        budget.charge(calls=1)
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, PROVIDER_SECONDS, {"provider": provider, "op": op})
+
+    def observe(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = Histogram()
+            hist.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        if not self.enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def record_tokens(self, provider: str, usage):
+        """Counts prompt/completion tokens from an OpenAI-style `usage` object."""
+        if usage is None:
+            return
+        budget.charge(tokens=(getattr(usage, "prompt_tokens", 0) or 0) + (getattr(usage, "completion_tokens", 0) or 0))
+        if not self.enabled:
+            return
+        self.inc(LLM_TOKENS, getattr(usage, "prompt_tokens", 0) or 0, provider=provider, kind="prompt")
+        self.inc(LLM_TOKENS, getattr(usage, "completion_tokens", 0) or 0, provider=provider, kind="completion")
+
+    def record_upload(self, kind: str, num_bytes: int):
+        self.inc(UPLOAD_BYTES, num_bytes, kind=kind)
+
+    def record_cache(self, cache: str, hit: bool):
+        self.inc(CACHE_REQUESTS, cache=cache, result="hit" if hit else "miss")
+
+    # --- Export ---
+
+    @staticmethod
+    def _fmt_labels(key: LabelKey, extra: Optional[dict] = None) -> str:
+        items = list(key) + sorted((extra or {}).items())
+        if not items:
+            return ""
+        body = ",".join(f'{k}="{_escape_label(v)}"' for k, v in items)
+        return "{" + body + "}"
+
+    def to_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for key, hist in series.items():
+                    cumulative = 0
+                    for bound, count in zip(hist.buckets, hist.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{self._fmt_labels(key, {'le': repr(float(bound))})} {cumulative}")
+                    lines.append(f"{name}_bucket{self._fmt_labels(key, {'le': '+Inf'})} {hist.count}")
+                    lines.append(f"{name}_sum{self._fmt_labels(key)} {hist.sum}")
+                    lines.append(f"{name}_count{self._fmt_labels(key)} {hist.count}")
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{self._fmt_labels(key)} {value}")
+        lines.append("# TYPE weflow_last_run_timestamp_seconds gauge")
+        lines.append(f"weflow_last_run_timestamp_seconds {self.started_at}")
+        return "\n".join(lines) + "\n"
+
+    def report(self) -> dict:
+        with self._lock:
+            histograms = {
+                name: [
+                    {
+                        "labels": dict(key),
+                        "count": hist.count,
+                        "sum": round(hist.sum, 6),
+                        "p50": hist.percentile(0.5),
+                        "p95": hist.percentile(0.95),
+                        "max": max(hist.samples) if hist.samples else None,
+                    }
+                    for key, hist in series.items()
+                ]
+                for name, series in self._histograms.items()
+            }
+            counters = {
+                name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                for name, series in self._counters.items()
+            }
+        cache = {}
+        for entry in counters.get(CACHE_REQUESTS, []):
+            stats = cache.setdefault(entry["labels"]["cache"], {"hit": 0, "miss": 0})
+            stats[entry["labels"]["result"]] += entry["value"]
+        for stats in cache.values():
+            total = stats["hit"] + stats["miss"]
+            stats["hit_rate"] = round(stats["hit"] / total, 3) if total else None
+        return {
+            "run_id": self.run_id,
+            "started_at": datetime.fromtimestamp(self.started_at).isoformat(),
+            "duration_seconds": round(time.time() - self.started_at, 3),
+            "histograms": histograms,
+            "counters": counters,
+            "cache_hit_rates": cache,
+        }
+
+    def export(self, directory: Optional[str] = None) -> Optional[str]:
+        """
+        Writes `weflow.prom` (node_exporter textfile collector format, replaced
+        atomically) and `run-<timestamp>-<run_id>.json`. Returns the JSON path.
+        """
+        if not self.enabled:
+            return None
+        directory = directory or os.getenv("METRICS_DIR", "metrics")
+        os.makedirs(directory, exist_ok=True)
+
+        prom_path = os.path.join(directory, "weflow.prom")
+        tmp_path = prom_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, prom_path)
+
+        stamp = datetime.fromtimestamp(self.started_at).strftime("%Y%m%d-%H%M%S")
+        json_path = os.path.join(directory, f"run-{stamp}-{self.run_id}.json")
+        with profiler.allocations("metrics_json"), open(json_path, "w") as f:
+            json.dump(self.report(), f, indent=2, ensure_ascii=False)
+        print(f"Metrics written to {json_path}")
+        return json_path
+
+
+metrics = Metrics()
@@ -1,15 +1,58 @@
 from datetime import datetime
 from typing import Optional, List, Dict, Any
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field, field_serializer
+from .spill import SpillRef, content_store
 
 class Article(BaseModel):
+    # `content` is a property over `text` (or its spilled copy); the field keeps "content" as its wire name
+    model_config = ConfigDict(validate_by_name=True, validate_by_alias=True, serialize_by_alias=True, arbitrary_types_allowed=True)
+
     title: str
     url: str
+    entry_id: Optional[str] = None  # Feed entry id/GUID (falls back to the link)
     published_date: Optional[str] = None
+    published_at: Optional[datetime] = None  # Full feed timestamp (UTC), when the feed provides one
     source_name: Optional[str] = None
-    content: Optional[str] = None
+    text: Optional[str] = Field(default=None, alias="content")
     summary: Optional[str] = None
     analysis: Optional[Dict[str, Any]] = None
     image_url: Optional[str] = None
     media_id: Optional[str] = None  # WeChat media ID
     status: str = "pending" # pending, crawled, summarized, image_generated, uploaded, published
+    extra_sources: List[Dict[str, str]] = []  # Near-duplicate copies folded into this article (title, url, source_name)
+    spill: Optional[SpillRef] = Field(default=None, exclude=True, repr=False)  # where `content` lives once spilled to disk
+
+    def model_post_init(self, __context):
+        if content_store.should_spill(self.text):
+            self.content = self.text
+
+    @property
+    def content(self) -> Optional[str]:
+        """Crawled Markdown; read back from the spill store on every access, so don't hold on to it."""
+        if self.spill is not None:
+            return content_store.get(self.spill)
+        return self.text
+
+    @content.setter
+    def content(self, value: Optional[str]):
+        if content_store.should_spill(value):
+            self.spill, self.text = content_store.put(value), None
+        else:
+            self.spill, self.text = None, value
+
+    @property
+    def content_chars(self) -> int:
+        """len(content) without reading it back"""
+        if self.spill is not None:
+            return self.spill.nchars
+        return len(self.text) if self.text else 0
+
+    def content_head(self, max_chars: int) -> Optional[str]:
+        """The first `max_chars` characters of content; reads only that much from disk."""
+        if self.spill is not None:
+            return content_store.get(self.spill, max_chars)
+        return self.text[:max_chars] if self.text else self.text
+
+    @field_serializer("text")
+    def _serialize_content(self, text: Optional[str]) -> Optional[str]:
+        return self.content
@@ -1,20 +1,16 @@
 import os
+import httpx
 import requests
 import json
 from typing import Optional
+from .resilience import guarded_call, timeout_for
 
 class FeishuNotifier:
     def __init__(self, webhook_url: Optional[str] = None):
         self.webhook_url = webhook_url or os.getenv("FEISHU_WEBHOOK_URL")
 
-    def send_card(self, title: str, summary: str, article_url: str, cover_image_key: str = "") -> bool:
-        """
-        Sends a card message to Feishu.
-        """
-        if not self.webhook_url:
-            print("Feishu webhook not configured. Skipping notification.")
-            return False
-
+    @staticmethod
+    def _card_payload(title: str, summary: str, article_url: str) -> dict:
         # Simplified Card Structure
         card = {
             "config": {
@@ -56,13 +52,96 @@ class FeishuNotifier:
             "msg_type": "interactive",
             "card": card
         }
+        return payload
 
+    @staticmethod
+    def _digests_payload(cards: list[dict]) -> dict:
+        """One card listing several pushed drafts (title, summary, article_url each)"""
+        elements = []
+        for card in cards:
+            elements += [
+                {
+                    "tag": "div",
+                    "text": {
+                        "tag": "lark_md",
+                        "content": f"**{card['title']}**\n{card['summary']}"
+                    }
+                },
+                {
+                    "tag": "action",
+                    "actions": [
+                        {
+                            "tag": "button",
+                            "text": {"tag": "plain_text", "content": "View Article"},
+                            "url": card["article_url"],
+                            "type": "primary"
+                        }
+                    ]
+                },
+            ]
+        return {
+            "msg_type": "interactive",
+            "card": {
+                "config": {"wide_screen_mode": True},
+                "header": {
+                    "title": {"tag": "plain_text", "content": f"{len(cards)} Drafts Pushed ✅"},
+                    "template": "blue"
+                },
+                "elements": elements,
+            }
+        }
+
+    def send_card(self, title: str, summary: str, article_url: str, cover_image_key: str = "") -> bool:
+        """
+        Sends a card message to Feishu.
+        """
+        return self._send(self._card_payload(title, summary, article_url))
+
+    def send_cards(self, cards: list[dict]) -> bool:
+        """Sends several drafts (title, summary, article_url each) as one message."""
+        if len(cards) == 1:
+            return self.send_card(**cards[0])
+        return self._send(self._digests_payload(cards))
+
+    def _send(self, payload: dict) -> bool:
+        if not self.webhook_url:
+            print("Feishu webhook not configured. Skipping notification.")
+            return False
+
+        try:
+            with guarded_call("feishu", "feishu", "webhook"):
+                response = requests.post(
+                    self.webhook_url, 
+                    headers={"Content-Type": "application/json"}, 
+                    data=json.dumps(payload),
+                    timeout=timeout_for("notify")
+                )
+            response.raise_for_status()
+            res_data = response.json()
+            if res_data.get("code") == 0:
+                print("Feishu notification sent successfully.")
+                return True
+            else:
+                print(f"Feishu API error: {res_data}")
+                return False
+        except Exception as e:
+            print(f"Failed to send Feishu notification: {e}")
+            return False
+
+
+class AsyncFeishuNotifier:
+    """Sends the same card as FeishuNotifier over an httpx.AsyncClient."""
+    def __init__(self, webhook_url: Optional[str] = None, client: Optional[httpx.AsyncClient] = None):
+        self.webhook_url = webhook_url or os.getenv("FEISHU_WEBHOOK_URL")
+        self.client = client or httpx.AsyncClient(timeout=30)
+
+    async def send_card(self, title: str, summary: str, article_url: str, cover_image_key: str = "") -> bool:
+        if not self.webhook_url:
+            print("Feishu webhook not configured. Skipping notification.")
+            return False
         try:
-            response = requests.post(
-                self.webhook_url, 
-                headers={"Content-Type": "application/json"}, 
-                data=json.dumps(payload)
-            )
+            with guarded_call("feishu", "feishu", "webhook"):
+                response = await self.client.post(self.webhook_url, json=FeishuNotifier._card_payload(title, summary, article_url), timeout=timeout_for("notify"))
             response.raise_for_status()
             res_data = response.json()
             if res_data.get("code") == 0:
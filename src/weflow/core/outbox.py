@@ -0,0 +1,175 @@
+import json
+from typing import Any, Iterable, List, Optional, Tuple
+from sqlalchemy import create_engine, Column, String, DateTime, Text, Integer, and_, or_, exists
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+from .storage import Base
+from .queue import LeasedTable, _utcnow
+from .metrics import metrics
+
+PUBLISH = "publish"
+NOTIFY = "notify"
+
+PENDING = "pending"
+SENDING = "sending"
+DONE = "done"
+DEAD = "dead"
+
+OUTBOX_TOTAL = "weflow_outbox_total"
+OUTBOX_DELAY = "weflow_outbox_delay_seconds"
+
+
+class OutboxModel(Base):
+    __tablename__ = 'outbox'
+    id = Column(Integer, primary_key=True)
+    key = Column(String, unique=True, index=True)  # idempotency key: adding it again is a no-op
+    kind = Column(String, index=True)              # publish, notify
+    batch = Column(String, index=True)             # one pipeline run; its notifications go out together
+    payload = Column(Text)                         # JSON
+    status = Column(String, index=True, default=PENDING)
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=5)
+    available_at = Column(DateTime, default=_utcnow)  # retry backoff: not claimable before this
+    lease_owner = Column(String, nullable=True)
+    lease_expires = Column(DateTime, nullable=True)
+    result = Column(Text, nullable=True)           # JSON
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=_utcnow)
+    updated_at = Column(DateTime, default=_utcnow, onupdate=_utcnow)
+
+
+class OutboxStore(LeasedTable):
+    """
+    Publish and notify actions in the shared database, written by the
+    pipeline and sent later by OutboxDispatcher.
+
+    Claims, leases, backoff and dead-lettering work as in JobQueue
+    (LeasedTable). Each action carries an idempotency key, so adding the
+    same draft twice (a retried run over the same articles) sends it once.
+    Notifications of a batch only become claimable once none of the batch's
+    publish actions is still pending, so a multi-digest run is announced in
+    one go.
+
+    Delivery is at least once: an action whose lease runs out mid-send (the
+    dispatcher died) is sent again.
+    """
+    model = OutboxModel
+    waiting = PENDING
+    running = SENDING
+
+    def __init__(self, db_url: Optional[str] = None, engine=None, retry_delay: float = 30.0, max_attempts: int = 5):
+        if engine is None:
+            if not db_url:
+                raise ValueError("Database URL is required")
+            engine = create_engine(db_url)
+        super().__init__(engine, retry_delay)
+        self.max_attempts = max_attempts
+
+    # --- Producer side ---
+
+    def add(self, kind: str, key: str, payload: dict, batch: Optional[str] = None) -> Tuple[int, bool]:
+        """Adds an action unless its key is already there; returns (id, added)."""
+        session = self.Session()
+        try:
+            row = session.query(OutboxModel.id).filter_by(key=key).first()
+            if row is None:
+                try:
+                    row = OutboxModel(key=key, kind=kind, batch=batch, payload=json.dumps(payload, ensure_ascii=False), max_attempts=self.max_attempts)
+                    session.add(row)
+                    session.commit()
+                    metrics.inc(OUTBOX_TOTAL, kind=kind, outcome="added")
+                    return row.id, True
+                except IntegrityError:
+                    # Added concurrently under the same key
+                    session.rollback()
+                    row = session.query(OutboxModel.id).filter_by(key=key).one()
+            metrics.inc(OUTBOX_TOTAL, kind=kind, outcome="duplicate")
+            print(f"Outbox: {key} is already queued (#{row.id}), not adding it again.")
+            return row.id, False
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+
+    # --- Dispatcher side ---
+
+    def claim(self, owner: str, kind: str, limit: int = 10, lease_seconds: float = 300) -> List[dict]:
+        """Leases up to `limit` due actions of `kind`: pending, or sending with an expired lease."""
+        filters = [OutboxModel.kind == kind]
+        if kind == NOTIFY:
+            publish = aliased(OutboxModel)
+            filters.append(~exists().where(
+                publish.batch == OutboxModel.batch,
+                publish.kind == PUBLISH,
+                publish.status.in_([PENDING, SENDING]),
+            ))
+        return self._claim(owner, filters, limit, lease_seconds)
+
+    def _claimed(self, row: OutboxModel, attempt: int) -> dict:
+        return {
+            "id": row.id,
+            "key": row.key,
+            "kind": row.kind,
+            "batch": row.batch,
+            "payload": json.loads(row.payload),
+            "attempt": attempt,
+            "created_at": row.created_at,
+        }
+
+    def complete(self, action: dict, owner: str, result: Any = None, follow_up: Optional[List[tuple]] = None) -> bool:
+        """
+        Marks the action sent and stores its result. `follow_up` is a list of
+        (kind, key, payload) actions added in the same transaction (publish -> notify).
+        """
+        if not super().complete(action["id"], owner, result, follow_up):
+            return False
+        metrics.inc(OUTBOX_TOTAL, kind=action["kind"], outcome="sent")
+        metrics.observe(OUTBOX_DELAY, (_utcnow() - action["created_at"]).total_seconds(), kind=action["kind"])
+        return True
+
+    def _add_follow_up(self, session, row: OutboxModel, follow_up: List[tuple]):
+        for kind, key, payload in follow_up:
+            if session.query(OutboxModel.id).filter_by(key=key).first() is None:
+                session.add(OutboxModel(key=key, kind=kind, batch=row.batch, payload=json.dumps(payload, ensure_ascii=False), max_attempts=self.max_attempts))
+
+    def fail(self, action: dict, owner: str, error: str) -> str:
+        """Retries with exponential backoff, or dead-letters once attempts run out. Returns the new status."""
+        return super().fail(action["id"], owner, error)
+
+    def _retrying(self, row: OutboxModel, delay: float, error: str):
+        metrics.inc(OUTBOX_TOTAL, kind=row.kind, outcome="retry")
+        print(f"Outbox: {row.key} failed (attempt {row.attempts}/{row.max_attempts}), retrying in {delay:.0f}s: {error}")
+
+    def _dead(self, row: OutboxModel, error: str):
+        metrics.inc(OUTBOX_TOTAL, kind=row.kind, outcome="dead")
+        print(f"Outbox: {row.key} dead-lettered: {error}")
+
+    # --- Inspection ---
+
+    def unsent(self, batch: Optional[str] = None) -> int:
+        """Actions still pending or being sent."""
+        counts = self.counts(batch)
+        return counts.get(PENDING, 0) + counts.get(SENDING, 0)
+
+    def due(self, batches: Optional[Iterable[str]] = None) -> int:
+        """Actions being sent or ready to send now (not backing off), optionally only of `batches`."""
+        now = _utcnow()
+        session = self.Session()
+        try:
+            query = session.query(OutboxModel.id).filter(or_(
+                and_(OutboxModel.status == PENDING, OutboxModel.available_at <= now),
+                OutboxModel.status == SENDING,
+            ))
+            if batches is not None:
+                query = query.filter(OutboxModel.batch.in_(list(batches)))
+            return query.count()
+        finally:
+            session.close()
+
+    def dead_letters(self, kinds: Optional[Iterable[str]] = None) -> List[dict]:
+        filters = [OutboxModel.kind.in_(list(kinds))] if kinds else []
+        return [
+            {"id": r.id, "key": r.key, "kind": r.kind, "batch": r.batch, "attempts": r.attempts, "error": r.last_error}
+            for r in self._dead_rows(None, *filters)
+        ]
@@ -0,0 +1,304 @@
+import os
+import re
+import sys
+import time
+import threading
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+NO_STAGE = "(no stage)"
+# Stack depth kept per sample; deeper frames are cut at the root end
+MAX_DEPTH = 128
+
+Stack = Tuple[str, ...]
+
+
+def _thread_group(name: str) -> str:
+    # Pool workers ("ThreadPoolExecutor-0_3", "weflow-ingest_1") fold into one row per pool
+    return re.sub(r"_\d+$", "", name)
+
+
+class Profiler:
+    """
+    Stage-scoped sampling profiler for whole runs.
+
+    A background thread samples every thread's stack each `interval` seconds
+    and files the sample under the innermost pipeline stage open at the time
+    (metrics.stage feeds it). Each sample counts once toward wall-clock time
+    and is weighted by the thread's CPU time since its previous sample, so
+    the same run yields a wall profile (where it waits) and a CPU profile
+    (where it computes), across the worker pools too. `allocations(name)`
+    traces the Python allocations of one block (formatting, JSON dumps).
+
+    Stages are tracked per thread: a thread's samples go to the innermost
+    stage it opened itself (parallel digests and backfill days stay apart),
+    and pool workers that open none go to the stage opened most recently. Allocation blocks may overlap across threads: they share one
+    tracemalloc session, and a block's peak is only reported if no other
+    block ran during it.
+
+    `export()` writes flamegraph-ready collapsed stacks (flamegraph.pl,
+    speedscope, inferno) per stage and for the whole run, plus a top-N
+    hotspot summary.
+    """
+    def __init__(self, enabled: bool = False, interval: float = 0.005, directory: str = "profiles", top: int = 20):
+        self.enabled = enabled
+        self.interval = interval
+        self.directory = directory
+        self.top = top
+        self._lock = threading.Lock()
+        self._local = threading.local()  # .stages: this thread's open stages, innermost last
+        self._active = {}                # thread ident -> that thread's open stages
+        self._opened = []                # every open stage in opening order, for threads with none of their own
+        self._blocks = []                # open allocation blocks; tracemalloc runs while there are any
+        self._owns_tracing = False
+        self._thread = None
+        self._stop = threading.Event()
+        self._reset()
+
+    def configure_from_env(self):
+        """WEFLOW_PROFILE=1 starts sampling; PROFILE_DIR, PROFILE_INTERVAL_MS (5), PROFILE_TOP (20)"""
+        self.enabled = os.getenv("WEFLOW_PROFILE", "").lower() in ("1", "true", "yes")
+        self.directory = os.getenv("PROFILE_DIR", "profiles")
+        self.interval = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+        self.top = int(os.getenv("PROFILE_TOP", "20"))
+        if self.enabled:
+            self.start()
+
+    def _reset(self):
+        self.started_at = time.time()
+        self.samples = 0
+        self._seconds: Dict[str, float] = defaultdict(float)     # stage -> wall seconds it was the innermost open stage
+        self._wall: Dict[str, Counter] = defaultdict(Counter)    # stage -> (thread, stack) -> samples
+        self._cpu: Dict[str, Counter] = defaultdict(Counter)     # stage -> (thread, stack) -> CPU microseconds
+        self._allocations = []                                   # (name, seconds, peak bytes, net bytes, top lines)
+        self._labels = {}                                        # code object -> frame label
+        self._cpu_seen = {}                                      # thread ident -> CPU seconds at its last sample
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._reset()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="weflow-profiler", daemon=True)
+        self._thread.start()
+        print(f"Profiling: sampling every {self.interval * 1000:g} ms")
+
+    # --- Recording ---
+
+    @contextmanager
+    def stage(self, name: str, span):
+        """Files this thread's samples under `name` while the block (and the metrics span it wraps) runs."""
+        stages = getattr(self._local, "stages", None)
+        if stages is None:
+            stages = self._local.stages = []
+        ident = threading.get_ident()
+        with self._lock:
+            stages.append(name)
+            self._active[ident] = stages
+            self._opened.append(name)
+        try:
+            with span:
+                yield span
+        finally:
+            with self._lock:
+                stages.pop()
+                if not stages:
+                    self._active.pop(ident, None)
+                # The latest opening of this name
+                del self._opened[len(self._opened) - 1 - self._opened[::-1].index(name)]
+
+    def _start_tracing(self) -> dict:
+        """Joins the shared tracemalloc session; returns the block's state."""
+        block = {"overlapped": False}
+        with self._lock:
+            if not self._blocks:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start(1)  # only the allocating line is reported; deeper tracebacks slow the block badly
+                    self._owns_tracing = True
+                else:
+                    self._owns_tracing = False  # started outside the profiler; leave it running
+                tracemalloc.reset_peak()
+            else:
+                # The peak is shared from here on, so no open block can claim it
+                block["overlapped"] = True
+                for other in self._blocks:
+                    other["overlapped"] = True
+            self._blocks.append(block)
+        return block
+
+    def _stop_tracing(self, block: dict):
+        with self._lock:
+            self._blocks.remove(block)
+            if not self._blocks and self._owns_tracing:
+                tracemalloc.stop()
+
+    @contextmanager
+    def allocations(self, name: str):
+        """
+        Traces what the block allocates (tracemalloc); a no-op unless
+        profiling. Profiling failures are logged, never raised into the block.
+        """
+        if not self.enabled:
+            yield
+            return
+        block = None
+        try:
+            block = self._start_tracing()
+            base = tracemalloc.get_traced_memory()[0]
+            before = tracemalloc.take_snapshot()
+        except Exception as e:
+            print(f"Profiling: allocation tracking for {name} failed: {e}")
+            if block is not None:
+                self._stop_tracing(block)
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            try:
+                seconds = time.perf_counter() - start
+                current, peak = tracemalloc.get_traced_memory()
+                after = tracemalloc.take_snapshot()
+                filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+                diff = after.filter_traces(filters).compare_to(before.filter_traces(filters), "lineno")
+                lines = [(str(stat.traceback[0]), stat.size_diff, stat.count_diff) for stat in diff[:self.top] if stat.size_diff > 0]
+                with self._lock:
+                    block_peak = None if block["overlapped"] else peak - base
+                    self._allocations.append((name, seconds, block_peak, current - base, lines))
+            except Exception as e:
+                print(f"Profiling: allocation tracking for {name} failed: {e}")
+            finally:
+                self._stop_tracing(block)
+
+    # --- Sampling ---
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def _stack(self, frame) -> Stack:
+        labels = []
+        while frame is not None and len(labels) < MAX_DEPTH:
+            labels.append(self._label(frame.f_code))
+            frame = frame.f_back
+        return tuple(reversed(labels))
+
+    @staticmethod
+    def _thread_cpu(ident: int) -> Optional[float]:
+        try:
+            return time.clock_gettime(time.pthread_getcpuclockid(ident))
+        except (AttributeError, OSError, ValueError):
+            return None  # not Linux/macOS, or the thread just exited
+
+    def _run(self):
+        me = threading.get_ident()
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                stages = {ident: open_stages[-1] for ident, open_stages in self._active.items() if open_stages}
+                latest = self._opened[-1] if self._opened else NO_STAGE
+            now = time.perf_counter()
+            # Wall seconds per stage: once per sample for every stage some thread has open
+            for stage in set(stages.values()) or {NO_STAGE}:
+                self._seconds[stage] += now - last
+            last = now
+            names = {t.ident: _thread_group(t.name) for t in threading.enumerate()}
+            frames = sys._current_frames()
+            for ident, frame in frames.items():
+                if ident == me:
+                    continue
+                stage = stages.get(ident, latest)
+                key = (names.get(ident, "thread"), self._stack(frame))
+                self._wall[stage][key] += 1
+                cpu = self._thread_cpu(ident)
+                if cpu is not None:
+                    spent = cpu - self._cpu_seen.get(ident, cpu)
+                    self._cpu_seen[ident] = cpu
+                    if spent > 0:
+                        self._cpu[stage][key] += int(spent * 1e6)
+            self.samples += 1
+            del frames
+
+    # --- Report ---
+
+    @staticmethod
+    def _write_folded(path: str, counts: Counter):
+        with open(path, "w") as f:
+            for (thread, stack), n in counts.most_common():
+                f.write(f"{thread};{';'.join(stack)} {n}\n")
+
+    def _hotspots(self, counts: Counter) -> Tuple[Counter, Counter]:
+        """(self, inclusive) weight per function"""
+        own, inclusive = Counter(), Counter()
+        for (_, stack), n in counts.items():
+            if not stack:
+                continue
+            own[stack[-1]] += n
+            for label in set(stack):
+                inclusive[label] += n
+        return own, inclusive
+
+    def summary(self) -> str:
+        lines = [f"Profile: {self.samples} samples every {self.interval * 1000:g} ms"]
+        stages = sorted(set(self._wall) | set(self._cpu), key=lambda s: -sum(self._cpu[s].values()))
+        for stage in stages:
+            wall = self._wall[stage]
+            cpu = self._cpu[stage]
+            cpu_s = sum(cpu.values()) / 1e6
+            lines.append(f"\n== {stage}: {cpu_s:.2f}s CPU over {self._seconds[stage]:.2f}s wall")
+            own_cpu, _ = self._hotspots(cpu)
+            _, incl_wall = self._hotspots(wall)
+            total_wall = sum(wall.values()) or 1
+            if own_cpu:
+                lines.append(f"  top {self.top} by self CPU:")
+                for label, us in own_cpu.most_common(self.top):
+                    lines.append(f"    {us / 1e6:8.3f}s  {label}")
+            if incl_wall:
+                lines.append(f"  top {self.top} by inclusive wall (share of thread samples):")
+                for label, n in incl_wall.most_common(self.top):
+                    lines.append(f"    {n / total_wall:7.1%}  {label}")
+        for name, seconds, peak, net, top_lines in self._allocations:
+            peak_text = f"peak {peak / 2**20:.2f} MB" if peak is not None else "peak n/a (overlapped other blocks)"
+            lines.append(f"\n== allocations in {name}: {peak_text}, net {net / 2**20:+.2f} MB over {seconds:.3f}s")
+            for where, size, count in top_lines:
+                lines.append(f"    {size / 1024:10.1f} KiB  {count:>7} blocks  {where}")
+        return "\n".join(lines)
+
+    def export(self, directory: Optional[str] = None) -> Optional[str]:
+        """Stops sampling and writes the folded stacks and summary; returns the output directory."""
+        if self._thread is None:
+            return None
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+        stamp = datetime.fromtimestamp(self.started_at).strftime("%Y%m%d-%H%M%S")
+        out = os.path.join(directory or self.directory, f"profile-{stamp}")
+        os.makedirs(out, exist_ok=True)
+        all_wall, all_cpu = Counter(), Counter()
+        for stage in set(self._wall) | set(self._cpu):
+            safe = re.sub(r"[^\w.-]+", "_", stage)
+            self._write_folded(os.path.join(out, f"wall-{safe}.folded"), self._wall[stage])
+            self._write_folded(os.path.join(out, f"cpu-{safe}.folded"), self._cpu[stage])
+            # Whole-run files keep the stage as the root frame
+            for (thread, stack), n in self._wall[stage].items():
+                all_wall[(stage, (thread,) + stack)] += n
+            for (thread, stack), n in self._cpu[stage].items():
+                all_cpu[(stage, (thread,) + stack)] += n
+        self._write_folded(os.path.join(out, "wall.folded"), all_wall)
+        self._write_folded(os.path.join(out, "cpu.folded"), all_cpu)
+        summary = self.summary()
+        with open(os.path.join(out, "summary.txt"), "w") as f:
+            f.write(summary + "\n")
+        print(summary)
+        print(f"Profile written to {out} (flamegraph.pl cpu.folded > cpu.svg, or open in speedscope)")
+        return out
+
+
+profiler = Profiler()
@@ -0,0 +1,321 @@
+import os
+import json
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional
+from sqlalchemy import create_engine, Column, String, DateTime, Text, Integer, and_, or_, update
+from sqlalchemy.orm import sessionmaker
+from .storage import Base, _utcnow
+from .metrics import metrics
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+DEAD = "dead"
+
+JOBS_TOTAL = "weflow_queue_jobs_total"
+
+
+class JobModel(Base):
+    __tablename__ = 'jobs'
+    id = Column(Integer, primary_key=True)
+    batch_id = Column(String, index=True)
+    kind = Column(String, index=True)            # crawl, analyze, vision
+    payload = Column(Text)                       # JSON
+    status = Column(String, index=True, default=QUEUED)
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=3)
+    available_at = Column(DateTime, default=_utcnow)  # retry backoff: not claimable before this
+    lease_owner = Column(String, nullable=True)
+    lease_expires = Column(DateTime, nullable=True)
+    result = Column(Text, nullable=True)         # JSON
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=_utcnow)
+    updated_at = Column(DateTime, default=_utcnow, onupdate=_utcnow)
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+class LeasedTable:
+    """
+    Rows in the shared database that workers claim under a lease: the claim,
+    retry backoff and dead-letter mechanics behind JobQueue and OutboxStore
+    (core.outbox).
+
+    Claims use SELECT ... FOR UPDATE SKIP LOCKED on Postgres, so concurrent
+    workers never block on or double-claim a row. The claim UPDATE is also
+    conditional on the row still being claimable, which keeps SQLite (no row
+    locks) correct for tests and single-host runs.
+
+    A claimed row holds a lease, which its owner can extend. A row whose
+    lease runs out is claimable again, and one that has used up
+    `max_attempts` is moved to the dead-letter status instead.
+
+    Subclasses set `model`, its `waiting`/`running` statuses and
+    `batch_column`, and say what a claimed row looks like (`_claimed`).
+    """
+    model = None
+    waiting = None
+    running = None
+    batch_column = "batch"
+
+    def __init__(self, engine, retry_delay: float = 30.0):
+        self.engine = engine
+        self.retry_delay = retry_delay
+        Base.metadata.create_all(self.engine, tables=[self.model.__table__])
+        self.Session = sessionmaker(bind=self.engine)
+
+    def _claimable(self, now: datetime):
+        m = self.model
+        return or_(
+            and_(m.status == self.waiting, m.available_at <= now),
+            and_(m.status == self.running, m.lease_expires < now),
+        )
+
+    def _claim(self, owner: str, filters: list, limit: int, lease_seconds: float) -> List[dict]:
+        """Leases up to `limit` claimable rows matching `filters`: waiting and due, or running with an expired lease."""
+        m = self.model
+        now = _utcnow()
+        claimable = self._claimable(now)
+        session = self.Session()
+        try:
+            rows = session.query(m).filter(claimable, *filters).order_by(m.id).limit(limit).with_for_update(skip_locked=True).all()
+
+            claimed = []
+            for row in rows:
+                # Read before the UPDATE below, which syncs row.attempts
+                attempt = row.attempts + 1
+                if row.attempts >= row.max_attempts:
+                    # Lease ran out on the last attempt (owner died mid-way)
+                    self._dead_letter(session, row, "lease expired on final attempt")
+                    continue
+                res = session.execute(
+                    update(m)
+                    .where(m.id == row.id, claimable)
+                    .values(
+                        status=self.running,
+                        attempts=m.attempts + 1,
+                        lease_owner=owner,
+                        lease_expires=now + timedelta(seconds=lease_seconds),
+                    )
+                )
+                if res.rowcount == 1:
+                    claimed.append(self._claimed(row, attempt))
+            session.commit()
+            return claimed
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+
+    def _claimed(self, row, attempt: int) -> dict:
+        raise NotImplementedError
+
+    def _owned(self, row_id: int, owner: str):
+        m = self.model
+        return and_(m.id == row_id, m.status == self.running, m.lease_owner == owner)
+
+    def heartbeat(self, row_id: int, owner: str, lease_seconds: float = 300) -> bool:
+        """Extends the lease; False means the row was lost (lease expired and reclaimed)."""
+        with self.engine.begin() as conn:
+            res = conn.execute(
+                update(self.model)
+                .where(self._owned(row_id, owner))
+                .values(lease_expires=_utcnow() + timedelta(seconds=lease_seconds))
+            )
+            return res.rowcount == 1
+
+    def complete(self, row_id: int, owner: str, result: Any = None, follow_up: Optional[List[tuple]] = None) -> bool:
+        """Marks the row done and stores its result; `follow_up` rows are added in the same transaction."""
+        session = self.Session()
+        try:
+            res = session.execute(
+                update(self.model)
+                .where(self._owned(row_id, owner))
+                .values(status=DONE, result=json.dumps(result, ensure_ascii=False), lease_owner=None, lease_expires=None)
+            )
+            if res.rowcount != 1:
+                session.rollback()
+                return False
+            if follow_up:
+                self._add_follow_up(session, session.get(self.model, row_id), follow_up)
+            session.commit()
+            return True
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+
+    def _add_follow_up(self, session, row, follow_up: List[tuple]):
+        raise NotImplementedError
+
+    def fail(self, row_id: int, owner: str, error: str) -> str:
+        """Retries with exponential backoff, or dead-letters once attempts run out. Returns the new status."""
+        session = self.Session()
+        try:
+            row = session.query(self.model).filter(self._owned(row_id, owner)).with_for_update().first()
+            if row is None:
+                return "lost"
+            if row.attempts >= row.max_attempts:
+                self._dead_letter(session, row, error)
+                status = DEAD
+            else:
+                delay = self.retry_delay * 2 ** (row.attempts - 1)
+                row.status = self.waiting
+                row.last_error = error
+                row.lease_owner = None
+                row.lease_expires = None
+                row.available_at = _utcnow() + timedelta(seconds=delay)
+                self._retrying(row, delay, error)
+                status = self.waiting
+            session.commit()
+            return status
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+
+    def _retrying(self, row, delay: float, error: str):
+        pass
+
+    def _dead_letter(self, session, row, error: str):
+        session.execute(
+            update(self.model)
+            .where(self.model.id == row.id)
+            .values(status=DEAD, last_error=error, lease_owner=None, lease_expires=None)
+        )
+        self._dead(row, error)
+
+    def _dead(self, row, error: str):
+        pass
+
+    # --- Inspection ---
+
+    def _in_batch(self, query, batch: Optional[str]):
+        return query.filter(getattr(self.model, self.batch_column) == batch) if batch else query
+
+    def counts(self, batch: Optional[str] = None) -> Dict[str, int]:
+        session = self.Session()
+        try:
+            counts = {}
+            for (status,) in self._in_batch(session.query(self.model.status), batch):
+                counts[status] = counts.get(status, 0) + 1
+            return counts
+        finally:
+            session.close()
+
+    def _dead_rows(self, batch: Optional[str] = None, *filters) -> list:
+        session = self.Session()
+        try:
+            query = self._in_batch(session.query(self.model).filter(self.model.status == DEAD, *filters), batch)
+            return query.order_by(self.model.id).all()
+        finally:
+            session.close()
+
+    def requeue_dead(self, batch: Optional[str] = None) -> int:
+        """Gives dead-lettered rows a fresh set of attempts."""
+        with self.engine.begin() as conn:
+            stmt = update(self.model).where(self.model.status == DEAD)
+            if batch:
+                stmt = stmt.where(getattr(self.model, self.batch_column) == batch)
+            return conn.execute(stmt.values(status=self.waiting, attempts=0, available_at=_utcnow())).rowcount
+
+
+class JobQueue(LeasedTable):
+    """
+    Work queue in the shared database, so several hosts can split crawl,
+    analyze and vision work. Workers claim jobs under a lease and heartbeat
+    to extend it; see LeasedTable for claims, retries and dead-lettering.
+    """
+    model = JobModel
+    waiting = QUEUED
+    running = RUNNING
+    batch_column = "batch_id"
+
+    def __init__(self, db_url: Optional[str] = None, engine=None, retry_delay: float = 30.0):
+        if engine is None:
+            db_url = db_url or os.getenv("DATABASE_URL")
+            if not db_url:
+                raise ValueError("Database URL is required")
+            engine = create_engine(db_url)
+        super().__init__(engine, retry_delay)
+
+    # --- Producer side ---
+
+    def enqueue(self, kind: str, payload: dict, batch_id: str, max_attempts: int = 3) -> int:
+        return self.enqueue_many(kind, [payload], batch_id, max_attempts)[0]
+
+    def enqueue_many(self, kind: str, payloads: Iterable[dict], batch_id: str, max_attempts: int = 3) -> List[int]:
+        session = self.Session()
+        try:
+            rows = [
+                JobModel(batch_id=batch_id, kind=kind, payload=json.dumps(p, ensure_ascii=False), max_attempts=max_attempts)
+                for p in payloads
+            ]
+            session.add_all(rows)
+            session.commit()
+            metrics.inc(JOBS_TOTAL, len(rows), kind=kind, outcome="enqueued")
+            return [r.id for r in rows]
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+
+    # --- Worker side ---
+
+    def claim(self, worker_id: str, kinds: Optional[Iterable[str]] = None, limit: int = 1, lease_seconds: float = 300) -> List[dict]:
+        """Leases up to `limit` runnable jobs: queued and due, or running with an expired lease."""
+        filters = [JobModel.kind.in_(list(kinds))] if kinds else []
+        return self._claim(worker_id, filters, limit, lease_seconds)
+
+    def _claimed(self, row: JobModel, attempt: int) -> dict:
+        return {
+            "id": row.id,
+            "batch_id": row.batch_id,
+            "kind": row.kind,
+            "payload": json.loads(row.payload),
+            "attempt": attempt,
+        }
+
+    def complete(self, job_id: int, worker_id: str, result: Any = None, follow_up: Optional[List[tuple]] = None) -> bool:
+        """
+        Marks the job done and stores its result. `follow_up` is a list of
+        (kind, payload) jobs enqueued in the same transaction (e.g. crawl -> analyze).
+        """
+        return super().complete(job_id, worker_id, result, follow_up)
+
+    def _add_follow_up(self, session, job: JobModel, follow_up: List[tuple]):
+        for kind, payload in follow_up:
+            session.add(JobModel(batch_id=job.batch_id, kind=kind, payload=json.dumps(payload, ensure_ascii=False), max_attempts=job.max_attempts))
+
+    def _dead(self, job: JobModel, error: str):
+        metrics.inc(JOBS_TOTAL, kind=job.kind, outcome="dead")
+        print(f"Job {job.id} ({job.kind}) dead-lettered: {error}")
+
+    # --- Coordinator side ---
+
+    def is_drained(self, batch_id: str) -> bool:
+        """True once no job in the batch is queued or running."""
+        counts = self.counts(batch_id)
+        return not counts.get(QUEUED) and not counts.get(RUNNING)
+
+    def results(self, batch_id: str, kind: str) -> List[Any]:
+        session = self.Session()
+        try:
+            rows = session.query(JobModel.result).filter_by(batch_id=batch_id, kind=kind, status=DONE).order_by(JobModel.id)
+            return [json.loads(r.result) for r in rows if r.result]
+        finally:
+            session.close()
+
+    def dead_letters(self, batch_id: Optional[str] = None) -> List[dict]:
+        return [
+            {"id": j.id, "batch_id": j.batch_id, "kind": j.kind, "attempts": j.attempts, "error": j.last_error, "payload": json.loads(j.payload)}
+            for j in self._dead_rows(batch_id)
+        ]
@@ -0,0 +1,110 @@
+import importlib
+from importlib.metadata import entry_points
+from typing import Any, Dict, List, Union
+
+ENTRY_POINT_GROUP = "weflow.providers"
+
+# kind -> name -> "module:attribute". Targets are plain strings so that looking
+# a provider up never imports it (or its SDK) until it is actually created.
+BUILTIN_PROVIDERS: Dict[str, Dict[str, str]] = {
+    "llm": {
+        "deepseek": "weflow.core.llm:DeepSeekLLM",
+        "hedged": "weflow.core.router:HedgedLLM.from_env",
+    },
+    "crawler": {
+        "firecrawl": "weflow.core.crawler:FirecrawlCrawler",
+        "local": "weflow.core.crawler:LocalCrawler",
+    },
+    "image": {
+        "mock": "weflow.core.image:MockImageProvider",
+        "qwen": "weflow.core.image:QwenImageProvider",
+        "gemini": "weflow.core.image:GeminiImageProvider",
+    },
+    "vision": {
+        "mock": "weflow.core.vision:MockVisionProvider",
+        "qwen": "weflow.core.vision:QwenVisionProvider",
+    },
+    # asyncio-native variants; names without one are wrapped in a thread adapter.
+    # Async crawlers are created with client=<shared httpx.AsyncClient>.
+    "async_llm": {
+        "deepseek": "weflow.core.llm:AsyncDeepSeekLLM",
+    },
+    "async_crawler": {
+        "firecrawl": "weflow.core.crawler:AsyncFirecrawlCrawler",
+        "local": "weflow.core.crawler:AsyncLocalCrawler",
+    },
+    "async_image": {
+        "qwen": "weflow.core.image:AsyncQwenImageProvider",
+    },
+    "async_vision": {
+        "qwen": "weflow.core.vision:AsyncQwenVisionProvider",
+    },
+}
+
+
+class ProviderRegistry:
+    """
+    Finds provider implementations by kind and name and imports them on first use.
+
+    Third-party packages can add providers through the `weflow.providers` entry
+    point group, named "<kind>.<name>":
+
+        [project.entry-points."weflow.providers"]
+        "image.stability" = "my_pkg.stability:StabilityImageProvider"
+    """
+    def __init__(self, builtins: Dict[str, Dict[str, str]] = BUILTIN_PROVIDERS):
+        self._targets: Dict[str, Dict[str, Union[str, Any]]] = {kind: dict(names) for kind, names in builtins.items()}
+        self._loaded: Dict[tuple, Any] = {}
+        self._entry_points_loaded = False
+
+    def register(self, kind: str, name: str, target: Union[str, Any]):
+        """Adds a provider: a "module:attribute" string, or the class/factory itself."""
+        self._targets.setdefault(kind, {})[name.lower()] = target
+        self._loaded.pop((kind, name.lower()), None)
+
+    def _load_entry_points(self):
+        if self._entry_points_loaded:
+            return
+        self._entry_points_loaded = True
+        for ep in entry_points(group=ENTRY_POINT_GROUP):
+            kind, _, name = ep.name.partition(".")
+            if not name:
+                print(f"Ignoring provider entry point '{ep.name}': expected '<kind>.<name>'")
+                continue
+            # Built-in and explicitly registered providers win over plugins
+            self._targets.setdefault(kind, {}).setdefault(name.lower(), ep.value)
+
+    def has(self, kind: str, name: str) -> bool:
+        if name.lower() in self._targets.get(kind, {}):
+            return True
+        self._load_entry_points()
+        return name.lower() in self._targets.get(kind, {})
+
+    def names(self, kind: str) -> List[str]:
+        self._load_entry_points()
+        return sorted(self._targets.get(kind, {}))
+
+    def load(self, kind: str, name: str) -> Any:
+        """Returns the provider class (or factory), importing its module if needed."""
+        name = name.lower()
+        key = (kind, name)
+        if key in self._loaded:
+            return self._loaded[key]
+        if not self.has(kind, name):
+            raise ValueError(f"Unknown {kind} provider '{name}'. Available: {', '.join(self.names(kind)) or 'none'}")
+
+        target = self._targets[kind][name]
+        if isinstance(target, str):
+            module_name, _, attr_path = target.partition(":")
+            obj = importlib.import_module(module_name)
+            for attr in attr_path.split(".") if attr_path else ():
+                obj = getattr(obj, attr)
+            target = obj
+        self._loaded[key] = target
+        return target
+
+    def create(self, kind: str, name: str, *args, **kwargs) -> Any:
+        return self.load(kind, name)(*args, **kwargs)
+
+
+registry = ProviderRegistry()
@@ -0,0 +1,163 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict
+from .budget import budget
+from .metrics import metrics
+
+# Per-call timeouts (seconds) by kind of call; PROVIDER_TIMEOUTS="llm=120,crawl=45" overrides
+DEFAULT_TIMEOUTS = {
+    "rss": 30,
+    "crawl": 90,
+    "llm": 180,
+    "vision": 60,
+    "image": 300,      # a whole render, submit to result
+    "wechat": 60,
+    "notify": 15,
+    "download": 60,    # source images fetched for upload or caching
+}
+# Past the run deadline calls still get this long, so the run winds down instead of failing outright
+DEADLINE_FLOOR_SECONDS = 5.0
+
+CIRCUIT_TRANSITIONS = "weflow_circuit_transitions_total"
+CIRCUIT_REJECTED = "weflow_circuit_rejected_total"
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose circuit is open."""
+
+
+class ProviderError(Exception):
+    """Error status from an SDK that returns failures instead of raising them."""
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _parse_timeouts(spec: str) -> Dict[str, float]:
+    timeouts = dict(DEFAULT_TIMEOUTS)
+    for part in spec.split(","):
+        if "=" in part:
+            name, value = part.split("=", 1)
+            timeouts[name.strip()] = float(value)
+    return timeouts
+
+
+def timeout_for(kind: str) -> float:
+    """Timeout for one call of `kind`: its configured limit, capped by what is left of the run's time budget."""
+    timeout = _parse_timeouts(os.getenv("PROVIDER_TIMEOUTS", "")).get(kind, 60)
+    left = budget.time_left()
+    if left is not None:
+        timeout = min(timeout, max(left, float(os.getenv("DEADLINE_FLOOR_SECONDS", DEADLINE_FLOOR_SECONDS))))
+    return timeout
+
+
+class CircuitBreaker:
+    """
+    Fails fast after `failure_threshold` consecutive errors. Once open, calls
+    are rejected with CircuitOpenError for `reset_seconds`; then a single
+    probe call is let through (half-open), which closes the circuit on
+    success or re-opens it on failure.
+    """
+    def __init__(self, name: str, failure_threshold: int = 5, reset_seconds: float = 60.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def _transition(self, state: str):
+        if state != self.state:
+            print(f"Circuit {self.name}: {self.state} -> {state}")
+            metrics.inc(CIRCUIT_TRANSITIONS, breaker=self.name, state=state)
+            self.state = state
+
+    def before(self):
+        """Raises CircuitOpenError unless the call may go ahead."""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self._transition(HALF_OPEN)  # this caller is the probe
+                return
+        metrics.inc(CIRCUIT_REJECTED, breaker=self.name)
+        raise CircuitOpenError(f"circuit {self.name} is open")
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self._transition(CLOSED)
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._transition(OPEN)
+
+    def abandon(self):
+        """A call given up before it had an outcome (cancelled): a half-open probe hands the probe back."""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                # Keeps opened_at, so the next call becomes the probe
+                self._transition(OPEN)
+
+    @property
+    def is_open(self) -> bool:
+        return self.state != CLOSED
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker(name: str) -> CircuitBreaker:
+    """The process-wide breaker for `name` (BREAKER_FAILURES, BREAKER_RESET_SECONDS)."""
+    with _breakers_lock:
+        b = _breakers.get(name)
+        if b is None:
+            b = _breakers[name] = CircuitBreaker(
+                name,
+                failure_threshold=int(os.getenv("BREAKER_FAILURES", "5")),
+                reset_seconds=float(os.getenv("BREAKER_RESET_SECONDS", "60")),
+            )
+        return b
+
+
+def reset_breakers():
+    with _breakers_lock:
+        _breakers.clear()
+
+
+def _trips(exc: Exception) -> bool:
+    """Client errors (4xx other than 429) say nothing about the provider's health."""
+    status = getattr(exc, "status_code", None) or getattr(getattr(exc, "response", None), "status_code", None)
+    return not (isinstance(status, int) and 400 <= status < 500 and status != 429)
+
+
+@contextmanager
+def guarded_call(breaker_name: str, provider: str, op: str):
+    """metrics.provider_call wrapped in the named circuit breaker: rejected fast when open, outcome recorded."""
+    b = breaker(breaker_name)
+    b.before()
+    try:
+        with metrics.provider_call(provider, op) as span:
+            yield span
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        if _trips(e):
+            b.failure()
+        else:
+            b.success()
+        raise
+    except BaseException:
+        # Cancelled (e.g. asyncio.CancelledError): says nothing about the provider
+        b.abandon()
+        raise
+    b.success()
@@ -0,0 +1,291 @@
+import os
+import json
+import time
+import threading
+from collections import deque, defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Optional, List
+from .llm import DeepSeekLLM
+from .metrics import metrics
+from .resilience import breaker, timeout_for
+
+
+class HedgeCancelled(Exception):
+    """Raised inside a losing request once another endpoint has answered."""
+
+
+class LatencyWindow:
+    """Sliding window of recent latencies (seconds) with percentile lookups."""
+    def __init__(self, size: int = 100):
+        self.samples = deque(maxlen=size)
+
+    def add(self, latency: float):
+        self.samples.append(latency)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        idx = min(len(ordered) - 1, int(q * len(ordered)))
+        return ordered[idx]
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+
+class EndpointStats:
+    """
+    Latency and error statistics for one endpoint.
+    Latencies are also tracked per call class (the system prompt), since a
+    title request and a full synthesis have very different normal latencies.
+    """
+    def __init__(self, window: int = 100):
+        self.window = window
+        self.latency = LatencyWindow(window)
+        self.by_class = defaultdict(lambda: LatencyWindow(window))
+        self.outcomes = deque(maxlen=window)  # True = success
+        self.requests = 0
+        self.errors = 0
+        self.hedges_won = 0
+        self.cancelled = 0
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+    def record(self, call_class: str, latency: float, ok: bool):
+        with self.lock:
+            self.requests += 1
+            self.outcomes.append(ok)
+            if ok:
+                self.latency.add(latency)
+                self.by_class[call_class].add(latency)
+            else:
+                self.errors += 1
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    def class_percentile(self, call_class: str, q: float, min_samples: int = 5) -> Optional[float]:
+        with self.lock:
+            win = self.by_class.get(call_class)
+            if win is not None and len(win) >= min_samples:
+                return win.percentile(q)
+            return None
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "error_rate": round(self.error_rate, 3),
+                "p50": self.latency.percentile(0.5),
+                "p95": self.latency.percentile(0.95),
+                "hedges_won": self.hedges_won,
+                "cancelled": self.cancelled,
+            }
+
+
+class LLMEndpoint:
+    """One OpenAI-compatible endpoint/model pair."""
+    def __init__(self, base_url: str, model: str, api_key: Optional[str] = None, name: Optional[str] = None, timeout: float = 120.0):
+        self.base_url = base_url
+        self.model = model
+        self.name = name or f"{base_url}#{model}"
+        self.timeout = timeout
+        from openai import OpenAI
+        self.client = OpenAI(api_key=api_key or "sk-none", base_url=base_url, timeout=timeout, max_retries=0)
+        self.stats = EndpointStats()
+
+    def __repr__(self) -> str:
+        return f"LLMEndpoint({self.name})"
+
+
+class HedgedLLM(DeepSeekLLM):
+    """
+    DeepSeekLLM that routes each chat call across several OpenAI-compatible
+    endpoints. The best-ranked endpoint gets the request; if it has not
+    answered by its observed p95 for that call class, a hedge request goes to
+    the next endpoint. The first valid answer wins and the loser's stream is
+    closed so it stops generating.
+    """
+    def __init__(
+        self,
+        endpoints: List[LLMEndpoint],
+        default_hedge_delay: float = 10.0,
+        min_hedge_delay: float = 0.2,
+        max_hedges: int = 1,
+        max_workers: int = 16,
+    ):
+        if not endpoints:
+            raise ValueError("At least one LLM endpoint is required")
+        self.endpoints = endpoints
+        self.default_hedge_delay = default_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.max_hedges = max_hedges
+        self.model = endpoints[0].model
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-hedge")
+
+    @classmethod
+    def from_env(cls) -> "HedgedLLM":
+        """
+        Builds the router from LLM_ENDPOINTS, a JSON list such as
+        [{"base_url": "https://api.deepseek.com", "model": "deepseek-chat", "api_key_env": "DEEPSEEK_API_KEY"}].
+        """
+        raw = os.getenv("LLM_ENDPOINTS")
+        if not raw:
+            raise ValueError("LLM_ENDPOINTS is required for HedgedLLM")
+        endpoints = []
+        for cfg in json.loads(raw):
+            api_key = cfg.get("api_key") or os.getenv(cfg.get("api_key_env", "DEEPSEEK_API_KEY"))
+            endpoints.append(LLMEndpoint(
+                base_url=cfg["base_url"],
+                model=cfg.get("model", "deepseek-chat"),
+                api_key=api_key,
+                name=cfg.get("name"),
+                timeout=float(cfg.get("timeout", 120)),
+            ))
+        return cls(
+            endpoints,
+            default_hedge_delay=float(os.getenv("LLM_HEDGE_DELAY", "10")),
+            max_hedges=int(os.getenv("LLM_MAX_HEDGES", "1")),
+        )
+
+    def _rank(self, call_class: str) -> List[LLMEndpoint]:
+        def key(item):
+            idx, ep = item
+            stats = ep.stats
+            unhealthy = breaker(f"llm:{ep.name}").is_open or (len(stats.outcomes) >= 3 and stats.error_rate > 0.5)
+            p50 = stats.class_percentile(call_class, 0.5, min_samples=1)
+            if p50 is None:
+                # Untried for this call class: keep the configured order
+                return (unhealthy, 1, 0.0, idx)
+            return (unhealthy, 0, p50 * (1 + 4 * stats.error_rate) * (1 + stats.in_flight), idx)
+        return [ep for _, ep in sorted(enumerate(self.endpoints), key=key)]
+
+    def _hedge_delay(self, endpoint: LLMEndpoint, call_class: str) -> float:
+        p95 = endpoint.stats.class_percentile(call_class, 0.95)
+        if p95 is None:
+            return self.default_hedge_delay
+        return max(self.min_hedge_delay, p95)
+
+    @staticmethod
+    def _is_valid(content: str, kwargs: dict) -> bool:
+        if not content or not content.strip():
+            return False
+        if (kwargs.get("response_format") or {}).get("type") == "json_object":
+            try:
+                json.loads(content)
+            except ValueError:
+                return False
+        return True
+
+    def _call(self, endpoint: LLMEndpoint, call_class: str, messages: list[dict], kwargs: dict, cancelled: threading.Event) -> str:
+        circuit = breaker(f"llm:{endpoint.name}")
+        circuit.before()
+        start = time.monotonic()
+        with endpoint.stats.lock:
+            endpoint.stats.in_flight += 1
+        span = metrics.provider_call(endpoint.name, "chat")
+        try:
+            with span:
+                try:
+                    content = self._stream(endpoint, messages, kwargs, cancelled)
+                except HedgeCancelled:
+                    span.set(outcome="cancelled")
+                    raise
+        except HedgeCancelled:
+            with endpoint.stats.lock:
+                endpoint.stats.cancelled += 1
+            circuit.abandon()
+            raise
+        except Exception:
+            endpoint.stats.record(call_class, time.monotonic() - start, ok=False)
+            circuit.failure()
+            raise
+        finally:
+            with endpoint.stats.lock:
+                endpoint.stats.in_flight -= 1
+        endpoint.stats.record(call_class, time.monotonic() - start, ok=True)
+        circuit.success()
+        return content
+
+    def _stream(self, endpoint: LLMEndpoint, messages: list[dict], kwargs: dict, cancelled: threading.Event) -> str:
+        options = {"timeout": min(endpoint.timeout, timeout_for("llm")), **kwargs}
+        stream = endpoint.client.chat.completions.create(
+            model=endpoint.model,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+            **options
+        )
+        parts = []
+        try:
+            for chunk in stream:
+                if cancelled.is_set():
+                    raise HedgeCancelled()
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                if getattr(chunk, "usage", None):
+                    metrics.record_tokens(endpoint.name, chunk.usage)
+        finally:
+            # Closing the stream drops the connection, so the server stops generating
+            stream.close()
+        content = "".join(parts)
+        if not self._is_valid(content, kwargs):
+            raise ValueError(f"Invalid response from {endpoint.name}")
+        return content
+
+    def _chat(self, messages: list[dict], **kwargs) -> str:
+        call_class = messages[0].get("content", "") if messages else ""
+        ranked = self._rank(call_class)
+        cancelled = threading.Event()
+        pending = {}
+        hedged = set()
+        last_error = None
+
+        def launch():
+            ep = ranked.pop(0)
+            pending[self.executor.submit(self._call, ep, call_class, messages, kwargs, cancelled)] = ep
+            return ep
+
+        primary = launch()
+        timeout = self._hedge_delay(primary, call_class)
+        try:
+            while pending:
+                done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    # Primary is past its p95: fire a hedge, then wait for whichever finishes first
+                    if ranked and len(hedged) < self.max_hedges:
+                        ep = launch()
+                        hedged.add(ep.name)
+                        print(f"LLM hedge: {primary.name} slow (> {timeout:.1f}s), hedging to {ep.name}")
+                        timeout = self._hedge_delay(ep, call_class) if len(hedged) < self.max_hedges else None
+                    else:
+                        timeout = None
+                    continue
+                for f in done:
+                    ep = pending.pop(f)
+                    try:
+                        content = f.result()
+                    except Exception as e:
+                        print(f"LLM endpoint {ep.name} failed: {e}")
+                        last_error = e
+                        continue
+                    if ep.name in hedged:
+                        with ep.stats.lock:
+                            ep.stats.hedges_won += 1
+                    return content
+                # Everything in flight failed so far: fail over right away
+                if not pending and ranked:
+                    launch()
+            raise last_error or RuntimeError("All LLM endpoints failed")
+        finally:
+            # Cancel the losers: queued ones never start, running ones close their stream
+            cancelled.set()
+            for f in pending:
+                f.cancel()
+
+    def stats(self) -> dict:
+        return {ep.name: ep.stats.snapshot() for ep in self.endpoints}
@@ -1,36 +1,224 @@
 from abc import ABC, abstractmethod
-from typing import List
+from typing import List, Optional
+import os
+import re
+import asyncio
 import feedparser
-from datetime import datetime
+import httpx
+import requests
+from datetime import datetime, timezone
 import time
+import calendar
 from .models import Article
+from .metrics import metrics
+from .resilience import guarded_call, timeout_for
+from .extract import html_to_markdown, text_length
+
+FULL_TEXT_TOTAL = "weflow_feed_full_text_total"
+CRAWLS_AVOIDED = "weflow_crawls_avoided_total"
+# How teasers end: "…", "[...]", "Read more", "Continue reading ->", 阅读全文
+TRUNCATED = re.compile(r"(…|\.\.\.|\[…\]|\[\.\.\.\]|read more|continue reading|阅读全文|阅读更多|查看全文)[\W_]*$", re.I)
 
 class RSSProvider(ABC):
     @abstractmethod
     def fetch_articles(self) -> List[Article]:
         pass
 
+def entry_order(published_at, entry_id) -> tuple:
+    """Sort key for dated entries: timestamp, then entry id, so entries sharing a second keep a fixed order."""
+    return published_at, entry_id or ""
+
+def past_high_water_mark(articles: List[Article], mark: Optional[dict]) -> List[Article]:
+    """
+    Entries newer than the mark ({"entry_id", "published_at"}).
+    Dated entries compare by (timestamp, entry id), so a batch stamped with
+    the same second isn't cut at the marked entry. Undated ones count as new only if they
+    appear above the marked entry in feed order (feeds list newest first), or
+    if the marked entry has already rolled off the feed.
+    """
+    if not mark:
+        return articles
+    mark_time = mark.get("published_at")
+    ids = [a.entry_id for a in articles]
+    mark_pos = ids.index(mark["entry_id"]) if mark.get("entry_id") in ids else None
+    fresh = []
+    for pos, a in enumerate(articles):
+        if a.entry_id == mark.get("entry_id"):
+            continue
+        if a.published_at and mark_time:
+            if entry_order(a.published_at, a.entry_id) > entry_order(mark_time, mark.get("entry_id")):
+                fresh.append(a)
+        elif mark_pos is None or pos < mark_pos:
+            fresh.append(a)
+    return fresh
+
+def newest_mark(articles: List[Article]) -> Optional[dict]:
+    """Mark for the newest of `articles`: the latest dated entry, else the first in feed order."""
+    if not articles:
+        return None
+    dated = [a for a in articles if a.published_at]
+    newest = max(dated, key=lambda a: entry_order(a.published_at, a.entry_id)) if dated else articles[0]
+    return {"entry_id": newest.entry_id, "published_at": newest.published_at}
+
+def full_text_settings() -> tuple:
+    """FEED_FULL_TEXT=0 always crawls; FEED_FULL_TEXT_MIN_CHARS (800) and FEED_FULL_TEXT_RATIO (3, times the summary)"""
+    enabled = os.getenv("FEED_FULL_TEXT", "1").lower() not in ("0", "false", "no")
+    return enabled, int(os.getenv("FEED_FULL_TEXT_MIN_CHARS", "800")), float(os.getenv("FEED_FULL_TEXT_RATIO", "3"))
+
+def entry_full_text(entry, min_chars: int = 800, ratio: float = 3.0) -> tuple:
+    """
+    (Markdown, None) when the entry ships the whole article (content:encoded or
+    Atom content), else (None, why not). Complete means at least `min_chars`
+    of text, `ratio` times the summary, and no teaser ending.
+    """
+    html = max((c.get("value") or "" for c in entry.get("content") or []), key=len, default="")
+    if not html.strip():
+        return None, "absent"
+    markdown = html_to_markdown(html, entry.get("link") or "")
+    summary_html = entry.get("summary") or ""
+    # feedparser falls back to the content when an entry has no summary of its own
+    summary_length = text_length(html_to_markdown(summary_html, "")) if summary_html and summary_html != html else 0
+    length = text_length(markdown)
+    if length < max(min_chars, ratio * summary_length):
+        return None, "teaser"
+    if TRUNCATED.search(markdown[-200:]):
+        return None, "teaser"
+    return markdown, None
+
+def has_full_text(article: Article) -> bool:
+    """The feed entry carried the whole article, so there is nothing to crawl"""
+    return article.status == "crawled" and article.content_chars > 0
+
 class GenericRSS(RSSProvider):
-    def __init__(self, url: str, source_name: str = "Unknown"):
+    """
+    With a `mark_store` (PostgresStorage), fetches return only entries past the
+    feed's persisted high-water mark; call `advance_mark` once they are processed.
+    """
+    def __init__(self, url: str, source_name: str = "Unknown", mark_store=None):
         self.url = url
         self.source_name = source_name
+        self.mark_store = mark_store
+        self.mark = None
+        self._mark_loaded = False
+        # Validators from the last response; a long-lived instance (daemon mode)
+        # sends them back so unchanged feeds answer 304 with no body
+        self.etag = None
+        self.modified = None
+        self.session = requests.Session()
+
+    def _conditional_headers(self) -> dict:
+        headers = {"User-Agent": feedparser.USER_AGENT}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.modified:
+            headers["If-Modified-Since"] = self.modified
+        return headers
 
     def fetch_articles(self) -> List[Article]:
         print(f"Fetching RSS from: {self.url}")
-        feed = feedparser.parse(self.url)
+        if not self.url.startswith(("http://", "https://")):
+            # Local file: nothing to time out
+            return self._past_mark(self._to_articles(feedparser.parse(self.url)))
+        # Downloaded here rather than by feedparser, which has no timeout; each feed has its own breaker
+        with guarded_call(f"rss:{self.url}", "rss", "fetch"):
+            response = self.session.get(self.url, headers=self._conditional_headers(), timeout=timeout_for("rss"))
+            if response.status_code != 304:
+                response.raise_for_status()
+        self.etag = response.headers.get("ETag", self.etag)
+        self.modified = response.headers.get("Last-Modified", self.modified)
+        if response.status_code == 304:
+            metrics.record_cache("rss_conditional_get", hit=True)
+            return []
+        metrics.record_cache("rss_conditional_get", hit=False)
+        feed = feedparser.parse(response.content, response_headers=dict(response.headers))
+        return self._past_mark(self._to_articles(feed))
+
+    def _past_mark(self, articles: List[Article]) -> List[Article]:
+        if self.mark_store is None:
+            return articles
+        fresh = past_high_water_mark(articles, self._load_mark())
+        metrics.inc("weflow_rss_entries_total", len(fresh), result="new")
+        metrics.inc("weflow_rss_entries_total", len(articles) - len(fresh), result="seen")
+        if self.mark:
+            print(f"{self.url}: {len(fresh)} of {len(articles)} entries past high-water mark")
+        return fresh
+
+    def advance_mark(self, processed: List[Article]):
+        """Moves the persisted mark up to the newest processed entry (never backwards)."""
+        if self.mark_store is None:
+            return
+        mark = newest_mark(processed)
+        if mark is None:
+            return
+        current = self._load_mark() or {}
+        if current.get("published_at") and mark["published_at"] and \
+                entry_order(mark["published_at"], mark["entry_id"]) <= entry_order(current["published_at"], current.get("entry_id")):
+            return
+        self.mark_store.save_feed_mark(self.url, mark["entry_id"], mark["published_at"])
+        self.mark = mark
+        self._mark_loaded = True
+
+    def _load_mark(self) -> Optional[dict]:
+        if not self._mark_loaded:
+            self.mark = self.mark_store.get_feed_mark(self.url)
+            self._mark_loaded = True
+        return self.mark
+
+    def reset_mark(self):
+        if self.mark_store is not None:
+            self.mark_store.reset_feed_marks(self.url)
+        self.mark = None
+        self._mark_loaded = True
+
+    @staticmethod
+    def _to_articles(feed) -> List[Article]:
+        use_full_text, min_chars, ratio = full_text_settings()
         articles = []
         for entry in feed.entries:
             published_date = None
+            published_at = None
             if hasattr(entry, 'published_parsed') and entry.published_parsed:
                 published_date = time.strftime("%Y-%m-%d", entry.published_parsed)
+                # feedparser normalizes *_parsed to UTC
+                published_at = datetime.fromtimestamp(calendar.timegm(entry.published_parsed), tz=timezone.utc)
             
-            articles.append(Article(
+            article = Article(
                 title=entry.title,
                 url=entry.link,
-                published_date=published_date
-            ))
+                entry_id=entry.get("id") or entry.link,
+                published_date=published_date,
+                published_at=published_at
+            )
+            # Full text in the feed: the article arrives already crawled
+            if use_full_text:
+                content, reason = entry_full_text(entry, min_chars, ratio)
+                metrics.inc(FULL_TEXT_TOTAL, result=reason or "used")
+                if content:
+                    article.content = content
+                    article.status = "crawled"
+            articles.append(article)
         return articles
 
 class MeituanRSS(GenericRSS):
     def __init__(self):
         super().__init__("https://tech.meituan.com/feed/", "Meituan Tech")
+
+class AsyncRSSProvider(ABC):
+    @abstractmethod
+    async def fetch_articles(self) -> List[Article]:
+        pass
+
+class AsyncGenericRSS(AsyncRSSProvider, GenericRSS):
+    """Downloads the feed with httpx and parses it off the event loop."""
+    def __init__(self, url: str, source_name: str = "Unknown", client: Optional[httpx.AsyncClient] = None, mark_store=None):
+        GenericRSS.__init__(self, url, source_name, mark_store=mark_store)
+        self.client = client or httpx.AsyncClient(timeout=30, follow_redirects=True)
+
+    async def fetch_articles(self) -> List[Article]:
+        print(f"Fetching RSS from: {self.url}")
+        with guarded_call(f"rss:{self.url}", "rss", "fetch"):
+            response = await self.client.get(self.url, timeout=timeout_for("rss"))
+            response.raise_for_status()
+        feed = await asyncio.to_thread(feedparser.parse, response.content, response_headers=dict(response.headers))
+        # Mark lookups hit the database, so keep them off the event loop too
+        return await asyncio.to_thread(self._past_mark, self._to_articles(feed))
@@ -0,0 +1,94 @@
+import os
+import tempfile
+import threading
+from typing import Optional
+from .metrics import metrics
+
+SPILL_BYTES = "weflow_content_spill_bytes_total"
+
+
+class _Segment:
+    """One anonymous spill file; deleted by the OS once the last article pointing into it is gone."""
+    __slots__ = ("file", "fd", "size")
+
+    def __init__(self, directory: Optional[str]):
+        self.file = tempfile.TemporaryFile(prefix="weflow-spill-", dir=directory)
+        self.fd = self.file.fileno()
+        self.size = 0
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+class SpillRef:
+    """Where one article body lives: segment, byte offset and length, and its length in characters."""
+    __slots__ = ("segment", "offset", "nbytes", "nchars")
+
+    def __init__(self, segment: _Segment, offset: int, nbytes: int, nchars: int):
+        self.segment = segment
+        self.offset = offset
+        self.nbytes = nbytes
+        self.nchars = nchars
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+class ContentStore:
+    """
+    Append-only on-disk store for crawled article bodies.
+
+    Articles keep a SpillRef instead of their content, and read it back
+    (whole, or just the head a prompt needs) with pread when a stage asks,
+    so a run's resident memory no longer grows with the total crawled text.
+    Bodies shorter than `min_chars` stay inline. Writes go to the current
+    segment until it reaches `segment_bytes`; a full segment is dropped from
+    the store and deleted once no article refers to it, which keeps a
+    long-running daemon's disk use bounded by the articles still in flight.
+    """
+    def __init__(self, enabled: bool = True, directory: Optional[str] = None, min_chars: int = 2048, segment_bytes: int = 256 * 2**20):
+        self.enabled = enabled
+        self.directory = directory
+        self.min_chars = min_chars
+        self.segment_bytes = segment_bytes
+        self._segment = None
+        self._lock = threading.Lock()
+
+    def configure_from_env(self):
+        """CONTENT_SPILL=0 keeps bodies in memory; CONTENT_SPILL_DIR (default: system temp), CONTENT_SPILL_MIN_CHARS"""
+        self.enabled = os.getenv("CONTENT_SPILL", "1").lower() not in ("0", "false", "no")
+        self.directory = os.getenv("CONTENT_SPILL_DIR") or None
+        self.min_chars = int(os.getenv("CONTENT_SPILL_MIN_CHARS", "2048"))
+        with self._lock:
+            self._segment = None
+
+    def should_spill(self, text: Optional[str]) -> bool:
+        return self.enabled and text is not None and len(text) >= self.min_chars
+
+    def put(self, text: str) -> SpillRef:
+        data = text.encode("utf-8")
+        with self._lock:
+            if self._segment is None or self._segment.size + len(data) > self.segment_bytes:
+                self._segment = _Segment(self.directory)
+            segment = self._segment
+            offset = segment.size
+            os.pwrite(segment.fd, data, offset)
+            segment.size += len(data)
+        metrics.inc(SPILL_BYTES, len(data))
+        return SpillRef(segment, offset, len(data), len(text))
+
+    @staticmethod
+    def get(ref: SpillRef, max_chars: Optional[int] = None) -> str:
+        """The body, or only its first `max_chars` characters (UTF-8 is at most 4 bytes a character)."""
+        nbytes = ref.nbytes if max_chars is None else min(ref.nbytes, max_chars * 4)
+        text = os.pread(ref.segment.fd, nbytes, ref.offset).decode("utf-8", errors="ignore")
+        return text if max_chars is None else text[:max_chars]
+
+
+content_store = ContentStore()
@@ -4,11 +4,18 @@ from sqlalchemy import create_engine, Column, String, DateTime, Text, Integer
 from sqlalchemy.orm import declarative_base, sessionmaker
 from sqlalchemy.sql import exists
 import os
-from datetime import datetime
+from datetime import date, datetime, timedelta, timezone
+from urllib.parse import urlparse
 from .models import Article
 
 Base = declarative_base()
 
+
+def _utcnow() -> datetime:
+    # Naive UTC, like the other DateTime columns
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
 class ArticleModel(Base):
     __tablename__ = 'articles'
     id = Column(Integer, primary_key=True)
@@ -20,7 +27,15 @@ class ArticleModel(Base):
     image_url = Column(String, nullable=True)
     media_id = Column(String, nullable=True)
     status = Column(String)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=_utcnow)
+
+class FeedStateModel(Base):
+    """Per-feed high-water mark: the newest entry already processed."""
+    __tablename__ = 'feed_state'
+    feed_url = Column(String, primary_key=True)
+    last_entry_id = Column(String, nullable=True)
+    last_published = Column(DateTime, nullable=True)  # UTC, naive
+    updated_at = Column(DateTime, default=_utcnow, onupdate=_utcnow)
 
 class StorageProvider(ABC):
     @abstractmethod
@@ -40,6 +55,13 @@ class PostgresStorage(StorageProvider):
         Base.metadata.create_all(self.engine)
         self.Session = sessionmaker(bind=self.engine)
 
+    @staticmethod
+    def _parse_date(value) -> Optional[datetime]:
+        # Articles carry "YYYY-MM-DD" strings; Postgres coerces them, SQLite does not
+        if isinstance(value, str):
+            return datetime.strptime(value, "%Y-%m-%d")
+        return value
+
     def save_article(self, article: Article):
         session = self.Session()
         try:
@@ -58,7 +80,7 @@ class PostgresStorage(StorageProvider):
                 db_article = ArticleModel(
                     title=article.title,
                     url=article.url,
-                    published_date=article.published_date,
+                    published_date=self._parse_date(article.published_date),
                     content=article.content,
                     summary=article.summary,
                     image_url=article.image_url,
@@ -79,3 +101,77 @@ class PostgresStorage(StorageProvider):
             return session.query(exists().where(ArticleModel.url == url)).scalar()
         finally:
             session.close()
+
+    def articles_between(self, start: date, end: date) -> list[Article]:
+        """Crawled articles published from `start` through `end` (inclusive), oldest first."""
+        session = self.Session()
+        try:
+            rows = (
+                session.query(ArticleModel)
+                .filter(ArticleModel.published_date >= datetime(start.year, start.month, start.day))
+                .filter(ArticleModel.published_date < datetime(end.year, end.month, end.day) + timedelta(days=1))
+                .filter(ArticleModel.content.isnot(None))
+                .order_by(ArticleModel.published_date, ArticleModel.id)
+                .all()
+            )
+            # source_name isn't stored; the feed's domain is what fetch_feeds would have set
+            return [
+                Article(
+                    title=row.title,
+                    url=row.url,
+                    published_date=row.published_date.strftime("%Y-%m-%d"),
+                    source_name=urlparse(row.url).netloc,
+                    content=row.content,
+                    summary=row.summary,
+                    image_url=row.image_url,
+                    media_id=row.media_id,
+                    status=row.status,
+                )
+                for row in rows
+            ]
+        finally:
+            session.close()
+
+    # --- Feed high-water marks ---
+
+    def get_feed_mark(self, feed_url: str) -> Optional[dict]:
+        """Returns {"entry_id", "published_at"} for the feed, or None if it has no mark."""
+        session = self.Session()
+        try:
+            row = session.get(FeedStateModel, feed_url)
+            if row is None:
+                return None
+            published_at = row.last_published.replace(tzinfo=timezone.utc) if row.last_published else None
+            return {"entry_id": row.last_entry_id, "published_at": published_at}
+        finally:
+            session.close()
+
+    def save_feed_mark(self, feed_url: str, entry_id: Optional[str], published_at: Optional[datetime]):
+        session = self.Session()
+        try:
+            row = session.get(FeedStateModel, feed_url)
+            if row is None:
+                row = FeedStateModel(feed_url=feed_url)
+                session.add(row)
+            row.last_entry_id = entry_id
+            # DateTime columns are naive; marks are always stored as UTC
+            row.last_published = published_at.astimezone(timezone.utc).replace(tzinfo=None) if published_at else None
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            raise e
+        finally:
+            session.close()
+
+    def reset_feed_marks(self, feed_url: Optional[str] = None) -> int:
+        """Deletes the mark for one feed (or all feeds) so the next fetch returns every entry."""
+        session = self.Session()
+        try:
+            query = session.query(FeedStateModel)
+            if feed_url:
+                query = query.filter_by(feed_url=feed_url)
+            count = query.delete()
+            session.commit()
+            return count
+        finally:
+            session.close()
@@ -1,8 +1,11 @@
 from abc import ABC, abstractmethod
 import os
-import dashscope
-from dashscope import MultiModalConversation
+import asyncio
+import threading
+from concurrent.futures import Future
 from typing import Optional
+from .metrics import metrics
+from .resilience import ProviderError, guarded_call, timeout_for
 
 class VisionProvider(ABC):
     @abstractmethod
@@ -15,40 +18,57 @@ class QwenVisionProvider(VisionProvider):
         self.api_key = api_key or os.getenv("DASHSCOPE_API_KEY")
         if not self.api_key:
             raise ValueError("DashScope API key is required for QwenVisionProvider")
+        # Imported on first use so mock runs never load the DashScope SDK
+        import dashscope
         dashscope.api_key = self.api_key
 
+    @staticmethod
+    def _messages(image_url: str) -> list[dict]:
+        return [
+            {
+                "role": "user",
+                "content": [
+                    {"image": image_url},
+                    {"text": "Briefly describe this image for a technical article caption. Keep it under 20 words."}
+                ]
+            }
+        ]
+
+    @staticmethod
+    def _raise_for_status(response):
+        # DashScope returns failures; raising inside the guarded call lets the breaker see them
+        if response.status_code != 200:
+            raise ProviderError(response.status_code, f"Qwen Vision API failed: {response.code} {response.message}")
+
+    @staticmethod
+    def _parse_response(response) -> str:
+        if response.status_code == 200:
+            if 'output' in response and 'choices' in response.output:
+                content = response.output.choices[0]['message']['content']
+                # Sometimes content is a list of dicts, sometimes string depending on SDK version?
+                # DashScope VL usually returns text in content list or direct string.
+                # Let's handle list just in case, but usually it's a struct.
+                if isinstance(content, list):
+                    text = "".join([c.get('text', '') for c in content])
+                    return text.strip()
+                return str(content).strip()
+            return ""
+        else:
+            print(f"Qwen Vision API failed: {response.code} {response.message}")
+            return ""
+
     def describe_image(self, image_url: str) -> str:
         """Uses Qwen-VL to describe the image."""
+        from dashscope import MultiModalConversation
         try:
-            messages = [
-                {
-                    "role": "user",
-                    "content": [
-                        {"image": image_url},
-                        {"text": "Briefly describe this image for a technical article caption. Keep it under 20 words."}
-                    ]
-                }
-            ]
-            
-            response = MultiModalConversation.call(
-                model='qwen-vl-max',
-                messages=messages
-            )
-            
-            if response.status_code == 200:
-                if 'output' in response and 'choices' in response.output:
-                    content = response.output.choices[0]['message']['content']
-                    # Sometimes content is a list of dicts, sometimes string depending on SDK version?
-                    # DashScope VL usually returns text in content list or direct string.
-                    # Let's handle list just in case, but usually it's a struct.
-                    if isinstance(content, list):
-                        text = "".join([c.get('text', '') for c in content])
-                        return text.strip()
-                    return str(content).strip()
-                return ""
-            else:
-                print(f"Qwen Vision API failed: {response.code} {response.message}")
-                return ""
+            with guarded_call("qwen-vl", "qwen-vl", "describe"):
+                response = MultiModalConversation.call(
+                    model='qwen-vl-max',
+                    messages=self._messages(image_url),
+                    request_timeout=int(timeout_for("vision"))
+                )
+                self._raise_for_status(response)
+            return self._parse_response(response)
                 
         except Exception as e:
             print(f"Error describing image {image_url}: {e}")
@@ -57,3 +77,67 @@ class QwenVisionProvider(VisionProvider):
 class MockVisionProvider(VisionProvider):
     def describe_image(self, image_url: str) -> str:
         return "A placeholder description for the image."
+
+class SharedVisionProvider(VisionProvider):
+    """
+    Describes each image once, however many digests look at it. Concurrent
+    callers for the same URL wait on the first call instead of repeating it;
+    empty (failed) descriptions are not cached.
+    """
+    def __init__(self, vision: VisionProvider):
+        self.vision = vision
+        self._lock = threading.Lock()
+        self._futures: dict[str, Future] = {}
+
+    def describe_image(self, image_url: str) -> str:
+        with self._lock:
+            future = self._futures.get(image_url)
+            owner = future is None
+            if owner:
+                future = self._futures[image_url] = Future()
+        if not owner:
+            metrics.record_cache("vision_description", hit=True)
+            return future.result()
+
+        metrics.record_cache("vision_description", hit=False)
+        desc = ""
+        try:
+            desc = self.vision.describe_image(image_url)
+        finally:
+            if not desc:
+                with self._lock:
+                    self._futures.pop(image_url, None)
+            future.set_result(desc)
+        return desc
+
+
+class AsyncVisionProvider(ABC):
+    @abstractmethod
+    async def describe_image(self, image_url: str) -> str:
+        """Returns a concise description of the image content."""
+        pass
+
+class AsyncQwenVisionProvider(AsyncVisionProvider, QwenVisionProvider):
+    """Qwen-VL through DashScope's asyncio client."""
+    async def describe_image(self, image_url: str) -> str:
+        from dashscope import AioMultiModalConversation
+        try:
+            with guarded_call("qwen-vl", "qwen-vl", "describe"):
+                response = await AioMultiModalConversation.call(
+                    model='qwen-vl-max',
+                    messages=self._messages(image_url),
+                    request_timeout=int(timeout_for("vision"))
+                )
+                self._raise_for_status(response)
+            return self._parse_response(response)
+        except Exception as e:
+            print(f"Error describing image {image_url}: {e}")
+            return ""
+
+class AsyncVisionAdapter(AsyncVisionProvider):
+    """Runs a sync VisionProvider in worker threads for the async pipeline."""
+    def __init__(self, vision: VisionProvider):
+        self.vision = vision
+
+    async def describe_image(self, image_url: str) -> str:
+        return await asyncio.to_thread(self.vision.describe_image, image_url)
@@ -1,7 +1,35 @@
 import requests
 import os
 import json
+import time
+import asyncio
+import threading
+import httpx
 from typing import Optional
+from .metrics import metrics
+from .profiling import profiler
+from .resilience import ProviderError, guarded_call, timeout_for
+
+WECHAT_API_BASE = "https://api.weixin.qq.com"
+# errcodes that are the API's trouble rather than the request's: system busy, call frequency/quota limits
+WECHAT_BUSY = {-1: 503, 45009: 429, 45011: 429}
+
+
+class WeChatError(ProviderError):
+    """A non-zero errcode; WeChat reports failures with HTTP 200, so the status is mapped for the circuit breaker."""
+    def __init__(self, data: dict):
+        self.errcode = data.get("errcode")
+        self.errmsg = data.get("errmsg", "")
+        super().__init__(WECHAT_BUSY.get(self.errcode, 400), f"WeChat error {self.errcode}: {self.errmsg}")
+
+
+def _reply(response) -> dict:
+    """The JSON body of a WeChat reply; raises WeChatError for a non-zero errcode (call inside guarded_call)."""
+    data = response.json()
+    if data.get("errcode"):
+        raise WeChatError(data)
+    return data
+
 
 class WeChatPublisher:
     def __init__(self, app_id: Optional[str] = None, app_secret: Optional[str] = None):
@@ -9,19 +37,33 @@ class WeChatPublisher:
         self.app_secret = app_secret or os.getenv("WECHAT_APP_SECRET")
         if not self.app_id or not self.app_secret:
             raise ValueError("WeChat App ID and Secret are required")
+        self.api_base = os.getenv("WECHAT_API_BASE", WECHAT_API_BASE).rstrip("/")
+        self.session = requests.Session()
         self.access_token = None
         self.token_expiry = 0
+        self._token_lock = threading.Lock()
+        # source URL -> uploaded mmbiz URL; uploads belong to this account, so
+        # digests sharing the account (and repeat header checks) reuse them
+        self._article_images = {}
 
     def _get_access_token(self) -> str:
-        # Simple implementation, ideally should cache properly checking expiry time
-        url = f"https://api.weixin.qq.com/cgi-bin/token?grant_type=client_credential&appid={self.app_id}&secret={self.app_secret}"
-        response = requests.get(url)
-        data = response.json()
-        if "access_token" in data:
-            self.access_token = data["access_token"]
-            return self.access_token
-        else:
-            raise Exception(f"Failed to get access token: {data}")
+        # Cached until shortly before expiry; WeChat rate-limits token fetches per day
+        with self._token_lock:
+            if self.access_token and time.time() < self.token_expiry:
+                metrics.record_cache("wechat_token", hit=True)
+                return self.access_token
+            url = f"{self.api_base}/cgi-bin/token?grant_type=client_credential&appid={self.app_id}&secret={self.app_secret}"
+            metrics.record_cache("wechat_token", hit=False)
+            with guarded_call(f"wechat:{self.app_id}", "wechat", "token"):
+                response = self.session.get(url, timeout=timeout_for("wechat"))
+                data = _reply(response)
+            if "access_token" in data:
+                self.access_token = data["access_token"]
+                # Refresh a few minutes early
+                self.token_expiry = time.time() + int(data.get("expires_in", 7200)) - 300
+                return self.access_token
+            else:
+                raise Exception(f"Failed to get access token: {data}")
 
     def upload_image(self, image_url: str) -> str:
         """Downloads image from URL and uploads to WeChat, returns media_id"""
@@ -40,23 +82,24 @@ class WeChatPublisher:
             temp_file = False
         else:
             # Remote URL
-            img_resp = requests.get(image_url)
+            img_resp = self.session.get(image_url, timeout=timeout_for("download"))
             img_resp.raise_for_status()
             filepath = unique_name
             with open(filepath, "wb") as f:
                 f.write(img_resp.content)
             temp_file = True
 
-        upload_url = f"https://api.weixin.qq.com/cgi-bin/material/add_material?access_token={token}&type=image"
+        upload_url = f"{self.api_base}/cgi-bin/material/add_material?access_token={token}&type=image"
         
         try:
-            with open(filepath, "rb") as f:
+            metrics.record_upload("material", os.path.getsize(filepath))
+            with open(filepath, "rb") as f, guarded_call(f"wechat:{self.app_id}", "wechat", "add_material"):
                 files = {'media': f}
-                response = requests.post(upload_url, files=files)
+                response = self.session.post(upload_url, files=files, timeout=timeout_for("wechat"))
+                data = _reply(response)
         finally:
             if temp_file and os.path.exists(filepath):
                 os.remove(filepath)
-        data = response.json()
         if "media_id" in data:
             return data["media_id"]
         else:
@@ -64,6 +107,10 @@ class WeChatPublisher:
 
     def upload_article_image(self, image_url: str) -> str:
         """Uploads an image to be used inside an article (not cover), returns URL"""
+        cached = self._article_images.get(image_url)
+        metrics.record_cache("wechat_article_image", hit=cached is not None)
+        if cached:
+            return cached
         token = self._get_access_token()
         
         import uuid
@@ -77,25 +124,27 @@ class WeChatPublisher:
             filepath = image_url
             temp_file = False
         else:
-            img_resp = requests.get(image_url)
+            img_resp = self.session.get(image_url, timeout=timeout_for("download"))
             img_resp.raise_for_status()
             filepath = unique_name
             with open(filepath, "wb") as f:
                 f.write(img_resp.content)
             temp_file = True
 
-        upload_url = f"https://api.weixin.qq.com/cgi-bin/media/uploadimg?access_token={token}"
+        upload_url = f"{self.api_base}/cgi-bin/media/uploadimg?access_token={token}"
         
         try:
-            with open(filepath, "rb") as f:
+            metrics.record_upload("article_image", os.path.getsize(filepath))
+            with open(filepath, "rb") as f, guarded_call(f"wechat:{self.app_id}", "wechat", "uploadimg"):
                 files = {'media': f}
-                response = requests.post(upload_url, files=files)
+                response = self.session.post(upload_url, files=files, timeout=timeout_for("wechat"))
+                data = _reply(response)
         finally:
             if temp_file and os.path.exists(filepath):
                 os.remove(filepath)
-                
-        data = response.json()
+
         if "url" in data:
+            self._article_images[image_url] = data["url"]
             return data["url"]
         else:
             raise Exception(f"Failed to upload article image: {data}")
@@ -103,7 +152,7 @@ class WeChatPublisher:
     def push_draft(self, title: str, summary: str, media_id: str, content: str, source_url: str, author: str = "") -> str:
         """Pushes a draft to WeChat, returns draft_id or status"""
         token = self._get_access_token()
-        url = f"https://api.weixin.qq.com/cgi-bin/draft/add?access_token={token}"
+        url = f"{self.api_base}/cgi-bin/draft/add?access_token={token}"
         
         article = {
             "title": title,
@@ -116,9 +165,12 @@ class WeChatPublisher:
         
         payload = {"articles": [article]}
         # Ensure proper encoding for Chinese characters
-        response = requests.post(url, data=json.dumps(payload, ensure_ascii=False).encode('utf-8'))
-        
-        data = response.json()
+        with profiler.allocations("draft_json"):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        with guarded_call(f"wechat:{self.app_id}", "wechat", "draft_add"):
+            response = self.session.post(url, data=body, timeout=timeout_for("wechat"))
+            data = _reply(response)
+
         if "media_id" in data: # Draft API returns media_id/article_id? Draft API vs News API differ. 
             # Recent WeChat API changes: 'draft/add' returns media_id usually.
             return data.get("media_id") or str(data)
@@ -130,15 +182,144 @@ class WeChatPublisher:
     def get_draft(self, media_id: str) -> Optional[dict]:
         """Fetches draft details including URL"""
         token = self._get_access_token()
-        url = f"https://api.weixin.qq.com/cgi-bin/draft/get?access_token={token}"
+        url = f"{self.api_base}/cgi-bin/draft/get?access_token={token}"
         payload = {"media_id": media_id}
         
         try:
-            response = requests.post(url, data=json.dumps(payload))
-            data = response.json()
+            with guarded_call(f"wechat:{self.app_id}", "wechat", "draft_get"):
+                response = self.session.post(url, data=json.dumps(payload), timeout=timeout_for("wechat"))
+                data = _reply(response)
             if "news_item" in data and len(data["news_item"]) > 0:
                 return data["news_item"][0] # Return the first item
             return None
         except Exception as e:
             print(f"Error fetching draft: {e}")
             return None
+
+
+class AsyncWeChatPublisher:
+    """
+    asyncio counterpart of WeChatPublisher over a shared httpx.AsyncClient.
+    The access token is cached until shortly before `expires_in`.
+    """
+    def __init__(self, app_id: Optional[str] = None, app_secret: Optional[str] = None, client: Optional[httpx.AsyncClient] = None):
+        self.app_id = app_id or os.getenv("WECHAT_APP_ID")
+        self.app_secret = app_secret or os.getenv("WECHAT_APP_SECRET")
+        if not self.app_id or not self.app_secret:
+            raise ValueError("WeChat App ID and Secret are required")
+        self.client = client or httpx.AsyncClient(timeout=60)
+        self.api_base = os.getenv("WECHAT_API_BASE", WECHAT_API_BASE).rstrip("/")
+        self.access_token = None
+        self.token_expiry = 0
+        self._token_lock = asyncio.Lock()
+
+    async def _get_access_token(self) -> str:
+        async with self._token_lock:
+            if self.access_token and time.time() < self.token_expiry:
+                metrics.record_cache("wechat_token", hit=True)
+                return self.access_token
+            metrics.record_cache("wechat_token", hit=False)
+            with guarded_call(f"wechat:{self.app_id}", "wechat", "token"):
+                response = await self.client.get(
+                    f"{self.api_base}/cgi-bin/token",
+                    params={"grant_type": "client_credential", "appid": self.app_id, "secret": self.app_secret},
+                    timeout=timeout_for("wechat")
+                )
+                data = _reply(response)
+            if "access_token" in data:
+                self.access_token = data["access_token"]
+                # Refresh a few minutes early
+                self.token_expiry = time.time() + int(data.get("expires_in", 7200)) - 300
+                return self.access_token
+            else:
+                raise Exception(f"Failed to get access token: {data}")
+
+    async def _read_image(self, image_url: str) -> bytes:
+        if os.path.exists(image_url):
+            return await asyncio.to_thread(lambda: open(image_url, "rb").read())
+        img_resp = await self.client.get(image_url, follow_redirects=True, timeout=timeout_for("download"))
+        img_resp.raise_for_status()
+        return img_resp.content
+
+    async def upload_image(self, image_url: str) -> str:
+        """Downloads image from URL and uploads to WeChat, returns media_id"""
+        token = await self._get_access_token()
+        content = await self._read_image(image_url)
+        metrics.record_upload("material", len(content))
+        with guarded_call(f"wechat:{self.app_id}", "wechat", "add_material"):
+            response = await self.client.post(
+                f"{self.api_base}/cgi-bin/material/add_material",
+                params={"access_token": token, "type": "image"},
+                files={"media": ("image.jpg", content)},
+                timeout=timeout_for("wechat")
+            )
+            data = _reply(response)
+        if "media_id" in data:
+            return data["media_id"]
+        else:
+            raise Exception(f"Failed to upload image: {data}")
+
+    async def upload_article_image(self, image_url: str) -> str:
+        """Uploads an image to be used inside an article (not cover), returns URL"""
+        token = await self._get_access_token()
+        content = await self._read_image(image_url)
+        metrics.record_upload("article_image", len(content))
+        with guarded_call(f"wechat:{self.app_id}", "wechat", "uploadimg"):
+            response = await self.client.post(
+                f"{self.api_base}/cgi-bin/media/uploadimg",
+                params={"access_token": token},
+                files={"media": ("image.jpg", content)},
+                timeout=timeout_for("wechat")
+            )
+            data = _reply(response)
+        if "url" in data:
+            return data["url"]
+        else:
+            raise Exception(f"Failed to upload article image: {data}")
+
+    async def push_draft(self, title: str, summary: str, media_id: str, content: str, source_url: str, author: str = "") -> str:
+        """Pushes a draft to WeChat, returns draft_id or status"""
+        token = await self._get_access_token()
+        article = {
+            "title": title,
+            "author": author,
+            "digest": summary,
+            "content": content,
+            "content_source_url": source_url,
+            "thumb_media_id": media_id,
+        }
+        with profiler.allocations("draft_json"):
+            body = json.dumps({"articles": [article]}, ensure_ascii=False).encode('utf-8')
+        with guarded_call(f"wechat:{self.app_id}", "wechat", "draft_add"):
+            response = await self.client.post(
+                f"{self.api_base}/cgi-bin/draft/add",
+                params={"access_token": token},
+                content=body,
+                timeout=timeout_for("wechat")
+            )
+            data = _reply(response)
+        if "media_id" in data:
+            return data.get("media_id") or str(data)
+        elif "errcode" in data and data["errcode"] == 0:
+            return "Success"
+        else:
+            raise Exception(f"Failed to push draft: {data}")
+
+    async def get_draft(self, media_id: str) -> Optional[dict]:
+        """Fetches draft details including URL"""
+        try:
+            token = await self._get_access_token()
+            with guarded_call(f"wechat:{self.app_id}", "wechat", "draft_get"):
+                response = await self.client.post(
+                    f"{self.api_base}/cgi-bin/draft/get",
+                    params={"access_token": token},
+                    content=json.dumps({"media_id": media_id}),
+                    timeout=timeout_for("wechat")
+                )
+                data = _reply(response)
+            if "news_item" in data and len(data["news_item"]) > 0:
+                return data["news_item"][0]
+            return None
+        except Exception as e:
+            print(f"Error fetching draft: {e}")
+            return None
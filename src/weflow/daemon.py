@@ -0,0 +1,311 @@
+import os
+import time
+import random
+import signal
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Optional
+from urllib.parse import urlparse
+
+from weflow.main import (
+    load_feed_urls,
+    feed_mark_store,
+    commit_feed_marks,
+    build_components,
+    crawl_article,
+    analyze_article,
+    publish_all,
+)
+from weflow.core.rss import GenericRSS
+from weflow.core.metrics import metrics
+from weflow.core.budget import budget
+from weflow.core.cassette import cassette
+from weflow.core.spill import content_store
+from weflow.core.profiling import profiler
+from weflow.core.dispatch import outbox
+
+# Resident mode: providers, HTTP sessions, the WeChat token and feed validators
+# (ETag/Last-Modified) live for the whole process. Feeds are polled on their
+# own schedule, new entries are crawled and analyzed as they arrive, and the
+# digest is assembled once a day from work that is already done.
+
+NEW_ENTRIES = "weflow_daemon_new_entries_total"
+MAX_INGEST_ATTEMPTS = 3
+# How often the seen-entry bookkeeping is pruned
+PRUNE_INTERVAL = 600
+
+
+class FeedSchedule:
+    """
+    Poll timing for one feed, adapted to how often it actually publishes.
+
+    Keeps an EWMA of the gap between consecutive entries and polls
+    `polls_per_gap` times per expected gap, clamped to [min_interval,
+    max_interval]. Polls that find nothing new while the feed is overdue back
+    the interval off, so feeds that went quiet stop costing requests.
+    """
+    def __init__(self, url: str, min_interval: float = 300, max_interval: float = 6 * 3600, polls_per_gap: int = 2, alpha: float = 0.3, mark_store=None):
+        self.url = url
+        self.rss = GenericRSS(url=url, mark_store=mark_store)
+        self.source_name = urlparse(url).netloc
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.polls_per_gap = polls_per_gap
+        self.alpha = alpha
+        self.gap_ewma: Optional[float] = None
+        self.newest: Optional[float] = None  # newest publish timestamp seen
+        self.empty_polls = 0
+        self.interval = min_interval
+        self.next_poll = 0.0
+
+    def observe(self, published: list[float], now: float):
+        """Updates the gap estimate from one poll's publish timestamps and schedules the next poll."""
+        fresh = sorted(t for t in published if self.newest is None or t > self.newest)
+        prev = self.newest
+        for t in fresh:
+            if prev is not None and t > prev:
+                gap = t - prev
+                self.gap_ewma = gap if self.gap_ewma is None else self.alpha * gap + (1 - self.alpha) * self.gap_ewma
+            prev = t
+        if fresh:
+            self.newest = fresh[-1]
+            self.empty_polls = 0
+        else:
+            self.empty_polls += 1
+
+        if self.gap_ewma is None:
+            interval = self.min_interval * 1.5 ** self.empty_polls
+        else:
+            interval = self.gap_ewma / self.polls_per_gap
+            if self.newest is not None and now - self.newest > 2 * self.gap_ewma:
+                interval *= 1.5 ** self.empty_polls
+        self.interval = min(self.max_interval, max(self.min_interval, interval))
+        # Jitter so feeds on the same host don't poll in lockstep
+        self.next_poll = now + self.interval * random.uniform(0.9, 1.1)
+
+
+def next_digest_at(digest_time: str, now: datetime) -> datetime:
+    """Next local datetime matching "HH:MM"."""
+    hour, minute = (int(x) for x in digest_time.split(":"))
+    at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    return at if at > now else at + timedelta(days=1)
+
+
+class Daemon:
+    def __init__(
+        self,
+        components: dict,
+        feed_urls: list[str],
+        digest_time: str = "08:00",
+        workers: int = 5,
+        min_interval: float = 300,
+        max_interval: float = 6 * 3600,
+        lookback_hours: float = 48,
+    ):
+        self.c = components
+        # High-water marks let a restarted daemon skip entries already in a digest
+        mark_store = feed_mark_store(components["storage"])
+        self.feeds = [
+            FeedSchedule(url, min_interval=min_interval, max_interval=max_interval, mark_store=mark_store)
+            for url in feed_urls
+        ]
+        self.digest_time = digest_time
+        self.lookback = lookback_hours * 3600
+        self.poll_pool = ThreadPoolExecutor(max_workers=min(8, max(1, len(self.feeds))), thread_name_prefix="weflow-poll")
+        self.ingest_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="weflow-ingest")
+        self.digest_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="weflow-digest")
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.wakeup = threading.Event()  # set when a poll finishes, so its next poll gets scheduled
+        self.seen = {}               # entry URL already queued or done -> when a poll last listed it
+        self.failures = defaultdict(int)
+        self.retry = set()           # seen entries whose ingest failed: taken again on their next listing
+        self.last_prune = time.time()
+        self.analyzed = {}           # url -> analyzed Article awaiting a digest
+        self.feed_of = {}            # url -> FeedSchedule, for committing marks
+        self.taken = {}              # url -> (poll time, entry) taken for ingest and not in a digest yet (queued, failed, dropped or analyzed)
+        self.polling = set()         # feeds with a poll in flight
+        self.digest_running = False
+        self.next_digest = next_digest_at(digest_time, datetime.now())
+
+    @classmethod
+    def from_env(cls, components: dict) -> "Daemon":
+        return cls(
+            components,
+            load_feed_urls(),
+            digest_time=os.getenv("DIGEST_TIME", "08:00"),
+            workers=int(os.getenv("DAEMON_WORKERS", "5")),
+            min_interval=float(os.getenv("DAEMON_MIN_POLL_SECONDS", "300")),
+            max_interval=float(os.getenv("DAEMON_MAX_POLL_SECONDS", str(6 * 3600))),
+            lookback_hours=float(os.getenv("DAEMON_LOOKBACK_HOURS", "48")),
+        )
+
+    # --- Ingestion ---
+
+    def poll(self, feed: FeedSchedule):
+        try:
+            articles = feed.rss.fetch_articles()
+        except Exception as e:
+            print(f"Error fetching {feed.url}: {e}")
+            articles = []
+        now = time.time()
+        feed.observe([a.published_at.timestamp() for a in articles if a.published_at], now)
+
+        new = []
+        with self.lock:
+            self.polling.discard(feed.url)
+            for a in articles:
+                if a.url in self.seen and a.url not in self.retry:
+                    self.seen[a.url] = now
+                    continue
+                self.seen[a.url] = now
+                self.retry.discard(a.url)
+                # Old entries are marked seen on the first sweep but never processed
+                if a.published_at and now - a.published_at.timestamp() > self.lookback:
+                    continue
+                a.source_name = feed.source_name
+                self.feed_of[a.url] = feed
+                self.taken[a.url] = (now, a)
+                new.append(a)
+            if now - self.last_prune > PRUNE_INTERVAL:
+                self.prune_seen(now)
+        metrics.inc(NEW_ENTRIES, len(new), feed=feed.source_name)
+        if new:
+            print(f"[{feed.source_name}] {len(new)} new entries, next poll in {feed.interval / 60:.0f} min")
+        for a in new:
+            self.ingest_pool.submit(self.ingest, a)
+        self.wakeup.set()
+
+    def prune_seen(self, now: float):
+        """
+        Forgets entries no poll has listed for the lookback window: they have
+        rolled off their feed, so they can't come back as new. Call with the lock held.
+        """
+        cutoff = now - self.lookback
+        for url in [url for url, listed in self.seen.items() if listed < cutoff]:
+            del self.seen[url]
+            self.failures.pop(url, None)
+            self.retry.discard(url)
+            if url not in self.analyzed:
+                self.feed_of.pop(url, None)
+                self.taken.pop(url, None)
+        self.last_prune = now
+
+    def ingest(self, article):
+        # Over the cycle's budget the entry is dropped for good (and reported with the digest)
+        if not budget.admit_one(article, "crawl"):
+            return
+        try:
+            with metrics.stage("ingest"):
+                crawled = crawl_article(article, self.c["crawler"], self.c["storage"])
+                analyzed = analyze_article(crawled, self.c["llm"]) if crawled else None
+        finally:
+            budget.release(article, "crawl")
+        with self.lock:
+            if analyzed:
+                self.analyzed[analyzed.url] = analyzed
+                return
+            # Let the next poll of the feed pick it up again, a few times at most
+            self.failures[article.url] += 1
+            if self.failures[article.url] < MAX_INGEST_ATTEMPTS:
+                self.retry.add(article.url)
+
+    # --- Digest ---
+
+    def run_digest(self, day: str):
+        try:
+            with self.lock:
+                articles = [a for a in self.analyzed.values() if a.published_date == day]
+            print(f"Assembling digest for {day} from {len(articles)} analyzed articles...")
+            if not articles:
+                print(f"No analyzed articles for {day}, skipping digest.")
+            elif publish_all(articles, self.c, day):
+                commit_feed_marks(self.feed_entries(), articles)
+            with self.lock:
+                # Everything at or before the digest day is done with
+                self.analyzed = {url: a for url, a in self.analyzed.items() if (a.published_date or "") > day}
+                for a in articles:
+                    self.feed_of.pop(a.url, None)
+                    self.taken.pop(a.url, None)
+        except Exception as e:
+            print(f"Digest for {day} failed: {e}")
+        finally:
+            # One metrics report (and one budget) per digest cycle
+            budget.report()
+            budget.reset()
+            metrics.export()
+            metrics.reset()
+            with self.lock:
+                self.digest_running = False
+
+    def feed_entries(self) -> list:
+        """
+        (rss, entries) per feed for commit_feed_marks: every entry taken and
+        not yet in a digest, so those still queued, retrying, failed or
+        dropped by the budget hold the feed's mark back.
+        """
+        with self.lock:
+            by_feed = defaultdict(list)
+            # Newest first, as in a feed: later polls first, each poll in feed order
+            for url, (_, a) in sorted(self.taken.items(), key=lambda item: -item[1][0]):
+                feed = self.feed_of.get(url)
+                if feed is not None:
+                    by_feed[feed].append(a)
+        return [(feed.rss, arts) for feed, arts in by_feed.items()]
+
+    # --- Main loop ---
+
+    def tick(self, now: float):
+        """Starts whatever is due: feed polls and the daily digest."""
+        with self.lock:
+            for feed in self.feeds:
+                if feed.next_poll <= now and feed.url not in self.polling:
+                    self.polling.add(feed.url)
+                    self.poll_pool.submit(self.poll, feed)
+            if datetime.now() >= self.next_digest and not self.digest_running:
+                day = (self.next_digest - timedelta(days=1)).strftime("%Y-%m-%d")
+                self.digest_running = True
+                self.next_digest = next_digest_at(self.digest_time, datetime.now())
+                self.digest_pool.submit(self.run_digest, day)
+
+    def run(self):
+        print(f"WeFlow daemon: {len(self.feeds)} feeds, next digest at {self.next_digest:%Y-%m-%d %H:%M}")
+        while not self.stop_event.is_set():
+            self.tick(time.time())
+            with self.lock:
+                wake = min([f.next_poll for f in self.feeds if f.url not in self.polling] + [self.next_digest.timestamp()])
+            self.wakeup.wait(min(60.0, max(0.0, wake - time.time())))
+            self.wakeup.clear()
+        print("Stopping: waiting for in-flight work...")
+        for pool in (self.poll_pool, self.ingest_pool, self.digest_pool):
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def stop(self, *_):
+        self.stop_event.set()
+        self.wakeup.set()
+
+
+def main():
+    metrics.configure_from_env()
+    budget.configure_from_env()
+    cassette.configure_from_env()
+    content_store.configure_from_env()
+    profiler.configure_from_env()
+    outbox.configure_from_env()
+    c = build_components()
+    if c is None:
+        return
+    daemon = Daemon.from_env(c)
+    signal.signal(signal.SIGTERM, daemon.stop)
+    signal.signal(signal.SIGINT, daemon.stop)
+    try:
+        daemon.run()
+    finally:
+        outbox.close()
+        profiler.export()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,11 @@ import os
 import time
 import re
 import json
+import uuid
+import hashlib
 from collections import defaultdict
 from dotenv import load_dotenv
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 from datetime import datetime, timedelta
 
@@ -12,15 +14,24 @@ from datetime import datetime, timedelta
 env_path = os.path.join(os.getcwd(), '.env')
 load_dotenv(dotenv_path=env_path, override=True)
 
-from weflow.core.rss import GenericRSS
-from weflow.core.crawler import FirecrawlCrawler
-from weflow.core.llm import DeepSeekLLM
-from weflow.core.image import MockImageProvider, QwenImageProvider, GeminiImageProvider
-from weflow.core.storage import PostgresStorage
+from weflow.core.rss import GenericRSS, has_full_text, entry_order, CRAWLS_AVOIDED
 from weflow.core.wechat import WeChatPublisher
 from weflow.core.formatter import WeChatFormatter
-from weflow.core.vision import QwenVisionProvider, MockVisionProvider
 from weflow.core.notifier import FeishuNotifier
+from weflow.core.dedup import fold_near_duplicates
+from weflow.core.imagescreen import ImageScreen
+from weflow.core.digests import load_digest_definitions
+from weflow.core.vision import SharedVisionProvider
+from weflow.core.metrics import metrics
+from weflow.core.budget import budget, ANALYZE_CHARS, SYNTHESIS_CHARS
+from weflow.core.cassette import cassette
+from weflow.core.spill import content_store
+from weflow.core.profiling import profiler
+from weflow.core.dispatch import outbox
+from weflow.core.resilience import timeout_for
+# LLM, crawler, image and vision providers (and their SDKs) are imported by the
+# registry only when created; storage pulls in SQLAlchemy, so it is deferred too.
+from weflow.core.registry import registry
 
 DEFAULT_RSS_FEEDS = [
     "https://openai.com/blog/rss.xml",
@@ -37,6 +48,78 @@ DEFAULT_RSS_FEEDS = [
     "https://www.artificialintelligence-news.com/feed/rss/"
 ]
 
+TOPIC_MAP = {
+    "Generative AI": "生成式 AI",
+    "Robotics": "机器人技术",
+    "Hardware/Chips": "芯片与硬件",
+    "Industry/Business": "产业动态",
+    "Programming/Dev": "编程与开发",
+    "Science/Research": "科研前沿",
+    "Agi/Safety": "AGI 与安全",
+    "Other": "其他"
+}
+
+# Image prompts; their fixed prefixes double as prompt classes for the generated-image cache
+COVER_PROMPT = "Futuristic collage for topics: {topics}"
+HEADER_PROMPT = "Abstract tech illustration for {topic}: {title}"
+IMAGE_PROMPT_CLASSES = {
+    "cover": COVER_PROMPT.split("{")[0],
+    "header": HEADER_PROMPT.split("{")[0],
+}
+HEADER_PLACEHOLDER = "https://via.placeholder.com/600x300?text=No+Image"
+
+def load_feed_urls() -> list[str]:
+    """RSS_FEEDS (comma separated) overrides the built-in list."""
+    env_feeds = os.getenv("RSS_FEEDS", "")
+    feed_urls = env_feeds.split(",") if env_feeds else DEFAULT_RSS_FEEDS
+    return [url.strip() for url in feed_urls if url.strip()]
+
+def provider_names() -> dict:
+    """Provider name per kind: LLM_PROVIDER, CRAWLER_PROVIDER, IMAGE_PROVIDER, VISION_PROVIDER."""
+    return {
+        "llm": (os.getenv("LLM_PROVIDER") or ("hedged" if os.getenv("LLM_ENDPOINTS") else "deepseek")).lower(),
+        "crawler": os.getenv("CRAWLER_PROVIDER", "firecrawl").lower(),
+        "image": os.getenv("IMAGE_PROVIDER", "mock").lower(),
+        "vision": (os.getenv("VISION_PROVIDER") or ("qwen" if os.getenv("DASHSCOPE_API_KEY") else "mock")).lower(),
+    }
+
+def feed_mark_store(storage):
+    """
+    Storage for per-feed high-water marks, so fetches only return new entries.
+    RSS_INCREMENTAL=0 turns marks off; RSS_RESET_MARKS=1 clears them first.
+    """
+    if storage is None or os.getenv("RSS_INCREMENTAL", "1").lower() in ("0", "false", "no"):
+        return None
+    if os.getenv("RSS_RESET_MARKS", "").lower() in ("1", "true", "yes"):
+        print(f"Reset {storage.reset_feed_marks()} feed high-water marks.")
+    return storage
+
+def done_entries(arts, processed_urls):
+    """
+    The processed entries of one feed that the mark may pass: those older
+    than every entry the run selected but did not process (dropped by the
+    budget, or failed to crawl or analyze), so those are fetched again.
+    """
+    pending = [(i, a) for i, a in enumerate(arts) if a.url not in processed_urls]
+    done = [(i, a) for i, a in enumerate(arts) if a.url in processed_urls]
+    if not pending:
+        return [a for _, a in done]
+    if all(a.published_at for _, a in pending + done):
+        cutoff = min(entry_order(a.published_at, a.entry_id) for _, a in pending)
+        return [a for _, a in done if entry_order(a.published_at, a.entry_id) < cutoff]
+    # Undated entries: feeds list newest first
+    cutoff = max(i for i, _ in pending)
+    return [a for i, a in done if i > cutoff]
+
+def commit_feed_marks(fetched, processed):
+    """Advances each feed's mark past the entries this run processed, never past one it didn't; (rss, articles) pairs"""
+    processed_urls = {a.url for a in processed}
+    for rss, arts in fetched:
+        try:
+            rss.advance_mark(done_entries(arts, processed_urls))
+        except Exception as e:
+            print(f"Failed to save high-water mark for {rss.url}: {e}")
+
 def extract_image_urls(markdown_content: str) -> list[str]:
     if not markdown_content:
         return []
@@ -45,6 +128,11 @@ def extract_image_urls(markdown_content: str) -> list[str]:
 def crawl_article(article, crawler, storage):
     """Step 1: Crawl single article"""
     try:
+        if has_full_text(article):
+            metrics.inc(CRAWLS_AVOIDED)
+            storage.save_article(article)
+            return article
+
         # Check storage
         if storage.article_exists(article.url):
              # For now, skip re-crawling if exists, but we need the content for analysis
@@ -61,14 +149,20 @@ def crawl_article(article, crawler, storage):
         print(f"Error crawling {article.title}: {e}")
         return None
 
+def report_crawls_avoided(articles):
+    """Prints how many of the articles to crawl already came with their full text from the feed"""
+    from_feed = sum(1 for a in articles if has_full_text(a))
+    if from_feed:
+        print(f"Full text from feeds: {from_feed} of {len(articles)} crawls avoided.")
+
 def analyze_article(article, llm):
     """Step 2: Analyze topic and relevance"""
-    if not article.content:
+    if not article.content_chars:
         return None
     
     try:
-        # analyze returns JSON string
-        analysis_json = llm.analyze(article.content)
+        # analyze returns JSON string; only the head the prompt uses is read back
+        analysis_json = llm.analyze(article.content_head(ANALYZE_CHARS))
         data = json.loads(analysis_json)
         
         # Attach analysis to article object (dynamically)
@@ -78,39 +172,81 @@ def analyze_article(article, llm):
         print(f"Error analyzing {article.title}: {e}")
         return None
 
-def synthesize_topic(topic, articles, llm, image_gen, vision, wechat, storage, used_images):
-    """Step 3: Synthesize report for a topic cluster (Markdown + Multimodal)"""
+def select_recommended(analyzed_articles):
+    """Step 3a: Drop noise and fold near-duplicates (folding mutates the kept articles, so run it once)"""
+    recommended_articles = []
+    for art in analyzed_articles:
+        if not hasattr(art, 'analysis') or not art.analysis:
+            continue
+            
+        if not art.analysis.get('recommended'):
+            print(f"Skipping noise: {art.title} ({art.analysis.get('reason')})")
+            continue
+        recommended_articles.append(art)
+
+    # Fold near-duplicate write-ups of the same story before they reach synthesis
+    return budget.admit(fold_near_duplicates(recommended_articles), "synthesize")
+
+def group_by_topic(recommended_articles, topic_map=TOPIC_MAP, keep=None):
+    """Step 3b: Group by (translated) topic; keep(raw_topic, topic) filters topics"""
+    clusters = defaultdict(list)
+    for art in recommended_articles:
+        raw_topic = art.analysis.get('topic', 'Other')
+        # Map to Chinese immediately
+        topic = topic_map.get(raw_topic, raw_topic)
+        if keep and not keep(raw_topic, topic):
+            continue
+        clusters[topic].append(art)
+    return clusters
+
+def build_clusters(analyzed_articles, topic_map=TOPIC_MAP):
+    """Step 3: Drop noise, fold near-duplicates and group by (translated) topic"""
+    return group_by_topic(select_recommended(analyzed_articles), topic_map)
+
+def synthesize_topic(topic, articles, llm, image_gen, vision, wechat, storage, used_images, screen=None):
+    """Step 3: Synthesize report for a topic cluster (Markdown + Multimodal); the header may be a Future"""
     print(f"Synthesizing topic: {topic} ({len(articles)} articles)...")
     
     # Prepare data for LLM
     articles_data = []
     image_candidates = [] # list of {url, description}
+    image_urls = []
     
     for art in articles:
+        # One read of the (possibly spilled) body; the prompt only ever sees its head
+        content = art.content
         articles_data.append({
             "title": art.title,
             "source_name": getattr(art, 'source_name', 'Unknown Source'),
-            "content": art.content
+            "content": content[:SYNTHESIS_CHARS] if content else content,
+            "summary": (art.analysis or {}).get("summary"),
+            "also_reported_by": [src.get("source_name") for src in art.extra_sources]
         })
-        # Extract images
-        imgs = extract_image_urls(art.content)
-        for img_url in imgs:
-            if not img_url.startswith("http"): continue
-            
-            # Global Deduplication check
-            if img_url in used_images:
-                continue
-            
-            used_images.add(img_url)
-            
-            # Limit to top 2 images per article to save time/cost
-            if len(image_candidates) >= 5: break
-            
-            print(f"Analyzing image: {img_url}")
-            desc = vision.describe_image(img_url)
-            if desc:
-                image_candidates.append({"url": img_url, "description": desc})
-                print(f"-> Desc: {desc[:50]}...")
+        # Extract images (Global Deduplication check against other topics)
+        for img_url in extract_image_urls(content):
+            if img_url.startswith("http") and img_url not in used_images:
+                image_urls.append(img_url)
+
+    # Drop pixels/icons/badges from their headers alone and try the biggest, earliest images first
+    if screen:
+        image_urls = [info.url for info in screen.screen(image_urls)]
+
+    for img_url in image_urls:
+        # Limit vision calls to save time/cost
+        if len(image_candidates) >= 5: break
+        if img_url in used_images:
+            continue
+        used_images.add(img_url)
+        
+        print(f"Analyzing image: {img_url}")
+        desc = vision.describe_image(img_url)
+        if desc:
+            image_candidates.append({"url": img_url, "description": desc})
+            print(f"-> Desc: {desc[:50]}...")
+
+    # With no usable original image the AI header is certain: render it while the report is written
+    header_prompt = HEADER_PROMPT.format(topic=topic, title=articles[0].title)
+    header_future = image_gen.submit(header_prompt) if not image_candidates else None
 
     # Synthesize (Markdown)
     report_md = llm.synthesize_report(articles_data, topic, images=image_candidates)
@@ -146,136 +282,257 @@ def synthesize_topic(topic, articles, llm, image_gen, vision, wechat, storage, u
         except:
             continue
             
-    # Fallback to AI for header image if no suitable original found
+    # Fallback to AI for header image if no suitable original found. Returned as
+    # a future and uploaded after all topics are written, so it renders meanwhile
     if not wechat_header_url:
         print(f"[{topic}] Generating AI illustration for header...")
-        try:
-            gen_url = image_gen.generate_image(f"Abstract tech illustration for {topic}: {articles[0].title}")
-            wechat_header_url = wechat.upload_article_image(gen_url)
-        except Exception as e:
-            print(f"[{topic}] Image generation for header failed: {e}")
-            wechat_header_url = "https://via.placeholder.com/600x300?text=No+Image" # Placeholder if AI fails too
+        return report_md, header_future or image_gen.submit(header_prompt)
             
     return report_md, wechat_header_url
 
+def resolve_header(topic, header, wechat):
+    """Uploads an AI header once its generation future is done; URLs pass through"""
+    if not isinstance(header, Future):
+        return header
+    try:
+        return wechat.upload_article_image(header.result(timeout=timeout_for("image")))
+    except TimeoutError:
+        print(f"[{topic}] Header image not ready in {timeout_for('image'):.0f}s, skipping it")
+    except Exception as e:
+        print(f"[{topic}] Image generation for header failed: {e}")
+    return HEADER_PLACEHOLDER # Placeholder if AI fails too
 
-from weflow.core.notifier import FeishuNotifier
+def fallback_cover(header_maps):
+    """A topic header to use as cover when the AI cover is not ready in time; None if there is none"""
+    return next((url for url in header_maps.values() if url and url != HEADER_PLACEHOLDER), None)
 
-def main():
-    print("Starting WeFlow Service (Advanced Synthesis Mode)...")
-    
-    # Init Components
+def wait_for_cover(cover_future, header_maps):
+    """The AI cover's URL; a topic header if it is not ready within the image timeout"""
     try:
-        crawler = FirecrawlCrawler() if os.getenv("FIRECRAWL_API_KEY") else None
-        llm = DeepSeekLLM() if os.getenv("DEEPSEEK_API_KEY") else None
-        storage = PostgresStorage() if os.getenv("DATABASE_URL") else None
-        wechat = WeChatPublisher() if os.getenv("WECHAT_APP_ID") else None
-        notifier = FeishuNotifier()
+        return cover_future.result(timeout=timeout_for("image"))
+    except TimeoutError:
+        cover_url = fallback_cover(header_maps)
+        if not cover_url:
+            raise TimeoutError(f"cover not ready in {timeout_for('image'):.0f}s and no header to use instead")
+        print(f"Cover not ready in {timeout_for('image'):.0f}s, using a topic header instead")
+        return cover_url
+
+
+def upload_cover(cover_url, wechat, image_cache=None):
+    """Cover as WeChat permanent material; a cached cover already uploaded to this account is reused"""
+    media_id = image_cache.media_id(cover_url, wechat.app_id) if image_cache else None
+    if media_id:
+        print(f"Reusing uploaded cover: {media_id}")
+        return media_id
+    media_id = wechat.upload_image(cover_url)
+    if image_cache:
+        image_cache.remember_media_id(cover_url, wechat.app_id, media_id)
+    return media_id
+
+def topic_sections(md_segments, header_maps):
+    """Turns (topic, markdown, articles) segments into one Markdown section per topic, returns (sections, source articles)"""
+    sections = []
+    all_source_articles = []
+    for topic, md_content, articles_in_topic in md_segments:
+        section_md = f"## {topic}\n\n"
+        if topic in header_maps and header_maps[topic]:
+            section_md += f"![Header]({header_maps[topic]})\n\n"
+        section_md += md_content
+        sections.append(section_md)
+        all_source_articles.extend(articles_in_topic)
+
+    return sections, all_source_articles
+
+def unify_mode():
+    """UNIFY_MODE=sections (default) keeps finished sections and only writes the glue; full rewrites the whole draft"""
+    return os.getenv("UNIFY_MODE", "sections").lower()
+
+def render_digest_html(unified_md, all_source_articles, date_str, author=""):
+    """Converts the unified Markdown to WeChat HTML and appends the source links"""
+    with profiler.allocations("format"):
+        report_html = WeChatFormatter.markdown_to_html(unified_md)
+
+        # Add Source Links
+        source_links_html = "<div style='margin-top:20px; font-size:12px; color:#999;'>Sources:<br>"
+        for art in all_source_articles:
+            source_links_html += f"<a href='{art.url}' style='color:#999; margin-right:10px; text-decoration: none;'>• {art.title}</a><br>"
+            for extra in art.extra_sources:
+                source_links_html += f"<a href='{extra['url']}' style='color:#999; margin-right:10px; text-decoration: none;'>• {extra['title']}</a><br>"
+        source_links_html += "</div>"
         
-        image_provider_name = os.getenv("IMAGE_PROVIDER", "mock").lower()
-        if image_provider_name == "qwen":
-            image_gen = QwenImageProvider()
-        elif image_provider_name == "gemini":
-            image_gen = GeminiImageProvider()
+        final_html = report_html + source_links_html
+        return WeChatFormatter.wrap_full_article(final_html, date_str, author=author)
+
+
+def build_components(require=("crawler", "llm", "storage", "wechat")):
+    """Creates all providers from the environment; None if init fails or a `require`d one is missing"""
+    try:
+        names = provider_names()
+        if names["crawler"] != "firecrawl" or os.getenv("FIRECRAWL_API_KEY"):
+            crawler = registry.create("crawler", names["crawler"])
         else:
-            image_gen = MockImageProvider()
-        
-        # Init Vision
-        if os.getenv("DASHSCOPE_API_KEY"):
-            vision = QwenVisionProvider()
+            crawler = None
+        if names["llm"] != "deepseek" or os.getenv("DEEPSEEK_API_KEY"):
+            llm = registry.create("llm", names["llm"])
+        else:
+            llm = None
+        if os.getenv("DATABASE_URL"):
+            from weflow.core.storage import PostgresStorage
+            storage = PostgresStorage()
         else:
-            vision = MockVisionProvider()
+            storage = None
+        if outbox.enabled and storage:
+            outbox.bind(storage.engine)
+        elif outbox.enabled:
+            print("OUTBOX needs DATABASE_URL; publishing inline.")
+        wechat = WeChatPublisher() if os.getenv("WECHAT_APP_ID") else None
+        notifier = FeishuNotifier()
+        image_gen = registry.create("image", names["image"])
+        vision = registry.create("vision", names["vision"])
+        image_screen = ImageScreen.from_env()
+        image_cache = None
+        if names["image"] != "mock":
+            from weflow.core.image_cache import GeneratedImageCache, CachedImageProvider
+            image_cache = GeneratedImageCache.from_env()
+            if image_cache:
+                image_gen = CachedImageProvider(image_gen, image_cache, names["image"], IMAGE_PROMPT_CLASSES)
 
     except Exception as e:
         print(f"Init failed: {e}")
-        return
+        return None
 
-    if not all([crawler, llm, storage, wechat]):
+    components = {
+        "crawler": crawler,
+        "llm": llm,
+        "storage": storage,
+        "wechat": wechat,
+        "notifier": notifier,
+        "outbox": outbox if outbox.store else None,
+        "image_gen": image_gen,
+        "image_cache": image_cache,
+        "image_screen": image_screen,
+        "vision": vision,
+    }
+    if not all(components[name] for name in require):
         print("Missing config (check .env).")
-        return
-        
-    # RSS Feeds
-    env_feeds = os.getenv("RSS_FEEDS", "")
-    feed_urls = env_feeds.split(",") if env_feeds else DEFAULT_RSS_FEEDS
-    rss_providers = [GenericRSS(url=url.strip()) for url in feed_urls if url.strip()]
-    
-    # 1. Fetch All Articles
+        return None
+
+    return components
+
+
+def fetch_feeds(mark_store=None):
+    """Step 1: Fetch all feeds; returns (all articles, [(rss, articles)] for committing marks)"""
+    from urllib.parse import urlparse
+    rss_providers = [GenericRSS(url=url, mark_store=mark_store) for url in load_feed_urls()]
+
     print("Fetching articles...")
     all_articles = []
-    for rss in rss_providers:
-        try:
-            from urllib.parse import urlparse
-            domain = urlparse(rss.url).netloc
-            
-            arts = rss.fetch_articles()
-            for a in arts:
-                a.source_name = domain 
-            all_articles.extend(arts)
-        except Exception as e:
-            print(f"Error fetching {rss.url}: {e}")
-            
-    
-    json.dump([a.__dict__ for a in all_articles], open("articles.json", "w"), indent=2, ensure_ascii=False)
+    fetched = []
+    with metrics.stage("fetch"):
+        for rss in rss_providers:
+            try:
+                domain = urlparse(rss.url).netloc
+                
+                arts = rss.fetch_articles()
+                for a in arts:
+                    a.source_name = domain 
+                all_articles.extend(arts)
+                fetched.append((rss, arts))
+            except Exception as e:
+                print(f"Error fetching {rss.url}: {e}")
+    return all_articles, fetched
 
-    # Filter for yesterday
+def release_catalog(fetched, selected):
+    """Narrows each feed's entries to the selected ones (all commit_feed_marks needs), so the rest of the catalog can be freed"""
+    keep = {a.url for a in selected}
+    return [(rss, [a for a in arts if a.url in keep]) for rss, arts in fetched]
+
+def select_digest_articles(all_articles):
+    """Yesterday's articles, or the 20 best (source weight, recency) as a fallback; returns (day, articles, is_fallback)"""
     today_str = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
     today_articles = [a for a in all_articles if a.published_date == today_str]
     
     is_fallback = False
     if not today_articles:
-        print("No articles for today. Switching to Fallback Strategy (Recent 20)...")
-        # Fallback: take top 20 recent articles
-        today_articles = all_articles[:20]
+        print("No articles for today. Switching to Fallback Strategy (Top 20)...")
+        # Fallback: take the 20 best-ranked articles
+        today_articles = budget.rank(all_articles)[:20]
         is_fallback = True
+    return today_str, today_articles, is_fallback
+
+
+def run_pipeline():
+    print("Starting WeFlow Service (Advanced Synthesis Mode)...")
     
+    c = build_components()
+    if c is None:
+        return
+    crawler, llm, storage = c["crawler"], c["llm"], c["storage"]
+        
+    # RSS Feeds (only entries past each feed's high-water mark)
+    all_articles, fetched = fetch_feeds(feed_mark_store(storage))
+    
+    with profiler.allocations("articles_json"), open("articles.json", "w") as f:
+        json.dump([a.model_dump(mode="json") for a in all_articles], f, indent=2, ensure_ascii=False)
+
+    today_str, today_articles, is_fallback = select_digest_articles(all_articles)
+    # Only the selected entries go further; don't keep the whole feed catalog alive through the run
+    fetched = release_catalog(fetched, today_articles)
+    del all_articles
     if not today_articles:
         print("No articles found even with fallback.")
         return
         
     print(f"Creating pipeline for {len(today_articles)} articles (Fallback: {is_fallback})...")
     
-    # 2. Crawl & Analyze (Parallel)
+    # 2. Crawl & Analyze (Parallel), each stage only taking what the run budget admits
     crawled_articles = []
-    with ThreadPoolExecutor(max_workers=5) as executor:
+    to_crawl = budget.admit(today_articles, "crawl")
+    report_crawls_avoided(to_crawl)
+    with metrics.stage("crawl"), ThreadPoolExecutor(max_workers=5) as executor:
         # Step 2a: Crawl
-        future_crawl = {executor.submit(crawl_article, a, crawler, storage): a for a in today_articles}
+        future_crawl = {executor.submit(crawl_article, a, crawler, storage): a for a in to_crawl}
         for f in tqdm(as_completed(future_crawl), total=len(future_crawl), desc="Crawling"):
             res = f.result()
             if res: crawled_articles.append(res)
             
     analyzed_articles = []
-    with ThreadPoolExecutor(max_workers=5) as executor:
+    with metrics.stage("analyze"), ThreadPoolExecutor(max_workers=5) as executor:
         # Step 2b: Analyze
-        future_analyze = {executor.submit(analyze_article, a, llm): a for a in crawled_articles}
+        future_analyze = {executor.submit(analyze_article, a, llm): a for a in budget.admit(crawled_articles, "analyze")}
         for f in tqdm(as_completed(future_analyze), total=len(future_analyze), desc="Analyzing"):
             res = f.result()
             if res: analyzed_articles.append(res)
+
+    # Back to feed order, so topic order (and the cover prompt) doesn't depend on completion order
+    feed_order = {a.url: i for i, a in enumerate(today_articles)}
+    analyzed_articles.sort(key=lambda a: feed_order.get(a.url, len(feed_order)))
             
+    # Marks only move once the digest is out, so a failed run can simply be retried
+    if publish_all(analyzed_articles, c, today_str):
+        commit_feed_marks(fetched, analyzed_articles)
+
+def publish_digest(analyzed_articles, c, today_str):
+    """Steps 3-5 over already analyzed articles: cluster, synthesize, unify and push the draft"""
     # 3. Clustering
-    TOPIC_MAP = {
-        "Generative AI": "生成式 AI",
-        "Robotics": "机器人技术",
-        "Hardware/Chips": "芯片与硬件",
-        "Industry/Business": "产业动态",
-        "Programming/Dev": "编程与开发",
-        "Science/Research": "科研前沿",
-        "Agi/Safety": "AGI 与安全",
-        "Other": "其他"
-    }
+    with metrics.stage("cluster"):
+        clusters = build_clusters(analyzed_articles)
+    return publish_clusters(clusters, c, today_str)
 
-    clusters = defaultdict(list)
-    for art in analyzed_articles:
-        if not hasattr(art, 'analysis') or not art.analysis:
-            continue
-            
-        if not art.analysis.get('recommended'):
-            print(f"Skipping noise: {art.title} ({art.analysis.get('reason')})")
-            continue
-            
-        raw_topic = art.analysis.get('topic', 'Other')
-        # Map to Chinese immediately
-        topic = TOPIC_MAP.get(raw_topic, raw_topic)
-        clusters[topic].append(art)
+def draft_key(app_id, today_str, title_suffix, clusters):
+    """Outbox idempotency key: the same digest over the same articles is one draft"""
+    urls = sorted(a.url for arts in clusters.values() for a in arts)
+    digest = hashlib.sha256("\n".join(urls).encode("utf-8")).hexdigest()[:16]
+    return f"draft:{app_id}:{today_str}:{title_suffix}:{digest}"
+
+def publish_clusters(clusters, c, today_str, author=None, title_suffix="WeFlow Daily"):
+    """
+    Steps 4-5: synthesize each topic cluster, unify, push the draft and notify;
+    returns the draft id. With the outbox on, the draft and its card are
+    committed to the outbox instead and the outbox reference is returned.
+    """
+    llm, storage, wechat = c["llm"], c["storage"], c["wechat"]
+    image_gen, vision, notifier = c["image_gen"], c["vision"], c["notifier"]
         
     print(f"Formed {len(clusters)} clusters: {list(clusters.keys())}")
     
@@ -283,71 +540,62 @@ def main():
         print("No relevant clusters found.")
         return
 
+    # The cover prompt only needs the topic list, so it renders during synthesis
+    topic_list = ", ".join(clusters.keys())
+    cover_future = image_gen.submit(COVER_PROMPT.format(topics=topic_list))
+
     # 4. Synthesize & Image & Format (Parallel by Topic)
     md_segments = []
     header_maps = {} # {topic: wechat_img_url}
     used_images = set() # Track used images to prevent duplicates across topics
     
-    for topic, arts in tqdm(clusters.items(), desc="Synthesizing"):
-        try:
-             # Run synthesis sequentially to handle image dedupe correctly
-            report_md, wechat_header_url = synthesize_topic(topic, arts, llm, image_gen, vision, wechat, storage, used_images)
-            md_segments.append((topic, report_md, arts)) # Store articles for source links
-            header_maps[topic] = wechat_header_url
-        except Exception as e:
-            print(f"Synthesis failed for {topic}: {e}")
+    with metrics.stage("synthesize"):
+        for topic, arts in tqdm(clusters.items(), desc="Synthesizing"):
+            try:
+                 # Run synthesis sequentially to handle image dedupe correctly
+                report_md, wechat_header_url = synthesize_topic(topic, arts, llm, image_gen, vision, wechat, storage, used_images, screen=c.get("image_screen"))
+                md_segments.append((topic, report_md, arts)) # Store articles for source links
+                header_maps[topic] = wechat_header_url
+            except Exception as e:
+                print(f"Synthesis failed for {topic}: {e}")
 
     if not md_segments:
         print("No sections generated.")
         return
-        
-    # Combine all markdown segments
-    combined_md_sections = []
-    all_source_articles = []
-    for topic, md_content, articles_in_topic in md_segments:
-        section_md = f"## {topic}\n\n"
-        if topic in header_maps and header_maps[topic]:
-            section_md += f"![Header]({header_maps[topic]})\n\n"
-        section_md += md_content
-        combined_md_sections.append(section_md)
-        all_source_articles.extend(articles_in_topic)
 
-    combined_md = "\n\n".join(combined_md_sections)
+    with metrics.stage("headers"):
+        header_maps = {topic: resolve_header(topic, header, wechat) for topic, header in header_maps.items()}
+        
+    sections, all_source_articles = topic_sections(md_segments, header_maps)
 
     # Unify the daily digest with LLM
     print("Unifying daily digest with LLM...")
-    unified_md = llm.unify_daily_digest(combined_md)
-
-    # Convert unified MD to HTML
-    report_html = WeChatFormatter.markdown_to_html(unified_md)
+    with metrics.stage("unify"):
+        if unify_mode() == "full":
+            unified_md = llm.unify_daily_digest("\n\n".join(sections))
+        else:
+            unified_md = llm.unify_sections(sections)
 
-    # Add Source Links
-    source_links_html = "<div style='margin-top:20px; font-size:12px; color:#999;'>Sources:<br>"
-    for art in all_source_articles:
-        source_links_html += f"<a href='{art.url}' style='color:#999; margin-right:10px; text-decoration: none;'>• {art.title}</a><br>"
-    source_links_html += "</div>"
-    
-    final_html = report_html + source_links_html
-    
-    # Aggregate
-    author_name = os.getenv("WECHAT_AUTHOR", "")
-    full_html = WeChatFormatter.wrap_full_article(final_html, today_str, author=author_name)
+    # Convert unified MD to HTML (with source links)
+    author_name = author if author is not None else os.getenv("WECHAT_AUTHOR", "")
+    with metrics.stage("format"):
+        full_html = render_digest_html(unified_md, all_source_articles, today_str, author=author_name)
     
     # Cover Image
     print("Generating cover...")
     try:
-        topic_list = ", ".join(clusters.keys())
-        cover_url = image_gen.generate_image(f"Futuristic collage for topics: {topic_list}")
-        media_id = wechat.upload_image(cover_url)
+        with metrics.stage("cover"):
+            cover_url = wait_for_cover(cover_future, header_maps)
+            media_id = upload_cover(cover_url, wechat, c.get("image_cache"))
         
         # Generate AI Title (Always, even for fallback)
         try:
              ai_title = llm.generate_digest_title(list(clusters.keys()))
-             title = f"{ai_title} | WeFlow Daily"
+             title = f"{ai_title} | {title_suffix}"
         except:
-             title = f"WeFlow Daily - {today_str}"
+             title = f"{title_suffix} - {today_str}"
         
-        res = wechat.push_draft(
+        draft = dict(
             title=title,
             summary=f"Topics: {topic_list}",
             media_id=media_id,
@@ -355,24 +603,123 @@ def main():
             source_url="",
             author=author_name
         )
+        if c.get("outbox"):
+            with metrics.stage("publish"):
+                c["outbox"].register(wechat)
+                notify = {"webhook_url": notifier.webhook_url, "title": title, "summary": f"Topics: {topic_list}"}
+                res = c["outbox"].enqueue_draft(
+                    draft_key(wechat.app_id, today_str, title_suffix, clusters),
+                    wechat.app_id, draft, notify=notify, batch=c.get("outbox_batch"),
+                )
+            print(f"Draft queued: {res}")
+            return res
+
+        with metrics.stage("publish"):
+            res = wechat.push_draft(**draft)
         print(f"Draft pushed: {res}")
         
         # Notify Feishu with real draft URL
         if res:
-             draft_info = wechat.get_draft(res) if res != "Success" else None
-             article_url = draft_info.get("url") if draft_info else "https://mp.weixin.qq.com"
-             
-             # Use AI Title and Topic List for summary
-             s = f"Topics: {topic_list}"
-             
-             notifier.send_card(
-                 title=title, 
-                 summary=s, 
-                 article_url=article_url 
-             )
+             with metrics.stage("notify"):
+                 draft_info = wechat.get_draft(res) if res != "Success" else None
+                 article_url = draft_info.get("url") if draft_info else "https://mp.weixin.qq.com"
+                 
+                 # Use AI Title and Topic List for summary
+                 s = f"Topics: {topic_list}"
+                 
+                 notifier.send_card(
+                     title=title, 
+                     summary=s, 
+                     article_url=article_url 
+                 )
+        return res
 
     except Exception as e:
         print(f"Push failed: {e}")
 
+def publish_digests(analyzed_articles, c, today_str, digests):
+    """
+    Fans one analyzed corpus out to several digest definitions, synthesized in
+    parallel. Noise filtering and near-duplicate folding run once; image
+    descriptions are shared by all digests and article image uploads by
+    digests on the same WeChat account. True only if every digest that had
+    something to publish was pushed (or committed to the outbox).
+    """
+    with metrics.stage("cluster"):
+        recommended = select_recommended(analyzed_articles)
+
+    shared_vision = SharedVisionProvider(c["vision"])
+    publishers = {c["wechat"].app_id: c["wechat"]}
+    jobs = {}
+    for digest in digests:
+        app_id = digest.wechat_app_id
+        if not app_id:
+            print(f"[{digest.name}] {digest.wechat_app_id_env} is not set, skipping digest.")
+            continue
+        if app_id not in publishers:
+            publishers[app_id] = WeChatPublisher(app_id=app_id, app_secret=digest.wechat_app_secret)
+        clusters = group_by_topic(recommended, digest.topic_map or TOPIC_MAP, keep=digest.keeps)
+        if not clusters:
+            print(f"[{digest.name}] No articles in this digest's topics today.")
+            continue
+        digest_c = dict(
+            c,
+            wechat=publishers[app_id],
+            vision=shared_vision,
+            notifier=FeishuNotifier(digest.feishu_webhook_url),
+        )
+        jobs[digest.name] = (clusters, digest_c, digest)
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, len(jobs)), thread_name_prefix="weflow-digest") as executor:
+        futures = {
+            executor.submit(publish_clusters, clusters, digest_c, today_str, author=digest.author, title_suffix=digest.title_suffix): name
+            for name, (clusters, digest_c, digest) in jobs.items()
+        }
+        for f in as_completed(futures):
+            name = futures[f]
+            try:
+                results[name] = f.result()
+            except Exception as e:
+                print(f"[{name}] Digest failed: {e}")
+                results[name] = None
+
+    for name, res in results.items():
+        print(f"[{name}] {'draft ' + str(res) if res else 'not published'}")
+    # Digests skipped for config or an empty topic mix don't hold the feed marks back
+    return bool(results) and all(results.values())
+
+def publish_all(analyzed_articles, c, today_str):
+    """publish_digest, or one digest per definition when DIGESTS/DIGESTS_FILE is set"""
+    if c.get("outbox"):
+        # One outbox batch per run: its digests are announced together
+        c = dict(c, outbox_batch=f"{today_str}-{uuid.uuid4().hex[:8]}")
+    digests = load_digest_definitions()
+    if digests:
+        return publish_digests(analyzed_articles, c, today_str, digests)
+    return publish_digest(analyzed_articles, c, today_str)
+
+def main():
+    # WEFLOW_METRICS=1 collects stage/provider timings and writes them out at exit
+    metrics.configure_from_env()
+    budget.configure_from_env()
+    cassette.configure_from_env()
+    content_store.configure_from_env()
+    profiler.configure_from_env()
+    outbox.configure_from_env()
+    try:
+        if os.getenv("WEFLOW_ASYNC", "").lower() in ("1", "true", "yes"):
+            if os.getenv("DIGESTS") or os.getenv("DIGESTS_FILE"):
+                print("Multi-digest fan-out runs on the threaded pipeline; ignoring WEFLOW_ASYNC.")
+                return run_pipeline()
+            from weflow.async_main import main_async
+            return main_async()
+        return run_pipeline()
+    finally:
+        outbox.close()
+        budget.report()
+        metrics.export()
+        profiler.export()
+
 if __name__ == "__main__":
     main()
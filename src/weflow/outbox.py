@@ -0,0 +1,63 @@
+"""
+Sends what the pipeline left in the publish/notify outbox (OUTBOX=1).
+
+    python -m weflow.outbox              # send what is due, waiting up to OUTBOX_DRAIN_SECONDS
+    python -m weflow.outbox --watch      # keep sending until Ctrl-C (next to cron runs of weflow)
+    python -m weflow.outbox --dead       # list dead-lettered actions
+    python -m weflow.outbox --requeue    # give dead-lettered actions fresh attempts
+
+Drafts are pushed with the WECHAT_APP_ID/WECHAT_APP_SECRET account, or the
+account of the digest definition (DIGESTS/DIGESTS_FILE) with that app id.
+"""
+import os
+import signal
+import argparse
+import threading
+from dotenv import load_dotenv
+
+from weflow.core.dispatch import outbox
+from weflow.core.metrics import metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--watch", action="store_true", help="keep sending until interrupted")
+    parser.add_argument("--dead", action="store_true", help="list dead-lettered actions and exit")
+    parser.add_argument("--requeue", action="store_true", help="requeue dead-lettered actions, then send")
+    args = parser.parse_args()
+
+    load_dotenv(dotenv_path=os.path.join(os.getcwd(), ".env"), override=True)
+    metrics.configure_from_env()
+    outbox.configure_from_env()
+    db_url = os.getenv("DATABASE_URL")
+    if not db_url:
+        print("DATABASE_URL is required.")
+        return
+    from sqlalchemy import create_engine
+    store = outbox.bind(create_engine(db_url), start=False)
+
+    if args.dead:
+        for action in store.dead_letters():
+            print(f"#{action['id']} {action['kind']:<8} {action['key']}  attempts {action['attempts']}: {action['error']}")
+        return
+    if args.requeue:
+        print(f"Requeued {store.requeue_dead()} dead-lettered action(s).")
+
+    print(f"Outbox: {store.unsent()} action(s) to send")
+    try:
+        outbox.start()
+        if not args.watch:
+            outbox.drain(outbox.drain_seconds)
+        else:
+            stop = threading.Event()
+            signal.signal(signal.SIGTERM, lambda *_: stop.set())
+            signal.signal(signal.SIGINT, lambda *_: stop.set())
+            stop.wait()
+    finally:
+        outbox.close()
+        metrics.export()
+    print(f"Outbox: {store.counts()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Runs the pipeline once with the stage profiler on (same as WEFLOW_PROFILE=1).
+
+    python -m weflow.profiler                   # threaded pipeline
+    python -m weflow.profiler --async --top 30
+    python -m weflow.profiler --entry daemon    # profile the daemon until Ctrl-C
+
+Writes per-stage and whole-run collapsed stacks (wall-*.folded, cpu-*.folded)
+and summary.txt to PROFILE_DIR/profile-<timestamp>/.
+"""
+import os
+import argparse
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entry", choices=["main", "daemon", "coordinator", "worker"], default="main", help="what to run")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="profile the asyncio pipeline (WEFLOW_ASYNC=1)")
+    parser.add_argument("--out", help="output directory (PROFILE_DIR, default: profiles)")
+    parser.add_argument("--interval-ms", type=float, help="sampling interval (PROFILE_INTERVAL_MS, default: 5)")
+    parser.add_argument("--top", type=int, help="hotspots listed per stage (PROFILE_TOP, default: 20)")
+    args = parser.parse_args()
+
+    os.environ["WEFLOW_PROFILE"] = "1"
+    if args.use_async:
+        os.environ["WEFLOW_ASYNC"] = "1"
+    if args.out:
+        os.environ["PROFILE_DIR"] = args.out
+    if args.interval_ms:
+        os.environ["PROFILE_INTERVAL_MS"] = str(args.interval_ms)
+    if args.top:
+        os.environ["PROFILE_TOP"] = str(args.top)
+
+    if args.entry == "daemon":
+        from weflow.daemon import main as run
+    elif args.entry == "coordinator":
+        from weflow.coordinator import main as run
+    elif args.entry == "worker":
+        from weflow.worker import main as run
+    else:
+        from weflow.main import main as run
+    run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,518 @@
+import os
+import re
+import json
+import time
+import zlib
+import struct
+import random
+import threading
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Callable, Optional, Union
+from urllib.parse import urlparse, parse_qs
+
+
+class StubServer:
+    """
+    Minimal threaded HTTP server for faking external APIs offline.
+
+    Subclasses register handlers with `route(method, path_suffix, fn)`; a
+    handler receives (path, query, body) and returns (status, headers, body).
+    Every request first goes through the fault injection below:
+    - latency: seconds, or a (low, high) tuple for uniform jitter
+    - error_rate: probability of answering 500 instead
+    - hang: if set, requests block until the server is stopped
+    """
+    def __init__(self, latency: Union[float, tuple] = 0.0, error_rate: float = 0.0, hang: bool = False, seed: Optional[int] = None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.hang = hang
+        self.routes = []
+        self.requests = []  # (method, path) log, useful for assertions
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._server = None
+        self._thread = None
+
+    def route(self, method: str, path_suffix: str, fn: Callable):
+        self.routes.append((method, path_suffix, fn))
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _delay(self) -> float:
+        if isinstance(self.latency, tuple):
+            with self._lock:
+                return self._rng.uniform(*self.latency)
+        return self.latency
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            return self._rng.random() < self.error_rate
+
+    def _handle(self, handler: BaseHTTPRequestHandler, method: str):
+        parsed = urlparse(handler.path)
+        length = int(handler.headers.get("Content-Length") or 0)
+        body = handler.rfile.read(length) if length else b""
+        with self._lock:
+            self.requests.append((method, parsed.path))
+
+        if self.hang:
+            self._stopped.wait()
+            return
+        delay = self._delay()
+        if delay:
+            time.sleep(delay)
+        if self._should_fail():
+            self._send(handler, 500, {"Content-Type": "application/json"}, b'{"error": "injected failure"}')
+            return
+
+        for m, suffix, fn in self.routes:
+            if m == method and parsed.path.endswith(suffix):
+                result = fn(handler, parsed.path, parse_qs(parsed.query), body)
+                if result is not None:
+                    self._send(handler, *result)
+                return
+        self._send(handler, 404, {"Content-Type": "text/plain"}, b"not found")
+
+    @staticmethod
+    def _send(handler, status: int, headers: dict, body: bytes):
+        handler.send_response(status)
+        for k, v in headers.items():
+            handler.send_header(k, v)
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        try:
+            handler.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def start(self) -> "StubServer":
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                stub._handle(self, "GET")
+
+            def do_POST(self):
+                stub._handle(self, "POST")
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            # The default backlog of 5 drops SYNs under async bursts and adds ~1s retries
+            request_queue_size = 256
+
+        self._server = Server(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def json_response(data, status: int = 200):
+    return status, {"Content-Type": "application/json"}, json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+
+class FakeOpenAIServer(StubServer):
+    """
+    OpenAI-compatible `/chat/completions` endpoint.
+    `reply` is a string or a callable taking the request payload. Streaming
+    responses are sent as SSE chunks with `chunk_delay` between them, so a
+    client that closes the stream early (a cancelled hedge) is observable via
+    `cancelled_streams`. `token_latency` adds seconds per 1,000 (estimated)
+    prompt + completion tokens, so big prompts are slower than small ones.
+    """
+    def __init__(self, reply: Union[str, Callable] = "ok", chunk_delay: float = 0.0, token_latency: float = 0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.reply = reply
+        self.chunk_delay = chunk_delay
+        self.token_latency = token_latency
+        self.cancelled_streams = 0
+        self.route("POST", "/chat/completions", self._completions)
+
+    def _content_for(self, payload: dict) -> str:
+        if callable(self.reply):
+            return self.reply(payload)
+        if (payload.get("response_format") or {}).get("type") == "json_object" and not self.reply.startswith("{"):
+            return json.dumps({"topic": "Other", "recommended": True, "reason": "stub", "summary": self.reply})
+        return self.reply
+
+    def _completions(self, handler, path, query, body):
+        payload = json.loads(body or b"{}")
+        content = self._content_for(payload)
+        model = payload.get("model", "stub-model")
+        usage = {"prompt_tokens": len(body) // 4, "completion_tokens": len(content) // 4}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        if self.token_latency:
+            time.sleep(self.token_latency * usage["total_tokens"] / 1000)
+
+        if not payload.get("stream"):
+            return json_response({
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Connection", "close")
+        handler.end_headers()
+        pieces = [content[i:i + 16] for i in range(0, len(content), 16)] or [""]
+        try:
+            for i, piece in enumerate(pieces):
+                chunk = {
+                    "id": "chatcmpl-stub",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": "stop" if i == len(pieces) - 1 else None}],
+                }
+                handler.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                handler.wfile.flush()
+                if self.chunk_delay:
+                    time.sleep(self.chunk_delay)
+            handler.wfile.write(b"data: [DONE]\n\n")
+            handler.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            with self._lock:
+                self.cancelled_streams += 1
+        handler.close_connection = True
+        return None
+
+
+def _tiny_png(width: int = 64, height: int = 32) -> bytes:
+    """A valid grey PNG, so anything that sniffs image headers accepts it."""
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+    raw = b"".join(b"\x00" + b"\x80" * width for _ in range(height))
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", ihdr) + chunk(b"IDAT", zlib.compress(raw)) + chunk(b"IEND", b"")
+
+
+PNG_BYTES = _tiny_png()
+FIGURE_PNG = _tiny_png(800, 450)   # a real article figure
+ICON_PNG = _tiny_png(48, 48)       # avatar/badge sized
+PIXEL_GIF = b"GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00\xff\xff\xff!\xf9\x04\x01\x00\x00\x00\x00,\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;"
+
+
+def ranged(handler, data: bytes, content_type: str):
+    """Response for `data` honouring a single `Range: bytes=a-b` header (206 + Content-Range)."""
+    match = re.match(r"bytes=(\d*)-(\d*)$", handler.headers.get("Range") or "")
+    if not match or not (match.group(1) or match.group(2)):
+        return 200, {"Content-Type": content_type}, data
+    start, end = match.group(1), match.group(2)
+    if start:
+        start, end = int(start), min(int(end) if end else len(data) - 1, len(data) - 1)
+    else:  # suffix range: the last N bytes
+        start, end = max(0, len(data) - int(end)), len(data) - 1
+    return 206, {"Content-Type": content_type, "Content-Range": f"bytes {start}-{end}/{len(data)}"}, data[start:end + 1]
+
+_WORDS = (
+    "model training inference latency dataset benchmark agent robot chip memory "
+    "transformer attention token scaling research safety alignment compiler kernel "
+    "startup funding release open source evaluation retrieval vision speech"
+).split()
+
+
+class RSSStubServer(StubServer):
+    """
+    Serves `feeds` RSS feeds at /feed/<i>.xml with `articles` items each,
+    spread over yesterday (newest first), plus the article pages and their images. Every item
+    links to /post/<feed>/<item>; `markdown_for(url)` returns the deterministic
+    page body a crawler would extract from it. Pages carry `images_per_article`
+    800x450 figures and, with `junk_images`, an author avatar and a tracking
+    pixel like real blogs. Images honour Range requests. The first
+    `full_text_feeds` feeds also ship each post's body in content:encoded.
+    """
+    def __init__(self, feeds: int = 3, articles: int = 10, paragraphs: int = 8, images_per_article: int = 2, junk_images: bool = True, full_text_feeds: int = 0, **kwargs):
+        super().__init__(**kwargs)
+        self.feeds = feeds
+        self.full_text_feeds = full_text_feeds
+        self.articles = articles
+        self.paragraphs = paragraphs
+        self.images_per_article = images_per_article
+        self.junk_images = junk_images
+        self.route("GET", ".xml", self._feed)
+        self.route("GET", ".png", lambda h, p, q, b: ranged(h, ICON_PNG if "/avatar/" in p else FIGURE_PNG, "image/png"))
+        self.route("GET", ".gif", lambda h, p, q, b: ranged(h, PIXEL_GIF, "image/gif"))
+        self.route("GET", "", self._post)
+
+    def feed_urls(self) -> list[str]:
+        return [f"{self.url}/feed/{i}.xml" for i in range(self.feeds)]
+
+    def markdown_for(self, url: str) -> str:
+        path = urlparse(url).path
+        rng = random.Random(path)
+        lines = [f"# Post {path}"]
+        if self.junk_images:
+            lines.append(f"![author]({self.url}/img/avatar/{path.split('/')[2] if path.count('/') > 2 else 0}.png)")
+        for p in range(self.paragraphs):
+            lines.append(" ".join(rng.choice(_WORDS) for _ in range(60)) + ".")
+            if p < self.images_per_article:
+                lines.append(f"![figure {p}]({self.url}/img{path}/{p}.png)")
+        if self.junk_images:
+            lines.append(f"![]({self.url}/pixel{path}.gif)")
+        return "\n\n".join(lines)
+
+    def _feed(self, handler, path, query, body):
+        feed_id = path.rsplit("/", 1)[-1][:-len(".xml")]
+        day_start = (datetime.now() - timedelta(days=1)).replace(hour=0, minute=30, second=0, microsecond=0)
+        step = timedelta(hours=23) / max(1, self.articles)
+
+        def pub_date(j):
+            return format_datetime((day_start + step * (self.articles - 1 - j)).astimezone(timezone.utc))
+
+        full_text = feed_id.isdigit() and int(feed_id) < self.full_text_feeds
+
+        def content(j):
+            return f"<content:encoded><![CDATA[{self.article_html(f'/post/{feed_id}/{j}')}]]></content:encoded>" if full_text else ""
+
+        items = "".join(
+            f"<item><title>Stub post {feed_id}-{j}</title>"
+            f"<link>{self.url}/post/{feed_id}/{j}</link>"
+            f"<guid>{self.url}/post/{feed_id}/{j}</guid>"
+            f"<pubDate>{pub_date(j)}</pubDate>"
+            f"<description>Summary of stub post {feed_id}-{j}</description>{content(j)}</item>"
+            for j in range(self.articles)
+        )
+        xml = (
+            '<?xml version="1.0" encoding="UTF-8"?><rss version="2.0" xmlns:content="http://purl.org/rss/1.0/modules/content/"><channel>'
+            f"<title>Stub feed {feed_id}</title><link>{self.url}</link>{items}</channel></rss>"
+        )
+        return 200, {"Content-Type": "application/rss+xml"}, xml.encode("utf-8")
+
+    def article_html(self, path: str) -> str:
+        """The post body as HTML: what the page's <article> and a full-text feed entry hold"""
+        return "".join(
+            f'<figure><img src="{line[line.index("(") + 1:-1]}" alt="{line[2:line.index("]")]}"></figure>' if line.startswith("![")
+            else f"<h1>{line[2:]}</h1>" if line.startswith("# ")
+            else f"<p>{line}</p>"
+            for line in self.markdown_for(path).split("\n\n")
+        )
+
+    def _post(self, handler, path, query, body):
+        if not path.startswith("/post/"):
+            return 404, {"Content-Type": "text/plain"}, b"not found"
+        html = self.article_html(path)
+        # Blog chrome around the post, for extractors to strip
+        page = (
+            '<html><head><meta charset="utf-8"><title>Stub post</title><script>var analytics = [];</script></head><body>'
+            '<header class="site-header"><nav><a href="/">Home</a> <a href="/archive">Archive</a> <a href="/about">About</a></nav></header>'
+            f'<main><article class="post">{html}</article>'
+            '<section class="comments"><h3>Comments</h3><p>First! Thanks for writing this up, it was really helpful.</p></section></main>'
+            '<aside class="sidebar"><h3>Popular</h3><ul><li><a href="/p/1">Older post</a></li><li><a href="/p/2">Another post</a></li></ul></aside>'
+            '<footer><p>Copyright 2026. Subscribe to the newsletter.</p></footer></body></html>'
+        )
+        return 200, {"Content-Type": "text/html; charset=utf-8"}, page.encode("utf-8")
+
+
+class FirecrawlStub(StubServer):
+    """Firecrawl `/v0/scrape`; `markdown_for(url)` supplies the page body."""
+    def __init__(self, markdown_for: Callable[[str], str], **kwargs):
+        super().__init__(**kwargs)
+        self.markdown_for = markdown_for
+        self.route("POST", "/v0/scrape", self._scrape)
+
+    def _scrape(self, handler, path, query, body):
+        url = json.loads(body or b"{}").get("url", "")
+        return json_response({"success": True, "data": {"markdown": self.markdown_for(url), "metadata": {"sourceURL": url}}})
+
+
+class SavedPagesServer(StubServer):
+    """
+    Serves saved HTML pages from `directory` at /<file name>, as a site would,
+    for testing content extraction offline. `markdown_for(url)` is a stand-in
+    Firecrawl body that marks the page as scraped remotely.
+    """
+    FIRECRAWL_MARKER = "Scraped by Firecrawl"
+
+    def __init__(self, directory: str, **kwargs):
+        super().__init__(**kwargs)
+        self.directory = directory
+        self.route("GET", "", self._page)
+
+    def page_urls(self) -> dict:
+        return {name: f"{self.url}/{name}" for name in sorted(os.listdir(self.directory)) if name.endswith(".html")}
+
+    def markdown_for(self, url: str) -> str:
+        return f"# {self.FIRECRAWL_MARKER}\n\n{url}"
+
+    def _page(self, handler, path, query, body):
+        name = os.path.basename(path)
+        file_path = os.path.join(self.directory, name)
+        if not name or not os.path.isfile(file_path):
+            return 404, {"Content-Type": "text/plain"}, b"not found"
+        with open(file_path, "rb") as f:
+            data = f.read()
+        # Like many servers: no charset in the header, pages declare their own
+        content_type = "text/html" if name.endswith(".html") else "application/octet-stream"
+        return 200, {"Content-Type": content_type}, data
+
+
+def pipeline_reply(payload: dict) -> str:
+    """
+    Chat reply for FakeOpenAIServer that plays every role in the digest
+    pipeline: analysis JSON (topics spread by content hash), synthesis
+    Markdown that embeds the offered images, titles and the unified digest.
+    """
+    messages = payload.get("messages") or [{}]
+    system = messages[0].get("content", "")
+    user = messages[-1].get("content", "")
+    if (payload.get("response_format") or {}).get("type") == "json_object":
+        topics = ["Generative AI", "Robotics", "Hardware/Chips", "Science/Research", "Programming/Dev"]
+        topic = topics[zlib.crc32(user.encode("utf-8")) % len(topics)]
+        return json.dumps({"topic": topic, "recommended": True, "reason": "stub", "summary": user[-200:].strip()})
+    if "condenses source articles" in system:
+        titles = re.findall(r"Title: (.+)", user)
+        return "\n".join(f"- {t}: 桩服务压缩的要点。" for t in titles)
+    if "creative editor" in system:
+        return "每日 AI 速递"
+    if "connective copy" in system:
+        return "桩服务生成的衔接段落。"
+    if "Chief Editor" in system:
+        # Unify: hand the draft back, which keeps every image link intact
+        marker = "**Draft Content**:"
+        return user[user.index(marker) + len(marker):].strip() if marker in user else user
+    images = re.findall(r"- Link: (\S+)", user)
+    body = ["### 核心进展", "桩服务生成的综述段落。" * 20]
+    body += [f"![配图]({url})" for url in images[:2]]
+    body += ["### 关键洞察", "- 要点一\n- 要点二"]
+    return "\n\n".join(body)
+
+
+class DashScopeStub(StubServer):
+    """
+    DashScope HTTP API: Wanx image synthesis as an async task
+    (submit, then GET /tasks/<id>) and Qwen-VL multimodal generation.
+    `image_url` is what finished synthesis tasks point at; tasks report
+    RUNNING until `render_seconds` after they were submitted.
+    """
+    def __init__(self, image_url: Optional[str] = None, render_seconds: float = 0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.image_url = image_url
+        self.render_seconds = render_seconds
+        self._task_seq = 0
+        self._submitted = {}
+        self.route("POST", "/services/aigc/text2image/image-synthesis", self._submit)
+        self.route("GET", "", self._task)
+        self.route("POST", "/services/aigc/multimodal-generation/generation", self._describe)
+
+    def _submit(self, handler, path, query, body):
+        with self._lock:
+            self._task_seq += 1
+            task_id = f"task-{self._task_seq}"
+            self._submitted[task_id] = time.monotonic()
+        return json_response({"request_id": task_id, "output": {"task_id": task_id, "task_status": "PENDING"}})
+
+    def _task(self, handler, path, query, body):
+        if "/tasks/" not in path:
+            return 404, {"Content-Type": "text/plain"}, b"not found"
+        task_id = path.rsplit("/", 1)[-1]
+        with self._lock:
+            submitted = self._submitted.get(task_id, 0.0)
+        if time.monotonic() - submitted < self.render_seconds:
+            return json_response({"request_id": task_id, "output": {"task_id": task_id, "task_status": "RUNNING"}})
+        return json_response({
+            "request_id": task_id,
+            "output": {
+                "task_id": task_id,
+                "task_status": "SUCCEEDED",
+                "results": [{"url": self.image_url or f"{self.url}/generated/{task_id}.png"}],
+            },
+            "usage": {"image_count": 1},
+        })
+
+    def _describe(self, handler, path, query, body):
+        return json_response({
+            "request_id": "vl-stub",
+            "output": {"choices": [{"finish_reason": "stop", "message": {"role": "assistant", "content": [{"text": "A stub figure of a benchmark chart."}]}}]},
+            "usage": {"input_tokens": 100, "output_tokens": 10},
+        })
+
+
+class WeChatStub(StubServer):
+    """WeChat Official Account API: token, add_material, uploadimg, draft/add and draft/get."""
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.uploaded_bytes = 0
+        self.drafts = {}
+        self._seq = 0
+        self.route("GET", "/cgi-bin/token", lambda h, p, q, b: json_response({"access_token": "stub-token", "expires_in": 7200}))
+        self.route("POST", "/cgi-bin/material/add_material", self._add_material)
+        self.route("POST", "/cgi-bin/media/uploadimg", self._uploadimg)
+        self.route("POST", "/cgi-bin/draft/add", self._draft_add)
+        self.route("POST", "/cgi-bin/draft/get", self._draft_get)
+        self.route("GET", ".png", lambda h, p, q, b: (200, {"Content-Type": "image/png"}, PNG_BYTES))
+
+    def _next(self) -> int:
+        with self._lock:
+            self._seq += 1
+            return self._seq
+
+    def _count(self, body: bytes):
+        with self._lock:
+            self.uploaded_bytes += len(body)
+
+    def _add_material(self, handler, path, query, body):
+        self._count(body)
+        n = self._next()
+        return json_response({"media_id": f"media-{n}", "url": f"{self.url}/mmbiz/{n}.png"})
+
+    def _uploadimg(self, handler, path, query, body):
+        self._count(body)
+        return json_response({"url": f"{self.url}/mmbiz/{self._next()}.png"})
+
+    def _draft_add(self, handler, path, query, body):
+        media_id = f"draft-{self._next()}"
+        with self._lock:
+            self.drafts[media_id] = json.loads(body or b"{}")
+        return json_response({"media_id": media_id})
+
+    def _draft_get(self, handler, path, query, body):
+        media_id = json.loads(body or b"{}").get("media_id")
+        with self._lock:
+            draft = self.drafts.get(media_id)
+        if draft is None:
+            return json_response({"errcode": 40007, "errmsg": "invalid media_id"})
+        item = dict(draft["articles"][0], url=f"{self.url}/s/{media_id}")
+        return json_response({"news_item": [item]})
+
+
+class FeishuStub(StubServer):
+    """Feishu custom-bot webhook at /hook; received cards are kept in `cards`."""
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.cards = []
+        self.route("POST", "/hook", self._hook)
+
+    @property
+    def webhook_url(self) -> str:
+        return f"{self.url}/hook"
+
+    def _hook(self, handler, path, query, body):
+        with self._lock:
+            self.cards.append(json.loads(body or b"{}"))
+        return json_response({"code": 0, "msg": "success"})
@@ -0,0 +1,182 @@
+import os
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from weflow.main import provider_names, crawl_article, analyze_article
+from weflow.core.models import Article
+from weflow.core.metrics import metrics
+from weflow.core.cassette import cassette
+from weflow.core.spill import content_store
+from weflow.core.profiling import profiler
+from weflow.core.registry import registry
+from weflow.core.queue import JobQueue, JOBS_TOTAL, default_worker_id
+
+# Queue worker: claims crawl/analyze/vision jobs from the shared database and
+# runs them with the same functions as the single-process pipeline. Run one
+# per host (python -m weflow.worker); the coordinator assembles the digest.
+
+JOB_KINDS = ("crawl", "analyze", "vision")
+
+
+def build_worker_components(kinds=JOB_KINDS) -> dict:
+    """Only the providers the claimed job kinds need (no WeChat/Feishu on workers)."""
+    from weflow.core.storage import PostgresStorage
+    names = provider_names()
+    c = {"storage": PostgresStorage()}
+    if "crawl" in kinds:
+        c["crawler"] = registry.create("crawler", names["crawler"])
+    if "analyze" in kinds:
+        c["llm"] = registry.create("llm", names["llm"])
+    if "vision" in kinds:
+        c["vision"] = registry.create("vision", names["vision"])
+    return c
+
+
+class Worker:
+    def __init__(
+        self,
+        queue: JobQueue,
+        components: dict,
+        worker_id: str = None,
+        kinds=JOB_KINDS,
+        concurrency: int = 4,
+        lease_seconds: float = 300,
+        poll_interval: float = 2.0,
+    ):
+        self.queue = queue
+        self.c = components
+        self.worker_id = worker_id or default_worker_id()
+        self.kinds = tuple(kinds)
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="weflow-worker")
+        self.lock = threading.Lock()
+        self.active = set()      # job ids in flight, heartbeated until done
+        self.stop_event = threading.Event()
+        self.wakeup = threading.Event()  # set when a job finishes and frees a slot
+
+    @classmethod
+    def from_env(cls, queue: JobQueue, components: dict, kinds=JOB_KINDS) -> "Worker":
+        return cls(
+            queue,
+            components,
+            worker_id=os.getenv("WORKER_ID") or None,
+            kinds=kinds,
+            concurrency=int(os.getenv("WORKER_CONCURRENCY", "4")),
+            lease_seconds=float(os.getenv("QUEUE_LEASE_SECONDS", "300")),
+            poll_interval=float(os.getenv("QUEUE_POLL_SECONDS", "2")),
+        )
+
+    # --- Job handlers: return (result, follow-up jobs) or raise to retry ---
+
+    def handle_crawl(self, payload: dict):
+        article = crawl_article(Article(**payload["article"]), self.c["crawler"], self.c["storage"])
+        if not article:
+            raise RuntimeError("crawl returned no content")
+        data = article.model_dump(mode="json")
+        follow_up = [("analyze", {"article": data})] if payload.get("analyze", True) else []
+        return {"url": article.url}, follow_up
+
+    def handle_analyze(self, payload: dict):
+        article = analyze_article(Article(**payload["article"]), self.c["llm"])
+        if not article:
+            raise RuntimeError("analysis failed")
+        return {"article": article.model_dump(mode="json")}, []
+
+    def handle_vision(self, payload: dict):
+        desc = self.c["vision"].describe_image(payload["url"])
+        if not desc:
+            raise RuntimeError("empty image description")
+        return {"url": payload["url"], "description": desc}, []
+
+    def run_job(self, job: dict):
+        handler = getattr(self, f"handle_{job['kind']}")
+        try:
+            with metrics.stage(f"job_{job['kind']}"):
+                result, follow_up = handler(job["payload"])
+            if self.queue.complete(job["id"], self.worker_id, result, follow_up=follow_up):
+                metrics.inc(JOBS_TOTAL, kind=job["kind"], outcome="done")
+            else:
+                print(f"Job {job['id']} lost its lease before finishing; result discarded.")
+        except Exception as e:
+            status = self.queue.fail(job["id"], self.worker_id, f"{type(e).__name__}: {e}")
+            metrics.inc(JOBS_TOTAL, kind=job["kind"], outcome="retried" if status == "queued" else status)
+            print(f"Job {job['id']} ({job['kind']}, attempt {job['attempt']}) failed: {e} -> {status}")
+        finally:
+            with self.lock:
+                self.active.discard(job["id"])
+            self.wakeup.set()
+
+    # --- Loops ---
+
+    def heartbeat_loop(self):
+        # Renew well before expiry so a slow job never loses its lease
+        while not self.stop_event.wait(self.lease_seconds / 3):
+            with self.lock:
+                active = list(self.active)
+            for job_id in active:
+                try:
+                    self.queue.heartbeat(job_id, self.worker_id, self.lease_seconds)
+                except Exception as e:
+                    print(f"Heartbeat for job {job_id} failed: {e}")
+
+    def run(self, until_idle: bool = False):
+        """Claims and runs jobs until stopped; `until_idle` returns once nothing is running or claimable right now."""
+        print(f"WeFlow worker {self.worker_id}: kinds={','.join(self.kinds)} concurrency={self.concurrency}")
+        heartbeat = threading.Thread(target=self.heartbeat_loop, name="weflow-heartbeat", daemon=True)
+        heartbeat.start()
+        try:
+            while not self.stop_event.is_set():
+                with self.lock:
+                    free = self.concurrency - len(self.active)
+                jobs = []
+                if free > 0:
+                    try:
+                        jobs = self.queue.claim(self.worker_id, self.kinds, limit=free, lease_seconds=self.lease_seconds)
+                    except Exception as e:
+                        print(f"Claim failed: {e}")
+                for job in jobs:
+                    with self.lock:
+                        self.active.add(job["id"])
+                    self.pool.submit(self.run_job, job)
+                if jobs:
+                    continue
+                with self.lock:
+                    idle = not self.active
+                if until_idle and idle:
+                    break
+                self.wakeup.wait(self.poll_interval)
+                self.wakeup.clear()
+        finally:
+            self.pool.shutdown(wait=True)
+            self.stop_event.set()
+
+    def stop(self, *_):
+        self.stop_event.set()
+        self.wakeup.set()
+
+
+def main():
+    metrics.configure_from_env()
+    cassette.configure_from_env()
+    content_store.configure_from_env()
+    profiler.configure_from_env()
+    kinds = [k.strip() for k in os.getenv("WORKER_KINDS", ",".join(JOB_KINDS)).split(",") if k.strip()]
+    try:
+        worker = Worker.from_env(JobQueue(), build_worker_components(kinds), kinds=kinds)
+    except Exception as e:
+        print(f"Init failed: {e}")
+        return
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    try:
+        worker.run()
+    finally:
+        metrics.export()
+        profiler.export()
+
+
+if __name__ == "__main__":
+    main()
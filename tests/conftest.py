@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
+
+from weflow.core.resilience import reset_breakers
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers():
+    # Breakers are process-wide: one test's failures must not open another's circuit
+    reset_breakers()
+    yield
+    reset_breakers()
@@ -0,0 +1,118 @@
+import threading
+import warnings
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from weflow.core.budget import RunBudget, parse_weights
+from weflow.core.models import Article
+
+NOW = datetime.now(timezone.utc)
+
+
+def article(n: int, hours_old: float = 0, source: str = "blog.example", **kwargs) -> Article:
+    return Article(title=f"post {n}", url=f"https://{source}/{n}", source_name=source, published_at=NOW - timedelta(hours=hours_old), **kwargs)
+
+
+def test_parse_weights():
+    assert parse_weights("a.com=2, b.org=0.5") == {"a.com": 2.0, "b.org": 0.5}
+    assert parse_weights('{"a.com": 3}') == {"a.com": 3.0}
+    assert parse_weights("") == {}
+
+
+def test_recency_halves_every_half_life():
+    budget = RunBudget(half_life_hours=24)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", DeprecationWarning)
+        assert budget.recency(article(1)) == pytest.approx(1.0, abs=0.01)
+        assert budget.recency(article(2, hours_old=24)) == pytest.approx(0.5, abs=0.01)
+        assert budget.recency(Article(title="t", url="u", published_date=(NOW - timedelta(days=2)).strftime("%Y-%m-%d"))) < 0.3
+        assert budget.recency(Article(title="t", url="u")) == 0.5
+
+
+def test_estimate_covers_remaining_stages():
+    crawled = article(1, content="x" * 3000)
+    # crawl + analyze + half of the synthesis calls (recommend rate 0.5)
+    assert RunBudget.estimate(article(1), "crawl") == (500 + 2000 + 1000, 4)
+    # feed content needs no crawl; analysis reads chars / 3 tokens
+    assert RunBudget.estimate(crawled, "crawl") == (500 + 1000 + 500, 2)
+    assert RunBudget.estimate(crawled, "analyze") == (500 + 1000 + 500, 2)
+    # a recommended article is certain to be synthesized
+    assert RunBudget.estimate(article(1, content="x" * 3000, analysis={"recommended": True}), "synthesize") == (1000, 3)
+
+
+def test_admit_ranks_by_priority_and_keeps_feed_order():
+    budget = RunBudget(max_calls=8, source_weights={"slow.example": 0.5}, min_articles=0)
+    stale, fresh, low = article(1, hours_old=72), article(2), article(3, source="slow.example")
+    # Two articles fit (4 calls each from crawl). Three days old scores 0.125,
+    # below a half-weight fresh post, so stale goes; the rest keep feed order.
+    assert budget.admit([low, stale, fresh], "crawl") == [low, fresh]
+    assert [(stage, reason, url) for stage, reason, _, url in budget.dropped] == [("crawl", "call budget", stale.url)]
+
+
+def test_admit_keeps_min_articles_over_budget():
+    budget = RunBudget(max_calls=1, min_articles=2)
+    arts = [article(n, hours_old=n) for n in range(4)]
+    assert budget.admit(arts, "crawl") == arts[:2]
+    assert len(budget.dropped) == 2
+
+
+def test_admit_drops_weight_zero_sources_even_within_min_articles():
+    budget = RunBudget(source_weights={"spam.example": 0}, min_articles=3)
+    spam, good = article(1, source="spam.example"), article(2)
+    assert budget.admit([spam, good], "crawl") == [good]
+    assert not budget.admit_one(article(3, source="spam.example"), "crawl")
+    assert [reason for _, reason, _, _ in budget.dropped] == ["source weight 0", "source weight 0"]
+
+
+def test_admit_counts_spend_so_far():
+    budget = RunBudget(max_tokens=10_000, min_articles=0)
+    budget.charge(tokens=9_000, calls=0)
+    assert budget.admit([article(1)], "crawl") == []
+    assert budget.exhausted() is None
+    budget.charge(tokens=2_000, calls=0)
+    assert budget.exhausted() == "token budget"
+
+
+def test_admit_one_reserves_until_release():
+    budget = RunBudget(max_calls=12)
+    first, second, third, fourth = (article(n) for n in range(4))
+    assert budget.admit_one(first, "crawl")
+    assert budget.admit_one(second, "crawl")
+    assert budget.admit_one(third, "crawl")
+    assert (budget.reserved_calls, budget.reserved_tokens) == (12, 3 * 3500)
+    # Nothing spent yet, but everything left is reserved
+    assert not budget.admit_one(fourth, "crawl")
+
+    # first finished: its actual spend is charged, its reservation freed
+    budget.charge(tokens=1000, calls=2)
+    budget.release(first, "crawl")
+    assert budget.reserved_calls == 8
+    assert not budget.admit_one(fourth, "crawl")  # 2 spent + 8 reserved + 4 > 12
+    budget.release(second, "crawl")
+    assert budget.admit_one(fourth, "crawl")
+
+    for a in (third, fourth, first):  # releasing twice is harmless
+        budget.release(a, "crawl")
+    assert (budget.reserved_calls, budget.reserved_tokens) == (0, 0)
+
+
+def test_concurrent_admit_one_never_overcommits():
+    budget = RunBudget(max_calls=40)
+    admitted = []
+    arts = [article(n) for n in range(50)]
+    threads = [threading.Thread(target=lambda a=a: admitted.append(budget.admit_one(a, "crawl"))) for a in arts]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(admitted) == 10
+    assert budget.reserved_calls == 40
+
+
+def test_time_budget():
+    budget = RunBudget(max_seconds=0)
+    assert budget.exhausted() == "time budget"
+    assert not budget.admit_one(article(1), "crawl")
+    budget.reset()
+    assert RunBudget().time_left() is None
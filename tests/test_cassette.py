@@ -0,0 +1,123 @@
+import os
+import json
+import time
+import zlib
+import asyncio
+
+import httpx
+import pytest
+import requests
+
+from weflow.core.cassette import Cassette, CassetteMiss, install, uninstall
+from weflow.testing.stubs import StubServer, FakeOpenAIServer, json_response
+
+
+@pytest.fixture
+def api():
+    server = StubServer()
+    server.route("GET", "/cgi-bin/token", lambda *_: json_response({"access_token": "live-token-123", "expires_in": 7200}))
+    server.route("POST", "/echo", lambda h, p, q, body: json_response({"echo": json.loads(body)}))
+    with server:
+        yield server
+
+
+def use(cassette: Cassette) -> Cassette:
+    uninstall()
+    install(cassette)
+    return cassette
+
+
+@pytest.fixture(autouse=True)
+def no_cassette():
+    yield
+    uninstall()
+
+
+def record_and_replay(tmp_path, calls):
+    path = str(tmp_path / "cassette")
+    use(Cassette(path, mode="record"))
+    recorded = calls()
+    replay = use(Cassette(path, mode="replay"))
+    replay.load()
+    return recorded, replay
+
+
+def test_requests_round_trip(tmp_path, api):
+    def calls():
+        token = requests.get(f"{api.url}/cgi-bin/token?appid=a&secret=s3cret", timeout=5).json()
+        echo = requests.post(f"{api.url}/echo", json={"n": 1}, timeout=5).json()
+        return token, echo
+
+    (token, echo), _ = record_and_replay(tmp_path, calls)
+    served = len(api.requests)
+    assert requests.post(f"{api.url}/echo", json={"n": 1}, timeout=5).json() == echo
+    replayed = requests.get(f"{api.url}/cgi-bin/token?appid=a&secret=other", timeout=5).json()
+    assert len(api.requests) == served  # served from the cassette
+    assert replayed["expires_in"] == token["expires_in"]
+
+
+def test_httpx_round_trip(tmp_path, api):
+    def calls():
+        with httpx.Client() as client:
+            sync = client.post(f"{api.url}/echo", json={"n": 2}).json()
+
+        async def call():
+            async with httpx.AsyncClient() as client:
+                return (await client.post(f"{api.url}/echo", json={"n": 3})).json()
+        return sync, asyncio.run(call())
+
+    (sync, async_), _ = record_and_replay(tmp_path, calls)
+    served = len(api.requests)
+    with httpx.Client() as client:
+        assert client.post(f"{api.url}/echo", json={"n": 2}).json() == sync
+
+    async def call():
+        async with httpx.AsyncClient() as client:
+            return (await client.post(f"{api.url}/echo", json={"n": 3})).json()
+    assert asyncio.run(call()) == async_
+    assert len(api.requests) == served
+
+
+def test_replay_miss_raises(tmp_path, api):
+    record_and_replay(tmp_path, lambda: requests.post(f"{api.url}/echo", json={"n": 1}, timeout=5))
+    with pytest.raises(CassetteMiss):
+        requests.get(f"{api.url}/never-recorded", timeout=5)
+    with pytest.raises(CassetteMiss):
+        httpx.get(f"{api.url}/never-recorded")
+    # A changed body still replays the recording for the same route
+    assert requests.post(f"{api.url}/echo", json={"n": 99}, timeout=5).json() == {"echo": {"n": 1}}
+
+
+def test_secrets_are_not_stored(tmp_path, api):
+    record_and_replay(tmp_path, lambda: requests.get(f"{api.url}/cgi-bin/token?appid=a&secret=s3cret", timeout=5))
+    stored = b""
+    for root, _, files in os.walk(tmp_path / "cassette"):
+        for name in files:
+            with open(os.path.join(root, name), "rb") as f:
+                data = f.read()
+            stored += data if name.endswith(".jsonl") else zlib.decompress(data)
+    assert b"live-token-123" not in stored
+    assert b"s3cret" not in stored
+    assert requests.get(f"{api.url}/cgi-bin/token?appid=a&secret=s3cret", timeout=5).json()["access_token"] == "REDACTED"
+
+
+def test_recording_streams_and_lets_callers_cancel(tmp_path):
+    path = str(tmp_path / "cassette")
+    with FakeOpenAIServer(reply="x" * 16 * 40, chunk_delay=0.1) as llm:
+        use(Cassette(path, mode="record"))
+        payload = {"model": "m", "stream": True, "messages": []}
+        with httpx.Client() as client:
+            with client.stream("POST", f"{llm.url}/v1/chat/completions", json=payload) as resp:
+                first = next(resp.iter_lines())
+        # Returned before the ~4s body finished: the stream was passed through, then cut
+        assert first.startswith("data: ")
+        deadline = time.monotonic() + 5
+        while llm.cancelled_streams == 0 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert llm.cancelled_streams == 1
+
+        replay = use(Cassette(path, mode="replay"))
+        replay.load()
+        with httpx.Client() as client:
+            body = client.post(f"{llm.url}/v1/chat/completions", json=payload).text
+        assert body.startswith("data: ") and "[DONE]" not in body
@@ -0,0 +1,109 @@
+import os
+import asyncio
+
+import httpx
+import pytest
+
+from weflow.core import crawler as crawler_module
+from weflow.core.crawler import LocalCrawler, AsyncLocalCrawler, AsyncFirecrawlCrawler
+from weflow.testing.stubs import SavedPagesServer, FirecrawlStub
+
+PAGES_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "benchmarks", "pages"))
+MARKER = SavedPagesServer.FIRECRAWL_MARKER
+
+
+@pytest.fixture
+def sites(monkeypatch):
+    with SavedPagesServer(PAGES_DIR) as pages, FirecrawlStub(pages.markdown_for) as firecrawl:
+        monkeypatch.setenv("FIRECRAWL_API_KEY", "stub")
+        monkeypatch.setenv("FIRECRAWL_BASE_URL", firecrawl.url)
+        # Extract inline: no process pool to spawn per test
+        monkeypatch.setenv("EXTRACT_PROCESSES", "0")
+        yield pages, firecrawl
+
+
+def test_extracts_articles_locally(sites):
+    pages, firecrawl = sites
+    crawler = LocalCrawler(fallback_after=1000)
+    urls = pages.page_urls()
+    wordpress = crawler.crawl(urls["wordpress.html"])
+    assert "# Scaling Retrieval for Long-Context Agents" in wordpress
+    assert "Recent Posts" not in wordpress
+    assert "内存带宽" in crawler.crawl(urls["divsoup.html"])
+    assert MARKER not in wordpress
+    assert firecrawl.requests == []
+
+
+def test_falls_back_for_pages_that_fail_checks(sites):
+    pages, firecrawl = sites
+    crawler = LocalCrawler(fallback_after=1000)
+    urls = pages.page_urls()
+    assert MARKER in crawler.crawl(urls["spa-shell.html"])
+    assert MARKER in crawler.crawl(urls["link-index.html"])
+    assert MARKER in crawler.crawl(f"{pages.url}/missing.html")
+    assert len(firecrawl.requests) == 3
+
+
+def test_domain_switches_to_fallback_after_failures(sites):
+    pages, firecrawl = sites
+    crawler = LocalCrawler(fallback_after=2)
+    urls = pages.page_urls()
+    crawler.crawl(urls["spa-shell.html"])
+    # One failure, then a success: the run of failures starts over
+    assert MARKER not in crawler.crawl(urls["ghost.html"])
+    crawler.crawl(urls["link-index.html"])
+    assert MARKER not in crawler.crawl(urls["wordpress.html"])
+
+    crawler.crawl(urls["spa-shell.html"])
+    crawler.crawl(urls["link-index.html"])
+    fetched = len(pages.requests)
+    # Routed: straight to Firecrawl, even for a page that would extract
+    assert MARKER in crawler.crawl(urls["wordpress.html"])
+    assert len(pages.requests) == fetched
+
+
+def test_fallback_after_zero_from_argument_wins_over_env(sites, monkeypatch):
+    monkeypatch.setenv("EXTRACT_FALLBACK_AFTER", "5")
+    assert LocalCrawler(fallback_after=0).domains.after == 0
+    assert LocalCrawler().domains.after == 5
+
+
+def test_extraction_error_goes_to_fallback(sites, monkeypatch):
+    pages, firecrawl = sites
+
+    def broken(*args):
+        raise RecursionError("maximum recursion depth exceeded")
+
+    monkeypatch.setattr(crawler_module, "extract", broken)
+    crawler = LocalCrawler(fallback_after=1000)
+    assert crawler._extract(pages.page_urls()["wordpress.html"], "pages") == (None, "extract_error")
+    assert MARKER in crawler.crawl(pages.page_urls()["wordpress.html"])
+
+
+def test_deeply_nested_page_extracts(sites, tmp_path):
+    paragraph = "<p>" + "Deeply nested content about retrieval systems. " * 20 + "</p>"
+    html = "<html><body>" + "<div>" * 5000 + paragraph * 3 + "</div>" * 5000 + "</body></html>"
+    (tmp_path / "deep.html").write_text(html)
+    with SavedPagesServer(str(tmp_path)) as deep:
+        markdown = LocalCrawler(fallback_after=1000).crawl(deep.page_urls()["deep.html"])
+    assert "Deeply nested content" in markdown
+    assert MARKER not in markdown
+
+
+def test_async_crawler_matches_sync(sites):
+    pages, firecrawl = sites
+    urls = pages.page_urls()
+
+    async def run():
+        async with httpx.AsyncClient(timeout=30) as client:
+            crawler = AsyncLocalCrawler(client=client, fallback=AsyncFirecrawlCrawler(client=client), fallback_after=2)
+            local = await crawler.crawl(urls["wordpress.html"])
+            await crawler.crawl(urls["spa-shell.html"])
+            await crawler.crawl(urls["link-index.html"])
+            routed = await crawler.crawl(urls["ghost.html"])
+            return local, routed
+
+    local, routed = asyncio.run(run())
+    assert "# Scaling Retrieval for Long-Context Agents" in local
+    assert MARKER in routed
+    assert len(firecrawl.requests) == 3
@@ -0,0 +1,68 @@
+import time
+
+import pytest
+
+from weflow import daemon as daemon_module
+from weflow.core.rss import GenericRSS
+from weflow.core.storage import PostgresStorage
+from weflow.daemon import Daemon, PRUNE_INTERVAL
+from weflow.testing.stubs import RSSStubServer
+
+
+@pytest.fixture
+def feed(tmp_path, monkeypatch):
+    monkeypatch.setenv("FEED_FULL_TEXT", "0")
+    monkeypatch.setenv("RSS_INCREMENTAL", "1")
+    monkeypatch.delenv("RSS_RESET_MARKS", raising=False)
+    # Ingest and publishing are not under test here
+    monkeypatch.setattr(Daemon, "ingest", lambda self, article: None)
+    monkeypatch.setattr(daemon_module, "publish_all", lambda articles, c, day: True)
+    storage = PostgresStorage(f"sqlite:///{tmp_path / 'weflow.db'}")
+    with RSSStubServer(feeds=1, articles=5) as rss:
+        yield storage, rss.feed_urls()[0]
+
+
+def make_daemon(storage, feed_url) -> Daemon:
+    d = Daemon({"storage": storage}, [feed_url], workers=1)
+    d.poll(d.feeds[0])
+    d.ingest_pool.shutdown(wait=True)
+    return d
+
+
+def test_digest_marks_stop_at_unfinished_entries(feed):
+    storage, feed_url = feed
+    d = make_daemon(storage, feed_url)
+    entries = [a for _, a in sorted(d.taken.values(), key=lambda t: -t[1].published_at.timestamp())]
+    assert len(entries) == 5
+    # The second-newest entry is still retrying (or was dropped by the budget)
+    for a in entries:
+        if a is not entries[1]:
+            d.analyzed[a.url] = a
+    d.run_digest(entries[0].published_date)
+
+    # A restarted daemon gets the unfinished entry again, and the newer one above it
+    restarted = GenericRSS(url=feed_url, mark_store=storage).fetch_articles()
+    assert [a.url for a in restarted] == [entries[0].url, entries[1].url]
+    # Digested entries are forgotten; the unfinished one still holds the mark
+    assert list(d.taken) == [entries[1].url]
+
+
+def test_digest_with_everything_done_advances_mark(feed):
+    storage, feed_url = feed
+    d = make_daemon(storage, feed_url)
+    for _, a in d.taken.values():
+        d.analyzed[a.url] = a
+    d.run_digest(next(iter(d.analyzed.values())).published_date)
+    assert GenericRSS(url=feed_url, mark_store=storage).fetch_articles() == []
+    assert d.taken == {}
+
+
+def test_prune_forgets_entries_off_the_feed(feed):
+    storage, feed_url = feed
+    d = make_daemon(storage, feed_url)
+    url = next(iter(d.taken))
+    d.failures[url] = 1
+    d.retry.add(url)
+    d.prune_seen(time.time() + d.lookback + PRUNE_INTERVAL)
+    assert d.seen == {} and d.taken == {} and d.feed_of == {}
+    assert url not in d.failures and url not in d.retry
@@ -0,0 +1,105 @@
+import random
+
+import pytest
+
+from weflow.core.dedup import _EMPTY, LSHIndex, MinHasher, NearDuplicateDetector, estimate_similarity, fold_near_duplicates
+from weflow.core.models import Article
+
+_WORDS = ("model", "release", "open", "weights", "benchmark", "agent", "training", "chip", "cluster", "startup",
+          "funding", "paper", "reasoning", "token", "context", "latency", "inference", "robot", "vision", "audio")
+
+
+def story(seed: int, words: int = 300) -> str:
+    rng = random.Random(seed)
+    return " ".join(rng.choice(_WORDS) + str(rng.randrange(50)) for _ in range(words))
+
+
+def rewrite(text: str, every: int = 40) -> str:
+    """Same story from another outlet: a few words changed, a byline and a link added."""
+    tokens = text.split()
+    for i in range(0, len(tokens), every):
+        tokens[i] = "edited"
+    return "Reported by Another Outlet. " + " ".join(tokens) + " [Read more](https://other.example/story)"
+
+
+def test_signature_is_deterministic_and_dense():
+    hasher = MinHasher()
+    sig = hasher.signature(story(1))
+    assert sig == MinHasher().signature(story(1))
+    assert len(sig) == 64
+    # 8 shingles leave most of the 64 bins empty; densification fills them all
+    short = hasher.signature(" ".join(story(5).split()[:12]))
+    assert len(hasher.shingles(" ".join(story(5).split()[:12]))) == 8
+    assert _EMPTY not in short and len(set(short)) > 8
+
+
+def test_identical_text_has_similarity_one():
+    hasher = MinHasher()
+    assert estimate_similarity(hasher.signature(story(1)), hasher.signature(story(1))) == 1.0
+
+
+def test_near_duplicates_score_high_and_different_stories_low():
+    hasher = MinHasher()
+    base = hasher.signature(story(1))
+    assert estimate_similarity(base, hasher.signature(rewrite(story(1)))) >= 0.5
+    assert estimate_similarity(base, hasher.signature(story(2))) < 0.2
+
+
+def test_links_and_images_do_not_count():
+    hasher = MinHasher(shingle_size=2)
+    assert hasher.shingles("see [the post](https://a.example/1) ![x](https://a.example/img.png)") == \
+        hasher.shingles("see [the post](https://b.example/2)")
+
+
+def test_empty_and_short_texts():
+    hasher = MinHasher(shingle_size=5)
+    assert hasher.signature("") is None
+    assert hasher.signature(None) is None
+    assert hasher.signature("!!! ???") is None
+    # Fewer tokens than the shingle size still give one shingle
+    assert len(hasher.shingles("two words")) == 1
+    assert hasher.signature("two words") == hasher.signature("Two  words!")
+
+
+def test_chinese_text_shingles_by_character():
+    hasher = MinHasher()
+    text = "大模型公司今天发布了新的开源权重，并公布了推理基准测试的结果。" * 3
+    assert estimate_similarity(hasher.signature(text), hasher.signature("据报道，" + text)) >= 0.5
+
+
+def test_lsh_finds_near_duplicates_only():
+    hasher = MinHasher()
+    index = LSHIndex()
+    for seed in range(20):
+        index.insert(str(seed), hasher.signature(story(seed)))
+    index.insert("3", hasher.signature(story(99)))  # already indexed: ignored
+    assert len(index) == 20
+
+    matches = index.query(hasher.signature(rewrite(story(3))), threshold=0.5)
+    assert [key for key, _ in matches] == ["3"]
+    assert index.query(hasher.signature(story(100)), threshold=0.5) == []
+
+
+def test_lsh_rejects_uneven_bands():
+    with pytest.raises(ValueError):
+        LSHIndex(num_perm=64, bands=10)
+
+
+def test_fold_keeps_longest_copy_and_feed_order():
+    first = Article(title="A", url="https://a.example/1", source_name="A", content=story(1))
+    other = Article(title="B", url="https://b.example/2", source_name="B", content=story(2))
+    mirror = Article(title="A again", url="https://c.example/3", source_name="C", content=rewrite(story(1)))
+    empty = Article(title="No text", url="https://d.example/4")
+
+    folded = NearDuplicateDetector().fold([first, other, mirror, empty])
+    assert folded == [other, mirror, empty]  # the rewrite is longer, so it represents the story
+    assert mirror.extra_sources == [{"title": "A", "url": "https://a.example/1", "source_name": "A"}]
+    assert other.extra_sources == [] and empty.extra_sources == []
+
+
+def test_fold_near_duplicates_threshold_from_env(monkeypatch):
+    articles = [Article(title=str(i), url=f"https://x.example/{i}", content=story(1)) for i in range(2)]
+    monkeypatch.setenv("NEAR_DUP_THRESHOLD", "0")
+    assert fold_near_duplicates(articles) == articles
+    monkeypatch.setenv("NEAR_DUP_THRESHOLD", "0.5")
+    assert len(fold_near_duplicates(articles)) == 1
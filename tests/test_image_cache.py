@@ -0,0 +1,92 @@
+import os
+import threading
+
+import pytest
+
+from weflow.core.image_cache import GeneratedImageCache
+
+
+def image_file(tmp_path, name: str, size: int, fill: bytes = b"x") -> str:
+    path = tmp_path / name
+    path.write_bytes(fill * size)
+    return str(path)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return GeneratedImageCache(str(tmp_path / "cache"), max_bytes=1000)
+
+
+def test_put_then_get(cache, tmp_path):
+    path = cache.put("wanx", "m", "A cat.", image_file(tmp_path, "a.png", 100))
+    assert os.path.exists(path)
+    assert cache.get("wanx", "m", "  a CAT ") == path
+    assert cache.get("wanx", "other-model", "a cat") is None
+
+
+def test_oversized_image_is_not_cached(cache, tmp_path):
+    src = image_file(tmp_path, "big.png", 2000)
+    cache.put("wanx", "m", "small", image_file(tmp_path, "small.png", 100, b"s"))
+    assert cache.put("wanx", "m", "big", src) == src
+    assert os.path.exists(src)
+    assert cache.get("wanx", "m", "big") is None
+    # Nothing else was evicted to make room
+    assert cache.get("wanx", "m", "small") is not None
+
+
+def test_least_recently_used_blob_is_evicted(cache, tmp_path):
+    old = cache.put("wanx", "m", "old", image_file(tmp_path, "1.png", 400, b"1"))
+    kept = cache.put("wanx", "m", "kept", image_file(tmp_path, "2.png", 400, b"2"))
+    os.utime(old, (1, 1))
+    os.utime(kept, (2, 2))
+    assert cache.get("wanx", "m", "kept") == kept
+    new = cache.put("wanx", "m", "new", image_file(tmp_path, "3.png", 400, b"3"))
+    assert not os.path.exists(old)
+    assert os.path.exists(kept) and os.path.exists(new)
+    assert cache.get("wanx", "m", "old") is None
+
+
+def test_instances_sharing_a_directory_keep_each_others_entries(tmp_path):
+    directory = str(tmp_path / "cache")
+    # One instance per process in production (backfill workers, coordinator and workers)
+    caches = [GeneratedImageCache(directory, max_bytes=10**6) for _ in range(2)]
+
+    def fill(n: int):
+        cache = caches[n]
+        for i in range(15):
+            cache.put("wanx", "m", f"prompt {n}-{i}", image_file(tmp_path, f"{n}-{i}.png", 10, f"{n}-{i}".encode()))
+
+    threads = [threading.Thread(target=fill, args=(n,)) for n in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    fresh = GeneratedImageCache(directory, max_bytes=10**6)
+    for n in range(2):
+        for i in range(15):
+            assert fresh.get("wanx", "m", f"prompt {n}-{i}") is not None
+    # And each instance sees the other's entries without restarting
+    assert caches[0].get("wanx", "m", "prompt 1-14") is not None
+
+
+def test_hits_do_not_rewrite_the_index(cache, tmp_path):
+    cache.put("wanx", "m", "a cat", image_file(tmp_path, "a.png", 100))
+    before = os.stat(cache.index_path).st_mtime_ns
+    for _ in range(5):
+        assert cache.get("wanx", "m", "a cat")
+    assert os.stat(cache.index_path).st_mtime_ns == before
+
+
+def test_media_ids_are_merged_across_instances(tmp_path):
+    directory = str(tmp_path / "cache")
+    first = GeneratedImageCache(directory)
+    second = GeneratedImageCache(directory)
+    path = first.put("wanx", "m", "cover", image_file(tmp_path, "c.png", 100))
+    second.put("wanx", "m", "other", image_file(tmp_path, "o.png", 100, b"o"))
+    first.remember_media_id(path, "app-1", "media-1")
+    second.remember_media_id(path, "app-2", "media-2")
+    fresh = GeneratedImageCache(directory)
+    assert fresh.media_id(path, "app-1") == "media-1"
+    assert fresh.media_id(path, "app-2") == "media-2"
+    assert fresh.get("wanx", "m", "other") is not None
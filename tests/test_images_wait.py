@@ -0,0 +1,68 @@
+import asyncio
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from weflow.async_main import synthesize_topic_async, wait_for_cover_async
+from weflow.main import HEADER_PLACEHOLDER, resolve_header, wait_for_cover
+
+
+class Uploads:
+    def upload_article_image(self, url):
+        return f"https://mmbiz.example/{url}"
+
+
+@pytest.fixture(autouse=True)
+def short_image_timeout(monkeypatch):
+    monkeypatch.setenv("PROVIDER_TIMEOUTS", "image=0.2")
+
+
+def done(url: str) -> Future:
+    future = Future()
+    future.set_result(url)
+    return future
+
+
+def test_resolve_header_gives_up_on_a_stuck_render():
+    start = time.monotonic()
+    assert resolve_header("Chips", Future(), Uploads()) == HEADER_PLACEHOLDER
+    assert time.monotonic() - start < 2
+    assert resolve_header("Chips", done("gen.png"), Uploads()) == "https://mmbiz.example/gen.png"
+    assert resolve_header("Chips", "https://mmbiz.example/original.png", Uploads()) == "https://mmbiz.example/original.png"
+
+
+def test_stuck_cover_falls_back_to_a_header():
+    headers = {"Chips": HEADER_PLACEHOLDER, "Agents": "https://mmbiz.example/agents.png"}
+    assert wait_for_cover(done("cover.png"), headers) == "cover.png"
+    assert wait_for_cover(Future(), headers) == "https://mmbiz.example/agents.png"
+    with pytest.raises(TimeoutError):
+        wait_for_cover(Future(), {"Chips": HEADER_PLACEHOLDER})
+
+
+def test_async_waits_are_bounded():
+    class StuckImages:
+        async def generate_image(self, prompt):
+            await asyncio.sleep(60)
+
+    class AsyncUploads:
+        async def upload_article_image(self, url):
+            return url
+
+    class OneLLM:
+        async def synthesize_report(self, articles_data, topic, images=[]):
+            return "report"
+
+    async def run():
+        headers = {"Chips": "https://mmbiz.example/chips.png"}
+        cover = asyncio.create_task(StuckImages().generate_image("cover"))
+        assert await wait_for_cover_async(cover, headers) == "https://mmbiz.example/chips.png"
+        assert cover.cancelled()
+
+        from weflow.core.models import Article
+        article = Article(title="t", url="https://a.example/1", content="no images here")
+        return await synthesize_topic_async("Chips", [article], OneLLM(), StuckImages(), None, AsyncUploads(), set(), asyncio.Semaphore(2))
+
+    start = time.monotonic()
+    assert asyncio.run(run()) == ("report", HEADER_PLACEHOLDER)
+    assert time.monotonic() - start < 2
@@ -0,0 +1,93 @@
+import struct
+
+from weflow.core.imagescreen import ImageInfo, ImageScreen, sniff_image
+from weflow.testing.stubs import FIGURE_PNG, ICON_PNG, PIXEL_GIF, StubServer, _tiny_png, ranged
+
+
+def jpeg(width: int, height: int, exif: int = 0) -> bytes:
+    app0 = b"\xff\xe0" + struct.pack(">H", 16) + b"JFIF\x00" + bytes(9)
+    app1 = b"\xff\xe1" + struct.pack(">H", exif + 2) + bytes(exif) if exif else b""
+    sof2 = b"\xff\xc2" + struct.pack(">HBHH", 17, 8, height, width) + bytes(12)
+    return b"\xff\xd8" + app0 + app1 + b"\xff\xff" + sof2 + bytes(2000)
+
+
+def webp(chunk: bytes, payload: bytes) -> bytes:
+    return b"RIFF" + struct.pack("<I", 4 + 8 + len(payload)) + b"WEBP" + chunk + struct.pack("<I", len(payload)) + payload
+
+
+def test_sniff_headers():
+    assert sniff_image(FIGURE_PNG) == ("image/png", 800, 450)
+    assert sniff_image(PIXEL_GIF) == ("image/gif", 1, 1)
+    assert sniff_image(jpeg(1024, 768)) == ("image/jpeg", 1024, 768)
+    assert sniff_image(webp(b"VP8 ", b"\x00\x00\x00\x9d\x01\x2a" + struct.pack("<HH", 640, 360) + bytes(10))) == ("image/webp", 640, 360)
+    bits = (640 - 1) | ((360 - 1) << 14)
+    assert sniff_image(webp(b"VP8L", b"\x2f" + bits.to_bytes(4, "little") + bytes(10))) == ("image/webp", 640, 360)
+    assert sniff_image(webp(b"VP8X", bytes(4) + (639).to_bytes(3, "little") + (359).to_bytes(3, "little"))) == ("image/webp", 640, 360)
+    assert sniff_image(b"BM" + bytes(16) + struct.pack("<ii", 300, -200) + bytes(30)) == ("image/bmp", 300, 200)
+    assert sniff_image(b'  <?xml version="1.0"?>\n<svg xmlns="http://www.w3.org/2000/svg"/>') == ("image/svg+xml", None, None)
+
+
+def test_sniff_unreadable():
+    # SOF beyond the probed bytes: still a JPEG, dimensions unknown
+    assert sniff_image(jpeg(1024, 768, exif=60000)[:32 * 1024]) == ("image/jpeg", None, None)
+    assert sniff_image(FIGURE_PNG[:20]) == (None, None, None)
+    assert sniff_image(b"<!doctype html><html></html>") == (None, None, None)
+    assert sniff_image(b"") == (None, None, None)
+
+
+def test_score_prefers_big_and_early():
+    assert ImageInfo("a", 0, width=800, height=450).score > ImageInfo("b", 3, width=800, height=450).score
+    assert ImageInfo("c", 5, width=1600, height=900).score > ImageInfo("d", 0, width=400, height=225).score
+    assert ImageInfo("e", 0).score == 0.0
+
+
+def serve(files: dict) -> StubServer:
+    stub = StubServer()
+    for path, (data, content_type) in files.items():
+        stub.route("GET", path, lambda h, p, q, b, data=data, content_type=content_type: ranged(h, data, content_type))
+    return stub.start()
+
+
+def test_screen_rejects_junk_and_ranks_keepers(capsys):
+    big = jpeg(1600, 900) + bytes(60 * 1024)
+    with serve({
+        "/figure.png": (FIGURE_PNG, "image/png"),
+        "/big.jpg": (big, "image/jpeg"),
+        "/avatar.png": (ICON_PNG + bytes(4000), "image/png"),
+        "/pixel.gif": (PIXEL_GIF, "image/gif"),
+        "/banner.png": (_tiny_png(1200, 200) + bytes(2000), "image/png"),
+        "/tiny-file.png": (FIGURE_PNG[:600], "image/png"),
+        "/logo.svg": (b'<svg xmlns="http://www.w3.org/2000/svg"></svg>', "image/svg+xml"),
+        "/page.html": (b"<html><body>moved</body></html>", "text/html"),
+        "/exif.jpg": (jpeg(1024, 768, exif=40000), "image/jpeg"),
+    }) as stub:
+        names = ["figure.png", "big.jpg", "avatar.png", "pixel.gif", "banner.png", "tiny-file.png", "logo.svg", "page.html", "missing.png", "exif.jpg"]
+        screen = ImageScreen()
+        kept = screen.screen([f"{stub.url}/{n}" for n in names] + [f"{stub.url}/figure.png"])
+
+        # Bigger image first despite its later position; unmeasured JPEG last
+        assert [i.url.rsplit("/", 1)[1] for i in kept] == ["big.jpg", "figure.png", "exif.jpg"]
+        assert kept[0].size == len(big)  # from Content-Range, not the probed bytes
+        skipped = [line.rsplit(": ", 1) for line in capsys.readouterr().out.splitlines() if line.startswith("Skipping image")]
+        assert {url.rsplit("/", 1)[1]: reason[len("Skipping image ("):-1] for reason, url in skipped} == {
+            "avatar.png": "too small", "pixel.gif": "too few bytes", "banner.png": "extreme aspect ratio",
+            "tiny-file.png": "too few bytes", "logo.svg": "svg", "page.html": "not an image",
+            "missing.png": "probe failed: HTTPError",
+        }
+
+        # Probes are cached per URL: screening again makes no new requests
+        before = len(stub.requests)
+        assert [i.url for i in screen.screen([f"{stub.url}/big.jpg", f"{stub.url}/avatar.png"])] == [f"{stub.url}/big.jpg"]
+        assert len(stub.requests) == before
+
+
+def test_screen_without_urls():
+    assert ImageScreen().screen([]) == []
+
+
+def test_from_env(monkeypatch):
+    monkeypatch.setenv("IMAGE_SCREEN", "0")
+    assert ImageScreen.from_env() is None
+    monkeypatch.setenv("IMAGE_SCREEN", "1")
+    monkeypatch.setenv("IMAGE_MIN_WIDTH", "640")
+    assert ImageScreen.from_env().min_width == 640
@@ -0,0 +1,193 @@
+import asyncio
+import re
+
+import pytest
+
+from weflow.core.llm import ARTICLE_CHARS, AsyncDeepSeekLLM, DeepSeekLLM, DeepSeekPrompts
+from weflow.testing.stubs import FakeOpenAIServer
+
+
+def source(n: int, chars: int, site: str = "site") -> dict:
+    return {"title": f"T{n}", "source_name": f"{site}{n % 2}", "summary": f"summary {n}", "content": f"{n} " * (chars // 2)}
+
+
+@pytest.fixture
+def small_limits(monkeypatch):
+    # Direct up to 3000 chars of source text; otherwise groups of about 2000
+    monkeypatch.setenv("SYNTH_DIRECT_CHARS", "3000")
+    monkeypatch.setenv("SYNTH_GROUP_CHARS", "2000")
+    monkeypatch.setenv("SYNTH_MAP_WORKERS", "4")
+
+
+def test_small_clusters_are_written_directly(small_limits):
+    assert DeepSeekPrompts._synthesis_groups([source(1, 2000), source(2, 1000)]) == []
+    # One article never needs condensing, however long
+    assert DeepSeekPrompts._synthesis_groups([source(1, 50000)]) == []
+
+
+def test_groups_pack_consecutive_articles(small_limits):
+    arts = [source(n, chars) for n, chars in enumerate([1200, 700, 900, 400, 1900, 300])]
+    groups = DeepSeekPrompts._synthesis_groups(arts)
+    assert [[a["title"] for a in g] for g in groups] == [["T0", "T1"], ["T2", "T3"], ["T4"], ["T5"]]
+    assert [a for g in groups for a in g] == arts
+
+
+def test_group_sizes_use_the_per_article_cut(monkeypatch):
+    monkeypatch.setenv("SYNTH_DIRECT_CHARS", str(2 * ARTICLE_CHARS))
+    # Each 20k-char article only contributes ARTICLE_CHARS to the prompt
+    assert DeepSeekPrompts._synthesis_groups([source(1, 20000), source(2, 20000)]) == []
+    assert len(DeepSeekPrompts._synthesis_groups([source(n, 20000) for n in range(3)])) == 3
+
+
+def test_brief_entry_merges_a_group():
+    group = [source(1, 10), dict(source(2, 10), also_reported_by=["Other"]), dict(source(3, 10), also_reported_by=["Other", "Third"])]
+    entry = DeepSeekPrompts._brief_entry(group, "- the brief")
+    assert entry == {"title": "T1 / T2 / T3", "source_name": "site1, site0", "content": "- the brief", "also_reported_by": ["Other", "Third"]}
+    # A failed condense falls back to the triage summaries
+    assert DeepSeekPrompts._brief_entry(group, None)["content"] == "- T1: summary 1\n- T2: summary 2\n- T3: summary 3"
+    assert DeepSeekPrompts._brief_entry(group[:1], None) is group[0]
+
+
+def condensing_reply(payload: dict) -> str:
+    system, prompt = payload["messages"][0]["content"], payload["messages"][1]["content"]
+    if "condenses source articles" in system:
+        return "- brief of " + ",".join(re.findall(r"Title: (T\d+)", prompt))
+    return "# Report\n\n" + " | ".join(re.findall(r"Title: (.+)", prompt))
+
+
+def test_map_reduce_condenses_groups_then_writes_from_briefs(small_limits):
+    arts = [source(n, 1800) for n in range(5)]
+    with FakeOpenAIServer(reply=condensing_reply) as server:
+        llm = DeepSeekLLM(api_key="test", base_url=f"{server.url}/v1")
+        report = llm.synthesize_report(arts, "Chips")
+        # Five condense calls (one per 1800-char article), then one synthesis from the briefs
+        assert len(server.requests) == 6
+        assert report == "# Report\n\nT0 | T1 | T2 | T3 | T4"
+
+
+def test_tiny_groups_are_not_sent_to_the_model(small_limits):
+    arts = [source(n, 100) for n in range(3)] + [source(9, 3000)]
+    with FakeOpenAIServer(reply=condensing_reply) as server:
+        llm = DeepSeekLLM(api_key="test", base_url=f"{server.url}/v1")
+        inputs = llm._condensed_inputs(arts, "Chips")
+        assert len(server.requests) == 1  # only the big article is condensed
+        assert inputs[0]["title"] == "T0 / T1 / T2" and inputs[0]["content"].startswith("0 0 ")
+        assert inputs[1]["content"] == "- brief of T9"
+
+
+def test_async_client_condenses_the_same_way(small_limits):
+    arts = [source(n, 1800) for n in range(5)]
+    with FakeOpenAIServer(reply=condensing_reply) as server:
+        async def run():
+            llm = AsyncDeepSeekLLM(api_key="test", base_url=f"{server.url}/v1")
+            try:
+                return await llm.synthesize_report(arts, "Chips")
+            finally:
+                await llm.aclose()
+        assert asyncio.run(run()) == "# Report\n\nT0 | T1 | T2 | T3 | T4"
+        assert len(server.requests) == 6
+
+
+SECTIONS = [
+    "## Chips\n\nNew accelerator announced.\n\n![die shot](https://img.example/die.png)\n\nMore detail.",
+    "## Agents\n\n![demo](https://img.example/demo.gif)\n\nAgents got better at tools.",
+    "## Robots\n\nA humanoid walked.",
+]
+
+
+def glue_reply(payload: dict) -> str:
+    prompt = payload["messages"][1]["content"]
+    if "opening paragraph" in prompt:
+        return "Today: chips, agents and robots."
+    if "closing paragraph" in prompt:
+        return "## Wrap-up\nThat was the day. ![x](https://img.example/stray.png)\n---"
+    return "And next, " + re.search(r"Start of next section ---\n## (\w+)", prompt).group(1).lower() + "."
+
+
+def test_glue_requests_cover_intro_transitions_and_conclusion():
+    requests = DeepSeekPrompts._glue_requests(SECTIONS)
+    assert len(requests) == len(SECTIONS) + 1
+    prompts = [r[1]["content"] for r in requests]
+    assert "opening paragraph" in prompts[0] and "closing paragraph" in prompts[-1]
+    assert "## Chips" in prompts[0] and "## Robots" in prompts[0]
+    # A transition sees the end of one section and the start of the next, without image links
+    assert "More detail." in prompts[1] and "## Agents" in prompts[1] and "## Robots" not in prompts[1]
+    assert not any("img.example" in p for p in prompts)
+
+
+def test_assemble_keeps_sections_verbatim():
+    glue = ["Intro.", "## Heading\nTo agents.", None, "Outro ![x](https://img.example/x.png)"]
+    assert DeepSeekPrompts._assemble_sections(SECTIONS, glue) == "\n\n".join(
+        ["Intro.", SECTIONS[0], "---", "To agents.", SECTIONS[1], "---", SECTIONS[2], "---", "Outro"])
+    # No glue at all still gives a readable digest
+    assert DeepSeekPrompts._assemble_sections(SECTIONS, [None] * 4) == "\n\n".join(
+        [SECTIONS[0], "---", SECTIONS[1], "---", SECTIONS[2]])
+
+
+def test_check_images():
+    draft = "\n\n".join(SECTIONS)
+    assert DeepSeekPrompts._check_images(draft, draft.replace("More detail.", "Reworded."))
+    assert not DeepSeekPrompts._check_images(draft, draft.replace("die.png", "die.jpg"))
+    assert not DeepSeekPrompts._check_images(draft, draft.replace("![demo](https://img.example/demo.gif)", ""))
+    assert DeepSeekPrompts._check_images("no images here", "")
+
+
+def test_unify_sections_writes_only_the_glue():
+    with FakeOpenAIServer(reply=glue_reply) as server:
+        llm = DeepSeekLLM(api_key="test", base_url=f"{server.url}/v1")
+        unified = llm.unify_sections(SECTIONS)
+    assert len(server.requests) == 4
+    assert unified == "\n\n".join([
+        "Today: chips, agents and robots.", SECTIONS[0], "---", "And next, agents.", SECTIONS[1],
+        "---", "And next, robots.", SECTIONS[2], "---", "That was the day.",
+    ])
+
+
+def test_unify_daily_digest_keeps_draft_when_images_are_lost():
+    draft = "\n\n".join(SECTIONS)
+    with FakeOpenAIServer(reply=draft.replace("https://img.example/die.png", "https://img.example/die%20shot.png")) as server:
+        assert DeepSeekLLM(api_key="test", base_url=f"{server.url}/v1").unify_daily_digest(draft) == draft
+    with FakeOpenAIServer(reply="# Digest\n\n" + draft) as server:
+        assert DeepSeekLLM(api_key="test", base_url=f"{server.url}/v1").unify_daily_digest(draft) == "# Digest\n\n" + draft
+
+
+def test_async_unify_sections_matches_sync():
+    with FakeOpenAIServer(reply=glue_reply) as server:
+        async def run():
+            llm = AsyncDeepSeekLLM(api_key="test", base_url=f"{server.url}/v1")
+            try:
+                return await llm.unify_sections(SECTIONS)
+            finally:
+                await llm.aclose()
+        assert asyncio.run(run()) == DeepSeekLLM(api_key="test", base_url=f"{server.url}/v1").unify_sections(SECTIONS)
+
+
+def test_sync_and_async_clients_send_the_same_requests(small_limits):
+    def run_all(llm, call):
+        return [
+            call(llm.analyze("article text")),
+            call(llm.synthesize_report([source(n, 1800) for n in range(3)], "Chips")),
+            call(llm.generate_digest_title(["Chips", "Agents"])),
+            call(llm.unify_daily_digest("\n\n".join(SECTIONS))),
+        ]
+
+    def reply(payload):
+        seen.append(payload)
+        return '"Chips & Agents"' if "creative editor" in payload["messages"][0]["content"] else condensing_reply(payload)
+
+    with FakeOpenAIServer(reply=reply) as server:
+        seen = []
+        sync_results = run_all(DeepSeekLLM(api_key="test", base_url=f"{server.url}/v1"), lambda r: r)
+        sync_requests, seen = seen, []
+
+        async def run():
+            llm = AsyncDeepSeekLLM(api_key="test", base_url=f"{server.url}/v1")
+            try:
+                return [await r for r in run_all(llm, lambda r: r)]
+            finally:
+                await llm.aclose()
+        assert asyncio.run(run()) == sync_results
+
+    assert sync_results[2] == "Chips & Agents"
+    key = lambda p: str(p["messages"])
+    assert sorted(seen, key=key) == sorted(sync_requests, key=key)
@@ -0,0 +1,189 @@
+import time
+
+import pytest
+from sqlalchemy import create_engine
+
+from weflow.core.dispatch import OutboxDispatcher, DEFAULT_ARTICLE_URL
+from weflow.core.outbox import OutboxStore, OutboxModel, PUBLISH, NOTIFY, PENDING, SENDING, DONE, DEAD
+from weflow.core.queue import _utcnow
+from weflow.core.wechat import WeChatPublisher
+from weflow.testing.stubs import WeChatStub, FeishuStub
+
+
+@pytest.fixture
+def engine(tmp_path):
+    return create_engine(f"sqlite:///{tmp_path / 'outbox.db'}")
+
+
+@pytest.fixture
+def store(engine):
+    return OutboxStore(engine=engine, retry_delay=60, max_attempts=2)
+
+
+def make_due(store: OutboxStore):
+    session = store.Session()
+    try:
+        session.query(OutboxModel).update({OutboxModel.available_at: _utcnow()})
+        session.commit()
+    finally:
+        session.close()
+
+
+def test_add_is_idempotent_by_key(store):
+    first, added = store.add(PUBLISH, "draft:a", {"n": 1}, batch="b1")
+    again, added_again = store.add(PUBLISH, "draft:a", {"n": 2}, batch="b1")
+    assert added and not added_again
+    assert first == again
+    claimed = store.claim("w1", PUBLISH)
+    assert [(a["id"], a["payload"]) for a in claimed] == [(first, {"n": 1})]
+
+
+def test_notify_waits_for_batch_publishes(store):
+    store.add(PUBLISH, "draft:a", {}, batch="b1")
+    store.add(PUBLISH, "draft:b", {}, batch="b1")
+    store.add(NOTIFY, "notify:other", {}, batch="b2")
+    publish = store.claim("w1", PUBLISH, limit=1)
+
+    # b1 still has a pending and a sending publish; b2's notification is free to go
+    assert [a["key"] for a in store.claim("w1", NOTIFY)] == ["notify:other"]
+    assert store.complete(publish[0], "w1", {"draft_id": "d1"}, follow_up=[(NOTIFY, "notify:draft:a", {"card": "a"})])
+    assert store.claim("w1", NOTIFY) == []
+
+    second = store.claim("w1", PUBLISH)
+    assert [a["key"] for a in second] == ["draft:b"]
+    assert store.claim("w1", NOTIFY) == []
+    store.complete(second[0], "w1", {"draft_id": "d2"}, follow_up=[(NOTIFY, "notify:draft:b", {"card": "b"})])
+    notified = store.claim("w1", NOTIFY)
+    assert [(a["key"], a["batch"], a["payload"]) for a in notified] == [
+        ("notify:draft:a", "b1", {"card": "a"}),
+        ("notify:draft:b", "b1", {"card": "b"}),
+    ]
+
+
+def test_dead_publish_releases_batch_notifications(store):
+    store.add(PUBLISH, "draft:a", {}, batch="b1")
+    store.add(NOTIFY, "notify:earlier", {}, batch="b1")
+    for _ in range(2):
+        make_due(store)
+        action = store.claim("w1", PUBLISH)[0]
+        status = store.fail(action, "w1", "boom")
+    assert status == DEAD
+    assert [a["key"] for a in store.claim("w1", NOTIFY)] == ["notify:earlier"]
+
+
+def test_fail_backs_off_then_dead_letters_and_requeues(store):
+    store.add(PUBLISH, "draft:a", {}, batch="b1")
+    action = store.claim("w1", PUBLISH)[0]
+    assert not store.complete(action, "other-owner")
+    assert store.fail(action, "w1", "timeout") == PENDING
+    # Backing off: not due for another minute
+    assert store.claim("w1", PUBLISH) == []
+    assert store.counts() == {PENDING: 1}
+
+    make_due(store)
+    action = store.claim("w1", PUBLISH)[0]
+    assert action["attempt"] == 2
+    assert store.fail(action, "w1", "timeout again") == DEAD
+    assert store.unsent() == 0
+    assert [(d["key"], d["attempts"], d["error"]) for d in store.dead_letters()] == [("draft:a", 2, "timeout again")]
+    assert store.dead_letters(kinds=[NOTIFY]) == []
+
+    assert store.requeue_dead() == 1
+    assert store.dead_letters() == []
+    action = store.claim("w1", PUBLISH)[0]
+    assert action["attempt"] == 1
+    assert store.complete(action, "w1", {"draft_id": "d1"})
+    assert store.counts("b1") == {DONE: 1}
+
+
+def test_expired_lease_is_sent_again(store):
+    store.add(PUBLISH, "draft:a", {}, batch="b1")
+    assert store.claim("w1", PUBLISH, lease_seconds=-1)
+    assert store.counts() == {SENDING: 1}
+    reclaimed = store.claim("w2", PUBLISH)
+    assert [a["attempt"] for a in reclaimed] == [2]
+    assert not store.complete(reclaimed[0], "w1")
+    assert store.complete(reclaimed[0], "w2")
+
+
+# --- Dispatcher against the WeChat and Feishu stubs ---
+
+@pytest.fixture
+def services(monkeypatch):
+    with WeChatStub() as wechat, FeishuStub() as feishu:
+        monkeypatch.setenv("WECHAT_API_BASE", wechat.url)
+        yield wechat, feishu
+
+
+def dispatcher_for(engine) -> OutboxDispatcher:
+    dispatcher = OutboxDispatcher(retry_delay=60, max_attempts=2)
+    dispatcher.bind(engine, start=False)
+    dispatcher.register(WeChatPublisher(app_id="stub", app_secret="stub"))
+    return dispatcher
+
+
+def draft(title: str) -> dict:
+    return {"title": title, "summary": "s", "media_id": "m", "content": "<p>x</p>", "source_url": "https://example.com"}
+
+
+def test_dispatcher_publishes_and_sends_one_card_per_batch(engine, services):
+    wechat, feishu = services
+    dispatcher = dispatcher_for(engine)
+    for title in ("A", "B"):
+        dispatcher.enqueue_draft(f"draft:{title}", "stub", draft(title), notify={"webhook_url": feishu.webhook_url, "title": title, "summary": "s"}, batch="b1")
+    # Same key again (a retried run): pushed once
+    dispatcher.enqueue_draft("draft:A", "stub", draft("A"), batch="b1")
+
+    while dispatcher.run_once():
+        pass
+    assert len(wechat.drafts) == 2
+    assert len(feishu.cards) == 1
+    assert f"{wechat.url}/s/draft-" in str(feishu.cards[0])
+    assert dispatcher.store.counts() == {DONE: 4}
+
+
+def test_pushed_draft_is_recorded_even_without_url(engine, services, monkeypatch):
+    wechat, feishu = services
+    dispatcher = dispatcher_for(engine)
+
+    def get_draft(media_id):
+        raise ConnectionError("draft/get unavailable")
+
+    monkeypatch.setattr(dispatcher.publishers["stub"], "get_draft", get_draft)
+    dispatcher.enqueue_draft("draft:A", "stub", draft("A"), notify={"webhook_url": feishu.webhook_url, "title": "A", "summary": "s"}, batch="b1")
+    while dispatcher.run_once():
+        pass
+    assert len(wechat.drafts) == 1
+    assert dispatcher.store.counts() == {DONE: 2}
+    assert DEFAULT_ARTICLE_URL in str(feishu.cards[0])
+
+
+def test_close_waits_only_for_own_due_actions(engine, services):
+    wechat, feishu = services
+    store = OutboxStore(engine=engine, retry_delay=3600)
+    # Another run's action, backing off for an hour
+    store.add(PUBLISH, "draft:old", {"app_id": "stub", "draft": draft("old")}, batch="old-run")
+    action = store.claim("w1", PUBLISH)[0]
+    store.fail(action, "w1", "boom")
+
+    dispatcher = dispatcher_for(engine)
+    dispatcher.drain_seconds = 30
+    dispatcher.start()
+    dispatcher.enqueue_draft("draft:A", "stub", draft("A"), notify={"webhook_url": feishu.webhook_url, "title": "A", "summary": "s"}, batch="b1")
+    start = time.monotonic()
+    dispatcher.close()
+    assert time.monotonic() - start < 10
+    assert dispatcher.store.counts("b1") == {DONE: 2}
+    assert dispatcher.store.counts("old-run") == {PENDING: 1}
+    assert dispatcher.store.due() == 0
+
+
+def test_close_without_own_actions_returns_at_once(engine):
+    store = OutboxStore(engine=engine)
+    store.add(PUBLISH, "draft:old", {"app_id": "unknown", "draft": {}}, batch="old-run")
+    dispatcher = dispatcher_for(engine)
+    dispatcher.drain_seconds = 30
+    dispatcher.start()
+    start = time.monotonic()
+    dispatcher.close()
+    assert time.monotonic() - start < 5
@@ -0,0 +1,115 @@
+import time
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import create_engine
+
+from weflow.core.queue import JobQueue, JobModel, _utcnow, QUEUED, RUNNING, DEAD
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(engine=create_engine(f"sqlite:///{tmp_path / 'jobs.db'}"), retry_delay=60)
+
+
+def job_row(queue: JobQueue, job_id: int) -> JobModel:
+    session = queue.Session()
+    try:
+        return session.get(JobModel, job_id)
+    finally:
+        session.close()
+
+
+def make_due(queue: JobQueue, job_id: int):
+    session = queue.Session()
+    try:
+        session.get(JobModel, job_id).available_at = _utcnow() - timedelta(seconds=1)
+        session.commit()
+    finally:
+        session.close()
+
+
+def test_claim_leases_each_job_once(queue):
+    ids = queue.enqueue_many("crawl", [{"url": f"u{i}"} for i in range(3)], "b1")
+    first = queue.claim("w1", limit=2)
+    second = queue.claim("w2", limit=2)
+    assert [j["id"] for j in first] == ids[:2]
+    assert [j["id"] for j in second] == ids[2:]
+    assert queue.claim("w3") == []
+    assert all(j["attempt"] == 1 for j in first + second)
+    assert queue.counts("b1") == {RUNNING: 3}
+
+
+def test_claim_filters_by_kind(queue):
+    queue.enqueue("crawl", {"url": "u"}, "b1")
+    analyze_id = queue.enqueue("analyze", {"url": "u"}, "b1")
+    assert [j["id"] for j in queue.claim("w1", kinds=["analyze"], limit=5)] == [analyze_id]
+
+
+def test_complete_stores_result_and_follow_up(queue):
+    job_id = queue.enqueue("crawl", {"url": "u"}, "b1")
+    queue.claim("w1")
+    assert not queue.complete(job_id, "other-worker", {"ok": True})
+    assert queue.complete(job_id, "w1", {"ok": True}, follow_up=[("analyze", {"url": "u"})])
+    assert queue.results("b1", "crawl") == [{"ok": True}]
+    follow_up = queue.claim("w1", kinds=["analyze"])
+    assert [j["payload"] for j in follow_up] == [{"url": "u"}]
+
+
+def test_expired_lease_is_reclaimed(queue):
+    job_id = queue.enqueue("crawl", {"url": "u"}, "b1")
+    assert queue.claim("w1", lease_seconds=0.2)
+    assert queue.claim("w2") == []
+    time.sleep(0.3)
+    reclaimed = queue.claim("w2")
+    assert [(j["id"], j["attempt"]) for j in reclaimed] == [(job_id, 2)]
+    # The first worker lost the job
+    assert not queue.heartbeat(job_id, "w1")
+    assert not queue.complete(job_id, "w1", "late")
+    assert queue.heartbeat(job_id, "w2")
+
+
+def test_fail_backs_off_exponentially(queue):
+    job_id = queue.enqueue("crawl", {"url": "u"}, "b1", max_attempts=3)
+    queue.claim("w1")
+    before = _utcnow()
+    assert queue.fail(job_id, "w1", "boom") == QUEUED
+    row = job_row(queue, job_id)
+    assert row.last_error == "boom"
+    assert before + timedelta(seconds=59) <= row.available_at <= _utcnow() + timedelta(seconds=60)
+    # Not due yet
+    assert queue.claim("w1") == []
+
+    queue.retry_delay = 0.1
+    make_due(queue, job_id)
+    queue.claim("w1")
+    before = _utcnow()
+    queue.fail(job_id, "w1", "boom again")
+    # Second failure waits twice as long
+    assert job_row(queue, job_id).available_at >= before + timedelta(seconds=0.2)
+
+
+def test_dead_letters_after_max_attempts_and_requeues(queue):
+    job_id = queue.enqueue("crawl", {"url": "u"}, "b1", max_attempts=2)
+    for attempt in (1, 2):
+        make_due(queue, job_id)
+        assert [j["attempt"] for j in queue.claim("w1")] == [attempt]
+        status = queue.fail(job_id, "w1", f"boom {attempt}")
+    assert status == DEAD
+    assert queue.is_drained("b1")
+    dead = queue.dead_letters("b1")
+    assert [(d["id"], d["attempts"], d["error"]) for d in dead] == [(job_id, 2, "boom 2")]
+
+    assert queue.requeue_dead("b1") == 1
+    assert [(j["id"], j["attempt"]) for j in queue.claim("w1")] == [(job_id, 1)]
+
+
+def test_lease_expiring_on_final_attempt_dead_letters(queue):
+    job_id = queue.enqueue("crawl", {"url": "u"}, "b1", max_attempts=1)
+    assert queue.claim("w1", lease_seconds=0.1)
+    time.sleep(0.2)
+    assert queue.claim("w2") == []
+    assert [d["error"] for d in queue.dead_letters()] == ["lease expired on final attempt"]
+    assert queue.counts("b1") == {DEAD: 1}
+    queue.complete(job_id, "w1")
+    assert queue.counts("b1") == {DEAD: 1}
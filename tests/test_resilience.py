@@ -0,0 +1,121 @@
+import asyncio
+import time
+
+import pytest
+import requests
+
+from weflow.core.budget import budget
+from weflow.core.notifier import FeishuNotifier
+from weflow.core.resilience import breaker, guarded_call, timeout_for, CircuitOpenError, CLOSED, OPEN
+from weflow.testing.stubs import StubServer, FeishuStub, json_response
+
+
+@pytest.fixture(autouse=True)
+def fast_breakers(monkeypatch):
+    monkeypatch.setenv("PROVIDER_TIMEOUTS", "notify=0.3")
+    monkeypatch.setenv("BREAKER_FAILURES", "2")
+    monkeypatch.setenv("BREAKER_RESET_SECONDS", "0.5")
+
+
+def call(server: StubServer, path: str = "/ok"):
+    with guarded_call("stub", "stub", "post"):
+        response = requests.post(f"{server.url}{path}", timeout=timeout_for("notify"))
+        response.raise_for_status()
+        return response.json()
+
+
+def healthy() -> StubServer:
+    server = StubServer()
+    server.route("POST", "/ok", lambda *_: json_response({"ok": True}))
+    return server
+
+
+def test_timeout_for_uses_configured_limit_capped_by_run_deadline(monkeypatch):
+    assert timeout_for("notify") == 0.3
+    assert timeout_for("unknown") == 60
+    monkeypatch.setenv("PROVIDER_TIMEOUTS", "llm=120")
+    monkeypatch.setattr(budget, "max_seconds", 30.0)
+    monkeypatch.setattr(budget, "started", time.monotonic())
+    assert 29 < timeout_for("llm") <= 30
+    # Past the deadline calls still get the floor
+    monkeypatch.setattr(budget, "started", time.monotonic() - 60)
+    assert timeout_for("llm") == 5.0
+
+
+def test_hung_server_times_out_and_opens_breaker():
+    with StubServer(hang=True) as server:
+        for _ in range(2):
+            start = time.monotonic()
+            with pytest.raises(requests.exceptions.Timeout):
+                call(server)
+            assert time.monotonic() - start < 2
+        assert breaker("stub").state == OPEN
+        # Rejected without reaching the server
+        with pytest.raises(CircuitOpenError):
+            call(server)
+        assert len(server.requests) == 2
+
+
+def test_failing_server_opens_breaker_and_probe_closes_it():
+    with StubServer(error_rate=1.0) as failing, healthy() as server:
+        for _ in range(2):
+            with pytest.raises(requests.exceptions.HTTPError):
+                call(failing)
+        assert breaker("stub").state == OPEN
+        with pytest.raises(CircuitOpenError):
+            call(server)
+        time.sleep(0.6)
+        # Half-open: one probe goes through and closes the circuit
+        assert call(server) == {"ok": True}
+        assert breaker("stub").state == CLOSED
+
+
+def test_failed_probe_reopens_breaker():
+    with StubServer(error_rate=1.0) as failing:
+        for _ in range(2):
+            with pytest.raises(requests.exceptions.HTTPError):
+                call(failing)
+        time.sleep(0.6)
+        with pytest.raises(requests.exceptions.HTTPError):
+            call(failing)
+        assert breaker("stub").state == OPEN
+        with pytest.raises(CircuitOpenError):
+            call(failing)
+        assert len(failing.requests) == 3
+
+
+def test_client_errors_do_not_trip_breaker():
+    with healthy() as server:
+        for _ in range(3):
+            with pytest.raises(requests.exceptions.HTTPError):
+                call(server, "/missing")
+        assert breaker("stub").state == CLOSED
+        assert call(server) == {"ok": True}
+
+
+def test_notifier_gives_up_on_hung_webhook_and_fails_fast_after():
+    with FeishuStub(hang=True) as feishu:
+        notifier = FeishuNotifier(feishu.webhook_url)
+        start = time.monotonic()
+        assert not notifier.send_card("t", "s", "https://example.com")
+        assert not notifier.send_card("t", "s", "https://example.com")
+        assert time.monotonic() - start < 3
+        assert breaker("feishu").state == OPEN
+        assert not notifier.send_card("t", "s", "https://example.com")
+        assert len(feishu.requests) == 2
+
+
+def test_cancelled_probe_hands_probe_back():
+    with StubServer(error_rate=1.0) as failing:
+        for _ in range(2):
+            with pytest.raises(requests.exceptions.HTTPError):
+                call(failing)
+    time.sleep(0.6)
+    with pytest.raises(asyncio.CancelledError):
+        with guarded_call("stub", "stub", "post"):
+            raise asyncio.CancelledError()
+    # Not stuck half-open: the next call is the probe
+    assert breaker("stub").state == OPEN
+    with healthy() as server:
+        assert call(server) == {"ok": True}
+    assert breaker("stub").state == CLOSED
@@ -0,0 +1,75 @@
+import time
+
+from weflow.core.resilience import breaker, CLOSED, OPEN
+from weflow.core.router import HedgedLLM, LLMEndpoint
+from weflow.testing.stubs import FakeOpenAIServer
+
+MESSAGES = [{"role": "system", "content": "test"}, {"role": "user", "content": "hello"}]
+
+
+def wait_for(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return condition()
+
+
+def endpoint(server: FakeOpenAIServer, name: str) -> LLMEndpoint:
+    return LLMEndpoint(base_url=f"{server.url}/v1", model="stub-model", name=name, timeout=10)
+
+
+def test_hedge_fires_after_delay_and_cancels_loser():
+    # 40 chunks of 0.2s: the primary would need ~8s to finish
+    with FakeOpenAIServer(reply="slow " * 128, chunk_delay=0.2) as slow, FakeOpenAIServer(reply="fast answer") as fast:
+        llm = HedgedLLM([endpoint(slow, "slow"), endpoint(fast, "fast")], default_hedge_delay=0.3)
+        start = time.monotonic()
+        assert llm._chat(MESSAGES) == "fast answer"
+        elapsed = time.monotonic() - start
+
+        assert 0.3 <= elapsed < 3
+        assert len(slow.requests) == 1
+        assert len(fast.requests) == 1
+        assert llm.endpoints[1].stats.hedges_won == 1
+        assert wait_for(lambda: slow.cancelled_streams == 1)
+        assert wait_for(lambda: llm.endpoints[0].stats.cancelled == 1)
+
+
+def test_no_hedge_when_primary_answers_in_time():
+    with FakeOpenAIServer(reply="primary") as primary, FakeOpenAIServer(reply="backup") as backup:
+        llm = HedgedLLM([endpoint(primary, "primary"), endpoint(backup, "backup")], default_hedge_delay=2.0)
+        assert llm._chat(MESSAGES) == "primary"
+        assert backup.requests == []
+        assert primary.cancelled_streams == 0
+
+
+def test_fails_over_when_primary_errors():
+    with FakeOpenAIServer(error_rate=1.0) as broken, FakeOpenAIServer(reply="backup") as backup:
+        llm = HedgedLLM([endpoint(broken, "broken"), endpoint(backup, "backup")], default_hedge_delay=5.0)
+        start = time.monotonic()
+        assert llm._chat(MESSAGES) == "backup"
+        # Failed over right away, not after the hedge delay
+        assert time.monotonic() - start < 2
+        assert llm.endpoints[0].stats.errors == 1
+
+
+def test_cancelled_probe_lets_breaker_recover(monkeypatch):
+    monkeypatch.setenv("BREAKER_RESET_SECONDS", "0.1")
+    with FakeOpenAIServer(reply="a" * 128, chunk_delay=0.1) as primary, FakeOpenAIServer(reply="b" * 128, chunk_delay=0.5) as flaky:
+        llm = HedgedLLM([endpoint(primary, "primary"), endpoint(flaky, "flaky")], default_hedge_delay=0.2)
+        circuit = breaker("llm:flaky")
+        for _ in range(circuit.failure_threshold):
+            circuit.failure()
+        time.sleep(0.2)
+
+        # The hedge to "flaky" is its half-open probe, and it loses the race
+        assert llm._chat(MESSAGES) == "a" * 128
+        assert len(flaky.requests) == 1
+        assert wait_for(lambda: llm.endpoints[1].stats.cancelled == 1)
+        assert circuit.state == OPEN
+
+        # The next call is let through as the probe and closes the circuit
+        flaky.chunk_delay = 0
+        assert HedgedLLM([llm.endpoints[1]])._chat(MESSAGES) == "b" * 128
+        assert circuit.state == CLOSED
@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from weflow.core.models import Article
+from weflow.core.rss import GenericRSS, past_high_water_mark, newest_mark
+from weflow.core.storage import PostgresStorage
+from weflow.main import commit_feed_marks, done_entries
+from weflow.testing.stubs import RSSStubServer
+
+T0 = datetime(2026, 10, 1, 8, 0, tzinfo=timezone.utc)
+
+
+def entry(n: int, at=None) -> Article:
+    return Article(title=f"post {n}", url=f"https://blog.example/{n}", entry_id=f"id-{n}", published_at=at)
+
+
+def urls(articles) -> list:
+    return [a.url.rsplit("/", 1)[-1] for a in articles]
+
+
+def test_no_mark_returns_everything():
+    articles = [entry(2, T0 + timedelta(hours=1)), entry(1, T0)]
+    assert past_high_water_mark(articles, None) == articles
+
+
+def test_dated_entries_compare_by_timestamp():
+    articles = [entry(3, T0 + timedelta(hours=2)), entry(2, T0 + timedelta(hours=1)), entry(1, T0)]
+    mark = {"entry_id": "id-2", "published_at": T0 + timedelta(hours=1)}
+    assert urls(past_high_water_mark(articles, mark)) == ["3"]
+
+
+def test_entries_sharing_the_marks_second_are_kept():
+    # A batch published with one timestamp: the mark is one of them
+    articles = [entry(n, T0) for n in (3, 2, 1)]
+    assert newest_mark(articles) == {"entry_id": "id-3", "published_at": T0}
+    mark = {"entry_id": "id-1", "published_at": T0}
+    assert urls(past_high_water_mark(articles, mark)) == ["3", "2"]
+    assert past_high_water_mark(articles, newest_mark(articles)) == []
+
+
+def test_undated_entries_use_feed_order():
+    articles = [entry(3), entry(2), entry(1)]
+    assert urls(past_high_water_mark(articles, {"entry_id": "id-2", "published_at": None})) == ["3"]
+    # Marked entry rolled off the feed: everything is new
+    assert urls(past_high_water_mark(articles, {"entry_id": "id-0", "published_at": None})) == ["3", "2", "1"]
+
+
+def test_done_entries_stop_at_oldest_pending():
+    arts = [entry(n, T0 + timedelta(hours=n)) for n in (4, 3, 2, 1)]
+    processed = {a.url for a in arts if not a.url.endswith("/2")}
+    assert urls(done_entries(arts, processed)) == ["1"]
+    assert urls(done_entries(arts, {a.url for a in arts})) == ["4", "3", "2", "1"]
+
+
+def test_done_entries_break_timestamp_ties_like_the_mark():
+    arts = [entry(n, T0) for n in (3, 2, 1)]
+    processed = {arts[1].url, arts[2].url}  # id-3 still pending
+    done = done_entries(arts, processed)
+    assert urls(done) == ["2", "1"]
+    assert urls(past_high_water_mark(arts, newest_mark(done))) == ["3"]
+
+
+def test_undated_done_entries_only_below_last_pending():
+    arts = [entry(n) for n in (4, 3, 2, 1)]
+    processed = {a.url for a in arts if not a.url.endswith("/3")}
+    assert urls(done_entries(arts, processed)) == ["2", "1"]
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return PostgresStorage(f"sqlite:///{tmp_path / 'weflow.db'}")
+
+
+def test_marks_survive_a_restart_and_hold_back_unprocessed(storage, monkeypatch):
+    monkeypatch.setenv("FEED_FULL_TEXT", "0")
+    with RSSStubServer(feeds=1, articles=5) as rss:
+        feed_url = rss.feed_urls()[0]
+        first = GenericRSS(url=feed_url, mark_store=storage)
+        arts = first.fetch_articles()
+        assert len(arts) == 5
+        # Newest first: the second-newest entry failed this run
+        processed = [a for i, a in enumerate(arts) if i != 1]
+        commit_feed_marks([(first, arts)], processed)
+
+        restarted = GenericRSS(url=feed_url, mark_store=storage)
+        again = restarted.fetch_articles()
+        assert [a.url for a in again] == [arts[0].url, arts[1].url]
+
+        commit_feed_marks([(restarted, again)], again)
+        assert GenericRSS(url=feed_url, mark_store=storage).fetch_articles() == []
+
+
+def test_mark_never_moves_backwards(storage):
+    rss = GenericRSS(url="https://blog.example/feed", mark_store=storage)
+    rss.advance_mark([entry(2, T0 + timedelta(hours=1))])
+    rss.advance_mark([entry(1, T0)])
+    assert storage.get_feed_mark("https://blog.example/feed") == {"entry_id": "id-2", "published_at": T0 + timedelta(hours=1)}
@@ -0,0 +1,102 @@
+import copy
+import gc
+import os
+
+import pytest
+
+from weflow.core.models import Article
+from weflow.core.spill import ContentStore, content_store
+
+BODY = "## 标题\n\nMixed text – with “quotes” and emoji 🚀. " * 100
+
+
+def open_spill_files(directory) -> int:
+    """Spill files still held open; they are unlinked at creation, so this is what's left on disk."""
+    if not os.path.isdir("/proc/self/fd"):
+        pytest.skip("needs /proc")
+    count = 0
+    for fd in os.listdir("/proc/self/fd"):
+        try:
+            count += os.readlink(f"/proc/self/fd/{fd}").startswith(str(directory))
+        except OSError:
+            pass
+    return count
+
+
+@pytest.fixture
+def spill_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(content_store, "enabled", True)
+    monkeypatch.setattr(content_store, "directory", str(tmp_path))
+    monkeypatch.setattr(content_store, "min_chars", 1000)
+    monkeypatch.setattr(content_store, "_segment", None)
+    yield content_store
+    content_store._segment = None
+
+
+def test_round_trip_and_heads(tmp_path):
+    store = ContentStore(directory=str(tmp_path))
+    refs = [store.put(BODY), store.put("second"), store.put("")]
+    assert [store.get(r) for r in refs] == [BODY, "second", ""]
+    assert refs[0].nchars == len(BODY) and refs[0].nbytes == len(BODY.encode("utf-8"))
+    assert refs[1].offset == refs[0].nbytes
+    # Heads cut on characters, never in the middle of a multi-byte one
+    for n in (1, 4, 7, 50, len(BODY), len(BODY) + 10):
+        assert store.get(refs[0], n) == BODY[:n]
+
+
+def test_threshold():
+    store = ContentStore(min_chars=10)
+    assert store.should_spill("x" * 10)
+    assert not store.should_spill("x" * 9)
+    assert not store.should_spill(None)
+    assert not ContentStore(enabled=False, min_chars=0).should_spill("x" * 100)
+
+
+def test_configure_from_env(monkeypatch, tmp_path):
+    store = ContentStore()
+    store.put("x")
+    monkeypatch.setenv("CONTENT_SPILL", "0")
+    monkeypatch.setenv("CONTENT_SPILL_DIR", str(tmp_path))
+    monkeypatch.setenv("CONTENT_SPILL_MIN_CHARS", "64")
+    store.configure_from_env()
+    assert (store.enabled, store.directory, store.min_chars, store._segment) == (False, str(tmp_path), 64, None)
+
+
+def test_full_segments_are_deleted_once_unreferenced(tmp_path):
+    store = ContentStore(directory=str(tmp_path), segment_bytes=3 * 1024)
+    refs = [store.put("x" * 1024) for _ in range(7)]
+    assert len({id(r.segment) for r in refs}) == 3
+    assert open_spill_files(tmp_path) == 3
+
+    del refs[:3]  # the first segment has no readers left
+    gc.collect()
+    assert open_spill_files(tmp_path) == 2
+    assert [store.get(r) for r in refs] == ["x" * 1024] * 4
+
+    del refs[:]  # the current segment stays with the store
+    gc.collect()
+    assert open_spill_files(tmp_path) == 1
+
+
+def test_article_spills_long_content(spill_store, tmp_path):
+    art = Article(title="t", url="u", content=BODY)
+    assert art.text is None and art.spill is not None
+    assert art.content == BODY and art.content_chars == len(BODY)
+    assert art.content_head(20) == BODY[:20]
+    assert art.model_dump()["content"] == BODY
+    assert Article.model_validate_json(art.model_dump_json()).content == BODY
+    # Copies share the spilled body instead of duplicating the file
+    assert art.model_copy().spill is art.spill and copy.deepcopy(art).spill is art.spill
+
+    art.content = "short now"
+    assert (art.text, art.spill) == ("short now", None)
+    del art
+    gc.collect()
+    assert open_spill_files(tmp_path) == 1  # the store's current segment
+
+
+def test_article_keeps_short_or_disabled_content_inline(spill_store, monkeypatch):
+    assert Article(title="t", url="u", content="short").spill is None
+    monkeypatch.setattr(content_store, "enabled", False)
+    art = Article(title="t", url="u", content=BODY)
+    assert (art.text, art.spill, art.content_chars) == (BODY, None, len(BODY))
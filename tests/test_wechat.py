@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from weflow.core.resilience import breaker, CircuitOpenError, CLOSED, OPEN
+from weflow.core.wechat import AsyncWeChatPublisher, WeChatError, WeChatPublisher
+from weflow.testing.stubs import WeChatStub, json_response
+
+DRAFT = dict(title="t", summary="s", media_id="m", content="<p>c</p>", source_url="")
+
+
+@pytest.fixture(autouse=True)
+def fast_breakers(monkeypatch):
+    monkeypatch.setenv("BREAKER_FAILURES", "2")
+    monkeypatch.setenv("BREAKER_RESET_SECONDS", "60")
+
+
+def wechat_stub(monkeypatch, draft_reply=None) -> WeChatStub:
+    stub = WeChatStub().start()
+    monkeypatch.setenv("WECHAT_API_BASE", stub.url)
+    if draft_reply:
+        stub.routes.insert(0, ("POST", "/cgi-bin/draft/add", lambda *_: json_response(draft_reply)))
+    return stub
+
+
+def test_busy_errcode_opens_the_circuit(monkeypatch):
+    stub = wechat_stub(monkeypatch, {"errcode": -1, "errmsg": "system error"})
+    try:
+        wechat = WeChatPublisher("app", "secret")
+        for _ in range(2):
+            with pytest.raises(WeChatError) as e:
+                wechat.push_draft(**DRAFT)
+            assert (e.value.errcode, e.value.status_code) == (-1, 503)
+        assert breaker("wechat:app").state == OPEN
+        with pytest.raises(CircuitOpenError):
+            wechat.push_draft(**DRAFT)
+    finally:
+        stub.stop()
+
+
+def test_request_errcode_fails_the_call_but_not_the_circuit(monkeypatch):
+    stub = wechat_stub(monkeypatch, {"errcode": 45002, "errmsg": "content size out of limit"})
+    try:
+        wechat = WeChatPublisher("app", "secret")
+        for _ in range(3):
+            with pytest.raises(WeChatError, match="45002"):
+                wechat.push_draft(**DRAFT)
+        # draft/get answers 40007 for an unknown id: no draft, circuit untouched
+        assert wechat.get_draft("missing") is None
+        assert breaker("wechat:app").state == CLOSED
+    finally:
+        stub.stop()
+
+
+def test_successful_replies_pass_through(monkeypatch):
+    stub = wechat_stub(monkeypatch)
+    try:
+        wechat = WeChatPublisher("app", "secret")
+        media_id = wechat.push_draft(**DRAFT)
+        assert wechat.get_draft(media_id)["title"] == "t"
+        assert wechat.upload_image(f"{stub.url}/cover.png").startswith("media-")
+    finally:
+        stub.stop()
+
+
+def test_async_publisher_raises_inside_the_breaker(monkeypatch):
+    stub = wechat_stub(monkeypatch, {"errcode": 45009, "errmsg": "reach max api daily quota limit"})
+
+    async def run():
+        wechat = AsyncWeChatPublisher("app", "secret")
+        try:
+            for _ in range(2):
+                with pytest.raises(WeChatError) as e:
+                    await wechat.push_draft(**DRAFT)
+                assert e.value.status_code == 429
+            with pytest.raises(CircuitOpenError):
+                await wechat.push_draft(**DRAFT)
+        finally:
+            await wechat.client.aclose()
+
+    try:
+        asyncio.run(run())
+    finally:
+        stub.stop()